@@ -31,7 +31,7 @@ from zato.common.util.platform_ import is_non_windows
 
 if 0:
     from zato.client import AnyServiceInvoker
-    from zato.common.typing_ import any_, anydict, anydictnone, optional
+    from zato.common.typing_ import any_, anydict, anydictnone, callnone, optional
     from zato.server.connection.server.rpc.api import ServerRPC
 
     AnyServiceInvoker = AnyServiceInvoker
@@ -73,11 +73,15 @@ class BrokerClient:
         scheduler_config: 'anydictnone'                 = None,
         server_rpc:       'optional[ServerRPC]'         = None,
         zato_client:      'optional[AnyServiceInvoker]' = None,
+        on_publish:       'callnone'                    = None,
         ) -> 'None':
 
         # This is used to invoke services
         self.server_rpc = server_rpc
 
+        # If given, this is called with each message that we are about to send to all the servers
+        self.on_publish = on_publish
+
         self.zato_client = zato_client
         self.scheduler_url = ''
         self.scheduler_auth = None
@@ -166,6 +170,13 @@ class BrokerClient:
                 logger.info('Invoking %s %s', code_name, msg)
 
             if self.server_rpc:
+
+                if self.on_publish:
+                    try:
+                        self.on_publish(msg)
+                    except Exception:
+                        logger.warning('Exception in on_publish callback (%r) -> %s', action, format_exc())
+
                 return self.server_rpc.invoke_all('zato.service.rpc-service-invoker', msg, ping_timeout=10)
             else:
                 logger.warning('Server-to-server RPC invocation failure -> self.server_rpc is not configured (%r) (%d:%r)',
@@ -148,6 +148,7 @@ startup_callable=
 return_json_schema_errors=False
 sftp_genkey_command=dropbearkey
 posix_ipc_skip_platform=darwin
+use_config_snapshot=True
 service_invoker_allow_internal="pub.zato.ping", "/zato/api/invoke/service_name"
 
 [events]
@@ -495,6 +495,9 @@ class KVDB(Attrs):
 
     LOCK_SERVICE_PREFIX = '{}service:'.format(LOCK_PREFIX)
     LOCK_CONFIG_PREFIX = '{}config:'.format(LOCK_PREFIX)
+    LOCK_CONFIG_SNAPSHOT = '{}snapshot:'.format(LOCK_CONFIG_PREFIX)
+
+    CONFIG_SNAPSHOT_CHANGE_ID = 'zato:config-snapshot:change-id'
 
     LOCK_FANOUT_PATTERN = '{}fanout:{{}}'.format(LOCK_PREFIX)
     LOCK_PARALLEL_EXEC_PATTERN = '{}parallel-exec:{{}}'.format(LOCK_PREFIX)
@@ -724,6 +727,11 @@ class HTTP_SOAP:
     class METHOD:
         ANY_INTERNAL = 'hmany'
 
+    # Circuit breakers of outgoing connections are off by default
+    class CIRCUIT_BREAKER:
+        MAX_FAILURES = 0
+        OPEN_TIME = 30
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -1375,6 +1383,7 @@ class AuditLog:
     class Default:
         max_len_messages = 50
         max_data_stored_per_message = 500 # In kilobytes
+        max_bytes_stored = 50_000_000 # Per direction, for each object whose events are kept on disk
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -7,23 +7,42 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+import os
+import re
 from collections import deque
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from logging import getLogger
+from shutil import rmtree
+from struct import Struct
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
+except ImportError:
+    # Ignore it under Windows
+    pass
 
 # gevent
 from gevent.lock import RLock
 
 # Zato
 from zato.common.api import AuditLog as CommonAuditLog, CHANNEL, GENERIC, WEB_SOCKET
+from zato.common.json_internal import dumps, loads
 from zato.common.util.api import new_cid
+from zato.common.util.disk_ring import DiskRing
 
 # ################################################################################################################################
 # ################################################################################################################################
 
+logger = getLogger('zato')
+
 _sent     = CommonAuditLog.Direction.sent
 _received = CommonAuditLog.Direction.received
 
+_epoch = datetime(1970, 1, 1)
+_one_microsecond = timedelta(microseconds=1)
+
+# Characters that cannot be used in names of directories that containers keep their data in
+_not_in_path = re.compile(r'[^\w.-]')
 
 event_attrs    = 'direction', 'data', 'event_id', 'timestamp', 'msg_id', 'in_reply_to', 'type_', 'object_id', 'conn_id'
 
@@ -33,7 +52,29 @@ transfer_attrs = 'total_bytes_received', 'total_messages_received', 'avg_msg_siz
 
 config_attrs   = 'type_', 'object_id', 'max_len_messages_received',      'max_len_messages_sent',      \
                                        'max_bytes_per_message_received', 'max_bytes_per_message_sent', \
-                                       'max_bytes_per_message'
+                                       'max_bytes_per_message',                                        \
+                                       'max_bytes_received',             'max_bytes_sent',             \
+                                       'storage_dir'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Events stored on disk begin with the length of their JSON-serialized attributes, followed by their data
+    Meta_Len = Struct('<I')
+
+    # What type data was of before it was stored on disk
+    Data_Bytes = 0
+    Data_Str   = 1
+    Data_None  = 2
+
+    # Held by each process for as long as it uses a directory with containers, and by the one that is looking for such a directory
+    Lock_File_Name = '.lock'
+
+    # Containers of these types are created for each connection, e.g. each WebSocket client, which means that,
+    # were they on disk, a directory would be left behind by each connection that did not close cleanly.
+    In_RAM_Types = {WEB_SOCKET.AUDIT_KEY}
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -68,6 +109,65 @@ class DataEvent:
             out[name] = getattr(self, name)
         return out
 
+# ################################################################################################################################
+
+    def to_bytes(self, max_len:'int', _format:'type'=ModuleCtx) -> 'bytes':
+        """ Serializes the event, along with up to max_len of its data, for it to be stored on disk.
+        """
+        data = self.data
+
+        if data is None:
+            data_type = _format.Data_None
+            data = b''
+        elif isinstance(data, bytes):
+            data_type = _format.Data_Bytes
+        else:
+            data_type = _format.Data_Str
+            data = data.encode('utf8') if isinstance(data, str) else str(data).encode('utf8')
+
+        meta = dumps([self.event_id, self.msg_id, self.in_reply_to, self.type_, self.object_id, self.conn_id, data_type])
+        meta = meta.encode('utf8')
+
+        return _format.Meta_Len.pack(len(meta)) + meta + data[:max_len]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_timestamp(value:'datetime') -> 'int':
+    """ Turns a datetime object, naive ones being in UTC, into the number of microseconds since the epoch.
+    """
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _epoch) // _one_microsecond
+
+# ################################################################################################################################
+
+def event_dict_from_bytes(direction:'str', timestamp:'int', data:'bytes', _format:'type'=ModuleCtx) -> 'dict':
+    """ Builds a dict out of an event stored on disk, the same as DataEvent.to_dict would have returned.
+    """
+    meta_len, = _format.Meta_Len.unpack_from(data, 0)
+    meta_end = _format.Meta_Len.size + meta_len
+
+    event_id, msg_id, in_reply_to, type_, object_id, conn_id, data_type = loads(data[_format.Meta_Len.size:meta_end])
+    data = data[meta_end:]
+
+    if data_type == _format.Data_Str:
+        data = data.decode('utf8', errors='replace')
+    elif data_type == _format.Data_None:
+        data = None
+
+    return {
+        'direction': direction,
+        'data': data,
+        'event_id': event_id,
+        'timestamp': _epoch + timedelta(microseconds=timestamp),
+        'msg_id': msg_id,
+        'in_reply_to': in_reply_to,
+        'type_': type_,
+        'object_id': object_id,
+        'conn_id': conn_id,
+    }
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -108,13 +208,21 @@ class LogContainerConfig:
         self.max_bytes_per_message_received = 0
         self.max_bytes_per_message_sent = 0
 
+        # How many bytes of events can be kept in total, 0 = no limit other than max_len_messages_*
+        self.max_bytes_received = 0
+        self.max_bytes_sent = 0
+
+        # If given, events are kept on disk, in this directory, instead of in RAM
+        self.storage_dir = None
+
 # ################################################################################################################################
 # ################################################################################################################################
 
 class LogContainer:
-    """ Stores messages for a specific object, e.g. an individual REST or HL7 channel.
+    """ Stores messages for a specific object, e.g. an individual REST or HL7 channel. Depending on configuration,
+    messages are kept either in RAM, bounded by their number and total size, or on disk, in rings bounded by size only.
     """
-    __slots__ = config_attrs + transfer_attrs + ('lock',)
+    __slots__ = config_attrs + transfer_attrs + ('lock', 'max_bytes', 'bytes_stored')
 
     def __init__(self, config, _sent=_sent, _received=_received):
         # type: (LogContainerConfig)
@@ -136,6 +244,19 @@ class LogContainer:
             _received: config.max_bytes_per_message_received,
         }
 
+        self.max_bytes = {
+            _sent:     config.max_bytes_sent,
+            _received: config.max_bytes_received,
+        }
+
+        # How many bytes of data there are in RAM
+        self.bytes_stored = {
+            _sent: 0,
+            _received: 0,
+        }
+
+        self.storage_dir = config.storage_dir
+
         self.total_bytes_sent    = 0
         self.total_messages_sent = 0
         self.avg_msg_size_sent   = 0
@@ -148,26 +269,99 @@ class LogContainer:
         self.first_received          = None # type: datetime
         self.last_received           = None # type: datetime
 
-        # These two deques are where the actual data is kept
+        # This is where the actual data is kept - either two rings on disk ..
         self.messages = {}
-        self.messages[_sent]     = deque(maxlen=self.max_len_messages_sent)
-        self.messages[_received] = deque(maxlen=self.max_len_messages_received)
+
+        if self.storage_dir:
+            self.messages[_sent]     = DiskRing(os.path.join(self.storage_dir, _sent), self.max_bytes[_sent])
+            self.messages[_received] = DiskRing(os.path.join(self.storage_dir, _received), self.max_bytes[_received])
+
+        # .. or two deques.
+        else:
+            self.messages[_sent]     = deque(maxlen=self.max_len_messages_sent)
+            self.messages[_received] = deque(maxlen=self.max_len_messages_received)
 
 # ################################################################################################################################
 
-    def store(self, data_event):
-        with self.lock[data_event.direction]:
+    def store(self, data_event, _get_timestamp=get_timestamp):
+        direction = data_event.direction
+
+        with self.lock[direction]:
 
             # Make sure we do not exceed our limit of bytes stored
-            max_len = self.max_bytes_per_message[data_event.direction]
+            max_len = self.max_bytes_per_message[direction]
+            storage = self.messages[direction]
+
+            # Events on disk are serialized, which means that no object is kept in RAM ..
+            if self.storage_dir:
+                storage = storage # type: DiskRing
+                timestamp = _get_timestamp(data_event.timestamp)
+                data = data_event.to_bytes(max_len)
+
+                # .. though an event may be too big for a segment, in which case we store as much of its data as will fit.
+                if not storage.append(timestamp, data):
+
+                    meta_len, = ModuleCtx.Meta_Len.unpack_from(data, 0)
+                    data_len = len(data) - ModuleCtx.Meta_Len.size - meta_len
+                    excess = len(data) - storage.max_data_size
+
+                    logger.warning('Truncating audit log event `%s` (%s) of %s bytes to %s bytes',
+                        data_event.event_id, direction, len(data), storage.max_data_size)
+
+                    if not storage.append(timestamp, data_event.to_bytes(max(data_len - excess, 0))):
+                        logger.warning('Audit log event `%s` (%s) could not be stored', data_event.event_id, direction)
+
+                return
+
+            # .. unlike with the ones that are kept in a deque, which may also need to make room for each new event.
             data_event.data = data_event.data[:max_len]
+            storage = storage # type: deque
+
+            max_bytes = self.max_bytes[direction]
+            if max_bytes:
+                self.bytes_stored[direction] += len(data_event.data or b'')
+
+                if storage.maxlen and len(storage) == storage.maxlen:
+                    self.bytes_stored[direction] -= len(storage[0].data or b'')
 
-            storage = self.messages[data_event.direction] # type: deque
             storage.append(data_event)
 
+            if max_bytes:
+                while self.bytes_stored[direction] > max_bytes and len(storage) > 1:
+                    self.bytes_stored[direction] -= len(storage.popleft().data or b'')
+
+# ################################################################################################################################
+
+    def get_events(self, direction, start=None, stop=None, _get_timestamp=get_timestamp):
+        # type: (str, datetime, datetime) -> list
+        """ Returns events, as dicts, whose timestamps are between start and stop, both inclusive, oldest first.
+        """
+        out = []
+
+        with self.lock[direction]:
+
+            if self.storage_dir:
+                start = _get_timestamp(start) if start else None
+                stop = _get_timestamp(stop) if stop else None
+
+                for timestamp, data in self.messages[direction].read(start, stop):
+                    out.append(event_dict_from_bytes(direction, timestamp, data))
+
+            else:
+                for message in self.messages[direction]: # type: DataEvent
+                    if start and message.timestamp < start:
+                        continue
+                    if stop and message.timestamp > stop:
+                        continue
+                    out.append(message.to_dict())
+
+        return out
+
 # ################################################################################################################################
 
     def to_dict(self, _sent=_sent, _received=_received):
+        """ Returns the most recent events, which on disk means up to max_len_messages_* of them.
+        """
         out = {
             _sent: [],
             _received: []
@@ -176,22 +370,48 @@ class LogContainer:
         for name in (_sent, _received):
             messages = out[name]
             with self.lock[name]:
-                for message in self.messages[name]: # type: DataEvent
-                    messages.append(message.to_dict())
+
+                if self.storage_dir:
+                    storage = self.messages[name] # type: DiskRing
+                    max_len = self.max_len_messages_sent if name == _sent else self.max_len_messages_received
+                    records = storage.get_latest(max_len) if max_len else storage.read()
+                    for timestamp, data in records:
+                        messages.append(event_dict_from_bytes(name, timestamp, data))
+
+                else:
+                    for message in self.messages[name]: # type: DataEvent
+                        messages.append(message.to_dict())
 
         return out
 
+# ################################################################################################################################
+
+    def close(self, needs_delete=False):
+        """ Closes on-disk storage, if there is any, and deletes its data if told to.
+        """
+        if self.storage_dir:
+            for name, storage in self.messages.items(): # type: (str, DiskRing)
+                with self.lock[name]:
+                    storage.close()
+
+            if needs_delete:
+                rmtree(self.storage_dir, ignore_errors=True)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
 class AuditLog:
     """ Stores a log of messages for channels, outgoing connections or other objects.
     """
-    def __init__(self):
+    def __init__(self, base_dir=None):
+        # type: (str) -> None
 
         # Update lock
         self.lock = RLock()
 
+        # If given, each container keeps its events on disk, in a subdirectory of this one
+        self.base_dir = base_dir
+
         # The main log - keys are object types, values are dicts mapping object IDs to LogContainer objects
         self._log = {
             CHANNEL.HTTP_SOAP: {},
@@ -203,6 +423,64 @@ class AuditLog:
         # Python logging
         self.logger = getLogger('zato')
 
+        # Keeps base_dir locked for as long as this process is running
+        self._base_dir_lock = None
+
+# ################################################################################################################################
+
+    def _lock_dir(self, path):
+        # type: (str) -> object
+        """ Returns an open file that locks a directory, or None if another live process has already locked it.
+        """
+        f = open(os.path.join(path, ModuleCtx.Lock_File_Name), 'a')
+
+        try:
+            flock(f, LOCK_EX | LOCK_NB)
+        except BlockingIOError:
+            f.close()
+        else:
+            return f
+
+# ################################################################################################################################
+
+    def open_base_dir(self, root_dir):
+        # type: (str) -> None
+        """ Sets base_dir to a subdirectory of root_dir that no other live process uses. A directory left behind
+        by a process that no longer exists is taken over, which means that its history is kept when servers are restarted,
+        and a new one is created only if there is no such directory.
+        """
+        os.makedirs(root_dir, mode=0o770, exist_ok=True)
+
+        # Only one process at a time may be looking for its directory ..
+        with open(os.path.join(root_dir, ModuleCtx.Lock_File_Name), 'a') as root_lock:
+            flock(root_lock, LOCK_EX)
+
+            try:
+
+                # .. reuse one of the directories that no one uses ..
+                for name in sorted(os.listdir(root_dir)):
+                    path = os.path.join(root_dir, name)
+
+                    if name.startswith('.') or not os.path.isdir(path):
+                        continue
+
+                    self._base_dir_lock = self._lock_dir(path)
+
+                    if self._base_dir_lock:
+                        self.logger.info('Audit log taking over directory `%s`', path)
+                        break
+
+                # .. or create a new one.
+                else:
+                    path = os.path.join(root_dir, new_cid())
+                    os.makedirs(path, mode=0o770)
+                    self._base_dir_lock = self._lock_dir(path)
+
+            finally:
+                flock(root_lock, LOCK_UN)
+
+        self.base_dir = path
+
 # ################################################################################################################################
 
     def get_container(self, type_, object_id):
@@ -227,6 +505,10 @@ class AuditLog:
             raise ValueError('Container already found `{}` ({})'.format(config.object_id, config.type_))
 
         # .. if we are here, it means that we are really adding a new container ..
+        if self.base_dir and config.type_ not in ModuleCtx.In_RAM_Types:
+            config.storage_dir = os.path.join(self.base_dir,
+                _not_in_path.sub('_', config.type_), _not_in_path.sub('_', config.object_id))
+
         container = LogContainer(config)
 
         # .. finally, we can attach it to the log by the object's ID.
@@ -241,8 +523,8 @@ class AuditLog:
 
 # ################################################################################################################################
 
-    def _delete_container(self, type_, object_id):
-        # type: (str, str)
+    def _delete_container(self, type_, object_id, needs_delete=True):
+        # type: (str, str, bool)
 
         # Make sure the object ID is a string (it can be an int)
         object_id = str(object_id)
@@ -259,7 +541,11 @@ class AuditLog:
         # Note that we use .pop on purpose - e.g. when a server has just started,
         # it may not have any such an object yet but the user may already try to edit
         # the object this log is attached to. Using .pop ignores non-existing keys.
-        container_dict.pop(object_id, None)
+        container = container_dict.pop(object_id, None) # type: LogContainer
+
+        # Data on disk is deleted along with its container unless the container is about to be created again
+        if container:
+            container.close(needs_delete)
 
 # ################################################################################################################################
 
@@ -273,7 +559,7 @@ class AuditLog:
     def edit_container(self, config):
         # type: (LogContainerConfig)
         with self.lock:
-            self._delete_container(config.type_, config.object_id)
+            self._delete_container(config.type_, config.object_id, False)
             self._create_container(config)
 
 # ################################################################################################################################
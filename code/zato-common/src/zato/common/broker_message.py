@@ -496,6 +496,8 @@ class SSO(Constants):
     LINK_AUTH_CREATE = ValueConstant('')
     LINK_AUTH_DELETE = ValueConstant('')
 
+    SESSION_INVALIDATE = ValueConstant('')
+
 class EVENT(Constants):
     code_start = 107400
     PUSH = ValueConstant('')
@@ -10,17 +10,14 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 import socket
 from datetime import datetime
 from logging import getLogger
+from time import monotonic
 
 # gevent
-from gevent import sleep
+from gevent import sleep, spawn
 from gevent.lock import RLock
 
-# orjson
-from orjson import dumps
-
 # Zato
-from zato.common.events.common import Action
-from zato.common.typing_ import asdict
+from zato.common.events.common import Action, BatchFormat, encode_push_batch, encode_push_ctx
 from zato.common.util.api import new_cid
 from zato.common.util.json_ import json_loads
 from zato.common.util.tcp import read_from_socket, SocketReaderCtx, wait_until_port_taken
@@ -63,6 +60,17 @@ class Client:
         self.is_connected = False
         self.lock = RLock()
 
+        # Events are not sent one by one but in batches, each sent when it is big enough ..
+        self.batch = []
+        self.batch_size = 0
+        self.max_batch_events = 5000
+        self.max_batch_size = 1_000_000
+
+        # .. or when it has been waiting long enough.
+        self.flush_interval = 0.5
+        self.flush_greenlet = None
+        self.last_flush = monotonic()
+
 # ################################################################################################################################
 
     def connect(self):
@@ -90,17 +98,25 @@ class Client:
 
 # ################################################################################################################################
 
-    def send(self, action, data=b''):
-        # type: (bytes) -> None
+    def send(self, action, data=b'', suffix=b'\n'):
+        # type: (bytes, bytes, bytes) -> None
         with self.lock:
             try:
-                self.socket.sendall(action + data + b'\n')
+                self.socket.sendall(action + data + suffix)
             except Exception as e:
                 self.is_connected = False
                 logger.info('Socket send error `%s` -> %s', e.args, self.remote_addr_str)
                 self.close()
                 self.connect()
 
+# ################################################################################################################################
+
+    def send_batch(self, action, data):
+        # type: (bytes, bytes) -> None
+        """ Unlike send, this does not rely on newlines to delimit messages so binary data can be sent.
+        """
+        self.send(action, BatchFormat.Header.pack(len(data)) + data, b'')
+
 # ################################################################################################################################
 
     def read(self):
@@ -142,20 +158,70 @@ class Client:
     def push(self, ctx):
         # type: (PushCtx) -> None
 
-        # Serialise the context to dict ..
-        data = asdict(ctx)
+        # Serialise the context ..
+        data = encode_push_ctx(ctx)
 
-        # .. now to JSON ..
-        data = dumps(data)
+        with self.lock:
 
-        # .. and send it across (there will be no response).
-        self.send(Action.Push, data)
+            # .. add it to the current batch ..
+            self.batch.append(data)
+            self.batch_size += len(data)
+
+            # .. send the batch across if it is already big enough (there will be no response) ..
+            if len(self.batch) >= self.max_batch_events or self.batch_size >= self.max_batch_size:
+                self.flush()
+
+            # .. and make sure that it will be sent in a moment otherwise.
+            elif not self.flush_greenlet:
+                self.flush_greenlet = spawn(self._flush_loop)
+
+# ################################################################################################################################
+
+    def flush(self):
+        # type: () -> int
+
+        with self.lock:
+
+            if not self.batch:
+                return 0
+
+            batch = self.batch
+            self.batch = []
+            self.batch_size = 0
+            self.last_flush = monotonic()
+
+            self.send_batch(Action.PushBatch, encode_push_batch(batch))
+            return len(batch)
+
+# ################################################################################################################################
+
+    def _flush_loop(self):
+
+        try:
+            while True:
+                sleep(self.flush_interval)
+
+                # Batches sent because of their size in the meantime do not need to be sent again ..
+                if monotonic() - self.last_flush < self.flush_interval:
+                    continue
+
+                # .. but all the other ones do.
+                with self.lock:
+                    if self.is_connected:
+                        self.flush()
+        except Exception as e:
+            logger.warning('Events flush error `%s` -> %s', e.args, self.remote_addr_str)
+        finally:
+            self.flush_greenlet = None
 
 # ################################################################################################################################
 
     def get_table(self):
 
-        # Request the tabulated data ..
+        # Make sure that the table includes all the events pushed so far ..
+        self.flush()
+
+        # .. request the tabulated data ..
         self.send(Action.GetTable)
 
         # .. wait for the reply ..
@@ -172,7 +238,10 @@ class Client:
 
     def sync_state(self):
 
-        # Request that the database sync its state with persistent storage ..
+        # Send all the events pushed so far ..
+        self.flush()
+
+        # .. request that the database sync its state with persistent storage ..
         self.send(Action.SyncState)
 
         # .. wait for the reply
@@ -7,6 +7,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from struct import Struct
 from typing import Optional as optional
 
 # Zato
@@ -50,6 +51,7 @@ class Action:
     GetTable       = b'04'
     GetTableReply  = b'05'
     SyncState      = b'06'
+    PushBatch      = b'07'
 
     LenAction = len(Ping)
 
@@ -79,3 +81,94 @@ class PushCtx:
 
 # ################################################################################################################################
 # ################################################################################################################################
+
+class BatchFormat:
+    """ Events pushed in batches are sent as a header with the size of the batch, followed by the batch itself.
+    Each batch begins with the number of events in it and each event consists of its integer fields
+    followed by its string fields, each string prefixed by its length.
+    """
+    Header = Struct('<I')
+    Count  = Struct('<I')
+    Ints   = Struct('<qqq')
+    Len    = Struct('<i')
+
+    Int_Fields = 'event_type', 'object_type', 'total_time_ms'
+    Str_Fields = 'id', 'cid', 'timestamp', 'source_type', 'source_id', 'object_id', 'recipient_type', 'recipient_id'
+
+    # Stands for None in integer fields ..
+    No_Int = -2 ** 63
+
+    # .. and in string ones.
+    No_Str = -1
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def encode_push_ctx(ctx, _format=BatchFormat):
+    # type: (PushCtx, type) -> bytes
+    """ Turns a single event into bytes that can be sent as part of a batch.
+    """
+    ints = [getattr(ctx, name, None) for name in _format.Int_Fields]
+    out = [_format.Ints.pack(*[_format.No_Int if value is None else value for value in ints])]
+
+    for name in _format.Str_Fields:
+        value = getattr(ctx, name, None)
+
+        if value is None:
+            out.append(_format.Len.pack(_format.No_Str))
+        else:
+            if not isinstance(value, str):
+                value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            value = value.encode('utf8')
+            out.append(_format.Len.pack(len(value)))
+            out.append(value)
+
+    return b''.join(out)
+
+# ################################################################################################################################
+
+def encode_push_batch(encoded_list, _format=BatchFormat):
+    # type: (list, type) -> bytes
+    """ Builds a batch out of events already encoded with encode_push_ctx.
+    """
+    return _format.Count.pack(len(encoded_list)) + b''.join(encoded_list)
+
+# ################################################################################################################################
+
+def decode_push_batch(data, _format=BatchFormat):
+    # type: (bytes, type) -> list
+    """ Turns a batch back into a list of dicts, each representing a single event.
+    """
+    out = []
+    data = memoryview(data)
+
+    count, = _format.Count.unpack_from(data, 0)
+    offset = _format.Count.size
+
+    int_fields = _format.Int_Fields
+    str_fields = _format.Str_Fields
+
+    for _ in range(count):
+
+        item = {}
+
+        for name, value in zip(int_fields, _format.Ints.unpack_from(data, offset)):
+            item[name] = None if value == _format.No_Int else value
+        offset += _format.Ints.size
+
+        for name in str_fields:
+            length, = _format.Len.unpack_from(data, offset)
+            offset += _format.Len.size
+
+            if length == _format.No_Str:
+                item[name] = None
+            else:
+                item[name] = str(data[offset:offset + length], 'utf8')
+                offset += length
+
+        out.append(item)
+
+    return out
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -66,6 +66,12 @@ class TimeoutException(ConnectionException):
 
 # ################################################################################################################################
 
+class CircuitOpen(ConnectionException):
+    """ Raised when a connection is not invoked because it failed too many times recently.
+    """
+
+# ################################################################################################################################
+
 class StatusAwareException(ZatoException):
     """ Raised when the underlying error condition can be easily expressed
     as one of the HTTP status codes.
@@ -8,12 +8,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import logging
+import os
+import socket
 
 # Zato
 from zato.common.api import IPC
 from zato.common.ipc.client import IPCClient
 from zato.common.ipc.server import IPCServer
-from zato.common.util.api import fs_safe_name, load_ipc_pid_port
+from zato.common.ipc.unix_socket import UnixIPCClient, UnixIPCServer
+from zato.common.util.api import fs_safe_name, get_ipc_pid_socket_path, load_ipc_pid_port
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -31,6 +34,14 @@ logger = logging.getLogger(__name__)
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # If Unix domain sockets are available, they are used instead of HTTP
+    Use_Unix_Sockets = hasattr(socket, 'AF_UNIX')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class IPCAPI:
     """ API through which IPC is performed.
     """
@@ -39,11 +50,19 @@ class IPCAPI:
     username: 'str'
     password: 'str'
     on_message_callback: 'callable_'
+    unix_server: 'UnixIPCServer | None'
 
     def __init__(self, parallel_server:'ParallelServer') -> 'None':
         self.parallel_server = parallel_server
         self.username = IPC.Credentials.Username
         self.password = ''
+        self.unix_server = None
+
+        # (cluster_name, server_name, PID) -> UnixIPCClient connected to that process
+        self.unix_clients = {}
+
+        # (cluster_name, server_name, PID) -> TCP port that the process listens on
+        self.ipc_ports = {}
 
 # ################################################################################################################################
 
@@ -79,6 +98,103 @@ class IPCAPI:
             server_type_suffix=server_type_suffix
         )
 
+# ################################################################################################################################
+
+    def start_unix_server(
+        self,
+        cluster_name,  # type: str
+        server_name,   # type: str
+        pid,           # type: int
+        *,
+        username='',   # type: str
+        password='',   # type: str
+        callback_func, # type: callable_
+    ) -> 'None':
+        """ Starts a server accepting IPC connections over a Unix domain socket, if such sockets are available.
+        """
+        if not ModuleCtx.Use_Unix_Sockets:
+            return
+
+        path = get_ipc_pid_socket_path(cluster_name, server_name, pid)
+
+        self.unix_server = UnixIPCServer(path, username or self.username, password or self.password, callback_func)
+        self.unix_server.start()
+
+# ################################################################################################################################
+
+    def stop_unix_server(self) -> 'None':
+        """ Stops accepting IPC connections over a Unix domain socket and closes the ones to other processes.
+        """
+        if self.unix_server:
+            self.unix_server.stop()
+            self.unix_server = None
+
+        for client in self.unix_clients.values():
+            try:
+                client.close()
+            except OSError:
+                pass
+
+        self.unix_clients.clear()
+
+# ################################################################################################################################
+
+    def _get_unix_client(self, cluster_name:'str', server_name:'str', target_pid:'int') -> 'UnixIPCClient | None':
+        """ Returns a client connected to a given process, creating it if this is the first time the process is invoked,
+        or None if the process cannot be connected to through its Unix socket.
+        """
+        key = (cluster_name, server_name, target_pid)
+        client = self.unix_clients.get(key)
+
+        if not client:
+
+            # The process may not have started its Unix socket server yet, or it may not have one at all ..
+            path = get_ipc_pid_socket_path(cluster_name, server_name, target_pid)
+            if not os.path.exists(path):
+                return None
+
+            client = UnixIPCClient(path, IPC.Credentials.Username, self.password)
+
+        # .. or it may have stopped it in the meantime. Either way, nothing has been sent to it yet.
+        try:
+            _ = client.connect()
+        except OSError:
+            _ = self.unix_clients.pop(key, None)
+            return None
+        else:
+            self.unix_clients[key] = client
+            return client
+
+# ################################################################################################################################
+
+    def _invoke_by_pid_unix(
+        self,
+        client,       # type: UnixIPCClient
+        service,      # type: str
+        request,      # type: str
+        cluster_name, # type: str
+        server_name,  # type: str
+        target_pid,   # type: int
+        timeout,      # type: int
+    ) -> 'IPCResponse':
+
+        try:
+            return client.invoke(
+                service,
+                request,
+                cluster_name=cluster_name,
+                server_name=server_name,
+                server_pid=target_pid,
+                timeout=timeout,
+                source_server_name=self.parallel_server.name,
+                source_server_pid=self.parallel_server.pid,
+            )
+        except OSError:
+
+            # The process may have stopped in the meantime, in which case we no longer need its client
+            _ = self.unix_clients.pop((cluster_name, server_name, target_pid), None)
+            raise
+
 # ################################################################################################################################
 
     def invoke_by_pid(
@@ -94,11 +210,24 @@ class IPCAPI:
         """ Invokes a service in a specific process synchronously through IPC.
         """
 
+        # Use a persistent connection, if possible ..
+        if ModuleCtx.Use_Unix_Sockets:
+            client = self._get_unix_client(cluster_name, server_name, target_pid)
+            if client:
+                return self._invoke_by_pid_unix(client, service, request, cluster_name, server_name, target_pid, timeout)
+
+        # .. otherwise, use HTTP.
+
         # This is constant
         ipc_host = '127.0.0.1'
 
-        # Get the port that we can find the PID listening on
-        ipc_port = load_ipc_pid_port(cluster_name, server_name, target_pid)
+        # Get the port that we can find the PID listening on, which needs to be read only once
+        key = (cluster_name, server_name, target_pid)
+        ipc_port = self.ipc_ports.get(key)
+
+        if not ipc_port:
+            ipc_port = load_ipc_pid_port(cluster_name, server_name, target_pid)
+            self.ipc_ports[key] = ipc_port
 
         # Log what we are about to do
         log_msg = f'Invoking {service} on {cluster_name}:{server_name}:{target_pid}-tcp:{ipc_port}'
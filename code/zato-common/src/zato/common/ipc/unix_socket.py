@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from hmac import compare_digest
+from itertools import count
+from json import dumps, loads
+from logging import getLogger
+from struct import Struct
+from traceback import format_exc
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import socket, spawn
+from gevent.event import AsyncResult
+from gevent.lock import RLock
+from gevent.server import StreamServer
+
+# Zato
+from zato.common.api import IPC as Common_IPC
+from zato.common.broker_message import SERVER_IPC
+from zato.common.ipc.client import build_ipc_response
+from zato.common.util.api import new_cid
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.ipc.client import IPCResponse
+    from zato.common.typing_ import any_, anydict, callable_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Each frame starts with a header consisting of the payload's length, a correlation ID and the frame's type
+    Header = Struct('!IQB')
+
+    # Frames larger than that are rejected
+    Max_Payload_Size = 256 * 1024 * 1024
+
+    # How many bytes to buffer when reading from sockets
+    Read_Buffer_Size = 64 * 1024
+
+    # How many connections a server may have waiting to be accepted
+    Backlog = 128
+
+class FrameType:
+    Auth     = 1
+    Request  = 2
+    Response = 3
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _build_frame(frame_type:'int', correlation_id:'int', data:'anydict') -> 'bytes':
+    payload = dumps(data).encode('utf8')
+    return ModuleCtx.Header.pack(len(payload), correlation_id, frame_type) + payload
+
+# ################################################################################################################################
+
+def _read_frame(reader:'any_') -> 'tuple | None':
+    """ Returns a (frame_type, correlation_id, payload) tuple or None if the other side closed the connection.
+    """
+    header = reader.read(ModuleCtx.Header.size)
+
+    if len(header) < ModuleCtx.Header.size:
+        return None
+
+    size, correlation_id, frame_type = ModuleCtx.Header.unpack(header)
+
+    if size > ModuleCtx.Max_Payload_Size:
+        raise ValueError('IPC frame too large ({} > {})'.format(size, ModuleCtx.Max_Payload_Size))
+
+    payload = reader.read(size)
+
+    if len(payload) < size:
+        return None
+
+    return frame_type, correlation_id, payload
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class UnixIPCServer:
+    """ Accepts long-lived connections from other processes of the same server over a Unix domain socket.
+    Requests received through a single connection are handled concurrently and their responses are sent back
+    in the order they are produced, each with the correlation ID of its request.
+    """
+    def __init__(self, path:'str', username:'str', password:'str', callback_func:'callable_') -> 'None':
+        self.path = path
+        self.username = username
+        self.password = password
+        self.callback_func = callback_func
+        self.server = None # type: StreamServer | None
+
+# ################################################################################################################################
+
+    def start(self) -> 'None':
+
+        # A previous process with the same PID may have left its socket behind ..
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        # .. create a new one, accessible to our own user only ..
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        listener.listen(ModuleCtx.Backlog)
+
+        # .. and start to accept connections.
+        self.server = StreamServer(listener, self._handle_connection)
+        self.server.start()
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        if self.server:
+            self.server.stop()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# ################################################################################################################################
+
+    def _check_credentials(self, payload:'bytes') -> 'bool':
+        credentials = loads(payload)
+        username = credentials.get('username') or ''
+        password = credentials.get('password') or ''
+
+        # Both need to be checked each time so as not to let anyone learn which one was invalid
+        is_username_ok = compare_digest(username, self.username)
+        is_password_ok = compare_digest(password, self.password)
+
+        return is_username_ok and is_password_ok
+
+# ################################################################################################################################
+
+    def _handle_connection(self, sock:'socket.socket', _ignored_address:'any_') -> 'None':
+
+        reader = sock.makefile('rb', ModuleCtx.Read_Buffer_Size)
+        write_lock = RLock()
+
+        try:
+
+            # Each connection starts with credentials ..
+            frame = _read_frame(reader)
+            if not frame:
+                return
+
+            frame_type, correlation_id, payload = frame
+            is_auth_ok = frame_type == FrameType.Auth and self._check_credentials(payload)
+            status = Common_IPC.Status_OK if is_auth_ok else 'error'
+
+            sock.sendall(_build_frame(FrameType.Response, correlation_id, {'status': status}))
+
+            if not is_auth_ok:
+                logger.info('Invalid IPC credentials received on `%s`', self.path)
+                return
+
+            # .. and then each frame is an individual request.
+            while True:
+
+                frame = _read_frame(reader)
+                if not frame:
+                    break
+
+                frame_type, correlation_id, payload = frame
+                _ = spawn(self._handle_request, sock, write_lock, correlation_id, payload)
+
+        except Exception:
+            logger.warning('IPC connection error on `%s`, e:`%s`', self.path, format_exc())
+
+        finally:
+            reader.close()
+
+# ################################################################################################################################
+
+    def _handle_request(self, sock:'socket.socket', write_lock:'RLock', correlation_id:'int', payload:'bytes') -> 'None':
+
+        cid = 'zipc{}'.format(new_cid())
+        response = {}
+
+        try:
+            request = Bunch(loads(payload))
+
+            if request.get('action') != SERVER_IPC.INVOKE.value:
+                raise ValueError('Unexpected IPC action `{}`'.format(request.get('action')))
+
+            response = self.callback_func(request)
+            status = Common_IPC.Status_OK
+
+        except Exception:
+            logger.warning(format_exc())
+            status = 'error'
+
+        frame = _build_frame(FrameType.Response, correlation_id, {
+            'cid': cid,
+            'status': status,
+            'response': response,
+        })
+
+        # Responses to concurrent requests cannot be interleaved
+        try:
+            with write_lock:
+                sock.sendall(frame)
+        except Exception:
+            logger.info('Could not send IPC response `%s` to `%s`, e:`%s`', cid, self.path, format_exc())
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class UnixIPCClient:
+    """ Invokes services in another process through a single, persistent, connection to its UnixIPCServer.
+    Any number of greenlets may use the same client concurrently.
+    """
+    def __init__(self, path:'str', username:'str', password:'str') -> 'None':
+        self.path = path
+        self.username = username
+        self.password = password
+
+        self.sock = None # type: socket.socket | None
+        self.connect_lock = RLock()
+        self.write_lock = RLock()
+
+        # Correlation ID -> AsyncResult of each request that has not received its response yet
+        self.pending = {} # type: dict
+        self.correlation_id_counter = count(1)
+
+# ################################################################################################################################
+
+    def _connect(self) -> 'socket.socket':
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+
+        reader = sock.makefile('rb', ModuleCtx.Read_Buffer_Size)
+
+        sock.sendall(_build_frame(FrameType.Auth, 0, {'username': self.username, 'password': self.password}))
+        frame = _read_frame(reader)
+
+        if not (frame and loads(frame[2])['status'] == Common_IPC.Status_OK):
+            reader.close()
+            sock.close()
+            raise Exception('Could not authenticate to IPC server `{}`'.format(self.path))
+
+        _ = spawn(self._read_responses, sock, reader)
+
+        return sock
+
+# ################################################################################################################################
+
+    def connect(self) -> 'socket.socket':
+        """ Returns a connection to the server, establishing it first if there is none yet.
+        """
+        with self.connect_lock:
+            if not self.sock:
+                self.sock = self._connect()
+            return self.sock
+
+# ################################################################################################################################
+
+    def _read_responses(self, sock:'socket.socket', reader:'any_') -> 'None':
+
+        error = None # type: Exception | None
+
+        try:
+            while True:
+                frame = _read_frame(reader)
+                if not frame:
+                    break
+
+                _ignored_frame_type, correlation_id, payload = frame
+
+                # The caller may have already given up waiting
+                result = self.pending.pop(correlation_id, None) # type: AsyncResult
+                if result:
+                    result.set(payload)
+
+        except Exception as e:
+            error = e
+            logger.info('IPC client connection error on `%s`, e:`%s`', self.path, format_exc())
+
+        finally:
+            self._on_disconnected(sock, reader, error)
+
+# ################################################################################################################################
+
+    def _on_disconnected(self, sock:'socket.socket', reader:'any_', error:'Exception | None') -> 'None':
+
+        # A new connection will be established on next use ..
+        if self.sock is sock:
+            self.sock = None
+
+        reader.close()
+        sock.close()
+
+        # .. but requests sent through this one will never receive their responses.
+        error = error or ConnectionError('IPC connection to `{}` closed'.format(self.path))
+
+        for correlation_id, result in list(self.pending.items()):
+            _ = self.pending.pop(correlation_id, None)
+            result.set_exception(error)
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        with self.connect_lock:
+            if self.sock:
+                self.sock.shutdown(socket.SHUT_RDWR)
+                self.sock = None
+
+# ################################################################################################################################
+
+    def invoke(
+        self,
+        service,    # type: str
+        request,    # type: any_
+        *,
+        cluster_name, # type: str
+        server_name,  # type: str
+        server_pid,   # type: int
+        timeout=90,   # type: int | None
+        source_server_name, # type: str | None
+        source_server_pid,  # type: int | None
+    ) -> 'IPCResponse':
+
+        correlation_id = next(self.correlation_id_counter)
+
+        frame = _build_frame(FrameType.Request, correlation_id, {
+            'source_server_name': source_server_name,
+            'source_server_pid':  source_server_pid,
+            'action':   SERVER_IPC.INVOKE.value,
+            'service':  service,
+            'data': request,
+        })
+
+        # Register interest in the response before it can possibly arrive ..
+        result = AsyncResult()
+        self.pending[correlation_id] = result
+
+        try:
+
+            # .. send the request ..
+            sock = self.connect()
+            with self.write_lock:
+                sock.sendall(frame)
+
+            # .. and wait for the response.
+            response = result.get(timeout=timeout)
+
+        finally:
+            _ = self.pending.pop(correlation_id, None)
+
+        return build_ipc_response(loads(response), cluster_name, server_name, server_pid)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -8,12 +8,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import os
+import re
 from logging import getLogger
+from numbers import Number
 
 # JSON Schema
 from jsonschema import validate as js_validate
-from jsonschema.exceptions import ValidationError as JSValidationError
-from jsonschema.validators import validator_for
+from jsonschema.exceptions import best_match, SchemaError, ValidationError as JSValidationError
+from jsonschema.validators import Draft4Validator, Draft6Validator, Draft7Validator, Draft201909Validator, \
+     Draft202012Validator, validator_for
 
 # Zato
 from zato.common.api import CHANNEL, NotGiven
@@ -27,7 +30,7 @@ from zato.common.util.open_ import open_r
 if 0:
     from typing import Callable
     from bunch import Bunch
-    from zato.common.typing_ import anydict
+    from zato.common.typing_ import any_, anydict, callnone, list_
     from zato.server.base.parallel import ParallelServer
     Bunch = Bunch
     Callable = Callable
@@ -41,6 +44,224 @@ logger = getLogger(__name__)
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # Schemas of these drafts can be compiled into Python functions ..
+    Compiled_Drafts = {Draft4Validator, Draft6Validator, Draft7Validator, Draft201909Validator, Draft202012Validator}
+
+    # .. as long as they use only keywords that do not affect validation ..
+    Annotation_Keywords = {'$schema', '$id', 'id', '$comment', 'title', 'description', 'default', 'examples', 'format',
+        'readOnly', 'writeOnly', 'deprecated', 'contentMediaType', 'contentEncoding', 'definitions', '$defs'}
+
+    # .. or ones that are compiled below. Note that format is never checked, as in jsonschema.validate.
+    Compiled_Keywords = {'type', 'properties', 'required', 'additionalProperties', 'items', 'enum', 'const',
+        'minLength', 'maxLength', 'pattern', 'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum',
+        'minItems', 'maxItems'}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _CannotCompile(Exception):
+    pass
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _is_number(value:'any_') -> 'bool':
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+def _is_integer_draft4(value:'any_') -> 'bool':
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_integer(value:'any_') -> 'bool':
+    return _is_integer_draft4(value) or (isinstance(value, float) and value.is_integer())
+
+_type_checks = {
+    'array': lambda value: isinstance(value, list),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+    'number': _is_number,
+    'object': lambda value: isinstance(value, dict),
+    'string': lambda value: isinstance(value, str),
+}
+
+# ################################################################################################################################
+
+def _compile_type(type_:'any_', is_draft4:'bool') -> 'Callable':
+
+    types = type_ if isinstance(type_, list) else [type_]
+    checks = []
+
+    for name in types:
+        if name == 'integer':
+            checks.append(_is_integer_draft4 if is_draft4 else _is_integer)
+        elif name in _type_checks:
+            checks.append(_type_checks[name])
+        else:
+            raise _CannotCompile()
+
+    if len(checks) == 1:
+        return checks[0]
+
+    return lambda value: any(check(value) for check in checks)
+
+# ################################################################################################################################
+
+def _compile_strings(values:'list_[any_]') -> 'Callable':
+    """ Compiles enum or const keywords, but only for strings, which are the only values
+    that Python and JSON Schema compare in the same way.
+    """
+    if not all(isinstance(elem, str) for elem in values):
+        raise _CannotCompile()
+
+    values = frozenset(values)
+    return lambda value: isinstance(value, str) and value in values
+
+# ################################################################################################################################
+
+def _compile(schema:'any_', is_draft4:'bool') -> 'Callable':
+    """ Turns a schema into a function that returns True if a value is valid or False if it may be invalid.
+    """
+    # Boolean schemas accept or reject everything
+    if schema is True or schema is False:
+        if is_draft4:
+            raise _CannotCompile()
+        return (lambda value: True) if schema else (lambda value: False)
+
+    if not isinstance(schema, dict):
+        raise _CannotCompile()
+
+    for keyword in schema:
+        if keyword not in ModuleCtx.Compiled_Keywords and keyword not in ModuleCtx.Annotation_Keywords:
+            raise _CannotCompile()
+
+    # Each element is a function that checks one keyword
+    checks = []
+
+    if 'type' in schema:
+        checks.append(_compile_type(schema['type'], is_draft4))
+
+    if 'enum' in schema:
+        checks.append(_compile_strings(schema['enum']))
+
+    if 'const' in schema:
+        if is_draft4:
+            raise _CannotCompile()
+        checks.append(_compile_strings([schema['const']]))
+
+    # Objects
+    properties = schema.get('properties', {})
+    required = schema.get('required', [])
+    additional = schema.get('additionalProperties', True)
+
+    if properties or required or additional is not True:
+
+        properties = {name: _compile(value, is_draft4) for name, value in properties.items()}
+        required = tuple(required)
+
+        # Note that in draft 4 additionalProperties could be a boolean even if boolean schemas were not allowed
+        if additional is True:
+            additional = None
+        elif additional is False:
+            additional = lambda value: False
+        else:
+            additional = _compile(additional, is_draft4)
+
+        def check_object(value:'any_') -> 'bool':
+            if not isinstance(value, dict):
+                return True
+            for name in required:
+                if name not in value:
+                    return False
+            for name, item in value.items():
+                check = properties.get(name)
+                if check:
+                    if not check(item):
+                        return False
+                elif additional and not additional(item):
+                    return False
+            return True
+
+        checks.append(check_object)
+
+    # Arrays
+    if 'items' in schema:
+        if isinstance(schema['items'], list):
+            raise _CannotCompile()
+        items = _compile(schema['items'], is_draft4)
+        checks.append(lambda value: not isinstance(value, list) or all(items(elem) for elem in value))
+
+    min_items = schema.get('minItems')
+    max_items = schema.get('maxItems')
+
+    if min_items is not None:
+        checks.append(lambda value: not isinstance(value, list) or len(value) >= min_items)
+
+    if max_items is not None:
+        checks.append(lambda value: not isinstance(value, list) or len(value) <= max_items)
+
+    # Strings
+    min_length = schema.get('minLength')
+    max_length = schema.get('maxLength')
+
+    if min_length is not None:
+        checks.append(lambda value: not isinstance(value, str) or len(value) >= min_length)
+
+    if max_length is not None:
+        checks.append(lambda value: not isinstance(value, str) or len(value) <= max_length)
+
+    if 'pattern' in schema:
+        search = re.compile(schema['pattern']).search
+        checks.append(lambda value: not isinstance(value, str) or search(value) is not None)
+
+    # Numbers - in draft 4, exclusive minimums and maximums were modifiers of other keywords rather than numbers
+    if is_draft4 and ('exclusiveMinimum' in schema or 'exclusiveMaximum' in schema):
+        raise _CannotCompile()
+
+    for keyword, is_valid in (
+        ('minimum', lambda value, limit: value >= limit),
+        ('maximum', lambda value, limit: value <= limit),
+        ('exclusiveMinimum', lambda value, limit: value > limit),
+        ('exclusiveMaximum', lambda value, limit: value < limit),
+    ):
+        if keyword in schema:
+            limit = schema[keyword]
+            checks.append(lambda value, is_valid=is_valid, limit=limit: not _is_number(value) or is_valid(value, limit))
+
+    if not checks:
+        return lambda value: True
+
+    if len(checks) == 1:
+        return checks[0]
+
+    checks = tuple(checks)
+
+    def check_all(value:'any_') -> 'bool':
+        for check in checks:
+            if not check(value):
+                return False
+        return True
+
+    return check_all
+
+# ################################################################################################################################
+
+def compile_schema(schema:'any_', validator_class:'type') -> 'callnone':
+    """ Returns a function that quickly accepts values that a schema considers valid, or None if the schema uses keywords
+    that cannot be compiled. Values that the function rejects need to be checked by jsonschema itself, which is needed anyway
+    to find out why they are invalid.
+    """
+    if validator_class not in ModuleCtx.Compiled_Drafts:
+        return None
+
+    try:
+        return _compile(schema, validator_class is Draft4Validator)
+    except (_CannotCompile, re.error, TypeError):
+        return None
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 def get_service_config(item:'anydict', server:'ParallelServer') -> 'anydict':
 
     # By default services are allowed to validate input using JSON Schema
@@ -164,7 +385,8 @@ class ValidationConfig:
     """ An individual set of configuration options - each object requiring validation (e.g. each channel)
     will have its own instance of this class assigned to its validator.
     """
-    __slots__ = 'is_enabled', 'object_type', 'object_name', 'schema_path', 'schema', 'validator', 'needs_err_details'
+    __slots__ = 'is_enabled', 'object_type', 'object_name', 'schema_path', 'schema', 'validator', 'is_valid', \
+        'needs_err_details'
 
     def __init__(self):
         self.is_enabled = None   # type: bool
@@ -177,6 +399,7 @@ class ValidationConfig:
         self.schema_path = None # type: str
         self.schema = None      # type: dict
         self.validator = None   # type: object
+        self.is_valid = None    # type: callnone
         self.needs_err_details = None # type: bool
 
 # ################################################################################################################################
@@ -237,26 +460,62 @@ class Validator:
         # Parse the contents as JSON
         schema = loads(schema)
 
-        # Assign the schema and validator for the schema for later use
+        # Assign the schema for later use ..
         self.config.schema = schema
-        self.config.validator = validator_for(schema)
+
+        # .. check it once instead of each time data is validated ..
+        validator_class = validator_for(schema)
+
+        try:
+            validator_class.check_schema(schema)
+        except SchemaError as e:
+
+            # .. an invalid schema cannot be used so each validation will report it, as it always did ..
+            logger.warning('Invalid JSON Schema `%s` (%s) -> `%s`', self.config.schema_path, self.config.object_name, e)
+            self.config.validator = validator_class
+
+        else:
+
+            # .. otherwise, the same validator object is reused for each validation, ..
+            self.config.validator = validator_class(schema)
+
+            # .. and, if possible, valid data is recognized by a function compiled from the schema.
+            self.config.is_valid = compile_schema(schema, validator_class)
 
         # Everything is set up = we are initialized
         self.is_initialized = True
 
-    def validate(self, cid, data, object_type=None, object_name=None, needs_err_details=False, _validate=js_validate):
-        # type: (str, object, str, str, Callable) -> Result
+    def validate(self, cid, data, object_type=None, object_name=None, needs_err_details=False, _validate=js_validate,
+        _best_match=best_match, _type=type):
+        # type: (str, object, str, str, Callable, Callable, type) -> Result
 
         # Result we will return
         result = Result()
         result.cid = cid
 
+        # Most of the time, data is valid, which a compiled schema can confirm the fastest
+        is_valid = self.config.is_valid
+        if is_valid and is_valid(data):
+            result.is_ok = True
+            return result
+
         object_type = object_type or self.config.object_type
         object_name or self.config.object_name
         needs_err_details = needs_err_details or self.config.needs_err_details
 
         try:
-            js_validate(data, self.config.schema, self.config.validator)
+            validator = self.config.validator
+
+            # A validator object means that the schema was already checked ..
+            if not isinstance(validator, _type):
+                error = _best_match(validator.iter_errors(data))
+                if error is not None:
+                    raise error
+
+            # .. otherwise, it is invalid and jsonschema will report it.
+            else:
+                _validate(data, self.config.schema, validator)
+
         except JSValidationError as e:
 
             # These will be always used, no matter the object/channel type
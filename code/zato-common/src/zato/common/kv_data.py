@@ -8,6 +8,11 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # Zato
 from datetime import datetime, timedelta
+
+# SQLAlchemy
+from sqlalchemy.exc import IntegrityError
+
+# Zato
 from zato.common.odb.model import KVData as KVDataModel
 from zato.common.typing_ import dataclass, optional
 
@@ -114,5 +119,47 @@ class KVDataAPI:
         session.add(item)
         session.commit()
 
+# ################################################################################################################################
+
+    def upsert(self, key, value):
+        # type: (str, str) -> None
+        """ Sets a key to a new value, no matter if the key already exists or not.
+        """
+        # We always operate on bytes
+        key = key.encode('utf8') if isinstance(key, str) else key
+        value = value.encode('utf8') if isinstance(value, str) else value
+
+        session = self._get_session()
+
+        # .. first, try to update an existing key ..
+        updated = session.query(KVDataModel).\
+            filter(KVDataModel.cluster_id==self.cluster_id).\
+            filter(KVDataModel.key==key).\
+            update({'value': value, 'creation_time': utcnow()}, synchronize_session=False)
+
+        # .. if there was no such key, we need to insert it ..
+        if not updated:
+
+            item = KVDataModel()
+            item.cluster_id = self.cluster_id
+            item.key = key
+            item.value = value
+            item.creation_time = utcnow()
+            item.expiry_time = default_expiry_time
+            session.add(item)
+
+            # .. but another process may have just inserted it, in which case it is enough to update it.
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                session.query(KVDataModel).\
+                    filter(KVDataModel.cluster_id==self.cluster_id).\
+                    filter(KVDataModel.key==key).\
+                    update({'value': value, 'creation_time': utcnow()}, synchronize_session=False)
+                session.commit()
+        else:
+            session.commit()
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -56,6 +56,14 @@ _None_Type = type(None)
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # Under this attribute, each model class keeps its compiled ModelPlan
+    Plan_Attr = '_zato_model_plan'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 def is_list(field_type:'Field', is_class:'bool') -> 'bool':
 
     # Using str is the only reliable method
@@ -270,17 +278,6 @@ class DictCtx:
         # We can check it once upfront and make it point to either init_attrs or setattr_attrs
         self.attrs_container = cast_('dict', None) # type: dictnone
 
-# ################################################################################################################################
-
-    def init(self):
-
-        # Whether the dataclass defines the __init__method
-        dataclass_params = getattr(self.DataClass, _PARAMS, None)
-        self.has_init = dataclass_params.init if dataclass_params else False
-
-        self.attrs_container = self.init_attrs if self.has_init else self.setattr_attrs
-        self.fields = getattr(self.DataClass, _FIELDS) # type: dictnone
-
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -322,90 +319,209 @@ class FieldCtx:
 
 # ################################################################################################################################
 
-    def init(self):
-
-        # Assume that we do not have any value
-        value = ZatoNotGiven
-
-        # If we have extra data, that will take priority over our regular dict, which is why we check it first here.
-        if self.has_extra:
-            if self.dict_ctx.extra:
-                value = self.dict_ctx.extra.get(self.name, ZatoNotGiven)
-
-        # If we do not have a value here, it means that we have no extra,
-        # or that it did not contain the expected value so we look it up in the current dictionary.
-        if value == ZatoNotGiven:
-            if isinstance(self.dict_ctx.current_dict, dict):
-                value = self.dict_ctx.current_dict.get(self.name, ZatoNotGiven)
-            elif isinstance(self.dict_ctx.current_dict, Model): # type: ignore
-                value = getattr(self.dict_ctx.current_dict, self.name, ZatoNotGiven)
-
-        # If this field has a value, we can try to parse it into a specific type ..
-        if value and (value != ZatoNotGiven):
-
-            try:
-                # .. as an integer ..
-                if self.field_type is int:
-                    if not isinstance(value, int):
-                        value = int(value)
-
-                if self.field_type is date_:
-                    if not isinstance(value, date_):
-                        value = dt_parse(value).date() # type: ignore
-
-                # .. as a datetime object ..
-                elif self.field_type in (datetime_, datetimez):
-                    if not isinstance(value, (date_, datetime_, datetimez)):
-                        _is_datetimez = self.field_type is datetimez
-                        value = dt_parse(value) # type: ignore
-                        if _is_datetimez:
-                            value = datetimez(
-                                year=value.year,
-                                month=value.month,
-                                day=value.day,
-                                hour=value.hour,
-                                minute=value.minute,
-                                second=value.second,
-                                microsecond=value.microsecond,
-                                tzinfo=value.tzinfo,
-                                fold=value.fold,
-                            )
-
-                # .. as a datetime object formatted as string ..
-                elif self.field_type is isotimestamp:
-                    if isinstance(value, str):
-                        value = dt_parse(value) # type: ignore
-                        value = value.isoformat()
-
-            except Exception as e:
-                msg = f'Value `{repr(value)}` of field {self.name} could not be parsed -> {e} -> {self.dict_ctx.current_dict}'
-                raise Exception(msg)
-
-        # At this point, we know there will be something to assign although it still may be ZatoNotGiven.
-        self.value = value
-
-        self.is_class = isclass(self.field.type)
-        self.is_model = self.is_class and issubclass(self.field.type, Model)
-        self.is_list = is_list(self.field.type, self.is_class) # type: ignore
-
-        #
-        # This is a list and we need to check if its definition
-        # contains information about the actual type of elements inside.
-        #
-        # If it does, in runtime, we will be extracting that particular type.
-        # Otherwise, we will just pass this list on as it is.
-        #
+    def get_name(self):
+        if self.dict_ctx.list_idx is not None:
+            return '{}[{}]'.format(self.name, self.dict_ctx.list_idx)
+        else:
+            return self.name
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _get_empty_value(field_type:'any_') -> 'any_':
+    """ Returns a value for an optional field that was not given on input and that has no default.
+    """
+    # This is the most reliable way
+    if 'typing.List' in str(field_type):
+        return []
+    elif field_type is Any:
+        return None
+    elif issubclass(field_type, str):
+        return ''
+    elif issubclass(field_type, int):
+        return 0
+    elif issubclass(field_type, list):
+        return []
+    elif issubclass(field_type, dict):
+        return {}
+    elif issubclass(field_type, float):
+        return 0.0
+    else:
+        return None
+
+# ################################################################################################################################
+
+def _parse_int(value:'any_') -> 'any_':
+    if not isinstance(value, int):
+        value = int(value)
+    return value
+
+def _parse_date(value:'any_') -> 'any_':
+    if not isinstance(value, date_):
+        value = dt_parse(value).date() # type: ignore
+    return value
+
+def _parse_datetime(value:'any_') -> 'any_':
+    if not isinstance(value, (date_, datetime_, datetimez)):
+        value = dt_parse(value) # type: ignore
+    return value
+
+def _parse_datetimez(value:'any_') -> 'any_':
+    if not isinstance(value, (date_, datetime_, datetimez)):
+        value = dt_parse(value) # type: ignore
+        value = datetimez(
+            year=value.year,
+            month=value.month,
+            day=value.day,
+            hour=value.hour,
+            minute=value.minute,
+            second=value.second,
+            microsecond=value.microsecond,
+            tzinfo=value.tzinfo,
+            fold=value.fold,
+        )
+    return value
+
+def _parse_isotimestamp(value:'any_') -> 'any_':
+    if isinstance(value, str):
+        value = dt_parse(value) # type: ignore
+        value = value.isoformat()
+    return value
+
+# Maps field types to functions that parse input values of these types
+_parsers = {
+    int: _parse_int,
+    date_: _parse_date,
+    datetime_: _parse_datetime,
+    datetimez: _parse_datetimez,
+    isotimestamp: _parse_isotimestamp,
+}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FieldPlan:
+    """ Everything about a single field of a model that can be established once, without looking at any input data.
+    """
+    __slots__ = 'name', 'field', 'field_type', 'is_required', 'is_class', 'is_model', 'is_list', 'model_class', \
+        'contains_model', 'default', 'default_factory', 'parse_func', 'empty_value', 'empty_value_func', \
+        'needs_empty_value_copy'
+
+    def __init__(self, field:'Field') -> 'None':
+
+        self.field = field
+        self.name = field.name # type: str
+
+        # Assume we are required ..
+        self.is_required = True
+
+        # Use this by default ..
+        self.field_type = field.type
+
+        # .. unless it is a union with None = this field is really optional[type_]
+        if is_union(field.type):
+            _, self.field_type, union_with = extract_from_union(field.type)
+
+            # .. check if this was an optional field.
+            self.is_required = not (union_with is _None_Type)
+
+        self.is_class = isclass(field.type)
+        self.is_model = self.is_class and issubclass(field.type, Model)
+        self.is_list = is_list(field.type, self.is_class) # type: ignore
+
+        # Lists may declare the type of elements inside, in which case we will be extracting that particular type
         if self.is_list:
-            self.model_class = extract_model_class(self.field.type) # type: ignore
+            self.model_class = extract_model_class(field.type) # type: ignore
             self.contains_model = bool(self.model_class and hasattr(self.model_class, _FIELDS))
+        else:
+            self.model_class = None
+            self.contains_model = False
+
+        self.default = field.default
+        self.default_factory = field.default_factory
+
+        # This is None if values of this field's type are not parsed
+        self.parse_func = _parsers.get(self.field_type)
+
+        # If we can compute it upfront, this is what optional fields without a default are given ..
+        try:
+            self.empty_value = _get_empty_value(self.field_type)
+        except Exception:
+
+            # .. if we cannot, we will be computing it each time, which will raise the same exception to our caller ..
+            self.empty_value = None
+            self.empty_value_func = _get_empty_value
+        else:
+            self.empty_value_func = None
+
+        # .. mutable values need to be different for each instance.
+        self.needs_empty_value_copy = isinstance(self.empty_value, (list, dict))
 
 # ################################################################################################################################
 
-    def get_name(self):
-        if self.dict_ctx.list_idx is not None:
-            return '{}[{}]'.format(self.name, self.dict_ctx.list_idx)
+    def get_empty_value(self) -> 'any_':
+        if self.empty_value_func:
+            return self.empty_value_func(self.field_type)
+        elif self.needs_empty_value_copy:
+            return self.empty_value.copy() # type: ignore
         else:
-            return self.name
+            return self.empty_value
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModelPlan:
+    """ A model class compiled into what is needed to create its instances out of input dicts.
+    """
+    __slots__ = 'DataClass', 'has_init', 'fields', 'field_plans'
+
+    def __init__(self, DataClass:'any_') -> 'None':
+
+        self.DataClass = DataClass
+
+        # Whether the dataclass defines the __init__method
+        dataclass_params = getattr(DataClass, _PARAMS, None)
+        self.has_init = dataclass_params.init if dataclass_params else False
+
+        # All the fields, in the order that we visit them in
+        self.fields = getattr(DataClass, _FIELDS) # type: anydict
+        self.field_plans = [FieldPlan(field) for _ignored_name, field in sorted(self.fields.items())]
+
+# ################################################################################################################################
+
+def get_model_plan(DataClass:'any_') -> 'ModelPlan':
+    """ Returns a compiled plan for the model class given on input, compiling it first if it is the first time we see it.
+    """
+    # We look up the class's own __dict__ because a subclass must never use the plan of its parent
+    plan = DataClass.__dict__.get(ModuleCtx.Plan_Attr)
+
+    if not plan:
+        plan = ModelPlan(DataClass)
+        setattr(DataClass, ModuleCtx.Plan_Attr, plan)
+
+    return plan
+
+# ################################################################################################################################
+
+def compile_model(DataClass:'any_', _visited:'optional[set]'=None) -> 'None':
+    """ Compiles a model class along with all the models that it contains. This is called when services are deployed
+    so that no request ever needs to compile any model.
+    """
+    _visited = _visited if _visited is not None else set()
+
+    # Models can refer to themselves
+    if DataClass in _visited:
+        return
+    else:
+        _visited.add(DataClass)
+
+    plan = get_model_plan(DataClass)
+
+    for field_plan in plan.field_plans:
+        if field_plan.is_model:
+            compile_model(field_plan.field.type, _visited)
+        elif field_plan.contains_model:
+            compile_model(field_plan.model_class, _visited)
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -483,6 +599,29 @@ class MarshalAPI:
         if not isinstance(value, list):
             raise self.get_validation_error(field_ctx, error_class=ElementIsNotAList)
 
+# ################################################################################################################################
+
+    def _get_field_ctx(
+        self,
+        dict_ctx,   # type: DictCtx
+        field_plan, # type: FieldPlan
+        parent,     # type: optional[FieldCtx]
+        value,      # type: any_
+    ) -> 'FieldCtx':
+        """ Builds a context object for a field that is a parent of other fields or that failed validation.
+        """
+        field_ctx = FieldCtx(dict_ctx, field_plan.field, parent)
+        field_ctx.value = value
+        field_ctx.field_type = field_plan.field_type
+        field_ctx.is_required = field_plan.is_required
+        field_ctx.is_class = field_plan.is_class
+        field_ctx.is_model = field_plan.is_model
+        field_ctx.is_list = field_plan.is_list
+        field_ctx.model_class = field_plan.model_class
+        field_ctx.contains_model = field_plan.contains_model
+
+        return field_ctx
+
 # ################################################################################################################################
 
     def from_dict(
@@ -492,136 +631,111 @@ class MarshalAPI:
         DataClass:    'any_',
         extra:        'dictnone' = None,
         list_idx:     'intnone'  = None,
-        parent:       'optional[FieldCtx]' = None
+        parent:       'optional[FieldCtx]' = None,
+        _ZatoNotGiven:'any_' = ZatoNotGiven,
         ) -> 'any_':
 
+        # Everything that can be known about the model without looking at input data is in its compiled plan
+        plan = DataClass.__dict__.get(ModuleCtx.Plan_Attr) or get_model_plan(DataClass)
+
         dict_ctx = DictCtx(service, current_dict, DataClass, extra, list_idx, parent)
-        dict_ctx.init()
+        dict_ctx.has_init = plan.has_init
+        dict_ctx.fields = plan.fields
 
-        # All fields that we will visit
-        field_items = sorted(dict_ctx.fields.items()) # type: any_
+        attrs_container = dict_ctx.init_attrs if plan.has_init else dict_ctx.setattr_attrs
+        dict_ctx.attrs_container = attrs_container
 
-        for _ignored_name, _field in field_items:
+        # Extra data can only ever overwrite top-level elements
+        has_extra = extra and (not parent)
 
-            # Assume we are required ..
-            is_required = True
+        # We can check it once for all the fields
+        is_dict = isinstance(current_dict, dict)
+        is_model_input = (not is_dict) and isinstance(current_dict, Model)
 
-            # Use this by default ..
-            field_type = _field.type
+        for field_plan in plan.field_plans:
 
-            # .. unless it is a union with None = this field is really optional[type_]
-            if is_union(_field.type):
-                result = extract_from_union(_field.type)
-                _, field_type, union_with = result
+            name = field_plan.name
+            value = _ZatoNotGiven
 
-                # .. check if this was an optional field.
-                is_required = not (union_with is _None_Type)
+            # If we have extra data, that will take priority over our regular dict ..
+            if has_extra:
+                value = extra.get(name, _ZatoNotGiven) # type: ignore
 
-            # Represents a current field in the model in the context of the input dict ..
-            field_ctx = FieldCtx(dict_ctx, _field, parent)
-            field_ctx.is_required = is_required
-            field_ctx.field_type = field_type
+            # .. if it did not contain the expected value, we look it up in the current dictionary ..
+            if value is _ZatoNotGiven:
+                if is_dict:
+                    value = current_dict.get(name, _ZatoNotGiven) # type: ignore
+                elif is_model_input:
+                    value = getattr(current_dict, name, _ZatoNotGiven)
 
-            # .. this call will populate the initial value of the field as well (field_ctx..
-            field_ctx.init()
+            # .. if this field has a value, we can try to parse it into a specific type.
+            if field_plan.parse_func and value and (value is not _ZatoNotGiven):
+                try:
+                    value = field_plan.parse_func(value)
+                except Exception as e:
+                    msg = f'Value `{repr(value)}` of field {name} could not be parsed -> {e} -> {current_dict}'
+                    raise Exception(msg)
 
             # If this field points to a model ..
-            if field_ctx.is_model:
+            if field_plan.is_model:
+
+                field_ctx = self._get_field_ctx(dict_ctx, field_plan, parent, value)
 
                 # .. first, we need a dict as value as it is the only container that we can extract model fields from ..
                 self._self_require_dict_or_model(field_ctx)
 
-                # .. if we are here, it means that we can check the dict and extract its fields,
-                # but note that we do not pass extra data on to nested models
-                # because we can only ever overwrite top-level elements with what extra contains.
-                field_ctx.value = self.from_field_ctx(field_ctx)
+                # .. but note that we do not pass extra data on to nested models.
+                value = self.from_field_ctx(field_ctx)
 
             # .. if this field points to a list ..
-            elif field_ctx.is_list:
-
-                # If we have a model class the elements of the list are of,
-                # we need to visit each of them now.
-                if field_ctx.model_class:
+            elif field_plan.is_list:
 
-                    # Enter further only if we have any value at all to check ..
-                    if field_ctx.value and field_ctx.value != ZatoNotGiven: # type: ignore
+                # If we have a model class the elements of the list are of, we need to visit each of them now ..
+                if field_plan.model_class:
 
-                        # .. if the field is required, make sure that what we have on input really is a list object ..
-                        if field_ctx.is_required:
-                            self._ensure_value_is_a_list(field_ctx, field_ctx.value)
-
-                        # However, that model class may actually point to <type 'str'> types
-                        # in case of fields like strlist, and we need to take that into account
-                        # before entering the _visit_list method below.
-                        if field_ctx.is_model or field_ctx.contains_model:
-                            field_ctx.value = self._visit_list(field_ctx)
+                    # .. enter further only if we have any value at all to check ..
+                    if value and value is not _ZatoNotGiven:
 
-                    # .. if we are here, it may be because the value is a dictlist instance
-                    # .. for which there will be no underlying model and we can just assign it as is ..
-                    else:
+                        field_ctx = self._get_field_ctx(dict_ctx, field_plan, parent, value)
 
-                        #
-                        # Object current_field may be returned by a default factory
-                        # in declarations, such as the one below. This is why we need to
-                        # ensure that this name exist in current_dict before we extract its value.
-                        #
-                        #
-                        # @dataclass(init=False, repr=False)
-                        # class MyModel(Model):
-                        #     my_list: anylistnone = list_field()
-                        #     my_dict: anydictnone = dict_field()
-                        #
-                        if field_ctx.name in current_dict:
+                        # .. if the field is required, make sure that what we have on input really is a list object ..
+                        if field_plan.is_required:
+                            self._ensure_value_is_a_list(field_ctx, value)
 
-                            # .. extract the value first ..
-                            value = current_dict[field_ctx.name]
+                        # .. however, that model class may actually point to <type 'str'> types in case of fields like strlist.
+                        if field_plan.is_model or field_plan.contains_model:
+                            value = self._visit_list(field_ctx)
 
-                            # .. if the field is required, make sure that what we have on input really is a list object ..
-                            if field_ctx.is_required:
-                                self._ensure_value_is_a_list(field_ctx, value)
+                # .. otherwise, there is no underlying model (e.g. dictlist), and we can assign the list as it is,
+                # assuming that it exists in current_dict, i.e. that it is not to be returned by a default factory.
+                elif name in current_dict:
 
-                            # .. assign the list now.
-                            field_ctx.value = value
+                    value = current_dict[name]
 
-            # If we do not have a value yet, perhaps we will find a default one
-            if field_ctx.value == ZatoNotGiven:
+                    # .. if the field is required, make sure that what we have on input really is a list object ..
+                    if field_plan.is_required:
+                        field_ctx = self._get_field_ctx(dict_ctx, field_plan, parent, value)
+                        self._ensure_value_is_a_list(field_ctx, value)
 
-                default = field_ctx.field.default
-                default_factory = field_ctx.field.default_factory
+            # If we do not have a value yet, perhaps we will find a default one ..
+            if value is _ZatoNotGiven:
 
-                if default is not MISSING:
-                    field_ctx.value = default
+                if field_plan.default is not MISSING:
+                    value = field_plan.default
 
-                elif default_factory and default_factory is not MISSING:
-                    field_ctx.value = default_factory()
+                elif field_plan.default_factory and field_plan.default_factory is not MISSING:
+                    value = field_plan.default_factory()
 
-            # Let's check if we found any value
-            if field_ctx.value != ZatoNotGiven:
-                value = field_ctx.value
-            else:
-                if field_ctx.is_required:
-                    raise self.get_validation_error(field_ctx)
-                else:
-                    # This is the most reliable way
-                    if 'typing.List' in str(field_ctx.field_type):
-                        value = []
-                    elif field_ctx.field_type is Any:
-                        value = None
-                    elif issubclass(field_ctx.field_type, str):
-                        value = ''
-                    elif issubclass(field_ctx.field_type, int):
-                        value = 0
-                    elif issubclass(field_ctx.field_type, list):
-                        value = []
-                    elif issubclass(field_ctx.field_type, dict):
-                        value = {}
-                    elif issubclass(field_ctx.field_type, float):
-                        value = 0.0
+                # .. if not, it is an error unless the field is optional.
+                if value is _ZatoNotGiven:
+                    if field_plan.is_required:
+                        field_ctx = self._get_field_ctx(dict_ctx, field_plan, parent, value)
+                        raise self.get_validation_error(field_ctx)
                     else:
-                        value = None
+                        value = field_plan.get_empty_value()
 
             # Assign the value now
-            dict_ctx.attrs_container[field_ctx.name] = value # type: ignore
+            attrs_container[name] = value
 
         # Create a new instance, potentially with attributes ..
         instance = DataClass(**dict_ctx.init_attrs) # type: Model
@@ -635,7 +749,7 @@ class MarshalAPI:
 
             ctx = ModelCtx()
             ctx.service = service
-            ctx.data = dict_ctx.current_dict
+            ctx.data = current_dict
             ctx.DataClass = DataClass
 
             instance.after_created(ctx)
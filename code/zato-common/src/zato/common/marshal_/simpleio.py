@@ -7,6 +7,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from inspect import isclass
 from logging import getLogger
 from traceback import format_exc
 
@@ -15,7 +16,7 @@ from orjson import loads
 
 # Zato
 from zato.common import DATA_FORMAT
-from zato.common.marshal_.api import Model
+from zato.common.marshal_.api import compile_model, Model
 from zato.common.pubsub import PubSubMessage
 
 # ################################################################################################################################
@@ -83,6 +84,11 @@ class DataClassSimpleIO:
             sio.service_class = class_
             class_._sio = sio
 
+            # Compile the input model now so that requests do not need to do it
+            input = getattr(user_sio, 'input', None)
+            if isclass(input) and issubclass(input, Model):
+                compile_model(input)
+
         except Exception:
             logger.warning('Could not attach DataClassSimpleIO to class `%s`, e:`%s`', class_, format_exc())
             raise
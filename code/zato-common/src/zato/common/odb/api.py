@@ -800,13 +800,14 @@ class ODBManager(SessionWrapper):
 # ################################################################################################################################
 
     def get_basic_data_deployed_service_list(self):
-        """ Returns basic information about all the deployed services in ODB.
+        """ Returns basic information about all the deployed services in ODB. Only hashes of the source code are returned,
+        rather than the source code itself, because they are enough to tell whether a service has changed.
         """
         with closing(self.session()) as session:
 
             query = select([
                 ServiceTable.c.name,
-                DeployedServiceTable.c.source,
+                DeployedServiceTable.c.source_hash,
             ]).where(and_(
                 DeployedServiceTable.c.service_id==ServiceTable.c.id,
                 DeployedServiceTable.c.server_id==self.server_id
@@ -31,3 +31,18 @@ def current_period_list(session, cluster_id):
     return session.query(RateLimitState.period)
 
 # ################################################################################################################################
+
+def state_list(session, cluster_id, periods):
+    """ Returns how many requests there were for each object and network in the given periods, as stored in ODB.
+    """
+    return session.query(
+        RateLimitState.object_type,
+        RateLimitState.object_id,
+        RateLimitState.period,
+        RateLimitState.last_network,
+        RateLimitState.requests,
+        ).\
+        filter(RateLimitState.cluster_id==cluster_id).\
+        filter(RateLimitState.period.in_(periods))
+
+# ################################################################################################################################
@@ -8,9 +8,12 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 from contextlib import closing
+from datetime import datetime
 from logging import getLogger
+from traceback import format_exc
 
 # gevent
+from gevent import sleep, spawn
 from gevent.lock import RLock
 
 # netaddr
@@ -20,7 +23,9 @@ from netaddr import IPNetwork
 from sqlalchemy import and_
 
 # Zato
+from zato.common.odb.query.rate_limiting import state_list
 from zato.common.rate_limiting.common import Const, DefinitionItem, ObjectInfo
+from zato.common.rate_limiting.counters import ModuleCtx as CountersCtx, SharedCounters
 from zato.common.rate_limiting.limiter import Approximate, Exact, RateLimitStateDelete, RateLimitStateTable
 
 # ################################################################################################################################
@@ -28,7 +33,7 @@ from zato.common.rate_limiting.limiter import Approximate, Exact, RateLimitState
 
 if 0:
     from zato.common.rate_limiting.limiter import BaseLimiter
-    from zato.common.typing_ import callable_, dict_, list_, strdict
+    from zato.common.typing_ import any_, anylist, callable_, dict_, list_, strdict
     from zato.distlock import LockManager
 
     # For pyflakes
@@ -139,7 +144,8 @@ class DefinitionParser:
 class RateLimiting:
     """ Main API for the management of rate limiting functionality.
     """
-    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id'
+    __slots__ = 'parser', 'config_store', 'lock', 'sql_session_func', 'global_lock_func', 'cluster_id', 'counters', \
+        'keep_syncing'
 
     def __init__(self) -> 'None':
         self.parser = DefinitionParser() # type: DefinitionParser
@@ -148,6 +154,8 @@ class RateLimiting:
         self.global_lock_func = None     # type: LockManager
         self.sql_session_func = None     # type: callable_
         self.cluster_id = None           # type: int
+        self.counters = SharedCounters() # type: SharedCounters
+        self.keep_syncing = False
 
 # ################################################################################################################################
 
@@ -230,6 +238,12 @@ class RateLimiting:
 # ################################################################################################################################
 
     def _delete_from_odb(self, object_type:'str', object_id:'int') -> 'None':
+
+        # Delete the counters first, otherwise they could be stored in the ODB again before they are deleted
+        object_id_str = str(object_id)
+        self.counters.delete(lambda _object_type, _object_id, _period, _network:
+            _object_type == object_type and _object_id == object_id_str)
+
         with closing(self.sql_session_func()) as session:
             session.execute(RateLimitStateDelete().where(and_(
                 RateLimitStateTable.c.object_type==object_type,
@@ -350,5 +364,123 @@ class RateLimiting:
         for config in self.config_store.values(): # type: BaseLimiter
             config.cleanup()
 
+# ################################################################################################################################
+
+    def _store_counters(self, session:'any_', claimed:'anylist', _utcnow:'callable_'=datetime.utcnow) -> 'None':
+        """ Adds to the ODB requests counted since the counters were last synchronized.
+        """
+        now = _utcnow()
+        table = RateLimitStateTable
+
+        for key, delta in claimed:
+
+            # Nothing was counted for that key since the last time
+            if not delta:
+                continue
+
+            object_type, object_id, period, network = self.counters.parse_key(key)
+            last_cid, last_from, last_request_time_utc = self.counters.last_info.get(key, ('', '', now))
+
+            where = and_(
+                table.c.cluster_id==self.cluster_id,
+                table.c.object_type==object_type,
+                table.c.object_id==object_id,
+                table.c.period==period,
+                table.c.last_network==network,
+            )
+
+            result = session.execute(table.update().where(where).values({
+                'requests': table.c.requests + delta,
+                'last_cid': last_cid,
+                'last_from': last_from,
+                'last_request_time_utc': last_request_time_utc,
+            }))
+
+            # No one has stored this key yet
+            if not result.rowcount:
+                session.execute(table.insert().values({
+                    'cluster_id': self.cluster_id,
+                    'object_type': object_type,
+                    'object_id': object_id,
+                    'period': period,
+                    'requests': delta,
+                    'last_cid': last_cid,
+                    'last_from': last_from,
+                    'last_network': network,
+                    'last_request_time_utc': last_request_time_utc,
+                }))
+
+# ################################################################################################################################
+
+    def sync_counters(self) -> 'None':
+        """ Stores in the ODB requests counted in shared counters since the last time and updates the counters
+        with requests counted by other servers. Only one process on a host does it at a time.
+        """
+        # There is nothing to synchronize without exact definitions ..
+        exact = [config for config in list(self.config_store.values()) if config.is_exact]
+        if not exact:
+            return
+
+        claimed = self.counters.claim()
+
+        # .. or if another process on this host is doing it already.
+        if claimed is None:
+            return
+
+        # Store what we counted ..
+        try:
+            with closing(self.sql_session_func()) as session:
+                self._store_counters(session, claimed)
+                session.commit()
+        except Exception:
+
+            # .. if we could not do it, the requests will be stored the next time ..
+            self.counters.unclaim(claimed)
+            logger.warning('Could not store rate limiting counters, e:`%s`', format_exc())
+            return
+
+        # .. and learn what other servers counted, which matters only for periods that have not ended yet.
+        totals = {} # type: dict_[bytes, int]
+        periods = list(exact[0].get_current_periods(datetime.utcnow()).values())
+
+        with closing(self.sql_session_func()) as session:
+            for object_type, object_id, period, network, requests in state_list(session, self.cluster_id, periods).all():
+                totals[self.counters.get_key(object_type, object_id, period, network)] = requests
+
+        self.counters.set_remote(totals)
+
+# ################################################################################################################################
+
+    def _run_sync_counters(self, _sleep:'callable_'=sleep) -> 'None':
+        while self.keep_syncing:
+            _sleep(CountersCtx.Sync_Interval)
+            try:
+                self.sync_counters()
+            except Exception:
+                logger.warning('Could not synchronize rate limiting counters, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def start_sync_counters(self) -> 'None':
+        """ Starts a background greenlet that synchronizes shared counters with the ODB.
+        """
+        self.keep_syncing = True
+        _ = spawn(self._run_sync_counters)
+
+# ################################################################################################################################
+
+    def stop_sync_counters(self) -> 'None':
+        """ Stops the background synchronization, storing in the ODB whatever has not been stored yet.
+        """
+        self.keep_syncing = False
+
+        try:
+            self.sync_counters()
+        except Exception:
+            logger.warning('Could not store rate limiting counters on stop, e:`%s`', format_exc())
+
+        # Another process may take over now rather than when our lease expires
+        self.counters.release_claim()
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from hashlib import blake2b
+from logging import getLogger
+from mmap import mmap
+from os import getpid
+from struct import Struct
+from time import time
+from traceback import format_exc
+
+try:
+    import posix_ipc as ipc
+except ImportError:
+    # Ignore it under Windows
+    ipc = None
+
+# Zato
+from zato.common.util.posix_ipc_ import semaphore_lock
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, anylist, callable_, intnone, strlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_shmem_pattern = '/zato-rate-limit-{}'
+_lock_pattern = '{}-lock'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Identifies shared memory laid out the way this module expects it
+    Magic = b'ZATORLC1'
+
+    # Magic, slot count, PID of the process that synchronizes counters with the ODB and until when it is allowed to do it
+    Header = Struct('<8sIId')
+    Header_Size = 64
+
+    # Key hash, key, and how many requests there were - in total on this host, how many of them are already in the ODB
+    # and how many requests other hosts stored in the ODB.
+    Slot = Struct('<Q192sqqq')
+    Key_Size = 192
+
+    # Where the counters begin in a slot
+    Count_Offset = 8 + Key_Size
+
+    # How many counters there can be on a host at most
+    Slot_Count = 4096
+
+    # How long to wait for other processes before giving up
+    Lock_Timeout = 5
+
+    # How often counters are synchronized with the ODB ..
+    Sync_Interval = 1
+
+    # .. and for how long a process may do it without other processes taking over.
+    Sync_Lease_Time = 30
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _InProcessLock:
+    """ Used when counters are not shared with other processes - there is nothing to lock then
+    because counters are never accessed with a greenlet switch in between.
+    """
+    def acquire(self, *ignored:'any_') -> 'None':
+        pass
+
+    def release(self) -> 'None':
+        pass
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SharedCounters:
+    """ Counters of requests to objects with exact rate limiting, each key being an object, its period and network.
+    The counters are kept in a fixed-size hash table in shared memory, which means that all the server processes
+    on a host count requests together, without accessing the ODB. One of the processes periodically stores
+    what was counted in the ODB and reads back how many requests other hosts counted in the meantime.
+
+    This makes the limits exact within a host and, across hosts, exact within the time it takes to synchronize the counters.
+    Until create is called, the counters are kept in memory of the current process only.
+    """
+    def __init__(self, slot_count:'int'=ModuleCtx.Slot_Count) -> 'None':
+        self.slot_count = slot_count
+        self.size = ModuleCtx.Header_Size + self.slot_count * ModuleCtx.Slot.size
+        self.shmem_name = ''
+        self.pid = getpid()
+        self.is_shared = False
+
+        self._mem = None
+        self._mmap = bytearray(self.size) # type: any_
+        self._lock = _InProcessLock() # type: any_
+
+        # Key -> (cid, from, request time) of the last request that this process counted
+        self.last_info = {} # type: anydict
+
+        self.store_initial()
+
+# ################################################################################################################################
+
+    def create(self, deployment_key:'str', needs_create:'bool'=True) -> 'None':
+        """ Moves the counters to shared memory, which each server process on a host should do for the same deployment key.
+        """
+        self.shmem_name = _shmem_pattern.format(deployment_key)
+
+        try:
+            self._mem = ipc.SharedMemory(self.shmem_name, ipc.O_CREAT if needs_create else 0, size=self.size)
+        except ipc.ExistentialError:
+            raise ValueError('Could not create shmem `{}`, e:`{}`'.format(self.shmem_name, format_exc()))
+
+        self._mmap = mmap(self._mem.fd, self.size)
+        self._lock = ipc.Semaphore(_lock_pattern.format(self.shmem_name), ipc.O_CREAT, initial_value=1)
+        self.is_shared = True
+
+        # Write the initial layout unless another process already did it
+        self.store_initial()
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        """ Closes the shared memory in the current process, leaving it in place for the other ones.
+        """
+        if not self.is_shared:
+            return
+
+        self._mmap.close()
+        self._mem.close_fd()
+        self._lock.close()
+
+        self.is_shared = False
+
+# ################################################################################################################################
+
+    @staticmethod
+    def unlink(deployment_key:'str') -> 'None':
+        """ Deletes the shared memory of a deployment key, which only the main process should do, once all of its workers stopped.
+        """
+        shmem_name = _shmem_pattern.format(deployment_key)
+
+        for func, name in (ipc.unlink_shared_memory, shmem_name), (ipc.unlink_semaphore, _lock_pattern.format(shmem_name)):
+            try:
+                func(name)
+            except ipc.ExistentialError:
+                pass
+
+# ################################################################################################################################
+
+    def _locked(self) -> 'any_':
+        return semaphore_lock(self._lock, self.shmem_name, ModuleCtx.Lock_Timeout)
+
+# ################################################################################################################################
+
+    def store_initial(self) -> 'None':
+        """ Stores the initial layout unless there is already one in place.
+        """
+        with self._locked():
+            magic, slot_count, _ignored_pid, _ignored_lease_until = ModuleCtx.Header.unpack_from(self._mmap, 0)
+
+            # Someone has already created the table so we only need to know how big it is ..
+            if magic == ModuleCtx.Magic:
+                self.slot_count = slot_count
+
+            # .. otherwise, we are the first ones.
+            else:
+                self._mmap[:self.size] = b'\x00' * self.size
+                ModuleCtx.Header.pack_into(self._mmap, 0, ModuleCtx.Magic, self.slot_count, 0, 0.0)
+
+# ################################################################################################################################
+
+    def get_key(self, object_type:'str', object_id:'any_', period:'str', network:'any_') -> 'bytes':
+        return '{}\x00{}\x00{}\x00{}'.format(object_type, object_id, period, network).encode('utf8')
+
+# ################################################################################################################################
+
+    def parse_key(self, key:'bytes') -> 'strlist':
+        """ Turns a key back into its object type, object ID, period and network.
+        """
+        return key.decode('utf8').split('\x00')
+
+# ################################################################################################################################
+
+    def _get_key_hash(self, key:'bytes') -> 'int':
+
+        # We cannot use hash() because it returns different values in each process,
+        # and the lowest bit is always set because zero stands for empty slots.
+        return int.from_bytes(blake2b(key, digest_size=8).digest(), 'little') | 1
+
+# ################################################################################################################################
+
+    def _get_slot_offset(self, slot_idx:'int') -> 'int':
+        return ModuleCtx.Header_Size + slot_idx * ModuleCtx.Slot.size
+
+# ################################################################################################################################
+
+    def _find_slot(self, key:'bytes', key_hash:'int') -> 'intnone':
+        """ Returns the offset of the slot that holds the key or of the first empty slot that the key can be stored in,
+        or None if the table is full. Must be called with the lock held.
+        """
+        slot_idx = key_hash % self.slot_count
+        padded_key = key.ljust(ModuleCtx.Key_Size, b'\x00')
+
+        for _ in range(self.slot_count):
+
+            offset = self._get_slot_offset(slot_idx)
+            slot_hash = ModuleCtx.Slot.unpack_from(self._mmap, offset)[0]
+
+            if not slot_hash:
+                return offset
+
+            if slot_hash == key_hash and self._mmap[offset + 8:offset + ModuleCtx.Count_Offset] == padded_key:
+                return offset
+
+            slot_idx = (slot_idx + 1) % self.slot_count
+
+# ################################################################################################################################
+
+    def _iter_slots(self) -> 'any_':
+        """ Yields offsets and contents of all the slots in use. Must be called with the lock held.
+        """
+        for slot_idx in range(self.slot_count):
+            offset = self._get_slot_offset(slot_idx)
+            key_hash, key, count, synced, remote = ModuleCtx.Slot.unpack_from(self._mmap, offset)
+
+            if key_hash:
+                yield offset, key_hash, key.rstrip(b'\x00'), count, synced, remote
+
+# ################################################################################################################################
+
+    def incr(self, key:'bytes', limit:'intnone') -> 'any_':
+        """ Counts a new request under a key unless that would exceed the limit. Returns a tuple of a flag indicating
+        whether the request was counted and the number of requests including it, or None if there is no room
+        for the key, in which case the caller should count the request by other means.
+        """
+        if len(key) > ModuleCtx.Key_Size:
+            return None
+
+        key_hash = self._get_key_hash(key)
+        with self._locked():
+            offset = self._find_slot(key, key_hash)
+
+            if offset is None:
+                return None
+
+            slot_hash, _ignored_key, count, synced, remote = ModuleCtx.Slot.unpack_from(self._mmap, offset)
+            requests = count + remote
+
+            if limit is not None and requests >= limit:
+                return False, requests
+
+            if slot_hash:
+                ModuleCtx.Slot.pack_into(self._mmap, offset, slot_hash, key, count + 1, synced, remote)
+            else:
+                ModuleCtx.Slot.pack_into(self._mmap, offset, key_hash, key, 1, 0, 0)
+
+            return True, requests + 1
+
+# ################################################################################################################################
+
+    def get_requests(self, key:'bytes') -> 'int':
+        """ Returns how many requests in total were counted under a key.
+        """
+        with self._locked():
+            offset = self._find_slot(key, self._get_key_hash(key))
+
+            if offset is None:
+                return 0
+
+            _ignored_hash, _ignored_key, count, _ignored_synced, remote = ModuleCtx.Slot.unpack_from(self._mmap, offset)
+            return count + remote
+
+# ################################################################################################################################
+
+    def claim(self, _time:'callable_'=time) -> 'any_':
+        """ Returns a list of (key, delta) tuples with all the keys and how many of their requests are not in the ODB yet,
+        marking these requests as already synchronized. Returns None if another process is synchronizing the counters.
+        """
+        now = _time()
+        out = []
+
+        with self._locked():
+            magic, slot_count, pid, lease_until = ModuleCtx.Header.unpack_from(self._mmap, 0)
+
+            if pid and pid != self.pid and lease_until > now:
+                return None
+
+            ModuleCtx.Header.pack_into(self._mmap, 0, magic, slot_count, self.pid, now + ModuleCtx.Sync_Lease_Time)
+
+            for offset, key_hash, key, count, synced, remote in self._iter_slots():
+                delta = count - synced
+                if delta:
+                    ModuleCtx.Slot.pack_into(self._mmap, offset, key_hash, key, count, count, remote)
+                out.append((key, delta))
+
+        return out
+
+# ################################################################################################################################
+
+    def release_claim(self) -> 'None':
+        """ Lets another process synchronize the counters without waiting for our lease to expire.
+        """
+        with self._locked():
+            magic, slot_count, pid, _ignored_lease_until = ModuleCtx.Header.unpack_from(self._mmap, 0)
+
+            if pid == self.pid:
+                ModuleCtx.Header.pack_into(self._mmap, 0, magic, slot_count, 0, 0.0)
+
+# ################################################################################################################################
+
+    def unclaim(self, claimed:'anylist') -> 'None':
+        """ Returns to the counters deltas previously claimed, e.g. because they could not be stored in the ODB.
+        """
+        self._update(claimed, self._on_unclaim, False)
+
+    def _on_unclaim(self, key:'bytes', delta:'int', count:'int', synced:'int', remote:'int') -> 'any_':
+        return count, synced - delta, remote
+
+# ################################################################################################################################
+
+    def set_remote(self, totals:'anydict') -> 'None':
+        """ Receives a dict of keys and how many requests in total the ODB has for each, after all the claimed deltas
+        were stored there, which means that whatever is not included in our own counters came from other hosts.
+        Keys that we have not counted any requests for yet are added, so that they start from what other hosts counted.
+        """
+        self._update(totals.items(), self._on_set_remote, True)
+
+    def _on_set_remote(self, key:'bytes', total:'int', count:'int', synced:'int', remote:'int') -> 'any_':
+        return count, synced, max(total - synced, 0)
+
+# ################################################################################################################################
+
+    def _update(self, items:'any_', update_func:'callable_', needs_create:'bool') -> 'None':
+
+        with self._locked():
+            for key, value in items:
+
+                # Such keys are never counted in shared memory
+                if len(key) > ModuleCtx.Key_Size:
+                    continue
+
+                key_hash = self._get_key_hash(key)
+                offset = self._find_slot(key, key_hash)
+
+                # There is no room for the key
+                if offset is None:
+                    continue
+
+                slot_hash, _ignored_key, count, synced, remote = ModuleCtx.Slot.unpack_from(self._mmap, offset)
+
+                # The key could have been deleted in the meantime
+                if not (slot_hash or needs_create):
+                    continue
+
+                count, synced, remote = update_func(key, value, count, synced, remote)
+                ModuleCtx.Slot.pack_into(self._mmap, offset, key_hash, key, count, synced, remote)
+
+# ################################################################################################################################
+
+    def get_periods(self) -> 'strlist':
+        """ Returns all the periods that there are counters for.
+        """
+        with self._locked():
+            return list({self.parse_key(key)[2] for _ignored_offset, _ignored_hash, key, *_ignored in self._iter_slots()})
+
+# ################################################################################################################################
+
+    def delete(self, needs_delete:'callable_') -> 'None':
+        """ Deletes all the keys for which needs_delete, given the object type, object ID, period and network, returns True.
+        """
+        with self._locked():
+            to_keep = []
+            has_deleted = False
+
+            for _ignored_offset, key_hash, key, count, synced, remote in self._iter_slots():
+                if needs_delete(*self.parse_key(key)):
+                    has_deleted = True
+                    _ = self.last_info.pop(key, None)
+                else:
+                    to_keep.append((key_hash, key, count, synced, remote))
+
+            # Open addressing does not let us simply clear a slot so all the remaining keys are inserted anew
+            if has_deleted:
+                slot_table_start = ModuleCtx.Header_Size
+                self._mmap[slot_table_start:self.size] = b'\x00' * (self.size - slot_table_start)
+
+                for key_hash, key, count, synced, remote in to_keep:
+                    offset = self._find_slot(key, key_hash)
+                    ModuleCtx.Slot.pack_into(self._mmap, offset, key_hash, key, count, synced, remote)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -9,7 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 from contextlib import closing
 from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # gevent
 from gevent.lock import RLock
@@ -45,6 +45,18 @@ RateLimitStateDelete = RateLimitStateTable.delete
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # Unit -> how to find the beginning of a period that a given time belongs to and how long such a period is
+    Period_Start = {
+        Const.Unit.minute: ({'second':0, 'microsecond':0}, timedelta(minutes=1)),
+        Const.Unit.hour:   ({'minute':0, 'second':0, 'microsecond':0}, timedelta(hours=1)),
+        Const.Unit.day:    ({'hour':0, 'minute':0, 'second':0, 'microsecond':0}, timedelta(days=1)),
+    }
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class BaseLimiter:
     """ A per-server, approximate, rate limiter object. It is approximate because it does not keep track
     of what current rate limits in other servers are.
@@ -52,7 +64,7 @@ class BaseLimiter:
     __slots__ = 'current_idx', 'lock', 'api', 'object_info', 'definition', 'has_from_any', 'from_any_rate', 'from_any_unit', \
         'is_limit_reached', 'ip_address_cache', 'current_period_func', 'by_period', 'parent_type', 'parent_name', \
         'is_exact', 'from_any_object_id', 'from_any_object_type', 'from_any_object_name', 'cluster_id', 'is_active', \
-        'invocation_no'
+        'invocation_no', 'period_cache'
 
     api:'RateLimiting'
     object_info:'ObjectInfo'
@@ -67,6 +79,7 @@ class BaseLimiter:
 
     ip_address_cache:'strdict'
     by_period:'strdict'
+    period_cache:'strdict'
 
     from_any_object_id:'int'
     from_any_object_type:'str'
@@ -90,6 +103,9 @@ class BaseLimiter:
         self.is_exact = False
         self.invocation_no = 0
 
+        # Unit -> the beginning and end of the most recent period of that unit, and the period itself
+        self.period_cache = {}
+
         self.current_period_func:'strcalldict' = {
             Const.Unit.day: self._get_current_day,
             Const.Unit.hour: self._get_current_hour,
@@ -113,21 +129,12 @@ class BaseLimiter:
             if len(self.ip_address_cache) >= 1000:
                 self.ip_address_cache.clear()
 
-            now = datetime.utcnow()
-            current_minute = self._get_current_minute(now)
-            current_hour = self._get_current_hour(now)
-            current_day = self._get_current_day(now)
+            current_periods_map = self.get_current_periods(datetime.utcnow())
 
             # We need a copy so as not to modify the dict in place
             periods = self._get_current_periods()
             to_delete = set()
 
-            current_periods_map = {
-                Const.Unit.minute: current_minute,
-                Const.Unit.hour: current_hour,
-                Const.Unit.day: current_day
-            }
-
             for period in periods: # type: str
                 period_unit = period[0] # type: str # One of Const.Unit instances
                 current_period = current_periods_map[period_unit]
@@ -197,6 +204,37 @@ class BaseLimiter:
         # type: (datetime, str, str) -> str
         return '{}.{}'.format(_prefix, now.strftime(_format))
 
+# ################################################################################################################################
+
+    def get_current_periods(self, now) -> 'strdict':
+        # type: (datetime) -> strdict
+        """ Returns a dict of units and the periods of each that now belongs to.
+        """
+        return {
+            Const.Unit.minute: self._get_current_minute(now),
+            Const.Unit.hour: self._get_current_hour(now),
+            Const.Unit.day: self._get_current_day(now),
+        }
+
+# ################################################################################################################################
+
+    def _get_current_period(self, unit, now, _period_start=ModuleCtx.Period_Start) -> 'str':
+        # type: (str, datetime, dict) -> str
+        """ Returns the period of a given unit that now belongs to, formatting each period only once.
+        """
+        cached = self.period_cache.get(unit)
+
+        if cached and cached[0] <= now < cached[1]:
+            return cached[2]
+
+        replace_kwargs, period_length = _period_start[unit]
+        start = now.replace(**replace_kwargs)
+
+        current_period = self.current_period_func[unit](start)
+        self.period_cache[unit] = (start, start + period_length, current_period)
+
+        return current_period
+
 # ################################################################################################################################
 
     def _format_last_info(self, current_state) -> 'str':
@@ -216,19 +254,12 @@ class BaseLimiter:
 
 # ################################################################################################################################
 
-    def _check_limit(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
-        _rate_any=Const.rate_any, _utcnow=datetime.utcnow) -> 'None':
-        # type: (str, str, str, int, str, str, object, str, str)
-
-        # Increase invocation counter
-        self.invocation_no += 1
-
-        # Local aliases
-        now = _utcnow()
-
-        # Get current period, e.g. current day, hour or minute
-        current_period_func = self.current_period_func[unit]
-        current_period = current_period_func(now)
+    def _count_request(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        now, current_period, _rate_any=Const.rate_any) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, datetime, str, str)
+        """ Counts a request in the current period, unless the rate limit has been already reached,
+        in which case an exception is raised.
+        """
         current_state = self._get_current_state(current_period, network_found)
 
         # Unless we are allowed to have any rate ..
@@ -242,6 +273,25 @@ class BaseLimiter:
         # Update current metadata state
         self._set_new_state(current_state, cid, orig_from, network_found, now, current_period)
 
+# ################################################################################################################################
+
+    def _check_limit(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        _utcnow=datetime.utcnow) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, str)
+
+        # Increase invocation counter
+        self.invocation_no += 1
+
+        # Local aliases
+        now = _utcnow()
+
+        # Get current period, e.g. current day, hour or minute
+        current_period = self._get_current_period(unit, now)
+
+        # This raises an exception if the limit is reached
+        self._count_request(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+            now, current_period)
+
         # Above, we checked our own rate limit but it is still possible that we have a parent
         # that also wants to check it.
         if self.has_parent:
@@ -322,11 +372,48 @@ class Approximate(BaseLimiter):
 # ################################################################################################################################
 
 class Exact(BaseLimiter):
-
+    """ A cluster-wide, exact, rate limiter. Requests are counted in counters shared by all the server processes on a host,
+    which RateLimiting.sync_counters stores in the ODB in background. Only if there is no room for more shared counters,
+    are requests counted in the ODB directly, each in its own transaction.
+    """
     def __init__(self, cluster_id:'int', sql_session_func:'callable_') -> 'None':
         super(Exact, self).__init__(cluster_id)
         self.sql_session_func = sql_session_func
 
+# ################################################################################################################################
+
+    def _count_request(self, cid, orig_from, network_found, rate, unit, def_object_id, def_object_name, def_object_type,
+        now, current_period, _rate_any=Const.rate_any) -> 'None':
+        # type: (str, str, str, int, str, str, object, str, datetime, str, str)
+
+        counters = self.api.counters
+        key = counters.get_key(self.object_info.type_, self.object_info.id, current_period, network_found)
+
+        result = counters.incr(key, None if rate == _rate_any else rate)
+
+        # There is no room for this key in shared memory so the request needs to be counted in the ODB ..
+        if result is None:
+            super(Exact, self)._count_request(cid, orig_from, network_found, rate, unit, def_object_id, def_object_name,
+                def_object_type, now, current_period)
+
+        # .. otherwise, it is already counted, unless the limit was reached.
+        else:
+            is_counted, requests = result
+
+            if not is_counted:
+                last_cid, last_from, last_request_time_utc = counters.last_info.get(key, (None, None, None))
+                current_state = {
+                    'requests': requests,
+                    'last_cid': last_cid,
+                    'last_from': last_from,
+                    'last_request_time_utc': last_request_time_utc,
+                }
+                self._raise_rate_limit_exceeded(rate, unit, orig_from, network_found, current_state, cid,
+                    def_object_id, def_object_name, def_object_type)
+
+            # This is what will be stored in the ODB along with the counter
+            counters.last_info[key] = (cid, orig_from, now)
+
 # ################################################################################################################################
 
     def _fetch_current_state(self, session, current_period, network_found) -> 'RateLimitState':
@@ -350,7 +437,11 @@ class Exact(BaseLimiter):
             item = self._fetch_current_state(session, current_period, network_found)
 
         if item:
-            current_state.update(item.asdict())
+            current_state['requests'] = item.requests
+            current_state['last_cid'] = item.last_cid
+            current_state['last_request_time_utc'] = item.last_request_time_utc
+            current_state['last_from'] = item.last_from
+            current_state['last_network'] = item.last_network
 
         return current_state
 
@@ -390,16 +481,22 @@ class Exact(BaseLimiter):
 
     def _get_current_periods(self) -> 'strlist':
         with closing(self.sql_session_func()) as session:
-            return [elem[0] for elem in current_period_list(session, self.cluster_id).all()]
+            out = {elem[0] for elem in current_period_list(session, self.cluster_id).all()}
+
+        out.update(self.api.counters.get_periods())
+        return list(out)
 
 # ################################################################################################################################
 
     def _delete_periods(self, to_delete) -> 'None':
+
         with closing(self.sql_session_func()) as session:
             session.execute(RateLimitStateDelete().where(
                 RateLimitStateTable.c.period.in_(to_delete)
             ))
             session.commit()
 
+        self.api.counters.delete(lambda _object_type, _object_id, period, _network: period in to_delete)
+
 # ################################################################################################################################
 # ################################################################################################################################
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import mmap
+import os
+from collections import deque
+from logging import getLogger
+from struct import Struct
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import iterator_, list_, tuple_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Identifies segment files laid out the way this module expects it
+    Magic = b'ZATORNG1'
+
+    # Magic, the lowest and highest timestamp in a segment, the number of records and the offset of the first free byte
+    Header = Struct('<8sqqQQ')
+    Header_Size = 64
+
+    # Length of data and its timestamp, in microseconds
+    Record = Struct('<Iq')
+
+    # Segment files are named after their sequence numbers
+    Segment_Pattern = '{:016d}.seg'
+    Segment_Suffix = '.seg'
+
+    # How big each segment is, unless a ring is so small that it needs smaller ones
+    Segment_Size = 4_000_000
+    Min_Segment_Size = 64_000
+
+    # Pages written to are given back to the operating system each time there is that many bytes of them
+    Release_Size = 1_048_576
+
+    # Used in headers of segments that have no records yet
+    No_Min_Timestamp = 2 ** 63 - 1
+    No_Max_Timestamp = -2 ** 63
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_has_madvise = hasattr(mmap, 'MADV_DONTNEED')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Segment:
+    """ What a ring knows about each of its segments without reading them.
+    """
+    __slots__ = 'seq', 'path', 'min_timestamp', 'max_timestamp', 'count', 'end'
+
+    def __init__(self, seq:'int', path:'str') -> 'None':
+        self.seq = seq
+        self.path = path
+        self.min_timestamp = ModuleCtx.No_Min_Timestamp
+        self.max_timestamp = ModuleCtx.No_Max_Timestamp
+        self.count = 0
+        self.end = ModuleCtx.Header_Size
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DiskRing:
+    """ Keeps timestamped records in a directory of fixed-size segment files, the oldest of which is deleted
+    when the ring would otherwise take up more than max_bytes. Records are appended to the newest segment through
+    a memory map. Each segment's header describes the records in it, which lets readers skip segments
+    outside of the time range they are interested in and lets a ring be reopened without reading its records.
+
+    Only the newest segment is mapped and pages of it that have been written to are released as it grows,
+    which means that the memory a ring uses is the same no matter how much data it holds.
+    """
+    def __init__(self, path:'str', max_bytes:'int', segment_size:'int'=ModuleCtx.Segment_Size) -> 'None':
+
+        self.path = path
+
+        # A ring always has at least two segments so that deleting the oldest one does not delete everything
+        self.segment_size = max(ModuleCtx.Min_Segment_Size, min(segment_size, max_bytes // 2))
+        self.max_segments = max(2, max_bytes // self.segment_size)
+
+        # Oldest segments come first
+        self.segments = deque() # type: deque[_Segment]
+
+        # The newest segment, mapped into memory
+        self._current = None # type: _Segment | None
+        self._mmap = None # type: mmap.mmap | None
+
+        # Pages of the newest segment below that offset are not in memory
+        self._released = 0
+
+        os.makedirs(self.path, mode=0o770, exist_ok=True)
+        self._open()
+
+# ################################################################################################################################
+
+    def _open(self) -> 'None':
+        """ Finds all the segments that already exist and maps the newest one, or creates it.
+        """
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(ModuleCtx.Segment_Suffix):
+                segment = self._read_segment(name)
+                if segment:
+                    self.segments.append(segment)
+
+        if self.segments:
+            self._map(self.segments[-1])
+        else:
+            self._add_segment(0)
+
+        self._delete_oldest()
+
+# ################################################################################################################################
+
+    def _read_segment(self, name:'str') -> '_Segment | None':
+
+        path = os.path.join(self.path, name)
+        segment = _Segment(int(name[:-len(ModuleCtx.Segment_Suffix)]), path)
+
+        with open(path, 'rb') as f:
+            header = f.read(ModuleCtx.Header.size)
+
+        if len(header) < ModuleCtx.Header.size or not header.startswith(ModuleCtx.Magic):
+            logger.warning('Deleting invalid audit log segment `%s`', path)
+            os.remove(path)
+            return
+
+        _, segment.min_timestamp, segment.max_timestamp, segment.count, segment.end = ModuleCtx.Header.unpack(header)
+        return segment
+
+# ################################################################################################################################
+
+    def _map(self, segment:'_Segment') -> 'None':
+
+        with open(segment.path, 'r+b') as f:
+
+            # A segment that was created with a different size keeps it
+            size = os.fstat(f.fileno()).st_size
+            if size < ModuleCtx.Header_Size:
+                size = self.segment_size
+                os.ftruncate(f.fileno(), size)
+
+            self._mmap = mmap.mmap(f.fileno(), size)
+
+        self._current = segment
+        self._released = mmap.PAGESIZE
+
+# ################################################################################################################################
+
+    def _add_segment(self, seq:'int') -> 'None':
+
+        segment = _Segment(seq, os.path.join(self.path, ModuleCtx.Segment_Pattern.format(seq)))
+
+        # The file is sparse so it takes up only as much disk space as there are records in it
+        with open(segment.path, 'wb') as f:
+            os.ftruncate(f.fileno(), self.segment_size)
+
+        self.segments.append(segment)
+        self._map(segment)
+        self._write_header()
+
+# ################################################################################################################################
+
+    def _write_header(self) -> 'None':
+        segment = self._current
+        ModuleCtx.Header.pack_into(self._mmap, 0, ModuleCtx.Magic,
+            segment.min_timestamp, segment.max_timestamp, segment.count, segment.end)
+
+# ################################################################################################################################
+
+    def _delete_oldest(self) -> 'None':
+        while len(self.segments) > self.max_segments:
+            segment = self.segments.popleft()
+            os.remove(segment.path)
+
+# ################################################################################################################################
+
+    def _release(self) -> 'None':
+        """ Gives back to the operating system pages of the newest segment that have been written to.
+        Pages of a shared mapping are already in the page cache so nothing is lost.
+        """
+        end = self._current.end - self._current.end % mmap.PAGESIZE
+        if _has_madvise and end > self._released:
+            self._mmap.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+# ################################################################################################################################
+
+    @property
+    def max_data_size(self) -> 'int':
+        """ How big data can be at most to fit in a segment.
+        """
+        return self.segment_size - ModuleCtx.Header_Size - ModuleCtx.Record.size
+
+# ################################################################################################################################
+
+    def append(self, timestamp:'int', data:'bytes') -> 'bool':
+        """ Adds data to the ring in constant time. Returns False if it will never fit in a segment.
+        """
+        if len(data) > self.max_data_size:
+            return False
+
+        size = ModuleCtx.Record.size + len(data)
+        segment = self._current
+
+        # Move on to a new segment if the current one is full ..
+        if segment.end + size > len(self._mmap):
+
+            self._mmap.close()
+            self._add_segment(segment.seq + 1)
+            self._delete_oldest()
+            segment = self._current
+
+        # .. write the record ..
+        offset = segment.end
+        ModuleCtx.Record.pack_into(self._mmap, offset, len(data), timestamp)
+        offset += ModuleCtx.Record.size
+        self._mmap[offset:offset + len(data)] = data
+
+        # .. update the segment's header ..
+        segment.end = offset + len(data)
+        segment.count += 1
+
+        if timestamp < segment.min_timestamp:
+            segment.min_timestamp = timestamp
+
+        if timestamp > segment.max_timestamp:
+            segment.max_timestamp = timestamp
+
+        self._write_header()
+
+        # .. and make sure we do not keep in memory more than we need to.
+        if segment.end - self._released >= ModuleCtx.Release_Size:
+            self._release()
+
+        return True
+
+# ################################################################################################################################
+
+    def _iter_segment(self, segment:'_Segment') -> 'iterator_[tuple_[int, bytes]]':
+        """ Yields all the records of a segment, oldest first.
+        """
+        if segment is self._current:
+            data = self._mmap
+        else:
+            with open(segment.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            offset = ModuleCtx.Header_Size
+            end = segment.end
+
+            while offset < end:
+
+                # A record that would not fit in what the header says is in use means that the segment is corrupt,
+                # e.g. because a process stopped before it updated the header, so nothing after it can be trusted.
+                if offset + ModuleCtx.Record.size > end:
+                    logger.warning('Incomplete record header at %s in audit log segment `%s`', offset, segment.path)
+                    break
+
+                size, timestamp = ModuleCtx.Record.unpack_from(data, offset)
+
+                if offset + ModuleCtx.Record.size + size > end:
+                    logger.warning('Invalid record size %s at %s in audit log segment `%s`', size, offset, segment.path)
+                    break
+
+                offset += ModuleCtx.Record.size
+                yield timestamp, data[offset:offset + size]
+                offset += size
+
+        finally:
+            if segment is self._current:
+                self._released = mmap.PAGESIZE
+                self._release()
+            else:
+                data.close()
+
+# ################################################################################################################################
+
+    def read(self, start:'int | None'=None, stop:'int | None'=None) -> 'iterator_[tuple_[int, bytes]]':
+        """ Yields timestamps and data of records whose timestamps are between start and stop, both inclusive.
+        """
+        for segment in list(self.segments):
+
+            # Skip whole segments that do not have what we are looking for ..
+            if not segment.count:
+                continue
+
+            if start is not None and segment.max_timestamp < start:
+                continue
+
+            if stop is not None and segment.min_timestamp > stop:
+                continue
+
+            # .. and check each record of the ones that may have it.
+            for timestamp, data in self._iter_segment(segment):
+                if start is not None and timestamp < start:
+                    continue
+                if stop is not None and timestamp > stop:
+                    continue
+                yield timestamp, data
+
+# ################################################################################################################################
+
+    def get_latest(self, limit:'int') -> 'list_[tuple_[int, bytes]]':
+        """ Returns up to limit of the most recently added records, oldest first.
+        """
+        out = deque() # type: deque[tuple_[int, bytes]]
+
+        for segment in reversed(list(self.segments)):
+
+            if len(out) >= limit:
+                break
+
+            records = deque(self._iter_segment(segment), maxlen=limit - len(out))
+            out.extendleft(reversed(records))
+
+        return list(out)
+
+# ################################################################################################################################
+
+    @property
+    def count(self) -> 'int':
+        return sum(segment.count for segment in self.segments)
+
+# ################################################################################################################################
+
+    @property
+    def size(self) -> 'int':
+        """ How many bytes of records there are in all the segments.
+        """
+        return sum(segment.end - ModuleCtx.Header_Size for segment in self.segments)
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -32,90 +32,149 @@ SOFTWARE.
 
 # stdlib
 from collections.abc import MutableMapping
-from time import time
+from time import monotonic
 
 # gevent
-from gevent import sleep
-from gevent.threading import Thread, Lock
+from gevent import sleep, spawn
+from gevent.event import Event
 
-# SortedContainers
-from sortedcontainers import SortedKeyList
+# Zato
+from zato.common.util.heap import LazyHeap
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How many keys to expire at most before letting other greenlets run
+    Max_Batch_Size = 5000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Stands for keys that are not in the dict
+_missing = object()
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 class ExpiringDict(MutableMapping):
+    """ A dict whose keys expire after their TTL. Expiration times are kept in a heap, served by a greenlet that sleeps
+    until the earliest of them, which means that a dict with nothing to expire does not wake up at all.
+    Keys that are deleted or overwritten are taken out of the expiration index at once. Expired keys are never returned,
+    even if the greenlet has not deleted them yet.
+    """
     def __init__(self, ttl=None, interval=0.100, *args, **kwargs):
+        # type: (floatnone, float, any_, any_) -> None
 
         self._store = dict(*args, **kwargs)
-        # self._keys = SortedKeyList(key=lambda x: x[0])
-        self._keys = SortedKeyList(key=self._sort_func)
         self._ttl = ttl
-        self.impl_lock = Lock()
+
+        # The greenlet will not wake up more often than that
         self._interval = interval
 
-        Thread(target=self._worker, daemon=True).start()
+        # Expiration times of keys that can expire
+        self._expiry = LazyHeap()
+
+        self._wakeup = Event()
+        self._greenlet = None
 
 # ################################################################################################################################
 
-    def _sort_func(self, elem):
-        # Object 'elem' is a two-element tuple.
-        # Index 0 is the expiration time.
-        # Index 1 is the actual object held at that key.
-        # By using index 0, we can sort objects by their expiration time.
-        return elem[0]
+    def flush(self, max_count=None, _monotonic=monotonic):
+        # type: (int | None, callable_) -> int
+        """ Deletes up to max_count keys that have already expired, or all of them if max_count is not given,
+        and returns how many were deleted.
+        """
+        expired = self._expiry.pop_due(_monotonic(), max_count)
 
-# ################################################################################################################################
+        for key, _ignored_expires_at in expired:
+            _ = self._store.pop(key, None)
 
-    def flush(self):
-        now = time()
-        max_index = 0
-        with self.impl_lock:
-            for index, (timestamp, key) in enumerate(self._keys):
-                if timestamp > now: # Break as soon as we find a key whose expiration time is in the future
-                    max_index = index
-                    break
-                try:
-                    del self._store[key]
-                except KeyError:
-                    pass  # Ignore it if it was deleted early
-            del self._keys[0:max_index]
+        return len(expired)
 
 # ################################################################################################################################
 
-    def _worker(self):
+    def _worker(self, _monotonic=monotonic):
+        # type: (callable_) -> None
+
+        max_batch_size = ModuleCtx.Max_Batch_Size
+
         while True:
-            self.flush()
-            sleep(self._interval)
+
+            # If there were more expired keys than a single batch, the rest is deleted after other greenlets run ..
+            if self.flush(max_batch_size) == max_batch_size:
+                sleep(0)
+                continue
+
+            # .. if there is nothing that can expire, the greenlet is not needed until something is set again ..
+            expires_at = self._expiry.get_next_deadline()
+            if expires_at is None:
+                self._greenlet = None
+                return
+
+            # .. otherwise, we wait until the next key expires, unless an earlier one is set in the meantime.
+            self._wakeup.clear()
+            _ = self._wakeup.wait(max(expires_at - _monotonic(), self._interval))
 
 # ################################################################################################################################
 
-    def get(self, key, default=None):
-        return self._store.get(key, default)
+    def get(self, key, default=None, _monotonic=monotonic):
+        # type: (any_, any_, callable_) -> any_
+
+        value = self._store.get(key, _missing)
+
+        if value is _missing:
+            return default
+
+        # The key may have expired already even if the greenlet has not deleted it yet
+        expires_at = self._expiry.get_deadline(key)
+        if expires_at is not None and expires_at <= _monotonic():
+            self.delete(key)
+            return default
+
+        return value
 
 # ################################################################################################################################
 
     def set(self, key, value, ttl=None):
+        # type: (any_, any_, floatnone) -> None
         ttl = ttl or self._ttl
         self._set_with_expire(key, value, ttl)
 
 # ################################################################################################################################
 
     def ttl(self, key, value, ttl):
+        # type: (any_, any_, float) -> None
         self._set_with_expire(key, value, ttl)
 
 # ################################################################################################################################
 
     def delete(self, key):
+        # type: (any_) -> None
         _ = self._store.pop(key, None)
+        _ = self._expiry.remove(key)
 
 # ################################################################################################################################
 
-    def _set_with_expire(self, key, value, ttl):
-        self.impl_lock.acquire()
-        self._keys.add((time() + ttl, key))
+    def _set_with_expire(self, key, value, ttl, _monotonic=monotonic):
+        # type: (any_, any_, floatnone, callable_) -> None
+
         self._store[key] = value
-        self.impl_lock.release()
+
+        # A previous value of the key no longer expires and, without a TTL, the new one does not either ..
+        if not ttl:
+            _ = self._expiry.remove(key)
+            return
+
+        # .. otherwise, the new expiration time replaces the previous one.
+        is_earliest = self._expiry.add(key, _monotonic() + ttl)
+
+        # Start the greenlet if it is not running yet or wake it up if it needs to expire this key earlier than it planned to
+        if self._greenlet is None:
+            self._greenlet = spawn(self._worker)
+        elif is_earliest:
+            self._wakeup.set()
 
 # ################################################################################################################################
 
@@ -129,16 +188,32 @@ class ExpiringDict(MutableMapping):
 
 # ################################################################################################################################
 
-    # Methods below are not used
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+# ################################################################################################################################
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+
+        if value is _missing:
+            raise KeyError(key)
+
+        return value
+
+# ################################################################################################################################
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+# ################################################################################################################################
 
-    def __delitem__(self, *ignored_args, **ignored_kwargs):
-        raise NotImplementedError*()
+    def __delitem__(self, key):
 
-    def __getitem__(self, *ignored_args, **ignored_kwargs):
-        raise NotImplementedError*()
+        if key not in self._store:
+            raise KeyError(key)
 
-    def __setitem__(self, *ignored_args, **ignored_kwargs):
-        raise NotImplementedError*()
+        self.delete(key)
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from heapq import heapify, heappop, heappush
+from itertools import count
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, floatnone, intnone, list_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Entries of removed keys are dropped from the heap once there are at least that many of them and they outnumber the live ones
+    Min_Compact_Size = 1000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Stands for keys of entries that were removed but are still in the heap
+_removed = object()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LazyHeap:
+    """ Keeps keys ordered by their deadlines, e.g. times at which they expire. A key removed or added again
+    is not looked up in the heap, its previous entry is only marked as removed and it is skipped once it reaches
+    the top of the heap, unless entries of removed keys start to outnumber the live ones, in which case the heap
+    is rebuilt without them. This means that each operation takes logarithmic time at most.
+    """
+    def __init__(self, min_compact_size:'int'=ModuleCtx.Min_Compact_Size) -> 'None':
+
+        self.min_compact_size = min_compact_size
+
+        # Each entry is a [deadline, sequence number, key] list, the sequence number breaks ties between equal deadlines
+        self.heap = [] # type: list_[list]
+
+        # Key -> its current entry in the heap
+        self.entries = {} # type: dict
+
+        # How many entries in the heap belong to removed keys
+        self.removed_count = 0
+
+        self.seq = count()
+
+# ################################################################################################################################
+
+    def __len__(self) -> 'int':
+        return len(self.entries)
+
+    def __contains__(self, key:'any_') -> 'bool':
+        return key in self.entries
+
+# ################################################################################################################################
+
+    def add(self, key:'any_', deadline:'float') -> 'bool':
+        """ Adds key with its deadline, replacing any deadline that it may have had previously.
+        Returns True if this is the earliest deadline now.
+        """
+        _ = self._remove(key)
+
+        entry = [deadline, next(self.seq), key]
+        self.entries[key] = entry
+        heappush(self.heap, entry)
+
+        return self.heap[0] is entry
+
+# ################################################################################################################################
+
+    def remove(self, key:'any_') -> 'bool':
+        """ Removes key from the heap, returning True if it was there.
+        """
+        if not self._remove(key):
+            return False
+
+        # Removed entries are only marked as such so they need to be actually deleted from time to time
+        if self.removed_count >= self.min_compact_size and self.removed_count > len(self.entries):
+            self.compact()
+
+        return True
+
+# ################################################################################################################################
+
+    def _remove(self, key:'any_') -> 'bool':
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return False
+
+        entry[-1] = _removed
+        self.removed_count += 1
+
+        return True
+
+# ################################################################################################################################
+
+    def compact(self) -> 'None':
+        """ Drops all the entries of removed keys from the heap.
+        """
+        self.heap[:] = [entry for entry in self.heap if entry[-1] is not _removed]
+        heapify(self.heap)
+        self.removed_count = 0
+
+# ################################################################################################################################
+
+    def get_deadline(self, key:'any_') -> 'floatnone':
+        """ Returns the deadline of key or None if it is not in the heap.
+        """
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+# ################################################################################################################################
+
+    def get_next_deadline(self) -> 'floatnone':
+        """ Returns the earliest deadline in the heap or None if the heap is empty.
+        """
+        heap = self.heap
+
+        while heap and heap[0][-1] is _removed:
+            _ = heappop(heap)
+            self.removed_count -= 1
+
+        return heap[0][0] if heap else None
+
+# ################################################################################################################################
+
+    def pop_due(self, now:'float', max_count:'intnone'=None) -> 'list_[tuple]':
+        """ Removes from the heap and returns (key, deadline) tuples whose deadlines are not later than now,
+        up to max_count of them or all of them if max_count is not given.
+        """
+        out = []
+        heap = self.heap
+
+        while heap and (max_count is None or len(out) < max_count):
+
+            deadline, _ignored_seq, key = heap[0]
+
+            if key is _removed:
+                _ = heappop(heap)
+                self.removed_count -= 1
+                continue
+
+            if deadline > now:
+                break
+
+            _ = heappop(heap)
+            del self.entries[key]
+            out.append((key, deadline))
+
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
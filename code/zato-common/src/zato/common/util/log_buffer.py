@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from collections import deque
+from logging import Formatter, getLogger, StreamHandler
+from sys import _getframe
+from time import time
+
+# gevent
+from gevent import sleep, spawn
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from logging import Handler, Logger, LogRecord
+    from zato.common.typing_ import any_, callable_, callnone, list_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How many records can wait to be written before new ones are dropped
+    Max_Size = 20_000
+
+    # How many records are written in one go
+    Batch_Size = 500
+
+    # How often, in seconds, the background greenlet writes what there is in the buffer
+    Flush_Interval = 0.1
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _PreformattedFormatter(Formatter):
+    """ Used with batches of records that have been already formatted.
+    """
+    def format(self, record:'LogRecord') -> 'str':
+        return record.msg
+
+_preformatted_formatter = _PreformattedFormatter()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LogBuffer:
+    """ Lets request greenlets log without waiting for any I/O. Records are kept in a bounded buffer, out of which
+    a background greenlet formats and writes them in batches. If the buffer is full, new records are dropped,
+    which is counted and reported the next time the buffer is written out.
+    """
+    def __init__(
+        self,
+        logger:'Logger',
+        get_extra:'callnone'=None,
+        max_size:'int'=ModuleCtx.Max_Size,
+        batch_size:'int'=ModuleCtx.Batch_Size,
+        flush_interval:'float'=ModuleCtx.Flush_Interval,
+    ) -> 'None':
+
+        self.logger = logger
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # If given, this builds a record's extra attributes out of what was given on input to self.log
+        self.get_extra = get_extra
+
+        # Each element is a tuple of details of a record that is yet to be written
+        self.records = deque()
+
+        # How many records were dropped in total and how many since they were last reported
+        self.dropped = 0
+        self._dropped_unreported = 0
+
+        # The background greenlet exists only if there is anything to write
+        self._greenlet = None
+
+# ################################################################################################################################
+
+    def log(self, level:'int', msg:'str', args:'any_'=(), extra:'any_'=None, _getframe:'callable_'=_getframe,
+        _time:'callable_'=time, _spawn:'callable_'=spawn) -> 'None':
+
+        if len(self.records) >= self.max_size:
+            self.dropped += 1
+            self._dropped_unreported += 1
+            return
+
+        frame = _getframe(1)
+        self.records.append((level, msg, args, extra, _time(), frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+
+        if not self._greenlet:
+            self._greenlet = _spawn(self._run)
+
+# ################################################################################################################################
+
+    def _run(self) -> 'None':
+
+        while self.records:
+            sleep(self.flush_interval)
+            self.flush()
+
+        self._greenlet = None
+
+# ################################################################################################################################
+
+    def _make_record(self, level:'int', msg:'str', args:'any_', extra:'any_', created:'float', file_name:'str',
+        line_no:'int', func_name:'str') -> 'LogRecord':
+
+        if self.get_extra and extra is not None:
+            extra = self.get_extra(extra)
+
+        record = self.logger.makeRecord(self.logger.name, level, file_name, line_no, msg, args, None, func_name, extra)
+
+        # A record's time is when it was logged rather than when it is written
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+
+        return record
+
+# ################################################################################################################################
+
+    def _get_handlers(self) -> 'list_[Handler]':
+        """ Returns all the handlers that the logger would call, in the same order that it would call them.
+        """
+        out = []
+        current = self.logger
+
+        while current:
+            out.extend(current.handlers)
+            if not current.propagate:
+                break
+            current = current.parent
+
+        return out
+
+# ################################################################################################################################
+
+    def _write(self, records:'list_[LogRecord]') -> 'None':
+
+        for handler in self._get_handlers():
+
+            records_to_write = [record for record in records if record.levelno >= handler.level and handler.filter(record)]
+
+            if not records_to_write:
+                continue
+
+            # Stream handlers, which includes all the file-based ones, write a whole batch at once, ..
+            if isinstance(handler, StreamHandler):
+
+                # .. which means that each record is formatted as usual ..
+                msg = handler.terminator.join([handler.format(record) for record in records_to_write])
+                batch = self.logger.makeRecord(self.logger.name, records_to_write[-1].levelno, '', 0, msg, (), None)
+
+                # .. and the batch is written as it is.
+                handler.acquire()
+                try:
+                    formatter = handler.formatter
+                    handler.formatter = _preformatted_formatter
+                    try:
+                        handler.emit(batch)
+                    finally:
+                        handler.formatter = formatter
+                finally:
+                    handler.release()
+
+            # .. whereas any other handler receives each record separately.
+            else:
+                for record in records_to_write:
+                    handler.handle(record)
+
+# ################################################################################################################################
+
+    def flush(self) -> 'None':
+        """ Writes out all the records currently in the buffer.
+        """
+        if self._dropped_unreported:
+            logger.warning('Dropped %d record(s) of `%s` because its buffer was full (%d)',
+                self._dropped_unreported, self.logger.name, self.max_size)
+            self._dropped_unreported = 0
+
+        while self.records:
+
+            count = min(len(self.records), self.batch_size)
+            records = []
+
+            for _ in range(count):
+                record = self._make_record(*self.records.popleft())
+                if not self.logger.filters or self.logger.filter(record):
+                    records.append(record)
+
+            if records and not self.logger.disabled:
+                try:
+                    self._write(records)
+                except Exception:
+                    logger.warning('Could not write %d record(s) of `%s`', len(records), self.logger.name, exc_info=True)
+
+            # Let other greenlets run in between batches
+            sleep(0)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -7,12 +7,18 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from hashlib import blake2b
 from logging import getLogger
 from mmap import mmap
-from time import sleep
+from struct import Struct
+from time import monotonic, sleep
 from traceback import format_exc
 
+# gevent
+from gevent import sleep as gevent_sleep
+
 try:
     import posix_ipc as ipc
 except ImportError:
@@ -26,7 +32,7 @@ from zato.common.json_internal import dumps, loads
 # ################################################################################################################################
 
 if 0:
-    from zato.common.typing_ import any_, strordict
+    from zato.common.typing_ import any_, iterator_, strordict
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -37,21 +43,94 @@ logger = getLogger('zato')
 # ################################################################################################################################
 
 _shmem_pattern = '/zato-shmem-{}'
+_lock_pattern = '{}-lock'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Identifies shared memory laid out the way this module expects it
+    Magic = b'ZATOSHM2'
+
+    # Magic, slot count, total size, generation and the offset of the first free byte in the data area
+    Header = Struct('<8sIIQQ')
+    Header_Size = 64
+
+    # Sequence, key hash, record offset and record length
+    Slot = Struct('<QQQQ')
+
+    # The sequence alone, which is what each slot begins with
+    Slot_Seq = Struct('<Q')
+
+    # Key length and value length
+    Record = Struct('<II')
+
+    # The slot table will take up at most that much of shared memory ..
+    Slot_Table_Ratio = 16
+
+    # .. and it will have no more slots than that.
+    Max_Slots = 4096
+
+    # How long to wait for other writers before giving up
+    Lock_Timeout = 5
+
+    # How long to sleep between attempts to acquire a lock, at first and at most
+    Lock_Poll_Min = 0.0005
+    Lock_Poll_Max = 0.05
+
+    # How many times readers try to obtain a consistent view of a key before giving up
+    Max_Read_Attempts = 10_000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+@contextmanager
+def semaphore_lock(semaphore:'any_', name:'str', timeout:'float'=ModuleCtx.Lock_Timeout) -> 'iterator_[None]':
+    """ Holds a named POSIX semaphore for the duration of a block. The semaphore is polled without blocking,
+    which lets other greenlets run in the meantime. If it cannot be acquired within timeout seconds, TimeoutError is raised
+    and, because it was never acquired, it is not released either.
+    """
+    until = monotonic() + timeout
+    interval = ModuleCtx.Lock_Poll_Min
+
+    while True:
+        try:
+            semaphore.acquire(0)
+        except ipc.BusyError:
+            if monotonic() >= until:
+                raise TimeoutError('Could not acquire semaphore `{}` within {}s'.format(name, timeout))
+            gevent_sleep(interval)
+            interval = min(interval * 2, ModuleCtx.Lock_Poll_Max)
+        else:
+            break
+
+    try:
+        yield
+    finally:
+        semaphore.release()
 
 # ################################################################################################################################
 # ################################################################################################################################
 
 class SharedMemoryIPC:
     """ An IPC object which Zato processes use to communicate with each other using mmap files
-    backed by shared memory. All data in shared memory is kept as a dictionary and serialized as JSON
-    each time any read or write is needed.
+    backed by shared memory. Data in shared memory is kept in a hash table of slots, each pointing to a record
+    with a key and its JSON-serialized value, which means that each key can be read and written individually.
+
+    Writers are serialized with a named semaphore. Readers do not take any locks - instead, each slot has a sequence
+    number that writers make odd for the duration of an update, which lets readers retry until they obtain a consistent
+    view of a key (a seqlock). Updated values are appended to the data area and the space taken by their previous versions
+    is reclaimed when the data area is full, in which case the generation number is used by readers in the same manner.
     """
     key_name = '<invalid>'
 
     def __init__(self):
         self.shmem_name = ''
         self.size = -1
+        self.slot_count = -1
         self._mmap = None
+        self._lock = None
         self.running = False
         self._mem = None
 
@@ -75,38 +154,253 @@ class SharedMemoryIPC:
         # Map memory to mmap
         self._mmap = mmap(self._mem.fd, self.size)
 
-        # Write initial data so that JSON .loads always succeeds
+        # All writers, no matter in which process, use the same lock
+        self._lock = ipc.Semaphore(_lock_pattern.format(self.shmem_name), ipc.O_CREAT, initial_value=1)
+
+        # Write the initial layout unless another process already did it
         self.store_initial()
 
         self.running = True
 
 # ################################################################################################################################
 
-    def store(self, data):
-        """ Serializes input data as JSON and stores it in RAM, overwriting any previous data.
+    def _locked(self):
+        return semaphore_lock(self._lock, '{} ({})'.format(self.shmem_name, self.key_name), ModuleCtx.Lock_Timeout)
+
+# ################################################################################################################################
+
+    def _get_slot_count(self):
+        """ Returns how many slots there will be in a table of the current size.
         """
-        self._mmap.seek(0)
-        self._mmap.write(dumps(data).encode('utf8'))
-        self._mmap.flush()
+        slot_count = 1
+        max_slots = min(ModuleCtx.Max_Slots, self.size // ModuleCtx.Slot_Table_Ratio // ModuleCtx.Slot.size)
+
+        while slot_count * 2 <= max_slots:
+            slot_count *= 2
+
+        return slot_count
 
 # ################################################################################################################################
 
     def store_initial(self):
-        """ Stores initial data in shmem unless there is already data in there.
+        """ Stores the initial layout in shmem unless there is already one in there.
         """
-        if self.load(False):
-            return
-        else:
-            self.store({})
+        with self._locked():
+            magic, slot_count, _ignored_size, _ignored_generation, _ignored_data_end = self._read_header()
+
+            # Someone has already created the table so we only need to know how big it is ..
+            if magic == ModuleCtx.Magic:
+                self.slot_count = slot_count
+
+            # .. otherwise, we are the first ones.
+            else:
+                self.slot_count = self._get_slot_count()
+                self._mmap[:self._get_data_start()] = b'\x00' * self._get_data_start()
+                self._write_header(0, self._get_data_start())
+
+# ################################################################################################################################
+
+    def _get_data_start(self):
+        return ModuleCtx.Header_Size + self.slot_count * ModuleCtx.Slot.size
+
+# ################################################################################################################################
+
+    def _read_header(self):
+        return ModuleCtx.Header.unpack_from(self._mmap, 0)
+
+# ################################################################################################################################
+
+    def _write_header(self, generation, data_end):
+        ModuleCtx.Header.pack_into(self._mmap, 0, ModuleCtx.Magic, self.slot_count, self.size, generation, data_end)
+
+# ################################################################################################################################
+
+    def _get_slot_offset(self, slot_idx):
+        return ModuleCtx.Header_Size + slot_idx * ModuleCtx.Slot.size
+
+# ################################################################################################################################
+
+    def _get_full_key(self, parent, key):
+        """ Returns a key under which a value is stored, e.g. ('/pubsub/pid', 'current') -> b'pubsub/pid\x00current'.
+        """
+        parent = '/'.join(elem for elem in parent.split('/') if elem)
+        return '{}\x00{}'.format(parent, key).encode('utf8')
+
+# ################################################################################################################################
+
+    def _get_key_hash(self, full_key):
+        # We cannot use hash() because it returns different values in each process
+        return int.from_bytes(blake2b(full_key, digest_size=8).digest(), 'little')
+
+# ################################################################################################################################
+
+    def _read_record(self, offset):
+        key_len, value_len = ModuleCtx.Record.unpack_from(self._mmap, offset)
+        key_start = offset + ModuleCtx.Record.size
+        value_start = key_start + key_len
+
+        return self._mmap[key_start:value_start], self._mmap[value_start:value_start + value_len]
+
+# ################################################################################################################################
+
+    def _find_slot(self, full_key, key_hash):
+        """ Returns the index of the slot that holds the key or of the first empty slot that the key can be stored in.
+        Must be called with the lock held.
+        """
+        slot_idx = key_hash % self.slot_count
+
+        for _ in range(self.slot_count):
+
+            _ignored_seq, slot_hash, offset, length = ModuleCtx.Slot.unpack_from(self._mmap, self._get_slot_offset(slot_idx))
+
+            if not length:
+                return slot_idx
+
+            if slot_hash == key_hash and self._read_record(offset)[0] == full_key:
+                return slot_idx
+
+            slot_idx = (slot_idx + 1) % self.slot_count
+
+        raise ValueError('No free slots in shmem `{}` ({} slots, {})'.format(self.shmem_name, self.slot_count, self.key_name))
 
 # ################################################################################################################################
 
-    def load(self, needs_loads=True):
-        """ Reads in all data from RAM and, optionally, loads it as JSON.
+    def _compact(self, generation):
+        """ Rewrites all the current records at the beginning of the data area, dropping previous versions of their values.
+        Must be called with the lock held.
         """
-        self._mmap.seek(0)
-        data = self._mmap.read(self.size).strip(b'\x00')
-        return loads(data.decode('utf8')) if needs_loads else data
+        data_start = self._get_data_start()
+
+        # Let readers know that records are being moved ..
+        self._write_header(generation + 1, self._read_header()[4])
+
+        data = bytearray()
+        slots = []
+
+        for slot_idx in range(self.slot_count):
+            slot_offset = self._get_slot_offset(slot_idx)
+            seq, key_hash, offset, length = ModuleCtx.Slot.unpack_from(self._mmap, slot_offset)
+
+            if length:
+                slots.append((slot_offset, seq, key_hash, data_start + len(data), length))
+                data += self._mmap[offset:offset + length]
+
+        self._mmap[data_start:data_start + len(data)] = data
+
+        for slot_offset, seq, key_hash, offset, length in slots:
+            ModuleCtx.Slot.pack_into(self._mmap, slot_offset, seq, key_hash, offset, length)
+
+        # .. and that they can read them again.
+        data_end = data_start + len(data)
+        self._write_header(generation + 2, data_end)
+
+        return generation + 2, data_end
+
+# ################################################################################################################################
+
+    def _set(self, full_key, value):
+        """ Serializes a value as JSON and stores it under a given key.
+        """
+        key_hash = self._get_key_hash(full_key)
+        value = dumps(value).encode('utf8')
+        record = ModuleCtx.Record.pack(len(full_key), len(value)) + full_key + value
+
+        with self._locked():
+            _ignored_magic, _ignored_slot_count, _ignored_size, generation, data_end = self._read_header()
+            slot_idx = self._find_slot(full_key, key_hash)
+
+            # Reclaim space taken by previous versions of values if there is not enough of it ..
+            if data_end + len(record) > self.size:
+                generation, data_end = self._compact(generation)
+
+                if data_end + len(record) > self.size:
+                    raise ValueError('Not enough space in shmem `{}` for `{}` ({} bytes, {})'.format(
+                        self.shmem_name, full_key, len(record), self.key_name))
+
+            # .. write the record where no reader is looking ..
+            self._mmap[data_end:data_end + len(record)] = record
+            self._write_header(generation, data_end + len(record))
+
+            # .. and point the slot to it. The sequence is made odd before the slot is changed and even again
+            # only after that, which lets readers notice that the slot changed while they were reading it.
+            slot_offset = self._get_slot_offset(slot_idx)
+            seq = ModuleCtx.Slot_Seq.unpack_from(self._mmap, slot_offset)[0]
+
+            ModuleCtx.Slot_Seq.pack_into(self._mmap, slot_offset, seq + 1)
+            ModuleCtx.Slot.pack_into(self._mmap, slot_offset, seq + 1, key_hash, data_end, len(record))
+            ModuleCtx.Slot_Seq.pack_into(self._mmap, slot_offset, seq + 2)
+
+# ################################################################################################################################
+
+    def _get(self, full_key):
+        """ Returns a value stored under a given key or raises KeyError if there is no such key.
+        """
+        key_hash = self._get_key_hash(full_key)
+
+        for _ in range(ModuleCtx.Max_Read_Attempts):
+
+            generation = self._read_header()[3]
+
+            # Records are being compacted, try again in a moment
+            if generation % 2:
+                sleep(0)
+                continue
+
+            slot_idx = key_hash % self.slot_count
+
+            for _ in range(self.slot_count):
+
+                slot_offset = self._get_slot_offset(slot_idx)
+                seq, slot_hash, offset, length = ModuleCtx.Slot.unpack_from(self._mmap, slot_offset)
+
+                # The slot is being updated
+                if seq % 2:
+                    break
+
+                # No such key, unless it is being added right now, which is checked below
+                if not length:
+                    value = KeyError
+                    break
+
+                if slot_hash == key_hash:
+                    record_key, value = self._read_record(offset)
+                    if record_key == full_key:
+                        break
+
+                slot_idx = (slot_idx + 1) % self.slot_count
+
+            else:
+                value = KeyError
+
+            # We can trust what we read only if no writer changed it in the meantime
+            if (not seq % 2) and seq == ModuleCtx.Slot.unpack_from(self._mmap, slot_offset)[0] and \
+                generation == self._read_header()[3]:
+
+                if value is KeyError:
+                    raise KeyError(full_key)
+                else:
+                    return loads(value)
+
+        raise ValueError('Could not read `{}` from shmem `{}` ({})'.format(full_key, self.shmem_name, self.key_name))
+
+# ################################################################################################################################
+
+    def load(self):
+        """ Returns all the keys and values as a dictionary of parents, each containing its keys.
+        """
+        out = {} # type: dict
+
+        with self._locked():
+            for slot_idx in range(self.slot_count):
+                _ignored_seq, _ignored_hash, offset, length = ModuleCtx.Slot.unpack_from(
+                    self._mmap, self._get_slot_offset(slot_idx))
+
+                if length:
+                    full_key, value = self._read_record(offset)
+                    parent, key = full_key.decode('utf8').split('\x00', 1)
+                    out.setdefault('/' + parent, {})[key] = loads(value)
+
+        return out
 
 # ################################################################################################################################
 
@@ -120,48 +414,26 @@ class SharedMemoryIPC:
             logger.info('Closing IPC (%s)', self.key_name)
 
         self._mmap.close()
-        try:
-            self._mem.unlink()
-        except ipc.ExistentialError:
-            pass
 
-# ################################################################################################################################
-
-    def get_parent(self, parent_path, needs_data=True):
-        """ Returns element pointed to by parent_path, creating all elements along the way, if neccessary.
-        """
-        data = self.load()
-        parent_path = [elem for elem in parent_path.split('/') if elem]
-
-        # Find or create element that is parent of input key
-        current = data
-        while parent_path:
-            next = parent_path.pop(0)
-            current = current.setdefault(next, {})
-
-        return (data, current) if needs_data else current
+        for item in self._mem, self._lock:
+            try:
+                item.unlink()
+            except ipc.ExistentialError:
+                pass
 
 # ################################################################################################################################
 
     def set_key(self, parent, key, value):
         """ Set key to value under element called 'parent'.
         """
-        # Get parent to add our key to - will create it if needed
-        data, parent = self.get_parent(parent)
-
-        # Set key to value
-        parent[key] = value
-
-        # Save it all back
-        self.store(data)
+        self._set(self._get_full_key(parent, key), value)
 
 # ################################################################################################################################
 
     def _get_key(self, parent, key):
         """ Low-level implementation of get_key which does not handle timeouts.
         """
-        parent = self.get_parent(parent, False)
-        return parent[key]
+        return self._get(self._get_full_key(parent, key))
 
 # ################################################################################################################################
 
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+from unittest.mock import patch
+
+# Zato
+from zato.common.ext.dataclasses import dataclass
+from zato.common.marshal_ import api as marshal_api
+from zato.common.marshal_.api import compile_model, ElementMissing, get_model_plan, MarshalAPI, Model, ModuleCtx
+from zato.common.test.marshall_ import Address, CreatePhoneListRequest, CreateUserRequest, Phone, WithAny
+from zato.common.typing_ import cast_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.server.service import Service
+    Service = Service
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+@dataclass(init=False, repr=False)
+class Tree(Model):
+    name: str
+    children: 'list[Tree]'
+
+@dataclass(init=False, repr=False)
+class AddressSubclass(Address):
+    country: str
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CompiledModelTestCase(TestCase):
+
+    def _get_user_request_data(self, role_count=2):
+        return {
+            'request_id': '123',
+            'user': {
+                'user_name': 'my.user',
+                'address': {
+                    'locality': 'my.locality',
+                }
+            },
+            'role_list': [{'type': 'type.{}'.format(idx), 'name': 'name.{}'.format(idx)} for idx in range(role_count)]
+        }
+
+# ################################################################################################################################
+
+    def test_from_dict(self):
+
+        service = cast_('Service', None)
+
+        data_list = [
+            (CreateUserRequest, self._get_user_request_data(), {
+                'request_id': 123,
+                'user': {
+                    'user_name': 'my.user',
+                    'address': {'locality': 'my.locality', 'post_code': '', 'details': {}, 'characteristics': []}
+                },
+                'role_list': [{'type': 'type.0', 'name': 'name.0'}, {'type': 'type.1', 'name': 'name.1'}]
+            }),
+            (CreatePhoneListRequest, {'phone_list': [{'attr_list': [{'type': 'a', 'name': 'b'}]}, {}]}, {
+                'phone_list': [{'attr_list': [{'type': 'a', 'name': 'b'}]}, {'attr_list': []}]
+            }),
+            (WithAny, {}, {'str1': None, 'list1': [], 'dict1': {}}),
+            (Address, {'locality': 'abc', 'characteristics': [1, 2]}, {
+                'locality': 'abc', 'post_code': '', 'details': {}, 'characteristics': [1, 2]
+            }),
+        ]
+
+        for DataClass, data, expected in data_list:
+            self.assertDictEqual(MarshalAPI().from_dict(service, data, DataClass).to_dict(), expected)
+
+        # Empty values of mutable types are not shared between instances
+        first = MarshalAPI().from_dict(service, {'locality': 'abc'}, Address)
+        second = MarshalAPI().from_dict(service, {'locality': 'abc'}, Address)
+        self.assertIsNot(first.details, second.details)
+
+# ################################################################################################################################
+
+    def test_errors(self):
+
+        service = cast_('Service', None)
+        data = {'phone_list': [{}, {'attr_list': [{'type': 'a', 'name': 'b'}, {'type': 'c'}]}]}
+
+        with self.assertRaises(ElementMissing) as cm:
+            MarshalAPI().from_dict(service, data, CreatePhoneListRequest)
+
+        self.assertEqual(cm.exception.reason, 'Element missing: /phone_list[1]/attr_list[1]/name')
+
+# ################################################################################################################################
+
+    def test_plan_cached_per_class(self):
+
+        compile_model(CreatePhoneListRequest)
+
+        # Nested models are compiled too ..
+        self.assertIn(ModuleCtx.Plan_Attr, Phone.__dict__)
+
+        # .. the plan is reused ..
+        self.assertIs(get_model_plan(Phone), get_model_plan(Phone))
+
+        # .. but subclasses have their own.
+        address_plan = get_model_plan(Address)
+        subclass_plan = get_model_plan(AddressSubclass)
+
+        self.assertIsNot(address_plan, subclass_plan)
+        self.assertNotIn('country', [item.name for item in address_plan.field_plans])
+        self.assertIn('country', [item.name for item in subclass_plan.field_plans])
+
+        # Models may refer to themselves
+        compile_model(Tree)
+
+# ################################################################################################################################
+
+    def test_plan_compiled_once(self):
+
+        service = cast_('Service', None)
+        data = self._get_user_request_data(role_count=1000)
+
+        # Make sure the plan exists before the model is used ..
+        compile_model(CreateUserRequest)
+
+        # .. which means that no field needs to be inspected again, no matter how many elements there are on input.
+        with patch.object(marshal_api, 'FieldPlan', side_effect=AssertionError('FieldPlan created')):
+            for _ in range(3):
+                request = MarshalAPI().from_dict(service, data, CreateUserRequest)
+
+        self.assertEqual(len(request.role_list), 1000)
+        self.assertEqual(request.role_list[-1].name, 'name.999')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from tracemalloc import get_traced_memory, start as tracemalloc_start, stop as tracemalloc_stop
+from unittest import main, TestCase
+
+# Zato
+from zato.common.api import CHANNEL, WEB_SOCKET
+from zato.common.audit_log import AuditLog, DataReceived, DataSent, LogContainerConfig
+from zato.common.util.disk_ring import DiskRing, ModuleCtx as DiskRingCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How much history test_memory_constant stores - this can be raised, e.g. to 10 GB, through an environment variable
+    History_Size = int(os.environ.get('Zato_Test_Audit_Log_History_Size') or 200_000_000)
+
+    # How big each event stored in test_memory_constant is
+    Event_Size = 10_000
+
+    Object_ID = '123'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class AuditLogTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+        self.start = datetime(2023, 1, 1, 12, 0, 0, 1)
+
+# ################################################################################################################################
+
+    def _get_audit_log(self, max_bytes, max_len_messages=0, base_dir=None, type_=CHANNEL.HTTP_SOAP):
+
+        config = LogContainerConfig()
+        config.type_ = type_
+        config.object_id = ModuleCtx.Object_ID
+        config.max_len_messages_sent = max_len_messages
+        config.max_len_messages_received = max_len_messages
+        config.max_bytes_per_message_sent = 1_000_000
+        config.max_bytes_per_message_received = 1_000_000
+        config.max_bytes_sent = max_bytes
+        config.max_bytes_received = max_bytes
+
+        audit_log = AuditLog(base_dir)
+        audit_log.create_container(config)
+
+        return audit_log, config
+
+# ################################################################################################################################
+
+    def _store(self, audit_log, idx, data, event_class=DataReceived):
+
+        data_event = event_class()
+        data_event.type_ = CHANNEL.HTTP_SOAP
+        data_event.object_id = ModuleCtx.Object_ID
+        data_event.data = data
+        data_event.timestamp = self.start + timedelta(seconds=idx)
+        data_event.msg_id = 'msg.{}'.format(idx)
+
+        audit_log.store_data(data_event)
+        return data_event
+
+# ################################################################################################################################
+
+    def test_on_disk(self):
+
+        audit_log, _ = self._get_audit_log(1_000_000, 2, self.tmp_dir.name)
+        container = audit_log.get_container(CHANNEL.HTTP_SOAP, ModuleCtx.Object_ID)
+
+        events = [
+            self._store(audit_log, 0, b'abc'),
+            self._store(audit_log, 1, 'zażółć'),
+            self._store(audit_log, 2, None),
+            self._store(audit_log, 3, b'def', DataSent),
+        ]
+
+        # Events read back from disk are the same as if they had been kept in RAM ..
+        self.assertListEqual(container.get_events('received'), [event.to_dict() for event in events[:3]])
+
+        # .. they can be looked up by their timestamps ..
+        result = container.get_events('received', self.start + timedelta(seconds=1), self.start + timedelta(seconds=2))
+        self.assertListEqual([item['msg_id'] for item in result], ['msg.1', 'msg.2'])
+
+        # .. and the most recent ones are returned as a dict.
+        result = container.to_dict()
+        self.assertListEqual([item['msg_id'] for item in result['received']], ['msg.1', 'msg.2'])
+        self.assertListEqual([item['msg_id'] for item in result['sent']], ['msg.3'])
+
+# ################################################################################################################################
+
+    def test_on_disk_reopen(self):
+
+        audit_log, config = self._get_audit_log(1_000_000, 0, self.tmp_dir.name)
+
+        for idx in range(10):
+            _ = self._store(audit_log, idx, b'abc')
+
+        # Data survives editing a container as well as starting again with a new log ..
+        audit_log.edit_container(config)
+        _ = self._store(audit_log, 10, b'abc')
+
+        audit_log = AuditLog(self.tmp_dir.name)
+        audit_log.create_container(config)
+
+        container = audit_log.get_container(CHANNEL.HTTP_SOAP, ModuleCtx.Object_ID)
+        self.assertEqual(len(container.get_events('received')), 11)
+
+        # .. but not deleting it.
+        audit_log.delete_container(CHANNEL.HTTP_SOAP, ModuleCtx.Object_ID)
+        self.assertListEqual(os.listdir(os.path.join(self.tmp_dir.name, CHANNEL.HTTP_SOAP)), [])
+
+# ################################################################################################################################
+
+    def test_base_dir(self):
+
+        root_dir = os.path.join(self.tmp_dir.name, 'audit-log')
+
+        # Each process uses a directory of its own ..
+        audit_log1 = AuditLog()
+        audit_log1.open_base_dir(root_dir)
+
+        audit_log2 = AuditLog()
+        audit_log2.open_base_dir(root_dir)
+
+        self.assertNotEqual(audit_log1.base_dir, audit_log2.base_dir)
+        self.assertEqual(os.path.dirname(audit_log1.base_dir), root_dir)
+
+        # .. until it no longer exists, in which case its directory is taken over by a new process ..
+        audit_log1._base_dir_lock.close()
+
+        audit_log3 = AuditLog()
+        audit_log3.open_base_dir(root_dir)
+        self.assertEqual(audit_log3.base_dir, audit_log1.base_dir)
+
+        # .. and new directories are created only if there are no such ones.
+        audit_log4 = AuditLog()
+        audit_log4.open_base_dir(root_dir)
+        self.assertNotIn(audit_log4.base_dir, (audit_log2.base_dir, audit_log3.base_dir))
+
+        for audit_log in audit_log2, audit_log3, audit_log4:
+            audit_log._base_dir_lock.close()
+
+# ################################################################################################################################
+
+    def test_on_disk_truncated(self):
+
+        audit_log, _ = self._get_audit_log(200_000, 0, self.tmp_dir.name)
+        container = audit_log.get_container(CHANNEL.HTTP_SOAP, ModuleCtx.Object_ID)
+
+        # An event too big for a segment is still stored ..
+        _ = self._store(audit_log, 0, b'a' * 500_000)
+
+        # .. though only with as much of its data as will fit.
+        events = container.get_events('received')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['msg_id'], 'msg.0')
+        self.assertGreater(len(events[0]['data']), 99_000)
+        self.assertLess(len(events[0]['data']), 100_000)
+
+# ################################################################################################################################
+
+    def test_in_ram_types(self):
+
+        audit_log, _ = self._get_audit_log(1_000_000, 2, self.tmp_dir.name, WEB_SOCKET.AUDIT_KEY)
+        container = audit_log.get_container(WEB_SOCKET.AUDIT_KEY, ModuleCtx.Object_ID)
+
+        # Containers created for each connection never leave anything on disk
+        self.assertIsNone(container.storage_dir)
+        self.assertListEqual(os.listdir(self.tmp_dir.name), [])
+
+# ################################################################################################################################
+
+    def test_ring_corrupt(self):
+
+        ring = DiskRing(self.tmp_dir.name, 400_000, 100_000)
+        self.addCleanup(ring.close)
+
+        for idx in range(3):
+            self.assertTrue(ring.append(idx, b'abc'))
+
+        # The size of the second record points past the end of what is in use ..
+        offset = DiskRingCtx.Header_Size + DiskRingCtx.Record.size + 3
+        DiskRingCtx.Record.pack_into(ring._mmap, offset, 100_000, 1)
+
+        # .. which means that nothing from that record on is read.
+        self.assertListEqual(list(ring.read()), [(0, b'abc')])
+
+# ################################################################################################################################
+
+    def test_ring_max_bytes(self):
+
+        ring = DiskRing(self.tmp_dir.name, 400_000, 100_000)
+        self.addCleanup(ring.close)
+
+        for idx in range(1000):
+            self.assertTrue(ring.append(idx, b'%05d' % idx + b'a' * 995))
+
+        # Only the newest segments remain, with the oldest records deleted along with their segments ..
+        self.assertEqual(len(ring.segments), 4)
+        self.assertLessEqual(ring.size, 400_000)
+
+        records = list(ring.read())
+        self.assertEqual(records[-1][0], 999)
+        self.assertEqual(records[0][1][:5], b'%05d' % records[0][0])
+        self.assertListEqual([record[0] for record in records], list(range(records[0][0], 1000)))
+
+        # .. the latest ones can be read without reading all of them ..
+        self.assertListEqual([record[0] for record in ring.get_latest(3)], [997, 998, 999])
+
+        # .. and data that would never fit is rejected.
+        self.assertFalse(ring.append(1000, b'a' * 100_000))
+
+# ################################################################################################################################
+
+    def test_in_ram_max_bytes(self):
+
+        audit_log, _ = self._get_audit_log(1000, 5)
+        container = audit_log.get_container(CHANNEL.HTTP_SOAP, ModuleCtx.Object_ID)
+
+        # Large events push out older ones ..
+        for idx in range(3):
+            _ = self._store(audit_log, idx, b'a' * 400)
+
+        self.assertListEqual([item['msg_id'] for item in container.get_events('received')], ['msg.1', 'msg.2'])
+        self.assertEqual(container.bytes_stored['received'], 800)
+
+        # .. and so does reaching the maximum number of events.
+        for idx in range(3, 9):
+            _ = self._store(audit_log, idx, b'a')
+
+        self.assertEqual(len(container.get_events('received')), 5)
+        self.assertEqual(container.bytes_stored['received'], 5)
+
+# ################################################################################################################################
+
+    def test_memory_constant(self):
+
+        audit_log, _ = self._get_audit_log(ModuleCtx.History_Size, 10, self.tmp_dir.name)
+        container = audit_log.get_container(CHANNEL.HTTP_SOAP, ModuleCtx.Object_ID)
+        data = b'a' * ModuleCtx.Event_Size
+
+        tracemalloc_start()
+
+        try:
+            for idx in range(ModuleCtx.History_Size // ModuleCtx.Event_Size):
+                _ = self._store(audit_log, idx, data)
+
+            _, peak = get_traced_memory()
+
+        finally:
+            tracemalloc_stop()
+
+        # Most of the history is on disk ..
+        ring = container.messages['received']
+        self.assertGreater(ring.size, ModuleCtx.History_Size * 0.9)
+
+        # .. while only a few events at a time were ever kept in memory ..
+        self.assertLess(peak, 500_000)
+
+        # .. and the same goes for pages of the memory-mapped segment that they were written to.
+        with open('/proc/self/smaps') as f:
+            smaps = f.read()
+
+        segment = ring.segments[-1].path
+        mapping = smaps[smaps.index(segment):]
+        rss_kb = int(mapping[mapping.index('Rss:'):].split()[1])
+
+        self.assertLess(rss_kb * 1024, 2 * 1_048_576 + 4096)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
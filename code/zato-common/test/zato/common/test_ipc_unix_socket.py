@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from tempfile import TemporaryDirectory
+from unittest import main, TestCase
+from unittest.mock import patch
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# Zato
+from zato.common.ipc.api import IPCAPI
+from zato.common.ipc.unix_socket import UnixIPCClient, UnixIPCServer
+from zato.common.util.api import get_ipc_pid_socket_path
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class UnixSocketIPCTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'ipc.sock')
+        self.connections = 0
+
+        self.server = UnixIPCServer(self.path, 'my.username', 'my.password', self._callback)
+
+        # Count how many connections were accepted ..
+        _handle_connection = self.server._handle_connection
+
+        def _handle_connection_wrapper(*args):
+            self.connections += 1
+            return _handle_connection(*args)
+
+        self.server._handle_connection = _handle_connection_wrapper
+
+        # .. before the server starts.
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+# ################################################################################################################################
+
+    def _callback(self, msg):
+        if msg.service == 'my.error':
+            raise Exception('Test error')
+        sleep(msg.data['sleep'])
+        return {'service': msg.service, 'idx': msg.data['idx']}
+
+    def _invoke(self, client, idx, sleep=0.0, service='my.service'):
+        return client.invoke(service, {'idx': idx, 'sleep': sleep}, cluster_name='my.cluster', server_name='my.server',
+            server_pid=123, source_server_name='my.source', source_server_pid=456)
+
+# ################################################################################################################################
+
+    def test_invoke_multiplexed(self):
+
+        client = UnixIPCClient(self.path, 'my.username', 'my.password')
+
+        # Earlier requests take longer so their responses arrive out of order ..
+        greenlets = [spawn(self._invoke, client, idx, (20 - idx) / 1000.0) for idx in range(20)]
+        joinall(greenlets, raise_error=True)
+
+        # .. yet each caller receives its own response ..
+        for idx, greenlet in enumerate(greenlets):
+            response = greenlet.value
+            self.assertTrue(response.meta.is_ok)
+            self.assertEqual(response.data, {'service': 'my.service', 'idx': idx})
+            self.assertEqual(response.meta.server_pid, 123)
+
+        # .. and all of them used the same connection.
+        self.assertEqual(self.connections, 1)
+
+        # Errors are reported in responses
+        response = self._invoke(client, 0, service='my.error')
+        self.assertFalse(response.meta.is_ok)
+        self.assertIsNone(response.data)
+
+        client.close()
+
+# ################################################################################################################################
+
+    def test_reconnect(self):
+
+        client = UnixIPCClient(self.path, 'my.username', 'my.password')
+        self.assertEqual(self._invoke(client, 1).data['idx'], 1)
+
+        # The connection is closed by the client ..
+        client.close()
+        sleep(0.01)
+
+        # .. and established again when needed.
+        self.assertEqual(self._invoke(client, 2).data['idx'], 2)
+        self.assertEqual(self.connections, 2)
+
+        client.close()
+
+# ################################################################################################################################
+
+    def test_invalid_credentials(self):
+
+        client = UnixIPCClient(self.path, 'my.username', 'invalid')
+
+        with self.assertRaises(Exception) as cm:
+            self._invoke(client, 1)
+
+        self.assertEqual(cm.exception.args[0], 'Could not authenticate to IPC server `{}`'.format(self.path))
+
+    def test_api_stop_and_fallback(self):
+
+        pid = os.getpid()
+        path = get_ipc_pid_socket_path('my.cluster', 'my.server', pid)
+
+        api = IPCAPI(Bunch(name='my.source', pid=456))
+        api.set_password('my.password')
+        api.start_unix_server('my.cluster', 'my.server', pid, callback_func=self._callback)
+        self.addCleanup(api.stop_unix_server)
+
+        def invoke():
+            return api.invoke_by_pid(False, 'my.service', {'idx': 1, 'sleep': 0}, 'my.cluster', 'my.server', pid)
+
+        # While the server is running, its Unix socket is used ..
+        self.assertEqual(invoke().data['idx'], 1)
+        self.assertEqual(len(api.unix_clients), 1)
+
+        # .. but not after it was stopped, which deletes the socket's file and closes all the connections ..
+        api.stop_unix_server()
+
+        self.assertFalse(os.path.exists(path))
+        self.assertDictEqual(api.unix_clients, {})
+
+        # .. in which case HTTP is used instead.
+        with patch('zato.common.ipc.api.load_ipc_pid_port', return_value=12345), \
+             patch('zato.common.ipc.api.IPCClient') as ipc_client:
+
+            ipc_client.return_value.invoke.return_value = 'my.response'
+            self.assertEqual(invoke(), 'my.response')
+            self.assertEqual(ipc_client.call_args[0][2], 12345)
+
+# ################################################################################################################################
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
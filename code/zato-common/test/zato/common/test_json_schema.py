@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from tempfile import mkstemp
+from unittest import main, TestCase
+
+# JSON Schema
+from jsonschema import Draft4Validator, Draft202012Validator, validate
+from jsonschema.exceptions import SchemaError, ValidationError
+
+# Zato
+from zato.common.api import CHANNEL
+from zato.common.json_internal import dumps
+from zato.common.json_schema import compile_schema, ValidationConfig, Validator
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_schema = {
+    'type': 'object',
+    'required': ['customer_id', 'items'],
+    'additionalProperties': False,
+    'properties': {
+        'customer_id': {'type': 'integer', 'minimum': 1},
+        'currency': {'enum': ['EUR', 'USD']},
+        'note': {'type': ['string', 'null'], 'maxLength': 5},
+        'items': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'sku': {'type': 'string', 'pattern': '^[A-Z]+-[0-9]+$'},
+                    'qty': {'type': 'number', 'exclusiveMinimum': 0},
+                }
+            }
+        }
+    }
+}
+
+_valid = {'customer_id': 1, 'currency': 'EUR', 'note': None, 'items': [{'sku': 'ABC-1', 'qty': 2.0}]}
+
+_invalid = [
+    {'items': [{'sku': 'ABC-1'}]},
+    dict(_valid, customer_id=0),
+    dict(_valid, customer_id=True),
+    dict(_valid, currency='PLN'),
+    dict(_valid, note='abcdef'),
+    dict(_valid, items=[]),
+    dict(_valid, items=[{'sku': 'abc'}]),
+    dict(_valid, items=[{'qty': 0}]),
+    dict(_valid, extra=1),
+    [],
+]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class JSONSchemaTestCase(TestCase):
+
+    def _get_validator(self, schema):
+
+        _, schema_path = mkstemp(suffix='.json')
+        self.addCleanup(os.remove, schema_path)
+
+        with open(schema_path, 'w') as f:
+            _ = f.write(dumps(schema))
+
+        config = ValidationConfig()
+        config.is_enabled = True
+        config.object_type = CHANNEL.HTTP_SOAP
+        config.object_name = 'test.channel'
+        config.schema_path = schema_path
+        config.needs_err_details = True
+
+        validator = Validator()
+        validator.config = config
+        validator.init()
+
+        return validator
+
+# ################################################################################################################################
+
+    def _get_error(self, schema, data):
+        """ Returns the error that jsonschema.validate reports for data.
+        """
+        try:
+            validate(data, schema)
+        except (SchemaError, ValidationError) as e:
+            return str(e)
+
+# ################################################################################################################################
+
+    def test_compile(self):
+
+        is_valid = compile_schema(_schema, Draft202012Validator)
+
+        self.assertTrue(is_valid(_valid))
+
+        for data in _invalid:
+            self.assertFalse(is_valid(data), data)
+
+# ################################################################################################################################
+
+    def test_compile_unsupported(self):
+
+        # References are not compiled ..
+        self.assertIsNone(compile_schema({'$ref': '#/$defs/a', '$defs': {'a': {}}}, Draft202012Validator))
+
+        # .. and neither are schemas with keywords whose meaning differs between drafts.
+        self.assertIsNone(compile_schema({'exclusiveMinimum': True, 'minimum': 1}, Draft4Validator))
+        self.assertIsNotNone(compile_schema({'exclusiveMinimum': 1}, Draft202012Validator))
+
+# ################################################################################################################################
+
+    def test_validate(self):
+
+        # Whether it is compiled or not, a validator reports errors exactly like jsonschema does
+        for schema in (_schema, dict(_schema, uniqueItems=True)):
+
+            validator = self._get_validator(schema)
+            self.assertEqual(validator.config.is_valid is None, 'uniqueItems' in schema)
+
+            self.assertTrue(validator.validate('cid.1', _valid))
+
+            for data in _invalid:
+                result = validator.validate('cid.1', data)
+                self.assertFalse(result)
+                self.assertEqual(result.error_msg, self._get_error(schema, data))
+
+# ################################################################################################################################
+
+    def test_invalid_schema(self):
+
+        schema = {'type': 'no-such-type'}
+        validator = self._get_validator(schema)
+
+        # An invalid schema is reported each time it is used
+        self.assertRaises(SchemaError, validator.validate, 'cid.1', {})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
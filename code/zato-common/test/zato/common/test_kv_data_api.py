@@ -96,6 +96,29 @@ class KVDataAPITestCase(ODBTestCase):
         self.assertEqual(result.creation_time, ctx.creation_time)
         self.assertEqual(result.expiry_time, default_expiry_time)
 
+# ################################################################################################################################
+
+    def test_upsert(self):
+
+        key = rand_string()
+        value1 = rand_string()
+        value2 = rand_string()
+
+        kv_data_api = KVDataAPI(cluster_id, self.session_wrapper)
+
+        # The key does not exist yet so it will be inserted ..
+        kv_data_api.upsert(key, value1)
+
+        result = kv_data_api.get(key)
+        self.assertEqual(result.value, value1)
+        self.assertEqual(result.expiry_time, default_expiry_time)
+
+        # .. now, it exists so it will be updated.
+        kv_data_api.upsert(key, value2)
+
+        result = kv_data_api.get(key)
+        self.assertEqual(result.value, value2)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from datetime import datetime
+from tempfile import mkstemp
+from unittest import main, skipUnless, TestCase
+from uuid import uuid4
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.odb.model import Base, RateLimitState
+from zato.common.rate_limiting import RateLimiting
+from zato.common.rate_limiting.common import RateLimitReached
+from zato.common.rate_limiting.counters import SharedCounters
+
+try:
+    import posix_ipc
+except ImportError:
+    posix_ipc = None
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ExactRateLimitingTestCase(TestCase):
+
+    def setUp(self):
+        _, self.db_path = mkstemp(suffix='.db')
+        self.engine = create_engine('sqlite:///{}'.format(self.db_path))
+        Base.metadata.create_all(self.engine, tables=[RateLimitState.__table__])
+        self.session_func = sessionmaker(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    def _get_rate_limiting(self, definition:'str'='* = 5/m') -> 'RateLimiting':
+        """ Each RateLimiting object stands for another host, with its own counters, but they all share the same ODB.
+        """
+        rate_limiting = RateLimiting()
+        rate_limiting.cluster_id = 1
+        rate_limiting.sql_session_func = self.session_func
+        rate_limiting.create({
+            'id': 123,
+            'type_': 'service',
+            'name': 'my.service',
+            'is_active': True,
+            'parent_type': None,
+            'parent_name': None,
+        }, definition, True)
+
+        return rate_limiting
+
+    def _check_limit(self, rate_limiting:'RateLimiting', count:'int') -> 'int':
+        """ Returns how many of the requests were allowed.
+        """
+        allowed = 0
+
+        for idx in range(count):
+            try:
+                rate_limiting.check_limit('cid.{}'.format(idx), 'service', 'my.service', '127.0.0.1')
+            except RateLimitReached:
+                pass
+            else:
+                allowed += 1
+
+        return allowed
+
+    def _get_odb_requests(self) -> 'any_':
+        session = self.session_func()
+        try:
+            return [item.requests for item in session.query(RateLimitState).all()]
+        finally:
+            session.close()
+
+# ################################################################################################################################
+
+    def test_exact_limit(self):
+
+        rate_limiting = self._get_rate_limiting()
+
+        # Requests are allowed until the limit is reached ..
+        self.assertEqual(self._check_limit(rate_limiting, 10), 5)
+
+        # .. none of which required accessing the ODB ..
+        self.assertListEqual(self._get_odb_requests(), [])
+
+        # .. until the counters are synchronized, which stores only the requests that were allowed.
+        rate_limiting.sync_counters()
+        self.assertListEqual(self._get_odb_requests(), [5])
+
+        # Nothing is stored twice
+        rate_limiting.sync_counters()
+        self.assertListEqual(self._get_odb_requests(), [5])
+
+# ################################################################################################################################
+
+    def test_hosts_synchronized(self):
+
+        host1 = self._get_rate_limiting()
+        host2 = self._get_rate_limiting()
+
+        # The first host uses up some of the limit ..
+        self.assertEqual(self._check_limit(host1, 3), 3)
+        host1.sync_counters()
+
+        # .. and once the second one learns about it, it allows only what is left.
+        host2.sync_counters()
+        self.assertEqual(self._check_limit(host2, 10), 2)
+
+        host2.sync_counters()
+        host1.sync_counters()
+
+        self.assertListEqual(self._get_odb_requests(), [5])
+        self.assertEqual(self._check_limit(host1, 10), 0)
+
+# ################################################################################################################################
+
+    def test_sync_error(self):
+
+        rate_limiting = self._get_rate_limiting()
+        self.assertEqual(self._check_limit(rate_limiting, 3), 3)
+
+        # The ODB is not available ..
+        def session_func():
+            raise Exception('Test exception')
+
+        rate_limiting.sql_session_func = session_func
+        rate_limiting.sync_counters()
+
+        # .. so the requests are stored the next time it is.
+        rate_limiting.sql_session_func = self.session_func
+        rate_limiting.sync_counters()
+
+        self.assertListEqual(self._get_odb_requests(), [3])
+
+# ################################################################################################################################
+
+    def test_sync_on_stop(self):
+
+        rate_limiting = self._get_rate_limiting()
+        self.assertEqual(self._check_limit(rate_limiting, 3), 3)
+
+        # Requests not stored yet are not lost when a server stops
+        rate_limiting.stop_sync_counters()
+        self.assertListEqual(self._get_odb_requests(), [3])
+
+# ################################################################################################################################
+
+    def test_sync_past_periods(self):
+
+        session = self.session_func()
+        try:
+            session.add(RateLimitState(cluster_id=1, object_type='service', object_id=123, period='m.2020-01-01T10:00',
+                requests=5, last_network='*', last_cid='cid.1', last_from='127.0.0.1', last_request_time_utc=datetime.utcnow()))
+            session.commit()
+        finally:
+            session.close()
+
+        # What other hosts counted in periods that have already ended is not read back
+        rate_limiting = self._get_rate_limiting()
+        self.assertEqual(self._check_limit(rate_limiting, 1), 1)
+        rate_limiting.sync_counters()
+
+        self.assertNotIn('m.2020-01-01T10:00', rate_limiting.counters.get_periods())
+
+# ################################################################################################################################
+
+    def test_delete(self):
+
+        rate_limiting = self._get_rate_limiting()
+        self.assertEqual(self._check_limit(rate_limiting, 3), 3)
+        rate_limiting.sync_counters()
+
+        # Deleting a definition deletes its counters and what was stored in the ODB
+        rate_limiting.delete('service', 'my.service')
+        rate_limiting.sync_counters()
+
+        self.assertListEqual(self._get_odb_requests(), [])
+        self.assertListEqual(rate_limiting.counters.get_periods(), [])
+
+# ################################################################################################################################
+
+    def test_table_full(self):
+
+        # There is no room for more counters ..
+        rate_limiting = self._get_rate_limiting()
+        rate_limiting.counters = SharedCounters(slot_count=1)
+
+        _ = rate_limiting.counters.incr(b'other.key', None)
+
+        # .. in which case requests are counted in the ODB directly.
+        self.assertEqual(self._check_limit(rate_limiting, 10), 5)
+        self.assertListEqual(self._get_odb_requests(), [5])
+
+# ################################################################################################################################
+
+    @skipUnless(posix_ipc, 'posix_ipc not available')
+    def test_shared_memory(self):
+
+        deployment_key = uuid4().hex
+
+        # Two processes on the same host ..
+        counters1 = SharedCounters()
+        counters2 = SharedCounters()
+
+        counters1.create(deployment_key)
+        counters2.create(deployment_key)
+
+        # .. pretend that they are separate processes.
+        counters2.pid = counters1.pid + 1
+
+        try:
+            key = counters1.get_key('service', 123, 'm.2023-01-01T10:00', '*')
+
+            # They count requests together ..
+            self.assertTupleEqual(counters1.incr(key, 2), (True, 1))
+            self.assertTupleEqual(counters2.incr(key, 2), (True, 2))
+            self.assertTupleEqual(counters1.incr(key, 2), (False, 2))
+
+            # .. but only one of them synchronizes the counters with the ODB ..
+            self.assertListEqual(counters1.claim(), [(key, 2)])
+            self.assertIsNone(counters2.claim())
+            self.assertListEqual(counters1.claim(), [(key, 0)])
+
+            # .. until it lets another one do it, e.g. because it is stopping ..
+            counters1.release_claim()
+            self.assertListEqual(counters2.claim(), [(key, 0)])
+
+            # .. and its counters remain in place for the other ones after it has stopped ..
+            counters1.close()
+            self.assertEqual(counters2.get_requests(key), 2)
+
+            counters3 = SharedCounters()
+            counters3.create(deployment_key, False)
+            self.assertEqual(counters3.get_requests(key), 2)
+            counters3.close()
+
+        finally:
+            counters2.close()
+            counters1.close()
+
+        # .. until they are deleted by the main process.
+        SharedCounters.unlink(deployment_key)
+        self.assertRaises(ValueError, SharedCounters().create, deployment_key, False)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
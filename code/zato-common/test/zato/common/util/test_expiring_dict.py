@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from time import monotonic
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep
+
+# Zato
+from zato.common.util.expiring_dict import ExpiringDict
+from zato.common.util.heap import ModuleCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ExpiringDictTestCase(TestCase):
+
+    def test_expire(self):
+
+        data = ExpiringDict(ttl=0.05, interval=0.01)
+
+        data.set('a', 1)
+        data.set('b', 2, ttl=10)
+        data['c'] = 3
+
+        self.assertEqual(data.get('a'), 1)
+        self.assertEqual(data['c'], 3)
+        self.assertEqual(len(data), 3)
+
+        sleep(0.1)
+
+        # Only the key with a longer TTL is still there ..
+        self.assertIsNone(data.get('a'))
+        self.assertNotIn('c', data)
+        self.assertEqual(data.get('b'), 2)
+        self.assertListEqual(list(data), ['b'])
+
+        # .. and nothing else is in the index.
+        self.assertEqual(len(data._expiry), 1)
+
+# ################################################################################################################################
+
+    def test_expired_not_returned_before_flush(self):
+
+        # The greenlet will not wake up in time but the key is expired nevertheless
+        data = ExpiringDict(ttl=0.01, interval=10)
+        data.set('a', 1)
+
+        sleep(0.02)
+
+        self.assertIsNone(data.get('a'))
+        self.assertRaises(KeyError, data.__getitem__, 'a')
+
+# ################################################################################################################################
+
+    def test_delete_overwrite(self):
+
+        data = ExpiringDict(ttl=10)
+
+        data.set('a', 1)
+        data.set('a', 2)
+        data.set('b', 1)
+        data.delete('b')
+
+        # Both deleted and overwritten keys are out of the expiration index at once ..
+        self.assertEqual(data.get('a'), 2)
+        self.assertNotIn('b', data)
+        self.assertEqual(len(data._expiry), 1)
+        self.assertEqual(data._expiry.removed_count, 2)
+
+        # .. and a key overwritten without a TTL does not expire at all.
+        data.ttl('a', 3, None)
+        self.assertEqual(len(data._expiry), 0)
+
+        self.assertRaises(KeyError, data.__delitem__, 'b')
+
+# ################################################################################################################################
+
+    def test_churn_bounded(self):
+
+        data = ExpiringDict(ttl=3600)
+
+        # Keys are constantly added and deleted ..
+        for idx in range(200_000):
+            data.set(idx, idx)
+            data.delete(idx - 10)
+
+        # .. yet the heap holds only the keys that are still there and not much more.
+        self.assertEqual(len(data), 10)
+        self.assertLessEqual(len(data._expiry.heap), len(data) + ModuleCtx.Min_Compact_Size)
+
+# ################################################################################################################################
+
+    def test_idle_and_wakeup(self):
+
+        data = ExpiringDict(interval=0.001)
+
+        # Without any keys that can expire, there is no greenlet at all ..
+        data.set('a', 1)
+        self.assertIsNone(data._greenlet)
+
+        # .. once there is a key, the greenlet waits until it expires ..
+        data.set('b', 1, ttl=3600)
+        sleep(0.01)
+
+        # .. but an earlier key wakes it up ..
+        start = monotonic()
+        data.set('c', 1, ttl=0.02)
+
+        while 'c' in data._store and monotonic() - start < 1:
+            sleep(0.005)
+
+        self.assertLess(monotonic() - start, 0.1)
+
+        # .. and when nothing is left to expire, the greenlet ends.
+        data.delete('b')
+        data.set('d', 1, ttl=0.01)
+        sleep(0.05)
+
+        self.assertIsNone(data._greenlet)
+        self.assertListEqual(list(data), ['a'])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
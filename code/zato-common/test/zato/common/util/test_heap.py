@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# Zato
+from zato.common.util.heap import LazyHeap, ModuleCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LazyHeapTestCase(TestCase):
+
+    def test_add_remove(self):
+
+        heap = LazyHeap()
+
+        # Each new key tells the caller whether it is the earliest one now ..
+        self.assertTrue(heap.add('a', 10.0))
+        self.assertFalse(heap.add('b', 20.0))
+        self.assertFalse(heap.add('c', 30.0))
+
+        # .. adding a key again replaces its previous deadline ..
+        self.assertFalse(heap.add('a', 40.0))
+        self.assertEqual(heap.get_deadline('a'), 40.0)
+
+        # .. and removed keys are gone at once, even though their entries are still in the heap.
+        self.assertTrue(heap.remove('b'))
+        self.assertFalse(heap.remove('b'))
+
+        self.assertNotIn('b', heap)
+        self.assertIsNone(heap.get_deadline('b'))
+        self.assertEqual(len(heap), 2)
+        self.assertEqual(heap.removed_count, 2)
+
+        # Entries of removed keys are dropped once they reach the top of the heap
+        self.assertEqual(heap.get_next_deadline(), 30.0)
+        self.assertEqual(heap.removed_count, 0)
+        self.assertEqual(len(heap.heap), 2)
+
+# ################################################################################################################################
+
+    def test_pop_due(self):
+
+        heap = LazyHeap()
+
+        for idx in range(10):
+            _ = heap.add(idx, float(idx))
+
+        _ = heap.remove(1)
+        _ = heap.add(2, 100.0)
+
+        # Only keys whose deadlines are not later than now are returned, in the order of their deadlines ..
+        self.assertListEqual(heap.pop_due(5.0, 3), [(0, 0.0), (3, 3.0), (4, 4.0)])
+        self.assertListEqual(heap.pop_due(5.0), [(5, 5.0)])
+
+        # .. and they are no longer in the heap afterwards.
+        self.assertNotIn(0, heap)
+        self.assertListEqual(heap.pop_due(5.0), [])
+        self.assertEqual(len(heap), 5)
+
+        # Equal deadlines are returned in the order they were added in
+        heap = LazyHeap()
+
+        for key in 'cab':
+            _ = heap.add(key, 1.0)
+
+        self.assertListEqual([key for key, _ignored_deadline in heap.pop_due(1.0)], ['c', 'a', 'b'])
+
+# ################################################################################################################################
+
+    def test_compact(self):
+
+        heap = LazyHeap()
+        count = ModuleCtx.Min_Compact_Size * 10
+
+        # Keys are constantly added and removed ..
+        for idx in range(count):
+            _ = heap.add(idx, float(idx))
+            _ = heap.remove(idx - 10)
+
+        # .. yet the heap holds only the keys that are still there and not much more.
+        self.assertEqual(len(heap), 10)
+        self.assertLessEqual(len(heap.heap), len(heap) + ModuleCtx.Min_Compact_Size)
+
+        # Removed entries do not count towards compacting the heap unless there are enough of them
+        heap = LazyHeap(min_compact_size=100)
+
+        for idx in range(99):
+            _ = heap.add(idx, float(idx))
+            _ = heap.remove(idx)
+
+        self.assertEqual(len(heap.heap), 99)
+
+        _ = heap.add(99, 99.0)
+        _ = heap.remove(99)
+
+        self.assertListEqual(heap.heap, [])
+        self.assertEqual(heap.removed_count, 0)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from io import StringIO
+from logging import Formatter, getLogger, Handler, INFO, StreamHandler
+from unittest import main, TestCase
+from uuid import uuid4
+
+# gevent
+from gevent import sleep
+
+# Zato
+from zato.common.util.log_buffer import LogBuffer
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Stream(StringIO):
+    """ Counts how many times it was written to.
+    """
+    write_count = 0
+
+    def write(self, data):
+        self.write_count += 1
+        return super().write(data)
+
+# ################################################################################################################################
+
+class _ListHandler(Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LogBufferTestCase(TestCase):
+
+    def setUp(self):
+
+        self.stream = _Stream()
+        self.stream_handler = StreamHandler(self.stream)
+        self.stream_handler.setFormatter(Formatter('%(levelname)s %(funcName)s %(user)s %(message)s'))
+
+        self.list_handler = _ListHandler()
+
+        self.logger = getLogger('zato.test.{}'.format(uuid4().hex))
+        self.logger.propagate = False
+        self.logger.setLevel(INFO)
+        self.logger.addHandler(self.stream_handler)
+        self.logger.addHandler(self.list_handler)
+
+# ################################################################################################################################
+
+    def test_log(self):
+
+        log_buffer = LogBuffer(self.logger, get_extra=lambda data: {'user': data.upper()}, flush_interval=0.01)
+
+        for idx in range(3):
+            log_buffer.log(INFO, 'Message %s', (idx,), 'user%s' % idx)
+
+        # Nothing is written by the calling greenlet ..
+        self.assertEqual(self.stream.getvalue(), '')
+        self.assertListEqual(self.list_handler.records, [])
+
+        sleep(0.05)
+
+        # .. the background one formats the records as usual, and a stream handler writes them all at once ..
+        self.assertEqual(self.stream.getvalue(),
+            'INFO test_log USER0 Message 0\nINFO test_log USER1 Message 1\nINFO test_log USER2 Message 2\n')
+        self.assertEqual(self.stream.write_count, 1)
+
+        # .. while other handlers receive each record separately.
+        self.assertListEqual([record.getMessage() for record in self.list_handler.records],
+            ['Message 0', 'Message 1', 'Message 2'])
+
+        self.assertIsNone(log_buffer._greenlet)
+
+# ################################################################################################################################
+
+    def test_drop(self):
+
+        log_buffer = LogBuffer(self.logger, max_size=2, batch_size=1, flush_interval=3600)
+
+        for idx in range(5):
+            log_buffer.log(INFO, 'Message %s', (idx,), {'user': 'abc'})
+
+        # Records that did not fit are counted ..
+        self.assertEqual(log_buffer.dropped, 3)
+
+        # .. and the ones that did are written.
+        log_buffer.flush()
+        self.assertEqual(self.stream.getvalue(), 'INFO test_drop abc Message 0\nINFO test_drop abc Message 1\n')
+        self.assertEqual(self.stream.write_count, 2)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
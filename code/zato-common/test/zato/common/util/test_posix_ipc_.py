@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from multiprocessing import get_context
+from time import perf_counter
+from unittest import main, TestCase
+from unittest.mock import patch
+from uuid import uuid4
+
+# Zato
+from zato.common.util.posix_ipc_ import ModuleCtx as PosixIPCModuleCtx, SharedMemoryIPC
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+    Size = 1_000_000
+    Writer_Count = 4
+    Keys_Per_Writer = 100
+    Updates_Per_Key = 5
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _write_keys(shmem_suffix:'str', writer_idx:'int') -> 'None':
+
+    shmem = SharedMemoryIPC()
+    shmem.create(shmem_suffix, ModuleCtx.Size, False)
+
+    for update_idx in range(ModuleCtx.Updates_Per_Key):
+        for key_idx in range(ModuleCtx.Keys_Per_Writer):
+            shmem.set_key('/writer/{}'.format(writer_idx), 'key.{}'.format(key_idx), {'update_idx': update_idx})
+
+            # Each writer checks that it can read back what it wrote, without taking any locks
+            assert shmem.get_key('/writer/{}'.format(writer_idx), 'key.{}'.format(key_idx)) == {'update_idx': update_idx}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SharedMemoryIPCTestCase(TestCase):
+
+    def setUp(self):
+        self.shmem_suffix = 'test-{}'.format(uuid4().hex)
+        self.shmem = SharedMemoryIPC()
+        self.shmem.create(self.shmem_suffix, ModuleCtx.Size, True)
+
+    def tearDown(self):
+        self.shmem.close()
+
+# ################################################################################################################################
+
+    def test_set_get(self):
+
+        self.shmem.set_key('/my/parent', 'my.key', 123)
+        self.shmem.set_key('my/parent/', 'my.key.2', {'a': ['b']})
+
+        self.assertEqual(self.shmem.get_key('/my/parent', 'my.key'), 123)
+        self.assertEqual(self.shmem.get_key('/my/parent', 'my.key.2'), {'a': ['b']})
+
+        # Values can be replaced ..
+        self.shmem.set_key('/my/parent', 'my.key', 456)
+        self.assertEqual(self.shmem.get_key('/my/parent', 'my.key'), 456)
+
+        # .. or they may not exist at all.
+        with self.assertRaises(KeyError):
+            self.shmem.get_key('/my/parent', 'my.key.3')
+
+        self.assertDictEqual(self.shmem.load(), {'/my/parent': {'my.key': 456, 'my.key.2': {'a': ['b']}}})
+
+        # Another process sees the same data
+        shmem = SharedMemoryIPC()
+        shmem.create(self.shmem_suffix, ModuleCtx.Size, False)
+        self.assertEqual(shmem.get_key('/my/parent', 'my.key'), 456)
+
+# ################################################################################################################################
+
+    def test_compact(self):
+
+        # Each value is a few kilobytes so the data area will need to be compacted many times ..
+        for idx in range(1000):
+            self.shmem.set_key('/my/parent', 'key.{}'.format(idx % 10), 'a' * 5000 + str(idx))
+
+        # .. but only the latest values will be kept.
+        for idx in range(990, 1000):
+            self.assertEqual(self.shmem.get_key('/my/parent', 'key.{}'.format(idx % 10)), 'a' * 5000 + str(idx))
+
+        # Values that would not fit in even after compacting are rejected
+        with self.assertRaises(ValueError):
+            self.shmem.set_key('/my/parent', 'too.big', 'a' * ModuleCtx.Size)
+
+# ################################################################################################################################
+
+    def test_concurrent_writers(self):
+
+        context = get_context('fork')
+        processes = [context.Process(target=_write_keys, args=(self.shmem_suffix, idx)) for idx in range(ModuleCtx.Writer_Count)]
+
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        # No writer overwrote keys of any other one
+        data = self.shmem.load()
+
+        for writer_idx in range(ModuleCtx.Writer_Count):
+            keys = data['/writer/{}'.format(writer_idx)]
+            self.assertEqual(len(keys), ModuleCtx.Keys_Per_Writer)
+
+            for value in keys.values():
+                self.assertEqual(value, {'update_idx': ModuleCtx.Updates_Per_Key - 1})
+
+# ################################################################################################################################
+
+    def test_lock_timeout(self):
+
+        # Another writer holds the lock for longer than we want to wait ..
+        self.shmem._lock.acquire()
+
+        with patch.object(PosixIPCModuleCtx, 'Lock_Timeout', 0.05):
+            with self.assertRaises(TimeoutError):
+                self.shmem.set_key('/my/parent', 'my.key', 123)
+
+        # .. which means that the lock was not released by us on its behalf ..
+        self.assertEqual(self.shmem._lock.value, 0)
+
+        # .. and it can be used again once its holder releases it.
+        self.shmem._lock.release()
+        self.shmem.set_key('/my/parent', 'my.key', 123)
+
+        self.assertEqual(self.shmem._lock.value, 1)
+        self.assertEqual(self.shmem.get_key('/my/parent', 'my.key'), 123)
+
+# ################################################################################################################################
+
+    def test_latency_flat(self):
+
+        def _get_time_per_key(key_count):
+            start = perf_counter()
+            for idx in range(key_count):
+                self.shmem.set_key('/latency/{}'.format(key_count), 'key.{}'.format(idx), idx)
+                _ = self.shmem.get_key('/latency/{}'.format(key_count), 'key.{}'.format(idx))
+            return (perf_counter() - start) / key_count
+
+        small = _get_time_per_key(10)
+        large = _get_time_per_key(500)
+
+        # Each key costs about the same no matter how many other keys there are
+        self.assertLess(large, small * 5)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Zato
+from zato.server.ext.zunicorn.http.errors import InvalidHeader, InvalidHeaderName, InvalidHTTPVersion, InvalidRequestLine, \
+    InvalidRequestMethod, InvalidSchemeHeaders, LimitRequestHeaders
+from zato.server.ext.zunicorn.util import split_request_uri
+
+# ################################################################################################################################
+
+# This is a compiled version of zato.server.ext.zunicorn.http.head - both of them need to accept and reject exactly
+# the same input, and to raise the same exceptions, which is why regular expressions from there are spelled out below.
+
+# ################################################################################################################################
+
+# Returns True if char matches [\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\"]
+cdef inline bint _is_invalid_header_name_char(Py_UCS4 char):
+    if char < 0x20 or char == 0x7F:
+        return True
+
+    return char in '()<>@,;:[]={} \t\\"'
+
+# ################################################################################################################################
+
+cdef inline Py_ssize_t _skip_digits(bytes data, Py_ssize_t idx, Py_ssize_t length):
+    """ Returns the index of the first character at or after idx that is not an ASCII digit.
+    """
+    while idx < length and 0x30 <= data[idx] <= 0x39:
+        idx += 1
+
+    return idx
+
+# ################################################################################################################################
+
+def parse_request_line(bytes line_bytes):
+    """ Returns the method, URI, path, query, fragment and version from a request line.
+    """
+    cdef list bits = line_bytes.split(None, 2)
+    cdef bytes method_bytes
+    cdef bytes version_bytes
+    cdef Py_ssize_t idx
+    cdef Py_ssize_t major_start
+    cdef Py_ssize_t major_end
+    cdef Py_ssize_t minor_start
+    cdef Py_ssize_t minor_end
+    cdef Py_ssize_t length
+
+    if len(bits) != 3:
+        raise InvalidRequestLine(line_bytes.decode('latin1'))
+
+    # Method, i.e. [A-Z0-9$-_.]{3,20} at the beginning, which is three characters between $ and _
+    method_bytes = bits[0]
+
+    if len(method_bytes) < 3:
+        raise InvalidRequestMethod(method_bytes.decode('latin1'))
+
+    for idx in range(3):
+        if not 0x24 <= method_bytes[idx] <= 0x5F:
+            raise InvalidRequestMethod(method_bytes.decode('latin1'))
+
+    method = method_bytes.decode('latin1').upper()
+
+    # URI
+    uri = bits[1].decode('latin1')
+
+    try:
+        parts = split_request_uri(uri)
+    except ValueError:
+        raise InvalidRequestLine(line_bytes.decode('latin1'))
+
+    # Version, i.e. HTTP/(\d+)\.(\d+) at the beginning
+    version_bytes = bits[2]
+    length = len(version_bytes)
+
+    if not version_bytes.startswith(b'HTTP/'):
+        raise InvalidHTTPVersion(version_bytes.decode('latin1'))
+
+    major_start = 5
+    major_end = _skip_digits(version_bytes, major_start, length)
+
+    if major_end == major_start or major_end == length or version_bytes[major_end] != 0x2E:
+        raise InvalidHTTPVersion(version_bytes.decode('latin1'))
+
+    minor_start = major_end + 1
+    minor_end = _skip_digits(version_bytes, minor_start, length)
+
+    if minor_end == minor_start:
+        raise InvalidHTTPVersion(version_bytes.decode('latin1'))
+
+    version = (int(version_bytes[major_start:major_end]), int(version_bytes[minor_start:minor_end]))
+
+    return method, uri, parts.path or '', parts.query or '', parts.fragment or '', version
+
+# ################################################################################################################################
+
+def parse_headers(bytes data, Py_ssize_t limit_request_fields, Py_ssize_t limit_request_field_size, secure_scheme_headers,
+    scheme):
+    """ Returns a list of (name, value) header tuples from data, which are all the header lines without the final empty one,
+    and the request's scheme, as given on input or as set by one of secure_scheme_headers.
+    """
+    cdef list headers = []
+    cdef list lines = data.decode('latin1').split('\r\n')
+    cdef list value_parts
+    cdef Py_ssize_t line_count = len(lines)
+    cdef Py_ssize_t idx = 0
+    cdef Py_ssize_t header_length
+    cdef Py_ssize_t colon_idx
+    cdef Py_UCS4 char
+    cdef bint scheme_header = False
+    cdef str line
+    cdef str name
+    cdef str value
+    cdef str next_line
+
+    while idx < line_count:
+
+        if len(headers) >= limit_request_fields:
+            raise LimitRequestHeaders('limit request headers fields')
+
+        line = lines[idx]
+        idx += 1
+
+        # Each line is counted along with its \r\n
+        header_length = len(line) + 2
+
+        colon_idx = line.find(':')
+        if colon_idx < 0:
+            raise InvalidHeader(line.strip())
+
+        name = line[:colon_idx].rstrip(' \t').upper()
+
+        for char in name:
+            if _is_invalid_header_name_char(char):
+                raise InvalidHeaderName(name)
+
+        name = name.strip()
+
+        # Continuation lines are kept along with their \r\n ..
+        if idx < line_count and lines[idx][:1] in (' ', '\t'):
+
+            value_parts = [(line[colon_idx + 1:] + '\r\n').lstrip()]
+
+            while idx < line_count and lines[idx][:1] in (' ', '\t'):
+                next_line = lines[idx]
+                idx += 1
+
+                header_length += len(next_line) + 2
+                if header_length > limit_request_field_size > 0:
+                    raise LimitRequestHeaders('limit request headers fields size')
+
+                value_parts.append(next_line + '\r\n')
+
+            value = ''.join(value_parts).rstrip()
+
+        # .. and without them, the value is simply stripped.
+        else:
+            value = line[colon_idx + 1:].strip()
+
+        if header_length > limit_request_field_size > 0:
+            raise LimitRequestHeaders('limit request headers fields size')
+
+        if name in secure_scheme_headers:
+            new_scheme = 'https' if value == secure_scheme_headers[name] else 'http'
+            if scheme_header:
+                if new_scheme != scheme:
+                    raise InvalidSchemeHeaders()
+            else:
+                scheme_header = True
+                scheme = new_scheme
+
+        headers.append((name, value))
+
+    return headers, scheme
+
+# ################################################################################################################################
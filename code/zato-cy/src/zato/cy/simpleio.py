@@ -68,6 +68,9 @@ backward_compat_default_value = ''
 
 prefix_optional = '-'
 
+# How many CSV rows at most are written out to a buffer before its contents are added to the output
+_stream_rows_per_chunk = 500
+
 # Dictionaries that map our own CSV parameters to stdlib's ones
 _csv_common_attr_map:dict = {
     'dialect': 'dialect',
@@ -1962,14 +1965,122 @@ class CySimpleIO:
 
         return out
 
+# ################################################################################################################################
+
+    @cy.returns(list)
+    def _get_input_columns(self, data_format:object) -> list:
+        """ Resolves all the input elements into a list of per-column converters for input in a given data format.
+        Each column is a tuple of (name, is_required, skip_always, skip_if_empty, is_secret, parse_func, sio_item).
+        """
+        out:list = []
+        sio_item:Elem = None
+        skip_empty:SIOSkipEmpty = self.definition.skip_empty
+
+        for sio_item in self.definition.all_input_elems:
+
+            # This is the same logic as in self._should_skip_on_input, resolved upfront
+            is_forced:cy.bint = sio_item.name in skip_empty.force_empty_input_set
+            skip_always:cy.bint = (not is_forced) and skip_empty.has_skip_input_set and sio_item.name in skip_empty.skip_input_set
+            skip_if_empty:cy.bint = (not is_forced) and skip_empty.skip_all_empty_input
+
+            out.append((
+                sio_item.name,
+                sio_item.is_required,
+                skip_always,
+                skip_if_empty,
+                getattr(sio_item, 'is_secret', False),
+                sio_item.parse_from.get(data_format),
+                sio_item,
+            ))
+
+        return out
+
+# ################################################################################################################################
+
+    @cy.returns(dict)
+    def _parse_input_row(self, columns:list, elem:object, data_format:object, is_csv:cy.bint) -> dict:
+        """ Parses a single dict or CSV row using columns from self._get_input_columns. This is the batch
+        equivalent of self._parse_input_elem for elements of input lists.
+        """
+        out:dict = {}
+        idx:cy.int = -1
+        sio_item:Elem = None
+
+        for name, is_required, skip_always, skip_if_empty, is_secret, parse_func, sio_item in columns:
+
+            # Start the loop with 0
+            idx += 1
+
+            if is_csv:
+                try:
+                    input_value = elem[idx]
+                except IndexError:
+                    raise ValueError('Could not find input value at index `{}` in `{}` (dialect:{}, config:{})'.format(
+                        idx, elem, self.definition._csv_config.dialect, self.definition._csv_config.common_config))
+            else:
+                input_value = cy.cast(dict, elem).get(name, InternalNotGiven)
+
+            # We do not have such a elem on input so an exception needs to be raised if this is a require one
+            if input_value is InternalNotGiven:
+
+                if is_required:
+
+                    # This goes to logs ..
+                    logger.warning('%s; No such input elem `%s` among `%s` in `%s`' % (
+                        self.service_class, name, elem if is_csv else cy.cast(dict, elem).keys(), elem))
+
+                    # .. while this is potentially returned to users.
+                    raise ElementMissing(name)
+
+                # A value that is not given is always empty
+                if skip_always or skip_if_empty:
+                    continue
+
+                if sio_item.get_default_value:
+                    value = sio_item.get_default_value()
+                else:
+                    value = sio_item.default_value
+
+            else:
+                if skip_always or (skip_if_empty and not input_value):
+                    continue
+
+                try:
+                    value = parse_func(input_value)
+                    if is_secret:
+                        value = self.eval_(name, input_value, self.server.encrypt if self.server else None)
+                except NotImplementedError:
+                    raise NotImplementedError('No parser for input `{}` ({})'.format(input_value, data_format))
+
+            out[name] = value
+
+        return out
+
 # ################################################################################################################################
 
     @cy.returns(object)
     def _parse_input_list(self, data:object, data_format:object, is_csv:cy.bint) -> object:
-        out = []
+
+        # The definition is resolved once for all the elements ..
+        columns:list = self._get_input_columns(data_format)
+        out:list = []
+
+        # .. unless there is no parser for any of them in this data format, in which case
+        # each element goes through the same path as a single one would ..
+        has_parsers:cy.bint = all(column[5] is not None for column in columns)
+
         for elem in data:
-            converted = self._parse_input_elem(elem, data_format, is_csv)
+
+            # .. and it is used directly for rows that are dicts or CSV ones ..
+            if has_parsers and (is_csv or isinstance(elem, dict)):
+                converted = self._parse_input_row(columns, elem, data_format, is_csv)
+
+            # .. while anything else, e.g. pub/sub messages or XML documents, is parsed individually.
+            else:
+                converted = self._parse_input_elem(elem, data_format, is_csv)
+
             out.append(bunchify(converted))
+
         return out
 
 # ################################################################################################################################
@@ -1990,6 +2101,34 @@ class CySimpleIO:
                 out = self._parse_input_elem(data, data_format, extra=extra)
             return bunchify(out)
 
+# ################################################################################################################################
+
+    @cy.returns(list)
+    def _get_output_columns(self, data_format:object) -> list:
+        """ Resolves all the output elements into a list of per-column converters for output in a given data format.
+        Each column is a tuple of (name, is_required, parse_func, text_encoding), where text_encoding is None
+        for elements other than text ones.
+        """
+        out:list = []
+        is_required:cy.bint
+        current_elems:dict = None
+        current_elem:Elem = None
+
+        for is_required, current_elems in (
+            (True, self.definition._output_required.elems_by_name),
+            (False, self.definition._output_optional.elems_by_name),
+            ):
+            for current_elem_name, current_elem in current_elems.items():
+
+                if cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type):
+                    text_encoding = current_elem.encoding
+                else:
+                    text_encoding = None
+
+                out.append((current_elem_name, is_required, current_elem.parse_to.get(data_format), text_encoding))
+
+        return out
+
 # ################################################################################################################################
 
     def _yield_data_dicts(self, data:object, data_format:str):
@@ -2001,19 +2140,12 @@ class CySimpleIO:
         yield list(required_elems.keys())
         yield list(optional_elems.keys())
 
-        input_data:list = data if isinstance(data, (list, tuple)) else [data]
+        input_data:object = data if isinstance(data, (list, tuple)) else [data]
 
-        # 1st item = is_required
-        # 2nd item = elems dict
-        all_elems:list = [
-            (True, required_elems),
-            (False, optional_elems),
-        ]
+        # The definition is resolved once for all the rows
+        columns:list = self._get_output_columns(data_format)
 
         is_required:cy.bint
-        current_elems:dict = None
-        current_elem_name:object = None
-        current_elem:Elem = None
         input_data_dict = None
 
         for _input_data_dict in input_data:
@@ -2035,28 +2167,25 @@ class CySimpleIO:
             elif isinstance(_input_data_dict, SQLRow):
                 input_data_dict = _input_data_dict.get_value()
 
-            for is_required, current_elems in all_elems: # type: bool, dict
-                for current_elem_name, current_elem in current_elems.items():
-                    value = input_data_dict.get(current_elem_name, InternalNotGiven)
-                    if value is InternalNotGiven:
-                        if is_required:
-                            raise SerialisationError('Required element `{}` missing in `{}` ({})'.format(
-                                current_elem_name, input_data_dict, self.service_class))
-                    else:
-                        try:
-                            parse_func = None
-                            parse_func = current_elem.parse_to[data_format]
-                            value = parse_func(value)
-                        except Exception as e:
-                            raise SerialisationError('Exception `{!r}` while serialising `{}` ({}) ({}) (func:{})'.format(
-                                e, value, self.service_class, input_data_dict, parse_func))
+            for current_elem_name, is_required, parse_func, text_encoding in columns:
+                value = input_data_dict.get(current_elem_name, InternalNotGiven)
+                if value is InternalNotGiven:
+                    if is_required:
+                        raise SerialisationError('Required element `{}` missing in `{}` ({})'.format(
+                            current_elem_name, input_data_dict, self.service_class))
+                else:
+                    try:
+                        value = parse_func(value)
+                    except Exception as e:
+                        raise SerialisationError('Exception `{!r}` while serialising `{}` ({}) ({}) (func:{})'.format(
+                            e, value, self.service_class, input_data_dict, parse_func))
 
-                        if cy.cast(cy.int, current_elem._type) == cy.cast(cy.int, sio_text_type):
-                            if isinstance(value, bytes):
-                                value = value.decode(current_elem.encoding)
+                    if text_encoding is not None:
+                        if isinstance(value, bytes):
+                            value = value.decode(text_encoding)
 
-                        # All checks passed - we can append this particular element to the output dictionary
-                        out_data_dict[current_elem_name] = value
+                    # All checks passed - we can append this particular element to the output dictionary
+                    out_data_dict[current_elem_name] = value
 
             # More yields - to actually return data
 
@@ -2064,12 +2193,11 @@ class CySimpleIO:
 
 # ################################################################################################################################
 
-    @cy.returns(str)
-    def _get_output_csv(self, data:object) -> str:
+    def _iter_output_csv(self, data:object):
 
         # No reason to continue if no SimpleIO output is declared
         if not (self.definition.has_output_required or self.definition.has_output_optional):
-            return ''
+            return
 
         gen = self._yield_data_dicts(data, DATA_FORMAT_CSV)
 
@@ -2077,7 +2205,6 @@ class CySimpleIO:
         required_field_names:list = next(gen)
         optional_field_names:list = next(gen)
 
-        out:object
         buff:StringIO = StringIO()
         writer:DictWriter = DictWriter(
             buff, required_field_names + optional_field_names, **self.definition._csv_config.writer_config)
@@ -2085,13 +2212,78 @@ class CySimpleIO:
         if self.definition._csv_config.should_write_header:
             writer.writeheader()
 
+        rows_in_buff:cy.int = 0
+
         for data_dict in gen:
             writer.writerow(data_dict)
+            rows_in_buff += 1
+
+            # Yield what we have so far and reuse the buffer for the next chunk
+            if rows_in_buff == _stream_rows_per_chunk:
+                yield buff.getvalue()
+                buff.seek(0)
+                buff.truncate(0)
+                rows_in_buff = 0
 
+        # Whatever is left, possibly the header alone
         out = buff.getvalue()
         buff.close()
 
-        return out
+        if out:
+            yield out
+
+# ################################################################################################################################
+
+    def _iter_output_json(self, data:object):
+
+        encoder = self.server_config.json_encoder
+
+        # No reason to continue if no SimpleIO output is declared
+        if not (self.definition.has_output_required or self.definition.has_output_optional):
+            yield encoder.encode('')
+            return
+
+        is_list:cy.bint = isinstance(data, (list, tuple))
+        has_response_elem:cy.bint = self.definition._has_response_elem
+        is_first:cy.bint = True
+
+        # Note that elements are converted to dicts first, which the encoder then serialises to JSON
+        gen = self._yield_data_dicts(data, DATA_FORMAT_DICT)
+
+        # Ignore field names, not needed in JSON
+        next(gen)
+        next(gen)
+
+        # Wrap the response in a top-level element if needed ..
+        if has_response_elem:
+            yield '{' + encoder.encode(self.definition._response_elem) + encoder.key_separator
+
+        # .. encode each element separately, which is what the encoder would do if it was given a full list ..
+        if is_list:
+            yield '['
+
+            for data_dict in gen:
+                if is_first:
+                    is_first = False
+                    yield encoder.encode(data_dict)
+                else:
+                    yield encoder.item_separator + encoder.encode(data_dict)
+
+            yield ']'
+
+        # .. or a single element ..
+        else:
+            yield encoder.encode(next(gen))
+
+        # .. close the top-level element.
+        if has_response_elem:
+            yield '}'
+
+# ################################################################################################################################
+
+    @cy.returns(str)
+    def _get_output_csv(self, data:object) -> str:
+        return ''.join(self._iter_output_csv(data))
 
 # ################################################################################################################################
 
@@ -2138,8 +2330,10 @@ class CySimpleIO:
 
     @cy.returns(object)
     def _get_output_json(self, data:object, serialise:cy.bint) -> object:
-        out:object = self._convert_to_dicts(data, DATA_FORMAT_JSON)
-        return self.serialise(out, DATA_FORMAT_JSON) if serialise else out
+        if serialise:
+            return ''.join(self._iter_output_json(data))
+        else:
+            return self._convert_to_dicts(data, DATA_FORMAT_JSON)
 
 # ################################################################################################################################
 
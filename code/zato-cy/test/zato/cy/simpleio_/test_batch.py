@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from json import loads
+
+# Zato
+from zato.common.api import DATA_FORMAT
+from zato.common.marshal_.api import ElementMissing
+from zato.common.test import BaseSIOTestCase
+from zato.server.service import Service
+
+# Zato - Cython
+from zato.simpleio import CySimpleIO, Int
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class BatchTestCase(BaseSIOTestCase):
+
+    def _get_service(self, response_elem=None):
+
+        class MyService(Service):
+            class SimpleIO:
+                input = 'aaa', Int('bbb'), '-ccc', '-ddd'
+                output = 'aaa', Int('bbb'), '-ccc', '-ddd'
+                default_value = 'my.default'
+
+                class SkipEmpty:
+                    input = True
+
+        if response_elem:
+            MyService.SimpleIO.response_elem = response_elem
+
+        CySimpleIO.attach_sio(None, self.get_server_config(), MyService)
+        return MyService
+
+# ################################################################################################################################
+
+    def _get_rows(self, count):
+        return [{'aaa': 'aaa-{}'.format(idx), 'bbb': str(idx), 'ccc': 'ccc-{}'.format(idx) if idx % 2 else ''}
+            for idx in range(count)]
+
+# ################################################################################################################################
+
+    def test_parse_input_list(self):
+
+        MyService = self._get_service()
+        data = self._get_rows(3)
+
+        result = MyService._sio.parse_input(data, DATA_FORMAT.DICT)
+
+        self.assertEqual(len(result), 3)
+
+        for idx, elem in enumerate(result):
+            self.assertEqual(elem.aaa, 'aaa-{}'.format(idx))
+            self.assertEqual(elem.bbb, idx)
+
+        # Optional input elements are skipped if they are missing on input ..
+        self.assertNotIn('ddd', result[1])
+
+        # .. or if they are empty.
+        self.assertNotIn('ccc', result[0])
+        self.assertEqual(result[1].ccc, 'ccc-1')
+
+        # Required elements still need to exist in all the rows
+        data.append({'aaa': 'aaa-3'})
+
+        with self.assertRaises(ElementMissing) as cm:
+            MyService._sio.parse_input(data, DATA_FORMAT.DICT)
+
+        self.assertEqual(cm.exception.elem_path, 'bbb')
+
+# ################################################################################################################################
+
+    def test_parse_input_list_no_parser(self):
+
+        MyService = self._get_service()
+        data = self._get_rows(2)
+
+        # Rows in a data format that elements have no parsers for are parsed the same way a single element would be
+        with self.assertRaises(KeyError) as cm_elem:
+            MyService._sio.parse_input(data[0], DATA_FORMAT.HL7)
+
+        with self.assertRaises(KeyError) as cm_list:
+            MyService._sio.parse_input(data, DATA_FORMAT.HL7)
+
+        self.assertEqual(cm_list.exception.args, cm_elem.exception.args)
+
+# ################################################################################################################################
+
+    def test_get_output_json(self):
+
+        for response_elem in (None, 'my_response'):
+
+            MyService = self._get_service(response_elem)
+            data = self._get_rows(1234)
+
+            result = MyService._sio.get_output(data, DATA_FORMAT.JSON)
+
+            # The output is the same as if it had been serialised in one go ..
+            expected = MyService._sio.get_output(data, DATA_FORMAT.JSON, False)
+            self.assertEqual(result, self.get_server_config().json_encoder.encode(expected))
+
+            result = loads(result)
+            if response_elem:
+                result = result[response_elem]
+
+            # .. and it contains all the elements.
+            self.assertEqual(len(result), 1234)
+            self.assertEqual(result[10], {'aaa': 'aaa-10', 'bbb': 10, 'ccc': ''})
+
+# ################################################################################################################################
+
+    def test_get_output_csv(self):
+
+        MyService = self._get_service()
+        data = self._get_rows(1234)
+
+        result = MyService._sio.get_output(data, DATA_FORMAT.CSV)
+        lines = result.splitlines()
+
+        self.assertEqual(len(lines), 1235)
+        self.assertEqual(lines[0], 'aaa,bbb,ccc,ddd')
+        self.assertEqual(lines[12], 'aaa-11,11,ccc-11,')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    from unittest import main
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
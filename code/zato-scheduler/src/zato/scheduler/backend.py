@@ -9,14 +9,14 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import datetime
 from logging import getLogger
+from time import monotonic
 from traceback import format_exc
 
 # datetime
 from dateutil.rrule import rrule, SECONDLY
 
 # gevent
-import gevent # Imported directly so it can be mocked out in tests
-from gevent import lock, sleep
+from gevent import lock, sleep, spawn
 
 # paodate
 from paodate import Delta
@@ -26,8 +26,9 @@ from zato.common.ext.future.utils import iterkeys, itervalues
 
 # Zato
 from zato.common.api import FILE_TRANSFER, SCHEDULER
-from zato.common.util.api import add_scheduler_jobs, add_startup_jobs, asbool, make_repr, new_cid, spawn_greenlet
+from zato.common.util.api import add_scheduler_jobs, add_startup_jobs, asbool, make_repr, new_cid
 from zato.scheduler.cleanup.cli import start_cleanup
+from zato.scheduler.timer_heap import TimerHeap
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -102,10 +103,6 @@ class Job:
         else:
             self.start_time = self.get_start_time(start_time if start_time is not None else datetime.datetime.utcnow())
 
-        self.wait_sleep_time = 1
-        self.wait_iter_cb = None
-        self.wait_iter_cb_args = ()
-
         # TODO: Add skip_days, skip_hours and skip_dates
 
     def __str__(self):
@@ -228,87 +225,76 @@ class Job:
             raise ValueError('Unsupported job type `{}` ({})'.format(self.type, self.name))
 
     def _spawn(self, *args, **kwargs):
-        """ A thin wrapper so that it is easier to mock this method out in unit-tests.
+        """ A thin wrapper so that it is easier to mock this method out in unit-tests. It does not wait for the greenlet
+        because all the jobs due at the same time are started one after another.
         """
-        return spawn_greenlet(*args, **kwargs)
-
-    def main_loop(self):
-
-        logger.info('Job entering main loop `%s`', self)
-
-        _sleep = gevent.sleep
-
-        try:
-            while self.keep_running:
-                try:
-                    self.current_run += 1
-
-                    # Perhaps we've already been executed enough times
-                    if self.max_repeats and self.current_run == self.max_repeats:
-                        self.keep_running = False
-                        self.max_repeats_reached = True
-                        self.max_repeats_reached_at = datetime.datetime.utcnow()
-
-                        if self.on_max_repeats_reached_cb:
-                            self.on_max_repeats_reached_cb(self)
-
-                    # Invoke callback in a new greenlet so it doesn't block the current one.
-                    self._spawn(self.callback, **{'ctx':self.get_context()})
-
-                except Exception:
-                    logger.warning(format_exc())
+        return spawn(*args, **kwargs)
 
-                finally:
-                    # pylint: disable=lost-exception
-
-                    # Pause the greenlet for however long is needed if it is not a one-off job
-                    if self.type == SCHEDULER.JOB_TYPE.ONE_TIME:
-                        return True
-                    else:
-                        _sleep(self.get_sleep_time(datetime.datetime.utcnow()))
+    def can_start(self):
+        """ Returns True if the job has everything it needs to be scheduled.
+        """
+        # If we are a job that triggers file transfer channels we do not start
+        # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
+        if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
+            logger.warning('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
+            return False
 
-            logger.info('Job leaving main loop `%s` after %d iterations', self, self.current_run)
-
-        except Exception:
-            logger.warning(format_exc())
+        if not self.start_time:
+            logger.warning('Job `%s` cannot start without start_time set', self.name)
+            return False
 
         return True
 
-    def run(self):
-
-        # OK, we're ready
-        try:
+    def get_first_deadline(self, now):
+        """ Converts the job's start time, which is in UTC, to a deadline in terms of the monotonic clock.
+        """
+        delay = (self.start_time - datetime.datetime.utcnow()).total_seconds()
+        return now + max(delay, 0)
 
-            # If we are a job that triggers file transfer channels we do not start
-            # unless our extra data is filled in. Otherwise, we would not trigger any transfer anyway.
-            if self.service == FILE_TRANSFER.SCHEDULER_SERVICE and (not self.extra):
-                logger.warning('Skipped file transfer job `%s` without extra set `%s` (%s)', self.name, self.extra, self.service)
-                return
+    def get_next_deadline(self, deadline, now):
+        """ Returns the deadline of the next run given the deadline of the current one. For interval-based jobs,
+        each deadline is computed from the previous one rather than from the time a run actually took place,
+        which means that how long it took to invoke the job does not make it drift.
+        """
+        if self.type == SCHEDULER.JOB_TYPE.INTERVAL_BASED:
+            interval = self.interval.in_seconds
+            next_deadline = deadline + interval
 
-            if not self.start_time:
-                logger.warning('Job `%s` cannot start without start_time set', self.name)
-                return
+            # We may have fallen behind, e.g. the process was suspended, in which case the runs that were missed are skipped
+            # but the next one will still be in line with all the previous ones.
+            if next_deadline <= now and interval > 0:
+                next_deadline += ((now - next_deadline) // interval + 1) * interval
 
-            logger.info('Job starting `%s`', self)
+            return next_deadline
 
-            _utcnow = datetime.datetime.utcnow
-            _sleep = gevent.sleep
+        else:
+            return now + self.get_sleep_time(datetime.datetime.utcnow())
 
-            # If the job has a start time in the future, sleep until it's ready to go.
-            now = _utcnow()
+    def on_timer(self, deadline, now):
+        """ Prepares the job's next run, which is to be started through run_callback,
+        and returns its deadline or None if there should not be any.
+        """
+        self.current_run += 1
 
-            while self.start_time > now:
-                _sleep(self.wait_sleep_time)
+        # Perhaps we've already been executed enough times
+        if self.max_repeats and self.current_run == self.max_repeats:
+            self.keep_running = False
+            self.max_repeats_reached = True
+            self.max_repeats_reached_at = datetime.datetime.utcnow()
 
-                if self.wait_iter_cb:
-                    self.wait_iter_cb(self.start_time, now, *self.wait_iter_cb_args)
+            if self.on_max_repeats_reached_cb:
+                self.on_max_repeats_reached_cb(self)
 
-                now = _utcnow()
+        if self.type == SCHEDULER.JOB_TYPE.ONE_TIME or not self.keep_running:
+            logger.info('Job `%s` will not run anymore after %d iterations', self.name, self.current_run)
+            return None
 
-            self.main_loop()
+        return self.get_next_deadline(deadline, now)
 
-        except Exception:
-            logger.warning(format_exc())
+    def run_callback(self, ctx):
+        """ Invokes callback in a new greenlet so it doesn't block the dispatcher.
+        """
+        self._spawn(self.callback, **{'ctx':ctx})
 
 # ################################################################################################################################
 
@@ -320,18 +306,17 @@ class Scheduler:
         self.startup_jobs = config.startup_jobs
         self.odb = config.odb
         self.jobs = {}
-        self.job_greenlets = {}
         self.keep_running = True
         self.lock = lock.RLock()
-        self.sleep_time = 0.1
-        self.iter_cb = None
-        self.iter_cb_args = ()
         self.ready = False
         self._add_startup_jobs = config._add_startup_jobs
         self._add_scheduler_jobs = config._add_scheduler_jobs
         self.job_log = getattr(logger, config.job_log_level)
         self.initial_sleep_time = self.config.main.get('misc', {}).get('initial_sleep_time') or SCHEDULER.InitialSleepTime
 
+        # Deadlines of all the jobs, served by a single greenlet
+        self.timer_heap = TimerHeap(self.on_timers_due)
+
     def on_max_repeats_reached(self, job):
         with self.lock:
             job.is_active = False
@@ -374,9 +359,7 @@ class Scheduler:
             del self.jobs[name]
             found = True
 
-        if name in iterkeys(self.job_greenlets):
-            self.job_greenlets[name].kill(block=False, timeout=2.0)
-            del self.job_greenlets[name]
+        if self.timer_heap.remove(name):
             found = True
 
         return found
@@ -421,14 +404,11 @@ class Scheduler:
         """ Stops all jobs and the scheduler itself.
         """
         with self.lock:
-            jobs = sorted(self.jobs)
+            jobs = sorted(itervalues(self.jobs))
             for job in jobs:
                 self._unschedule_stop(job.clone(), 'stopped')
 
-    def sleep(self, value):
-        """ A method introduced so the class is easier to mock out in tests.
-        """
-        gevent.sleep(value)
+        self.timer_heap.stop()
 
     def execute(self, name):
         """ Executes a job no matter if it's active or not. One-time job are not unscheduled afterwards.
@@ -456,17 +436,46 @@ class Scheduler:
             if ctx['type'] == SCHEDULER.JOB_TYPE.ONE_TIME and unschedule_one_time:
                 self.unschedule_by_name(ctx['name'])
 
-    def _spawn(self, *args, **kwargs):
-        """ As in the Job class, this is a thin wrapper so that it is easier to mock this method out in unit-tests.
-        """
-        return spawn_greenlet(*args, **kwargs)
-
     def spawn_job(self, job):
-        """ Spawns a job's greenlet. Must be called with self.lock held.
+        """ Adds a job's first deadline to the timer heap. Must be called with self.lock held.
         """
         job.callback = self.on_job_executed
         job.on_max_repeats_reached_cb = self.on_max_repeats_reached
-        self.job_greenlets[job.name] = self._spawn(job.run)
+
+        if job.can_start():
+            logger.info('Job starting `%s`', job)
+            self.timer_heap.add(job.name, job.get_first_deadline(monotonic()))
+
+    def on_timers_due(self, due, now):
+        """ Invoked by the timer heap with (name, deadline) tuples of all the jobs whose time has come.
+        """
+        # Jobs to run along with their contexts
+        to_run = []
+
+        with self.lock:
+            for name, deadline in due:
+                try:
+                    job = self.jobs.get(name)
+
+                    # The job may have been unscheduled in the meantime
+                    if not (job and job.keep_running):
+                        continue
+
+                    next_deadline = job.on_timer(deadline, now)
+                    to_run.append((job, job.get_context()))
+
+                    if next_deadline is not None:
+                        self.timer_heap.add(name, next_deadline)
+
+                except Exception:
+                    logger.warning(format_exc())
+
+        # Callbacks are started only once the lock is released because one-time jobs need it to unschedule themselves
+        for job, ctx in to_run:
+            try:
+                job.run_callback(ctx)
+            except Exception:
+                logger.warning(format_exc())
 
     def init_jobs(self):
 
@@ -489,9 +498,6 @@ class Scheduler:
             # Add default jobs to the ODB and start all of them, the default and user-defined ones
             self.init_jobs()
 
-            _sleep = self.sleep
-            _sleep_time = self.sleep_time
-
             with self.lock:
                 for job in sorted(itervalues(self.jobs)):
 
@@ -509,11 +515,8 @@ class Scheduler:
 
             logger.info('Scheduler started')
 
-            while self.keep_running:
-                _sleep(_sleep_time)
-
-                if self.iter_cb:
-                    self.iter_cb(*self.iter_cb_args)
+            # This returns only when the timer heap is stopped
+            self.timer_heap.run()
 
         except Exception:
             logger.warning(format_exc())
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from logging import getLogger
+from time import monotonic
+from traceback import format_exc
+
+# gevent
+from gevent import sleep
+from gevent.event import Event
+
+# Zato
+from zato.common.util.heap import LazyHeap
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How many due items to dispatch at most before letting other greenlets run
+    Max_Batch_Size = 1000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TimerHeap(LazyHeap):
+    """ Keeps the deadlines of all the scheduled items in a single heap, served by a single greenlet.
+    The greenlet sleeps until the earliest deadline, or until it is woken up because an earlier one was added,
+    and then dispatches everything that is due, in batches. Deadlines are absolute values of the monotonic clock,
+    which means that it is up to the callers to compute the next deadline of an item based on its previous one.
+    """
+    def __init__(
+        self,
+        dispatch_func, # type: callable_
+        _monotonic=monotonic, # type: callable_
+        _wait=None,    # type: callable_ | None
+        _yield=sleep,  # type: callable_
+    ) -> 'None':
+
+        super().__init__()
+
+        # Called with a list of (key, deadline) tuples and the current time
+        self.dispatch_func = dispatch_func
+
+        self._monotonic = _monotonic
+        self._yield = _yield
+
+        self.wakeup = Event()
+        self._wait = _wait or self.wakeup.wait
+        self.keep_running = True
+
+        # How many times the dispatcher woke up in total and how many times there was nothing to dispatch at all
+        self.wakeups = 0
+        self.idle_wakeups = 0
+
+# ################################################################################################################################
+
+    def add(self, key:'any_', deadline:'float') -> 'bool':
+        """ Schedules key to be dispatched at deadline, replacing any deadline that it may have had previously.
+        """
+        is_earliest = super().add(key, deadline)
+
+        # The dispatcher needs to wake up earlier than it planned to only if this is the earliest deadline now
+        if is_earliest:
+            self.wakeup.set()
+
+        return is_earliest
+
+# ################################################################################################################################
+
+    def stop(self) -> 'None':
+        self.keep_running = False
+        self.wakeup.set()
+
+# ################################################################################################################################
+
+    def run(self) -> 'None':
+        """ The main loop of the dispatcher, it returns only when the heap is stopped.
+        """
+        _monotonic = self._monotonic
+        _max_batch_size = ModuleCtx.Max_Batch_Size
+
+        while self.keep_running:
+
+            now = _monotonic()
+            due = self.pop_due(now, _max_batch_size)
+
+            if due:
+                try:
+                    self.dispatch_func(due, now)
+                except Exception:
+                    logger.warning('Could not dispatch timers, e:`%s`', format_exc())
+
+                # If the batch was full, there may be more to dispatch but other greenlets get their turn first
+                if len(due) == _max_batch_size:
+                    self._yield(0)
+
+                continue
+
+            # If we are here, nothing is due so we can sleep until the next deadline, or indefinitely if there is none ..
+            deadline = self.get_next_deadline()
+            timeout = None if deadline is None else deadline - now
+
+            # .. unless we are woken up earlier because something was added in the meantime.
+            self.wakeup.clear()
+            _ = self._wait(timeout)
+            self.wakeups += 1
+
+            # Note that nothing can be added between the check and the wait above because we never yield in between
+            next_deadline = self.get_next_deadline()
+            if next_deadline is None or next_deadline > _monotonic():
+                self.idle_wakeups += 1
+
+# ################################################################################################################################
+# ################################################################################################################################
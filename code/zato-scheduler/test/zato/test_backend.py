@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from datetime import datetime, timedelta
+from time import monotonic
+from unittest import main, TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.common.api import SCHEDULER
+from zato.scheduler.backend import Interval, Job, Scheduler
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How many jobs are due at the same time
+    Job_Count = 50
+
+    # In how many seconds from now they are due
+    Delay = 0.2
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SchedulerTestCase(TestCase):
+
+    def setUp(self):
+
+        # Job name -> when it was executed
+        self.executed = {}
+
+        config = Bunch()
+        config.on_job_executed_cb = self._on_job_executed
+        config._add_startup_jobs = False
+        config._add_scheduler_jobs = False
+        config.startup_jobs = []
+        config.odb = None
+        config.job_log_level = 'info'
+        config.main = Bunch()
+
+        self.scheduler = Scheduler(config, None)
+
+# ################################################################################################################################
+
+    def _on_job_executed(self, ctx):
+        self.executed[ctx['name']] = monotonic()
+
+# ################################################################################################################################
+
+    def test_jobs_due_together(self):
+
+        scheduler = self.scheduler
+        greenlet = spawn(scheduler.timer_heap.run)
+
+        try:
+            start_time = datetime.utcnow() + timedelta(seconds=ModuleCtx.Delay)
+            names = ['job.{}'.format(idx) for idx in range(ModuleCtx.Job_Count)]
+
+            for idx, name in enumerate(names):
+                scheduler.create(Job(idx, name, SCHEDULER.JOB_TYPE.ONE_TIME, Interval(in_seconds=1), start_time))
+
+            sleep(ModuleCtx.Delay + 0.5)
+
+            # All the jobs ran at the same time, none of them waiting for the previous ones to complete ..
+            self.assertListEqual(sorted(self.executed), sorted(names))
+            self.assertLess(max(self.executed.values()) - min(self.executed.values()), 0.05)
+
+            # .. and, being one-time ones, they were all unscheduled afterwards.
+            self.assertDictEqual(scheduler.jobs, {})
+            self.assertEqual(len(scheduler.timer_heap), 0)
+
+        finally:
+
+            # Stopping the scheduler stops its timer heap too
+            scheduler.stop()
+            greenlet.join(1)
+
+        self.assertTrue(greenlet.dead)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from time import monotonic
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.scheduler.timer_heap import ModuleCtx, TimerHeap
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SimulatedClock:
+    """ Time advances only when the timer heap waits or when callbacks pretend they take some time to complete.
+    """
+    def __init__(self, end:'float') -> 'None':
+        self.now = 0.0
+        self.end = end
+        self.heap = None # type: TimerHeap | None
+
+    def monotonic(self) -> 'float':
+        return self.now
+
+    def wait(self, timeout:'float | None') -> 'bool':
+
+        # With nothing to wait for or past the end of the test, we stop ..
+        if timeout is None or self.now + timeout > self.end:
+            self.heap.keep_running = False
+
+        # .. otherwise, we are woken up exactly when we wanted to be.
+        else:
+            self.now += timeout
+
+        return False
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class TimerHeapTestCase(TestCase):
+
+    def _get_heap(self, clock:'SimulatedClock', dispatch_func:'any_') -> 'TimerHeap':
+        heap = TimerHeap(dispatch_func, _monotonic=clock.monotonic, _wait=clock.wait, _yield=lambda _ignored: None)
+        clock.heap = heap
+        return heap
+
+# ################################################################################################################################
+
+    def test_no_drift_simulated_clock(self):
+
+        # Each key is a job with one of several intervals ..
+        intervals = {'job.{}'.format(idx): 1.0 + idx % 7 for idx in range(500)}
+
+        # .. each of its runs pretends to take that much time ..
+        execution_time = 0.0005
+
+        # .. and the test covers an hour of simulated time.
+        clock = SimulatedClock(end=3600.0)
+
+        # Job -> deadlines that it was dispatched for
+        dispatched = {}
+
+        # The largest difference between a deadline and the time it was dispatched
+        data = {'max_lateness': 0.0}
+
+        def dispatch(due, now):
+            for key, deadline in due:
+                dispatched.setdefault(key, []).append(deadline)
+                data['max_lateness'] = max(data['max_lateness'], clock.now - deadline)
+
+                # Each run takes some time yet the next deadline is computed from the previous one
+                clock.now += execution_time
+                heap.add(key, deadline + intervals[key])
+
+        heap = self._get_heap(clock, dispatch)
+
+        for key, interval in intervals.items():
+            heap.add(key, interval)
+
+        heap.run()
+
+        for key, interval in intervals.items():
+            deadlines = dispatched[key]
+
+            # Each job ran as many times as its interval allowed for ..
+            self.assertEqual(len(deadlines), int(clock.end // interval))
+
+            # .. always exactly on the same multiples of its interval.
+            for idx, deadline in enumerate(deadlines, 1):
+                self.assertEqual(deadline, idx * interval)
+
+        # Jobs due at the same time are dispatched after one another so the last ones are late by their combined time,
+        # but that does not accumulate over time.
+        self.assertLess(data['max_lateness'], len(intervals) * execution_time + 0.001)
+
+        # Something was due each second, which means that the dispatcher woke up once per second ..
+        self.assertEqual(heap.wakeups - heap.idle_wakeups, 3600)
+
+        # .. and it never woke up without anything to do, apart from the very last time, when it was stopped.
+        self.assertEqual(heap.idle_wakeups, 1)
+
+# ################################################################################################################################
+
+    def test_batches(self):
+
+        key_count = ModuleCtx.Max_Batch_Size * 2 + 1
+        batches = []
+        yields = []
+
+        clock = SimulatedClock(end=1.0)
+
+        heap = TimerHeap(lambda due, now: batches.append(due), _monotonic=clock.monotonic, _wait=clock.wait,
+            _yield=yields.append)
+        clock.heap = heap
+
+        for idx in range(key_count):
+            heap.add(idx, 0.5)
+
+        heap.run()
+
+        # Everything was dispatched once, in batches, with other greenlets allowed to run in between full batches
+        self.assertListEqual([len(batch) for batch in batches], [ModuleCtx.Max_Batch_Size, ModuleCtx.Max_Batch_Size, 1])
+        self.assertListEqual(sorted(key for batch in batches for key, _ignored_deadline in batch), list(range(key_count)))
+        self.assertListEqual(yields, [0, 0])
+        self.assertEqual(len(heap), 0)
+
+# ################################################################################################################################
+
+    def test_add_remove(self):
+
+        dispatched = []
+        clock = SimulatedClock(end=100.0)
+        heap = self._get_heap(clock, lambda due, now: dispatched.extend(due))
+
+        heap.add('a', 10.0)
+        heap.add('b', 20.0)
+        heap.add('c', 30.0)
+
+        # Replacing a deadline discards the previous one ..
+        heap.add('a', 40.0)
+
+        # .. and removed keys are not dispatched at all.
+        self.assertTrue(heap.remove('b'))
+        self.assertFalse(heap.remove('b'))
+        self.assertNotIn('b', heap)
+
+        self.assertEqual(heap.get_next_deadline(), 30.0)
+
+        heap.run()
+
+        self.assertListEqual(dispatched, [('c', 30.0), ('a', 40.0)])
+
+# ################################################################################################################################
+
+    def test_wakeup_on_earlier_deadline(self):
+
+        dispatched = []
+        heap = TimerHeap(lambda due, now: dispatched.extend((key, now) for key, _ignored_deadline in due))
+        greenlet = spawn(heap.run)
+
+        try:
+
+            # The dispatcher is sleeping until a deadline far in the future ..
+            heap.add('late', monotonic() + 3600)
+            sleep(0.01)
+
+            # .. but it wakes up as soon as an earlier one is added.
+            start = monotonic()
+            deadline = start + 0.05
+            heap.add('early', deadline)
+
+            while not dispatched and monotonic() - start < 1:
+                sleep(0.01)
+
+            key, now = dispatched[0]
+            self.assertEqual(key, 'early')
+            self.assertGreaterEqual(now, deadline)
+            self.assertLess(now - deadline, 0.02)
+            self.assertIn('late', heap)
+
+        finally:
+            heap.stop()
+            greenlet.join(1)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -52,6 +52,7 @@ from zato.common.odb.api import PoolStore
 from zato.common.odb.post_process import ODBPostProcess
 from zato.common.pubsub import SkipDelivery
 from zato.common.rate_limiting import RateLimiting
+from zato.common.rate_limiting.counters import SharedCounters
 from zato.common.typing_ import cast_, intnone, optional
 from zato.common.util.api import absolutize, get_config_from_file, get_kvdb_config_for_log, get_user_config_name, \
     fs_safe_name, hot_deploy, invoke_startup_services as _invoke_startup_services, new_cid, register_diag_handlers, \
@@ -59,13 +60,14 @@ from zato.common.util.api import absolutize, get_config_from_file, get_kvdb_conf
 from zato.common.util.file_transfer import path_string_list_to_list
 from zato.common.util.hot_deploy_ import extract_pickup_from_items
 from zato.common.util.json_ import BasicParser
+from zato.common.util.log_buffer import LogBuffer
 from zato.common.util.platform_ import is_posix
 from zato.common.util.posix_ipc_ import ConnectorConfigIPC, ServerStartupIPC
 from zato.common.util.time_ import TimeUtil
 from zato.common.util.tcp import wait_until_port_taken
 from zato.distlock import LockManager
 from zato.server.base.parallel.config import ConfigLoader
-from zato.server.base.parallel.http import HTTPHandler
+from zato.server.base.parallel.http import get_access_log_extra, HTTPHandler
 from zato.server.base.parallel.subprocess_.api import CurrentState as SubprocessCurrentState, \
      StartConfig as SubprocessStartConfig
 from zato.server.base.parallel.subprocess_.ftp import FTPIPC
@@ -91,6 +93,7 @@ if 0:
     from zato.common.odb.api import ODBManager
     from zato.common.odb.model import Cluster as ClusterModel
     from zato.common.typing_ import any_, anydict, anylist, anyset, callable_, dictlist, stranydict, strbytes, strlist, strnone
+    from zato.server.base.parallel.config_snapshot import ConfigSnapshot
     from zato.server.connection.cache import Cache, CacheAPI
     from zato.server.connection.connector.subprocess_.ipc import SubprocessIPC
     from zato.server.ext.zunicorn.arbiter import Arbiter
@@ -135,6 +138,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
     odb: 'ODBManager'
     kvdb: 'KVDB'
     config: 'ConfigStore'
+    config_snapshot: 'ConfigSnapshot'
     crypto_manager: 'ServerCryptoManager'
     sql_pool_store: 'PoolStore'
     kv_data_api: 'KVDataAPI'
@@ -292,6 +296,10 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.access_logger = logging.getLogger('zato_access_log')
         self.access_logger_log = self.access_logger._log
         self.needs_access_log = self.access_logger.isEnabledFor(INFO)
+
+        # Access and REST logs are written in background, out of request greenlets
+        self.access_log_buffer = LogBuffer(self.access_logger, get_access_log_extra)
+        self.rest_log_buffer = LogBuffer(logging.getLogger('zato_rest'))
         self.needs_all_access_log = True
         self.access_log_ignore = set()
         self.rest_log_ignore   = set()
@@ -890,6 +898,10 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # Set for later use - this is the version that we currently employ and we know that it exists.
         self.events_dir = events_dir_v1
 
+        # Each worker keeps its own audit log on disk, in a directory that it takes over from a previous process, if there is one
+        if is_posix:
+            self.audit_log.open_base_dir(os.path.join(self.work_dir, 'audit-log', 'v1'))
+
         # Will be None if we are not running in background.
         if not zato_deployment_key:
             zato_deployment_key = '{}.{}'.format(datetime.utcnow().isoformat(), uuid4().hex)
@@ -1009,12 +1021,21 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # Finally, assign it to ServiceStore
         self.service_store.max_batch_size = max_batch_size
 
+        # Hashes of source files that services are deployed from are kept in work_dir between restarts
+        self.service_store.set_up_deploy_manifest(self.work_dir)
+
         # Rate limiting
         self.rate_limiting = RateLimiting()
         self.rate_limiting.cluster_id = cast_('int', self.cluster_id)
         self.rate_limiting.global_lock_func = self.zato_lock_manager
         self.rate_limiting.sql_session_func = self.odb.session
 
+        # Exact rate limits are counted in memory shared by all the server processes on this host, if our platform allows it,
+        # and the counters are periodically synchronized with the ODB.
+        if self.has_posix_ipc:
+            self.rate_limiting.counters.create(self.deployment_key)
+        self.rate_limiting.start_sync_counters()
+
         # Set up rate limiting for ConfigDict-based objects, which includes everything except for:
         # * services  - configured in ServiceStore
         # * SSO       - configured in the next call
@@ -1071,7 +1092,8 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
                     self.hot_deploy_config.work_dir, self.fs_server_config.hot_deploy[name]))
 
         self.broker_client = BrokerClient(
-            server_rpc=self.rpc, zato_client=None, scheduler_config=self.fs_server_config.scheduler)
+            server_rpc=self.rpc, zato_client=None, scheduler_config=self.fs_server_config.scheduler,
+            on_publish=self.on_config_change_published)
         self.worker_store.set_broker_client(self.broker_client)
 
         self._after_init_accepted(locally_deployed)
@@ -1193,9 +1215,19 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             callback_func=self.on_ipc_invoke_callback,
         )
 
-        # .. we can now store the information about what IPC port to use with this PID.
+        # .. we can now store the information about what IPC port to use with this PID ..
         save_ipc_pid_port(self.cluster_name, self.name, self.pid, bind_port)
 
+        # .. and other processes of this server will prefer to connect to us through a Unix socket, if possible.
+        self.ipc_api.start_unix_server(
+            self.cluster_name,
+            self.name,
+            self.pid,
+            username=IPC.Credentials.Username,
+            password=ipc_password,
+            callback_func=self.on_ipc_invoke_callback,
+        )
+
 # ################################################################################################################################
 
     def _stop_after_timeout(self):
@@ -1272,6 +1304,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
                     connector_attr = 'connector_{}'.format(connector_suffix)
                     connector = getattr(self, connector_attr) # type: SubprocessIPC
                     connector.ipc_tcp_port = response['port']
+                    connector.framed_port = response.get('framed_port')
 
 # ################################################################################################################################
 
@@ -1571,6 +1604,17 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
     def publish(self, *args:'any_', **kwargs:'any_') -> 'any_':
         return self.worker_store.pubsub.publish(*args, **kwargs)
 
+# ################################################################################################################################
+
+    def on_broker_msg(self, msg:'anydict') -> 'None':
+        super().on_broker_msg(msg)
+
+        # Configuration snapshots need to be rebuilt if this message changed anything in the ODB
+        try:
+            self.on_config_changed(msg)
+        except Exception:
+            logger.warning('Could not invalidate config snapshot, e:`%s`', format_exc())
+
 # ################################################################################################################################
 
     def invoke_async(self, service:'str', request:'any_', callback:'callable_', *args:'any_', **kwargs:'any_') -> 'any_':
@@ -1779,6 +1823,15 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
     def before_pid_kill(arbiter:'Arbiter', worker:'GeventWorker') -> 'None':
         pass
 
+# ################################################################################################################################
+
+    @staticmethod
+    def on_exit(arbiter:'Arbiter') -> 'None':
+
+        # Workers only close shared rate limiting counters so they can be deleted only once all of them have stopped
+        if is_posix:
+            SharedCounters.unlink(arbiter.zato_deployment_key)
+
 # ################################################################################################################################
 
     def cleanup_wsx(self, needs_pid:'bool'=False) -> 'None':
@@ -1825,14 +1878,25 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             # Close SQL pools
             self.sql_pool_store.cleanup_on_stop()
 
-            # Close all POSIX IPC structures
+            # Stop synchronizing rate limiting counters
+            self.rate_limiting.stop_sync_counters()
+
+            # Stop accepting IPC connections over our Unix socket, which also deletes the socket's file
+            self.ipc_api.stop_unix_server()
+
+            # Close all POSIX IPC structures, although rate limiting counters are deleted by the main process in on_exit
             if self.has_posix_ipc:
                 self.server_startup_ipc.close()
                 self.connector_config_ipc.close()
+                self.rate_limiting.counters.close()
 
             # WSX connections for this server cleanup
             self.cleanup_wsx(True)
 
+            # Write out what is still waiting in log buffers
+            self.access_log_buffer.flush()
+            self.rest_log_buffer.flush()
+
             logger.info('Stopping server process (%s:%s) (%s)', self.name, self.pid, os.getpid())
 
             import sys
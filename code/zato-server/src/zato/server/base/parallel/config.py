@@ -11,15 +11,17 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 from contextlib import closing
 from logging import getLogger
+from traceback import format_exc
 
 # Zato
 from zato.bunch import Bunch
-from zato.common.api import AuditLog, RATE_LIMIT
+from zato.common.api import AuditLog, KVDB, RATE_LIMIT
 from zato.common.audit_log import LogContainerConfig
 from zato.common.const import SECRETS, ServiceConst
-from zato.common.util.api import asbool
+from zato.common.util.api import asbool, new_cid
 from zato.common.util.sql import elems_with_opaque
 from zato.common.util.url_dispatcher import get_match_target
+from zato.server.base.parallel.config_snapshot import ConfigSnapshot
 from zato.server.config import ConfigDict
 from zato.url_dispatcher import Matcher
 
@@ -29,7 +31,7 @@ from zato.url_dispatcher import Matcher
 if 0:
     from zato.common.model.wsx import WSXConnectorConfig
     from zato.common.odb.model import Server as ServerModel
-    from zato.common.typing_ import anydict, anydictnone, anyset
+    from zato.common.typing_ import anydict, anydictnone, anylist, anyset, strnone
     from zato.server.base.parallel import ParallelServer
     WSXConnectorConfig = WSXConnectorConfig
 
@@ -43,6 +45,7 @@ logger = getLogger(__name__)
 
 class ModuleCtx:
     Audit_Max_Len_Messages = AuditLog.Default.max_len_messages
+    Audit_Max_Bytes_Stored = AuditLog.Default.max_bytes_stored
     Config_Store = ('apikey', 'basic_auth', 'jwt')
     Rate_Limit_Exact = RATE_LIMIT.TYPE.EXACT.id
     Rate_Limit_Sec_Def = RATE_LIMIT.OBJECT_TYPE.SEC_DEF
@@ -55,6 +58,41 @@ class ConfigLoader:
     """ Loads server's configuration.
     """
 
+# ################################################################################################################################
+
+    def get_config_change_id(
+        self:'ParallelServer', # type: ignore
+    ) -> 'strnone':
+        """ Returns the cluster-wide ID of the most recent configuration change, if there has been any.
+        """
+        result = self.kv_data_api.get(KVDB.CONFIG_SNAPSHOT_CHANGE_ID)
+        return result.value if result else None
+
+# ################################################################################################################################
+
+    def on_config_changed(
+        self:'ParallelServer', # type: ignore
+        msg:'anydict'
+    ) -> 'None':
+        """ Invoked in each process for each broker message received - if the message changes configuration in the ODB,
+        the local snapshot is deleted. The new change ID has been already stored by the process that published the message.
+        """
+        if ConfigSnapshot.is_change_action(msg.get('action') or ''):
+            self.config_snapshot.invalidate()
+
+# ################################################################################################################################
+
+    def on_config_change_published(
+        self:'ParallelServer', # type: ignore
+        msg:'anydict'
+    ) -> 'None':
+        """ Invoked only in the process that publishes a broker message - if the message changes configuration in the ODB,
+        a new cluster-wide change ID is stored, which invalidates configuration snapshots of all servers.
+        This is the only place where the change ID is written to so each change results in a single write.
+        """
+        if ConfigSnapshot.is_change_action(msg.get('action') or ''):
+            self.kv_data_api.upsert(KVDB.CONFIG_SNAPSHOT_CHANGE_ID, new_cid())
+
 # ################################################################################################################################
 
     def set_up_config(
@@ -62,6 +100,50 @@ class ConfigLoader:
         server:'ServerModel'
     ) -> 'None':
 
+        # Whether workers may load configuration from a snapshot built by another worker ..
+        use_config_snapshot = asbool(self.fs_server_config.misc.get('use_config_snapshot', True))
+
+        change_id = self.get_config_change_id() if use_config_snapshot else None
+        self.config_snapshot = ConfigSnapshot(self.work_dir, self.deployment_key, change_id)
+
+        # .. if we are not to use it, we simply run all the queries ourselves ..
+        if not use_config_snapshot:
+            self._set_up_config(server)
+            return
+
+        lock_name = '{}{}:{}'.format(KVDB.LOCK_CONFIG_SNAPSHOT, self.fs_server_config.main.token, self.deployment_key)
+
+        # .. otherwise, only one worker at a time will be running queries, while others wait for the snapshot ..
+        with self.zato_lock_manager(lock_name, ttl=self.deployment_lock_expires, block=self.deployment_lock_timeout):
+
+            # .. if there is a valid one, no queries will be run at all ..
+            if self.config_snapshot.load():
+                logger.info('Loading configuration from snapshot `%s` (%s)', self.config_snapshot.path, self.name)
+
+            self._set_up_config(server)
+
+            # .. if we were the ones to run the queries, let other workers make use of the results.
+            if not self.config_snapshot.is_loaded:
+                try:
+                    self.config_snapshot.store()
+                except Exception:
+                    logger.warning('Config snapshot could not be stored, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+    def _get_channel_http_soap_list(
+        self:'ParallelServer', # type: ignore
+        cluster_id:'int'
+    ) -> 'anylist':
+        return elems_with_opaque(self.odb.get_http_soap_list(cluster_id, 'channel'))
+
+# ################################################################################################################################
+
+    def _set_up_config(
+        self:'ParallelServer',  # type: ignore
+        server:'ServerModel'
+    ) -> 'None':
+
         # Which components are enabled
         self.component_enabled.stats = asbool(self.fs_server_config.component_enabled.stats)
         self.component_enabled.slow_response = asbool(self.fs_server_config.component_enabled.slow_response)
@@ -70,10 +152,10 @@ class ConfigLoader:
         # Cassandra - start
         #
 
-        query = self.odb.get_cassandra_conn_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('cassandra_conn', self.odb.get_cassandra_conn_list, server.cluster.id, True)
         self.config.cassandra_conn = ConfigDict.from_query('cassandra_conn', query, decrypt_func=self.decrypt)
 
-        query = self.odb.get_cassandra_query_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('cassandra_query', self.odb.get_cassandra_query_list, server.cluster.id, True)
         self.config.cassandra_query = ConfigDict.from_query('cassandra_query', query, decrypt_func=self.decrypt)
 
         #
@@ -84,10 +166,10 @@ class ConfigLoader:
         # Search - start
         #
 
-        query = self.odb.get_search_es_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('search_es', self.odb.get_search_es_list, server.cluster.id, True)
         self.config.search_es = ConfigDict.from_query('search_es', query, decrypt_func=self.decrypt)
 
-        query = self.odb.get_search_solr_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('search_solr', self.odb.get_search_solr_list, server.cluster.id, True)
         self.config.search_solr = ConfigDict.from_query('search_solr', query, decrypt_func=self.decrypt)
 
         #
@@ -98,7 +180,7 @@ class ConfigLoader:
         # SMS - start
         #
 
-        query = self.odb.get_sms_twilio_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('sms_twilio', self.odb.get_sms_twilio_list, server.cluster.id, True)
         self.config.sms_twilio = ConfigDict.from_query('sms_twilio', query, decrypt_func=self.decrypt)
 
         #
@@ -111,7 +193,7 @@ class ConfigLoader:
 
         # AWS S3
 
-        query = self.odb.get_cloud_aws_s3_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('cloud_aws_s3', self.odb.get_cloud_aws_s3_list, server.cluster.id, True)
         self.config.cloud_aws_s3 = ConfigDict.from_query('cloud_aws_s3', query, decrypt_func=self.decrypt)
 
         #
@@ -121,7 +203,7 @@ class ConfigLoader:
         # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
         # Services
-        query = self.odb.get_service_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('service', self.odb.get_service_list, server.cluster.id, True)
         self.config.service = ConfigDict.from_query('service_list', query, decrypt_func=self.decrypt)
 
         #
@@ -129,11 +211,11 @@ class ConfigLoader:
         #
 
         # AMQP
-        query = self.odb.get_definition_amqp_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('definition_amqp', self.odb.get_definition_amqp_list, server.cluster.id, True)
         self.config.definition_amqp = ConfigDict.from_query('definition_amqp', query, decrypt_func=self.decrypt)
 
         # IBM MQ
-        query = self.odb.get_definition_wmq_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('definition_wmq', self.odb.get_definition_wmq_list, server.cluster.id, True)
         self.config.definition_wmq = ConfigDict.from_query('definition_wmq', query, decrypt_func=self.decrypt)
 
         #
@@ -145,11 +227,11 @@ class ConfigLoader:
         #
 
         # AMQP
-        query = self.odb.get_channel_amqp_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('channel_amqp', self.odb.get_channel_amqp_list, server.cluster.id, True)
         self.config.channel_amqp = ConfigDict.from_query('channel_amqp', query, decrypt_func=self.decrypt)
 
         # IBM MQ
-        query = self.odb.get_channel_wmq_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('channel_wmq', self.odb.get_channel_wmq_list, server.cluster.id, True)
         self.config.channel_wmq = ConfigDict.from_query('channel_wmq', query, decrypt_func=self.decrypt)
 
         #
@@ -161,58 +243,58 @@ class ConfigLoader:
         #
 
         # AMQP
-        query = self.odb.get_out_amqp_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_amqp', self.odb.get_out_amqp_list, server.cluster.id, True)
         self.config.out_amqp = ConfigDict.from_query('out_amqp', query, decrypt_func=self.decrypt)
 
         # Caches
-        query = self.odb.get_cache_builtin_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('cache_builtin', self.odb.get_cache_builtin_list, server.cluster.id, True)
         self.config.cache_builtin = ConfigDict.from_query('cache_builtin', query, decrypt_func=self.decrypt)
 
-        query = self.odb.get_cache_memcached_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('cache_memcached', self.odb.get_cache_memcached_list, server.cluster.id, True)
         self.config.cache_memcached = ConfigDict.from_query('cache_memcached', query, decrypt_func=self.decrypt)
 
         # FTP
-        query = self.odb.get_out_ftp_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_ftp', self.odb.get_out_ftp_list, server.cluster.id, True)
         self.config.out_ftp = ConfigDict.from_query('out_ftp', query, decrypt_func=self.decrypt)
 
         # IBM MQ
-        query = self.odb.get_out_wmq_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_wmq', self.odb.get_out_wmq_list, server.cluster.id, True)
         self.config.out_wmq = ConfigDict.from_query('out_wmq', query, decrypt_func=self.decrypt)
 
         # Odoo
-        query = self.odb.get_out_odoo_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_odoo', self.odb.get_out_odoo_list, server.cluster.id, True)
         self.config.out_odoo = ConfigDict.from_query('out_odoo', query, decrypt_func=self.decrypt)
 
         # SAP RFC
-        query = self.odb.get_out_sap_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_sap', self.odb.get_out_sap_list, server.cluster.id, True)
         self.config.out_sap = ConfigDict.from_query('out_sap', query, decrypt_func=self.decrypt)
 
         # REST
-        query = self.odb.get_http_soap_list(server.cluster.id, 'outgoing', 'plain_http', True)
+        query = self.config_snapshot.get_query('out_plain_http', self.odb.get_http_soap_list, server.cluster.id, 'outgoing', 'plain_http', True)
         self.config.out_plain_http = ConfigDict.from_query('out_plain_http', query, decrypt_func=self.decrypt)
 
         # SFTP
-        query = self.odb.get_out_sftp_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_sftp', self.odb.get_out_sftp_list, server.cluster.id, True)
         self.config.out_sftp = ConfigDict.from_query('out_sftp', query, decrypt_func=self.decrypt, drop_opaque=True)
 
         # SOAP
-        query = self.odb.get_http_soap_list(server.cluster.id, 'outgoing', 'soap', True)
+        query = self.config_snapshot.get_query('out_soap', self.odb.get_http_soap_list, server.cluster.id, 'outgoing', 'soap', True)
         self.config.out_soap = ConfigDict.from_query('out_soap', query, decrypt_func=self.decrypt)
 
         # SQL
-        query = self.odb.get_out_sql_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_sql', self.odb.get_out_sql_list, server.cluster.id, True)
         self.config.out_sql = ConfigDict.from_query('out_sql', query, decrypt_func=self.decrypt)
 
         # ZMQ channels
-        query = self.odb.get_channel_zmq_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('channel_zmq', self.odb.get_channel_zmq_list, server.cluster.id, True)
         self.config.channel_zmq = ConfigDict.from_query('channel_zmq', query, decrypt_func=self.decrypt)
 
         # ZMQ outgoing
-        query = self.odb.get_out_zmq_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('out_zmq', self.odb.get_out_zmq_list, server.cluster.id, True)
         self.config.out_zmq = ConfigDict.from_query('out_zmq', query, decrypt_func=self.decrypt)
 
         # WebSocket channels
-        query = self.odb.get_channel_web_socket_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('channel_web_socket', self.odb.get_channel_web_socket_list, server.cluster.id, True)
         self.config.channel_web_socket = ConfigDict.from_query('channel_web_socket', query, decrypt_func=self.decrypt)
 
         #
@@ -228,7 +310,7 @@ class ConfigLoader:
         # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
         # Connections
-        query = self.odb.get_generic_connection_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('generic_connection', self.odb.get_generic_connection_list, server.cluster.id, True)
         self.config.generic_connection = ConfigDict.from_query('generic_connection', query, decrypt_func=self.decrypt)
 
         #
@@ -242,7 +324,7 @@ class ConfigLoader:
         #
 
         # SQL
-        query = self.odb.get_notif_sql_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('notif_sql', self.odb.get_notif_sql_list, server.cluster.id, True)
         self.config.notif_sql = ConfigDict.from_query('notif_sql', query, decrypt_func=self.decrypt)
 
         #
@@ -256,59 +338,59 @@ class ConfigLoader:
         #
 
         # API keys
-        query = self.odb.get_apikey_security_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('apikey', self.odb.get_apikey_security_list, server.cluster.id, True)
         self.config.apikey = ConfigDict.from_query('apikey', query, decrypt_func=self.decrypt)
 
         # AWS
-        query = self.odb.get_aws_security_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('aws', self.odb.get_aws_security_list, server.cluster.id, True)
         self.config.aws = ConfigDict.from_query('aws', query, decrypt_func=self.decrypt)
 
         # HTTP Basic Auth
-        query = self.odb.get_basic_auth_list(server.cluster.id, None, True)
+        query = self.config_snapshot.get_query('basic_auth', self.odb.get_basic_auth_list, server.cluster.id, None, True)
         self.config.basic_auth = ConfigDict.from_query('basic_auth', query, decrypt_func=self.decrypt)
 
         # JWT
-        query = self.odb.get_jwt_list(server.cluster.id, None, True)
+        query = self.config_snapshot.get_query('jwt', self.odb.get_jwt_list, server.cluster.id, None, True)
         self.config.jwt = ConfigDict.from_query('jwt', query, decrypt_func=self.decrypt)
 
         # NTLM
-        query = self.odb.get_ntlm_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('ntlm', self.odb.get_ntlm_list, server.cluster.id, True)
         self.config.ntlm = ConfigDict.from_query('ntlm', query, decrypt_func=self.decrypt)
 
         # OAuth
-        query = self.odb.get_oauth_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('oauth', self.odb.get_oauth_list, server.cluster.id, True)
         self.config.oauth = ConfigDict.from_query('oauth', query, decrypt_func=self.decrypt)
 
         # RBAC - permissions
-        query = self.odb.get_rbac_permission_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('rbac_permission', self.odb.get_rbac_permission_list, server.cluster.id, True)
         self.config.rbac_permission = ConfigDict.from_query('rbac_permission', query, decrypt_func=self.decrypt)
 
         # RBAC - roles
-        query = self.odb.get_rbac_role_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('rbac_role', self.odb.get_rbac_role_list, server.cluster.id, True)
         self.config.rbac_role = ConfigDict.from_query('rbac_role', query, decrypt_func=self.decrypt)
 
         # RBAC - client roles
-        query = self.odb.get_rbac_client_role_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('rbac_client_role', self.odb.get_rbac_client_role_list, server.cluster.id, True)
         self.config.rbac_client_role = ConfigDict.from_query('rbac_client_role', query, decrypt_func=self.decrypt)
 
         # RBAC - role permission
-        query = self.odb.get_rbac_role_permission_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('rbac_role_permission', self.odb.get_rbac_role_permission_list, server.cluster.id, True)
         self.config.rbac_role_permission = ConfigDict.from_query('rbac_role_permission', query, decrypt_func=self.decrypt)
 
         # TLS CA certs
-        query = self.odb.get_tls_ca_cert_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('tls_ca_cert', self.odb.get_tls_ca_cert_list, server.cluster.id, True)
         self.config.tls_ca_cert = ConfigDict.from_query('tls_ca_cert', query, decrypt_func=self.decrypt)
 
         # TLS channel security
-        query = self.odb.get_tls_channel_sec_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('tls_channel_sec', self.odb.get_tls_channel_sec_list, server.cluster.id, True)
         self.config.tls_channel_sec = ConfigDict.from_query('tls_channel_sec', query, decrypt_func=self.decrypt)
 
         # TLS key/cert pairs
-        query = self.odb.get_tls_key_cert_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('tls_key_cert', self.odb.get_tls_key_cert_list, server.cluster.id, True)
         self.config.tls_key_cert = ConfigDict.from_query('tls_key_cert', query, decrypt_func=self.decrypt)
 
         # Vault connections
-        query = self.odb.get_vault_connection_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('vault_conn_sec', self.odb.get_vault_connection_list, server.cluster.id, True)
         self.config.vault_conn_sec = ConfigDict.from_query('vault_conn_sec', query, decrypt_func=self.decrypt)
 
         # Encrypt all secrets
@@ -323,7 +405,7 @@ class ConfigLoader:
         # All the HTTP/SOAP channels.
         http_soap = []
 
-        for item in elems_with_opaque(self.odb.get_http_soap_list(server.cluster.id, 'channel')):
+        for item in self.config_snapshot.get_list('http_soap', self._get_channel_http_soap_list, server.cluster.id):
 
             hs_item = {}
             for key in item.keys():
@@ -337,7 +419,7 @@ class ConfigLoader:
         self.config.http_soap = http_soap
 
         # JSON Pointer
-        query = self.odb.get_json_pointer_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('json_pointer', self.odb.get_json_pointer_list, server.cluster.id, True)
         self.config.json_pointer = ConfigDict.from_query('json_pointer', query, decrypt_func=self.decrypt)
 
         # SimpleIO
@@ -360,23 +442,23 @@ class ConfigLoader:
         self.config.pubsub = Bunch()
 
         # Pub/sub - endpoints
-        query = self.odb.get_pubsub_endpoint_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('pubsub_endpoint', self.odb.get_pubsub_endpoint_list, server.cluster.id, True)
         self.config.pubsub_endpoint = ConfigDict.from_query('pubsub_endpoint', query, decrypt_func=self.decrypt)
 
         # Pub/sub - topics
-        query = self.odb.get_pubsub_topic_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('pubsub_topic', self.odb.get_pubsub_topic_list, server.cluster.id, True)
         self.config.pubsub_topic = ConfigDict.from_query('pubsub_topic', query, decrypt_func=self.decrypt)
 
         # Pub/sub - subscriptions
-        query = self.odb.get_pubsub_subscription_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('pubsub_subscription', self.odb.get_pubsub_subscription_list, server.cluster.id, True)
         self.config.pubsub_subscription = ConfigDict.from_query('pubsub_subscription', query, decrypt_func=self.decrypt)
 
         # E-mail - SMTP
-        query = self.odb.get_email_smtp_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('email_smtp', self.odb.get_email_smtp_list, server.cluster.id, True)
         self.config.email_smtp = ConfigDict.from_query('email_smtp', query, decrypt_func=self.decrypt)
 
         # E-mail - IMAP
-        query = self.odb.get_email_imap_list(server.cluster.id, True)
+        query = self.config_snapshot.get_query('email_imap', self.odb.get_email_imap_list, server.cluster.id, True)
         self.config.email_imap = ConfigDict.from_query('email_imap', query, decrypt_func=self.decrypt)
 
         # .. reusable ..
@@ -520,6 +602,10 @@ class ConfigLoader:
         log_config.max_bytes_per_message_sent     = int(config_max_len_messages_sent) * 1000
         log_config.max_bytes_per_message_received = int(config_max_len_messages_received) * 1000
 
+        # .. this is how much of history can be kept on disk ..
+        log_config.max_bytes_sent     = ModuleCtx.Audit_Max_Bytes_Stored
+        log_config.max_bytes_received = ModuleCtx.Audit_Max_Bytes_Stored
+
         # .. and now we can create our audit log container
         func = self.audit_log.edit_container if is_edit else self.audit_log.create_container
         func(log_config)
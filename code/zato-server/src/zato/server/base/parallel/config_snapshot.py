@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from logging import getLogger
+from pickle import dumps as pickle_dumps, HIGHEST_PROTOCOL as highest_pickle_protocol, loads as pickle_loads
+from tempfile import NamedTemporaryFile
+from traceback import format_exc
+from zlib import compress, decompress
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common.broker_message import code_to_name
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, callable_, stranydict, strnone
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Increased each time the layout of what we store in the snapshot changes
+    Format_Version = 1
+
+    # Each snapshot file begins with this header
+    Magic = b'ZCS1'
+
+    # Under the server's work_dir
+    File_Name = 'config-snapshot.bin'
+
+    # Broker messages with actions ending in one of these mean that configuration in the ODB has changed ..
+    Change_Action_Suffixes = ('_CREATE', '_EDIT', '_DELETE', '_CHANGE_PASSWORD')
+
+    # .. and so do all the hot-deployment messages.
+    Change_Action_Prefixes = ('HOT_DEPLOY_',)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _row_to_dict(row:'any_') -> 'stranydict':
+    """ Rows can be SQLAlchemy's named tuples or Bunch instances, depending on the query.
+    """
+    return row._asdict() if hasattr(row, '_asdict') else dict(row)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ConfigSnapshot:
+    """ A local, serialised copy of the results of all the ODB queries that a server's worker runs when it starts.
+    The first worker to start builds the snapshot and the remaining ones load it from the file system, which means
+    that they do not need to run any of the queries themselves. A snapshot is valid only for the deployment key
+    it was built in and only as long as the cluster-wide change ID stored in the ODB does not change.
+    """
+    def __init__(self, work_dir:'str', deployment_key:'str', change_id:'strnone') -> 'None':
+        self.path = os.path.join(work_dir, ModuleCtx.File_Name)
+        self.deployment_key = deployment_key
+        self.change_id = change_id or ''
+
+        # Query results, either loaded from a file or collected while queries are running
+        self.data = {} # type: stranydict
+
+        # Set to True if self.data was read from a file
+        self.is_loaded = False
+
+# ################################################################################################################################
+
+    @staticmethod
+    def is_change_action(action:'str') -> 'bool':
+        """ Returns True if a broker message with the given action means that configuration has changed.
+        """
+        action_name = code_to_name.get(action) or ''
+        return action_name.endswith(ModuleCtx.Change_Action_Suffixes) or \
+            action_name.startswith(ModuleCtx.Change_Action_Prefixes)
+
+# ################################################################################################################################
+
+    def load(self) -> 'bool':
+        """ Loads the snapshot from the file system. Returns True if it was found and it is still valid.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, 'rb') as f:
+                contents = f.read()
+
+            if not contents.startswith(ModuleCtx.Magic):
+                logger.info('Ignoring config snapshot without a valid header `%s`', self.path)
+                return False
+
+            snapshot = pickle_loads(decompress(contents[len(ModuleCtx.Magic):]))
+
+        except Exception:
+            logger.warning('Config snapshot `%s` could not be loaded, e:`%s`', self.path, format_exc())
+            return False
+
+        if snapshot['format_version'] != ModuleCtx.Format_Version:
+            logger.info('Ignoring config snapshot in format `%s` (expected `%s`)',
+                snapshot['format_version'], ModuleCtx.Format_Version)
+            return False
+
+        if snapshot['deployment_key'] != self.deployment_key:
+            logger.info('Ignoring config snapshot from a previous deployment `%s`', snapshot['deployment_key'])
+            return False
+
+        if snapshot['change_id'] != self.change_id:
+            logger.info('Ignoring outdated config snapshot `%s` (current `%s`)', snapshot['change_id'], self.change_id)
+            return False
+
+        self.data = snapshot['data']
+        self.is_loaded = True
+
+        return True
+
+# ################################################################################################################################
+
+    def store(self) -> 'None':
+        """ Atomically saves to the file system all the query results collected so far.
+        """
+        snapshot = {
+            'format_version': ModuleCtx.Format_Version,
+            'deployment_key': self.deployment_key,
+            'change_id': self.change_id,
+            'data': self.data,
+        }
+
+        contents = ModuleCtx.Magic + compress(pickle_dumps(snapshot, protocol=highest_pickle_protocol))
+
+        # Write to a temporary file first so that no one can ever read a partially written snapshot ..
+        dir_name = os.path.dirname(self.path)
+        with NamedTemporaryFile(mode='wb', dir=dir_name, prefix='.config-snapshot-', delete=False) as f:
+            _ = f.write(contents)
+            temp_path = f.name
+
+        # .. now, it is safe to move it to its target location.
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.path)
+
+        logger.info('Stored config snapshot `%s` (%s entries, %s bytes)', self.path, len(self.data), len(contents))
+
+# ################################################################################################################################
+
+    def invalidate(self) -> 'None':
+        """ Deletes the snapshot from the file system, if there is any.
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# ################################################################################################################################
+
+    def get_query(self, name:'str', func:'callable_', *args:'any_') -> 'any_':
+        """ Returns results of an ODB query, either from the snapshot, if it was loaded, or by running the query,
+        in which case the results are also added to the snapshot.
+        """
+        if self.is_loaded:
+            rows, columns = self.data[name]
+            if rows is None:
+                return None
+            else:
+                return [Bunch(row) for row in rows], dict.fromkeys(columns)
+
+        # If we are here, we need to actually run the query ..
+        result = func(*args)
+
+        # .. and save its results for other workers.
+        if result:
+            query, columns = result
+            rows = [_row_to_dict(row) for row in query]
+            self.data[name] = (rows, list(columns.keys()))
+        else:
+            self.data[name] = (None, None)
+
+        return result
+
+# ################################################################################################################################
+
+    def get_list(self, name:'str', func:'callable_', *args:'any_') -> 'any_':
+        """ Like get_query but for queries that return a list of rows without any columns.
+        """
+        if self.is_loaded:
+            return [Bunch(row) for row in self.data[name]]
+
+        result = func(*args)
+        self.data[name] = [_row_to_dict(row) for row in result]
+
+        return result
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -43,6 +43,32 @@ _has_log_info = logger.isEnabledFor(INFO)
 # ################################################################################################################################
 # ################################################################################################################################
 
+def get_access_log_extra(
+    data, # type: any_
+    _Access_Log_Date_Time_Format=Access_Log_Date_Time_Format, # type: str
+) -> 'stranydict':
+    """ Turns details of a request, as they were collected by on_wsgi_request, into extra attributes of an access log record.
+    """
+    remote_ip, cid, resp_time, channel_name, request_ts_utc, request_ts_local, method, path, http_version, \
+        status_code, response_size, user_agent = data
+
+    return {
+        'remote_ip': remote_ip,
+        'cid_resp_time': '%s/%s' % (cid, resp_time),
+        'channel_name': channel_name,
+        'req_timestamp_utc': request_ts_utc.strftime(_Access_Log_Date_Time_Format),
+        'req_timestamp': request_ts_local.strftime(_Access_Log_Date_Time_Format),
+        'method': method,
+        'path': path,
+        'http_version': http_version,
+        'status_code': status_code,
+        'response_size': response_size,
+        'user_agent': user_agent,
+    }
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class HTTPHandler:
     """ Handles incoming HTTP requests.
     """
@@ -55,7 +81,6 @@ class HTTPHandler:
         _utcnow=datetime.utcnow, # type: callable_
         _INFO=INFO, # type: int
         _UTC=UTC,   # type: any_
-        _Access_Log_Date_Time_Format=Access_Log_Date_Time_Format, # type: str
         _no_remote_address=NO_REMOTE_ADDRESS, # type: str
         **kwargs:'any_'
     ) -> 'list_[bytes]':
@@ -134,24 +159,21 @@ class HTTPHandler:
             # .. is not in a list of paths to ignore ..
             if self.needs_all_access_log or wsgi_environ['PATH_INFO'] not in self.access_log_ignore:
 
-                self.access_logger_log(
-                    _INFO,
-                    '',
-                    None, # type: ignore
-                    None,
-                    {
-                        'remote_ip': remote_addr,
-                        'cid_resp_time': '%s/%s' % (cid, (_utcnow() - request_ts_utc).total_seconds()),
-                        'channel_name': channel_name,
-                        'req_timestamp_utc': request_ts_utc.strftime(_Access_Log_Date_Time_Format),
-                        'req_timestamp': request_ts_local.strftime(_Access_Log_Date_Time_Format),
-                        'method': wsgi_environ['REQUEST_METHOD'],
-                        'path': wsgi_environ['PATH_INFO'],
-                        'http_version': wsgi_environ['SERVER_PROTOCOL'],
-                        'status_code': status_code,
-                        'response_size': response_size,
-                        'user_agent': user_agent,
-                })
+                # .. the record is formatted in background, by get_access_log_extra ..
+                self.access_log_buffer.log(_INFO, '', (), (
+                    remote_addr,
+                    cid,
+                    (_utcnow() - request_ts_utc).total_seconds(),
+                    channel_name,
+                    request_ts_utc,
+                    request_ts_local,
+                    wsgi_environ['REQUEST_METHOD'],
+                    wsgi_environ['PATH_INFO'],
+                    wsgi_environ['SERVER_PROTOCOL'],
+                    status_code,
+                    response_size,
+                    user_agent,
+                ))
 
         # .. this goes to the server log ..
         if _has_log_info:
@@ -161,8 +183,7 @@ class HTTPHandler:
                 delta = _utcnow() - request_ts_utc
 
                 # .. log information about what we are returning ..
-                msg = f'REST cha ← cid={cid}; {status_code} time={delta}; len={response_size}'
-                logger.info(msg)
+                self.rest_log_buffer.log(_INFO, 'REST cha ← cid=%s; %s time=%s; len=%s', (cid, status_code, delta, response_size))
 
         # Now, return the response to our caller.
         return [payload]
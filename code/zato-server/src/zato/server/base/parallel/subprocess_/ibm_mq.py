@@ -41,6 +41,7 @@ class IBMMQIPC(SubprocessIPC):
     pidfile_suffix = 'ibm-mq'
 
     connector_module = 'zato.server.connection.connector.subprocess_.impl.ibm_mq'
+    callback_service = 'zato.channel.jms-wmq.on-message-received'
 
     action_definition_create = DEFINITION.WMQ_CREATE
     action_outgoing_create = OUTGOING.WMQ_CREATE
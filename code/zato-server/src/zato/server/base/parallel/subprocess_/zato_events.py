@@ -32,6 +32,9 @@ class ZatoEventsIPC(SubprocessIPC):
 
     connector_module = 'zato.server.connection.connector.subprocess_.impl.events.container'
 
+    # This connector has its own protocol
+    has_framed_ipc = False
+
 # ################################################################################################################################
 
     def get_credentials(self):
@@ -1127,6 +1127,8 @@ class WorkerStore(_WorkerStoreBase):
           'should_delete_after_pickup': config.get('delete_after_pickup', True),
           'is_case_sensitive': config.get('is_case_sensitive', True),
           'is_line_by_line': config.get('is_line_by_line', False),
+          'should_stream_on_pickup': config.get('stream_on_pickup', False),
+          'stream_chunk_size': config.get('stream_chunk_size'),
           'is_recursive': config.get('is_recursive', False),
           'binary_file_patterns': config.get('binary_file_patterns') or [],
           'outconn_rest_list': [],
@@ -51,6 +51,9 @@ class SSO(WorkerImpl):
                 'parent_name': None,
             }, msg.rate_limit_def, True)
 
+        # Cached sessions need to be read again to learn about the changes to their user
+        self.server.sso_api.user.session.on_broker_msg_SSO_SESSION_INVALIDATE(None, msg.user_id)
+
 # ################################################################################################################################
 
     def on_broker_msg_SSO_LINK_AUTH_CREATE(
@@ -67,4 +70,12 @@ class SSO(WorkerImpl):
     ) -> 'None':
         self.server.sso_api.user.on_broker_msg_SSO_LINK_AUTH_DELETE(msg.auth_type, msg.auth_id)
 
+# ################################################################################################################################
+
+    def on_broker_msg_SSO_SESSION_INVALIDATE(
+        self:'WorkerStore', # type: ignore
+        msg, # type: Bunch
+    ) -> 'None':
+        self.server.sso_api.user.session.on_broker_msg_SSO_SESSION_INVALIDATE(msg.session_key, msg.user_id)
+
 # ################################################################################################################################
@@ -16,7 +16,7 @@ from http.client import BAD_REQUEST, FORBIDDEN, INTERNAL_SERVER_ERROR, NOT_ACCEP
 from logging import Formatter, getLogger, StreamHandler
 from logging.handlers import RotatingFileHandler
 from os import getppid, path
-from threading import RLock
+from threading import Lock, RLock
 from traceback import format_exc
 from wsgiref.simple_server import make_server as wsgiref_make_server
 
@@ -40,6 +40,7 @@ from zato.common.util.api import parse_cmd_line_options
 from zato.common.util.auth import parse_basic_auth
 from zato.common.util.open_ import open_r, open_w
 from zato.common.util.posix_ipc_ import ConnectorConfigIPC
+from zato.server.connection.connector.subprocess_.framed import FramedSender, FramedServer, get_replies
 
 # ################################################################################################################################
 
@@ -187,6 +188,13 @@ class BaseConnectionContainer:
         self.server_address = 'http://127.0.0.1:{}{}'
         self.lock = RLock()
         self.logger = None # type: Logger
+
+        # Requests are handled one by one, regardless of whether they arrive through HTTP or persistent connections
+        self.request_lock = Lock()
+
+        # Both are set only if our server supports framed IPC, in which case messages are sent through the sender
+        self.framed_port = None
+        self.sender = None # type: FramedSender | None
         self.parent_pid = getppid()
 
         self.config_ipc = ConnectorConfigIPC()
@@ -248,6 +256,13 @@ class BaseConnectionContainer:
         self.server_path = config.server_path
         self.server_address = self.server_address.format(self.server_port, self.server_path)
 
+        self.framed_port = config.get('framed_port')
+
+        if config.get('server_framed_port'):
+            # If the server's worker that receives our messages is gone, they are sent over HTTP instead
+            self.sender = FramedSender(
+                self.host, config.server_framed_port, self.username, self.password, fallback=self._post_http)
+
         if self.options['zato_subprocess_mode']:
             with open_r(config.logging_conf_path) as f:
                 logging_config = yaml.load(f, yaml.FullLoader)
@@ -313,14 +328,28 @@ class BaseConnectionContainer:
 # ################################################################################################################################
 
     def _post(self, msg, _post=requests_post):
-        self.logger.info('POST to `%s` (%s), msg:`%s`', self.server_address, self.username, msg)
 
         for k, v in msg.items():
             if isinstance(v, bytes):
                 msg[k] = v.decode('utf8')
 
+        # If we can, the message is sent along with others over a persistent connection ..
+        if self.sender:
+            self.logger.info('Sending to port `%s` (%s), msg:`%s`', self.sender.port, self.username, msg)
+            self.sender.send(dumps(msg).encode('utf8'))
+            return
+
+        # .. otherwise, each one is a separate HTTP request.
+        self._post_http(dumps(msg), _post)
+
+# ################################################################################################################################
+
+    def _post_http(self, data, _post=requests_post):
+
+        self.logger.info('POST to `%s` (%s), msg:`%s`', self.server_address, self.username, data)
+
         try:
-            _post(self.server_address, data=dumps(msg), auth=self.server_auth)
+            _post(self.server_address, data=data, auth=self.server_auth)
         except Exception as e:
             self.logger.warning('Exception in BaseConnectionContainer._post: `%s`', e.args[0])
 
@@ -420,17 +449,39 @@ class BaseConnectionContainer:
         if path == _path_ping:
             return Response()
         else:
-            msg = msg.decode('utf8')
-            msg = loads(msg)
-            msg = bunchify(msg)
+            return self.handle_request(msg)
 
-            # Delete what handlers don't need
-            msg.pop('msg_type', None) # Optional if message was sent by a server that is starting up vs. API call
-            action = msg.pop('action')
+# ################################################################################################################################
 
-            handler = getattr(self, '_on_{}'.format(code_to_name[action]))
+    def handle_request(self, msg):
+        """ Reconfigures the connector or puts messages to queues, no matter through what kind of a connection they arrived.
+        """
+        msg = msg.decode('utf8')
+        msg = loads(msg)
+        msg = bunchify(msg)
+
+        # Delete what handlers don't need
+        msg.pop('msg_type', None) # Optional if message was sent by a server that is starting up vs. API call
+        action = msg.pop('action')
+
+        handler = getattr(self, '_on_{}'.format(code_to_name[action]))
+
+        with self.request_lock:
             return handler(msg)
 
+# ################################################################################################################################
+
+    def _on_framed_request(self, msg):
+        self.logger.info('MSG received through port %s %s', self.framed_port, msg)
+
+        response = self.handle_request(msg) # type: Response
+        return int(response.status.split()[0]), response.data
+
+# ################################################################################################################################
+
+    def _on_framed_items(self, items):
+        return get_replies(self._on_framed_request, items)
+
 # ################################################################################################################################
 
     def check_credentials(self, auth):
@@ -689,6 +740,13 @@ class BaseConnectionContainer:
 # ################################################################################################################################
 
     def run(self):
+
+        # Persistent connections are accepted in a background thread, if our server supports them ..
+        if self.framed_port:
+            framed_server = FramedServer(self.host, self.framed_port, self.username, self.password, self._on_framed_items)
+            framed_server.start()
+
+        # .. while HTTP requests are handled in the main one.
         server = self.make_server()
         try:
             server.serve_forever()
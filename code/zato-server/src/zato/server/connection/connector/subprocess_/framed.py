@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import socket
+from hmac import compare_digest
+from logging import getLogger
+from queue import Empty, LifoQueue, Queue
+from select import select
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+from struct import Struct
+from threading import BoundedSemaphore, Thread
+from time import monotonic, sleep
+from traceback import format_exc
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, callable_, list_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Each frame begins with its size and the number of items in it, and each item is prefixed with its own size
+    Header = Struct('!I')
+
+    # Each item in a reply is additionally prefixed with its status code
+    Status = Struct('!H')
+
+    # Frames above that size are rejected ..
+    Max_Frame_Size = 100_000_000
+
+    # .. and the first frame of a connection, with credentials, needs to be much smaller than that.
+    Max_Credentials_Frame_Size = 4096
+
+    # How many messages a sender puts in a single frame
+    Batch_Size = 100
+
+    # How many messages can wait to be sent before their producers are blocked
+    Queue_Size = 1000
+
+    # How many connections a client keeps to a single server
+    Pool_Size = 5
+
+    # How long, in seconds, a sender waits before it reconnects after an error
+    Reconnect_Delay = 1
+
+    # After that many failed attempts in a row, a sender that has a fallback hands its messages over to it ..
+    Max_Send_Failures = 5
+
+    # .. and keeps doing it for that many seconds before it tries to reconnect again.
+    Fallback_Time = 30
+
+    Status_OK = 200
+    Status_Forbidden = 403
+    Status_Error = 500
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FramedResponse:
+    """ A reply to a single message, exposing the same attributes that HTTP-based callers have always used.
+    """
+    __slots__ = 'status_code', 'text'
+
+    def __init__(self, status_code:'int', text:'str') -> 'None':
+        self.status_code = status_code
+        self.text = text
+
+    @property
+    def ok(self) -> 'bool':
+        return self.status_code < 400
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def encode_frame(items:'list_[bytes]', _header:'Struct'=ModuleCtx.Header) -> 'bytes':
+    """ Turns a list of items into a frame that can be sent over a socket.
+    """
+    out = [b'', _header.pack(len(items))]
+    for item in items:
+        out.append(_header.pack(len(item)))
+        out.append(item)
+
+    out[0] = _header.pack(sum(map(len, out)))
+    return b''.join(out)
+
+# ################################################################################################################################
+
+def _recv_exactly(sock:'socket.socket', size:'int') -> 'memoryview':
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionResetError('Connection closed by peer after {} of {} bytes'.format(received, size))
+        received += count
+
+    return view
+
+# ################################################################################################################################
+
+def recv_frame(sock:'socket.socket', _header:'Struct'=ModuleCtx.Header, _max_size:'int'=ModuleCtx.Max_Frame_Size) \
+    -> 'list_[bytes] | None':
+    """ Reads a frame from a socket and returns its items, or None if the socket was closed before the frame began.
+    """
+    # Find out how big the frame is ..
+    try:
+        size, = _header.unpack(_recv_exactly(sock, _header.size))
+    except ConnectionResetError:
+        return None
+
+    if size > _max_size:
+        raise ValueError('Frame size {} exceeds {}'.format(size, _max_size))
+
+    # .. read all of it at once ..
+    data = _recv_exactly(sock, size)
+
+    # .. and split it into items.
+    count, = _header.unpack_from(data, 0)
+    offset = _header.size
+    out = []
+
+    for _ in range(count):
+        item_size, = _header.unpack_from(data, offset)
+        offset += _header.size
+        out.append(bytes(data[offset:offset + item_size]))
+        offset += item_size
+
+    return out
+
+# ################################################################################################################################
+
+def encode_reply(status_code:'int', data:'any_', _status:'Struct'=ModuleCtx.Status) -> 'bytes':
+    if not isinstance(data, bytes):
+        data = data.encode('utf8')
+    return _status.pack(status_code) + data
+
+# ################################################################################################################################
+
+def decode_reply(item:'bytes', _status:'Struct'=ModuleCtx.Status) -> 'FramedResponse':
+    status_code, = _status.unpack_from(item, 0)
+    return FramedResponse(status_code, item[_status.size:].decode('utf8'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _FramedRequestHandler(BaseRequestHandler):
+    """ Serves a single connection - authenticates it and then replies to each frame received.
+    """
+    server: 'FramedServer'
+
+    def handle(self) -> 'None':
+
+        sock = self.request # type: socket.socket
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # The first frame is always a username and password, read before we know who the peer is ..
+        try:
+            credentials = recv_frame(sock, _max_size=ModuleCtx.Max_Credentials_Frame_Size)
+        except ValueError:
+            logger.warning('Credentials frame too big from %s', self.client_address)
+            return
+
+        if credentials is None:
+            return
+
+        if not self.server.check_credentials(credentials):
+            logger.warning('Invalid username or password from %s', self.client_address)
+            sock.sendall(encode_frame([encode_reply(ModuleCtx.Status_Forbidden, 'Invalid username or password')]))
+            return
+
+        sock.sendall(encode_frame([encode_reply(ModuleCtx.Status_OK, '')]))
+
+        # .. and each frame after that is a batch of messages, all of which are replied to in a single frame.
+        while True:
+            items = recv_frame(sock)
+            if items is None:
+                return
+            sock.sendall(encode_frame(self.server.on_items(items)))
+
+# ################################################################################################################################
+
+class FramedServer(ThreadingTCPServer):
+    """ Accepts persistent connections over which frames of messages are exchanged. Runs in its own thread,
+    with each connection served by a separate thread, which become greenlets if the process is monkey-patched by gevent.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host:'str',
+        port:'int',
+        username:'str',
+        password:'str',
+        on_items:'callable_',
+    ) -> 'None':
+
+        # This receives a list of messages and returns a list of replies, each encoded with encode_reply
+        self.on_items = on_items
+        self.credentials = [username.encode('utf8'), password.encode('utf8')]
+
+        super().__init__((host, port), _FramedRequestHandler)
+
+    @property
+    def port(self) -> 'int':
+        return self.server_address[1]
+
+    def check_credentials(self, credentials:'list_[bytes]') -> 'bool':
+
+        if len(credentials) != 2:
+            return False
+
+        # Both parts are always compared, in constant time, so as not to reveal which one was invalid
+        is_username_valid = compare_digest(credentials[0], self.credentials[0])
+        is_password_valid = compare_digest(credentials[1], self.credentials[1])
+
+        return is_username_valid and is_password_valid
+
+    def start(self) -> 'None':
+        thread = Thread(target=self.serve_forever, name='FramedServer-{}'.format(self.port))
+        thread.daemon = True
+        thread.start()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def connect(host:'str', port:'int', username:'str', password:'str') -> 'socket.socket':
+    """ Returns a new connection to a framed server, already authenticated.
+    """
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    try:
+        sock.sendall(encode_frame([username.encode('utf8'), password.encode('utf8')]))
+        reply = recv_frame(sock)
+        if not reply:
+            raise ConnectionResetError('No reply to credentials from {}:{}'.format(host, port))
+
+        response = decode_reply(reply[0])
+        if not response.ok:
+            raise PermissionError('Could not connect to {}:{} -> {}'.format(host, port, response.text))
+
+    except Exception:
+        sock.close()
+        raise
+
+    return sock
+
+# ################################################################################################################################
+
+def _is_stale(sock:'socket.socket') -> 'bool':
+    """ A server never sends anything unprompted so an idle connection that can be read from has been closed by it.
+    """
+    readable, _, _ = select([sock], [], [], 0)
+    return bool(readable)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FramedClient:
+    """ Sends messages over a pool of persistent connections, waiting for the reply to each. Callers wait for a connection
+    if all of them are in use, which means that a server cannot receive more than pool_size messages at a time.
+    """
+    def __init__(
+        self,
+        host:'str',
+        port:'int',
+        username:'str',
+        password:'str',
+        pool_size:'int'=ModuleCtx.Pool_Size,
+    ) -> 'None':
+
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+
+        self._semaphore = BoundedSemaphore(pool_size)
+        self._idle = LifoQueue()
+
+# ################################################################################################################################
+
+    def _get_connection(self) -> 'socket.socket':
+
+        # Reuse an idle connection if there is one that is still open ..
+        while True:
+            try:
+                sock = self._idle.get_nowait()
+            except Empty:
+                break
+            else:
+                if _is_stale(sock):
+                    sock.close()
+                else:
+                    return sock
+
+        # .. and open a new one otherwise.
+        return connect(self.host, self.port, self.username, self.password)
+
+# ################################################################################################################################
+
+    def invoke_many(self, items:'list_[bytes]') -> 'list_[FramedResponse]':
+        """ Sends a batch of messages in one frame and returns a reply to each.
+        """
+        with self._semaphore:
+
+            sock = self._get_connection()
+
+            try:
+                sock.sendall(encode_frame(items))
+                reply = recv_frame(sock)
+                if reply is None:
+                    raise ConnectionResetError('Connection to {}:{} closed before reply'.format(self.host, self.port))
+            except Exception:
+                sock.close()
+                raise
+            else:
+                self._idle.put(sock)
+
+        return [decode_reply(item) for item in reply]
+
+# ################################################################################################################################
+
+    def invoke(self, item:'bytes') -> 'FramedResponse':
+        return self.invoke_many([item])[0]
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FramedSender:
+    """ Sends messages in the background, in batches, each of which is sent again until the server acknowledges it.
+    Producers are blocked for as long as the queue of messages that are yet to be sent is full. If the server
+    cannot be reached and a fallback is given, messages are handed over to it, one by one, instead.
+    """
+    def __init__(
+        self,
+        host:'str',
+        port:'int',
+        username:'str',
+        password:'str',
+        batch_size:'int'=ModuleCtx.Batch_Size,
+        queue_size:'int'=ModuleCtx.Queue_Size,
+        reconnect_delay:'float'=ModuleCtx.Reconnect_Delay,
+        fallback:'callable_ | None'=None,
+        max_send_failures:'int'=ModuleCtx.Max_Send_Failures,
+        fallback_time:'float'=ModuleCtx.Fallback_Time,
+    ) -> 'None':
+
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.batch_size = batch_size
+        self.reconnect_delay = reconnect_delay
+        self.fallback = fallback
+        self.max_send_failures = max_send_failures
+        self.fallback_time = fallback_time
+
+        self.queue = Queue(queue_size)
+        self._sock = None # type: socket.socket | None
+
+        # How many attempts to send a batch failed in a row ..
+        self.failure_count = 0
+
+        # .. and until when messages go to the fallback because of it.
+        self.fallback_until = 0.0
+
+        self._thread = Thread(target=self._run, name='FramedSender-{}'.format(port))
+        self._thread.daemon = True
+        self._thread.start()
+
+# ################################################################################################################################
+
+    def send(self, item:'bytes') -> 'None':
+        self.queue.put(item)
+
+# ################################################################################################################################
+
+    def _get_batch(self) -> 'list_[bytes]':
+
+        # Wait for at least one message ..
+        out = [self.queue.get()]
+
+        # .. and take as many more as there already are, up to the batch size.
+        while len(out) < self.batch_size:
+            try:
+                out.append(self.queue.get_nowait())
+            except Empty:
+                break
+
+        return out
+
+# ################################################################################################################################
+
+    def _send_batch(self, items:'list_[bytes]') -> 'list_[FramedResponse]':
+
+        if not self._sock:
+            self._sock = connect(self.host, self.port, self.username, self.password)
+
+        try:
+            self._sock.sendall(encode_frame(items))
+            reply = recv_frame(self._sock)
+            if reply is None:
+                raise ConnectionResetError('Connection to {}:{} closed before reply'.format(self.host, self.port))
+        except Exception:
+            self._sock.close()
+            self._sock = None
+            raise
+
+        return [decode_reply(item) for item in reply]
+
+# ################################################################################################################################
+
+    def _send_fallback(self, items:'list_[bytes]') -> 'None':
+        for item in items:
+            try:
+                self.fallback(item) # type: ignore
+            except Exception:
+                logger.warning('Exception in fallback sender for %s:%s -> `%s`', self.host, self.port, format_exc())
+
+# ################################################################################################################################
+
+    def _run(self) -> 'None':
+
+        while True:
+            items = self._get_batch()
+
+            # If the server could not be reached recently, we do not wait for it ..
+            if self.fallback and monotonic() < self.fallback_until:
+                self._send_fallback(items)
+                continue
+
+            # .. otherwise, a batch is sent until it is acknowledged, which means the server may receive it more than once ..
+            while True:
+                try:
+                    responses = self._send_batch(items)
+                except Exception:
+                    self.failure_count += 1
+
+                    # .. unless the server is gone for good, e.g. its process was stopped, in which case we use the fallback ..
+                    if self.fallback and self.failure_count >= self.max_send_failures:
+                        logger.warning('Could not send %d message(s) to %s:%s after %d attempt(s), falling back for %ss -> `%s`',
+                            len(items), self.host, self.port, self.failure_count, self.fallback_time, format_exc())
+                        self.fallback_until = monotonic() + self.fallback_time
+                        self._send_fallback(items)
+                        responses = []
+                        break
+
+                    logger.warning('Could not send %d message(s) to %s:%s, retrying in %ss -> `%s`',
+                        len(items), self.host, self.port, self.reconnect_delay, format_exc())
+                    sleep(self.reconnect_delay)
+                else:
+                    self.failure_count = 0
+                    break
+
+            # .. whereas errors in handling any of its messages are only logged.
+            for response in responses:
+                if not response.ok:
+                    logger.warning('Error reply from %s:%s -> %s `%s`', self.host, self.port,
+                        response.status_code, response.text)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def get_replies(handler:'callable_', items:'list_[bytes]') -> 'list_[bytes]':
+    """ Calls a handler for each of the messages received and returns replies to all of them.
+    """
+    out = []
+
+    for item in items:
+        try:
+            status_code, data = handler(item)
+        except Exception:
+            logger.warning('Exception while handling a framed message -> `%s`', format_exc())
+            status_code, data = ModuleCtx.Status_Error, format_exc()
+        out.append(encode_reply(status_code, data))
+
+    return out
+
+# ################################################################################################################################
+# ################################################################################################################################
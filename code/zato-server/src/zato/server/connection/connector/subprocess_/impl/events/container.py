@@ -12,7 +12,7 @@ from logging import getLogger
 from traceback import format_exc
 
 # Zato
-from zato.common.events.common import Action
+from zato.common.events.common import Action, BatchFormat, decode_push_batch
 from zato.common.util.json_ import JSONParser
 from zato.common.util.tcp import ZatoStreamServer
 from zato.server.connection.connector.subprocess_.base import BaseConnectionContainer
@@ -66,6 +66,7 @@ class EventsConnectionContainer(BaseConnectionContainer):
         self._action_map = {
             Action.Ping: self._on_event_ping,
             Action.Push: self._on_event_push,
+            Action.PushBatch: self._on_event_push_batch,
             Action.GetTable: self._on_event_get_table,
         }
 
@@ -111,6 +112,18 @@ class EventsConnectionContainer(BaseConnectionContainer):
         # .. now, we can push it to the database.
         self.events_db.access_state(_opcode, data)
 
+# ################################################################################################################################
+
+    def _on_event_push_batch(self, data, ignored_address_str, _opcode=OpCode.Push):
+        # type: (bytes, str, str) -> None
+
+        # We received a batch of events in their binary form ..
+        data = decode_push_batch(data)
+
+        # .. and each of them is pushed to the database.
+        for item in data:
+            self.events_db.access_state(_opcode, item)
+
 # ################################################################################################################################
 
     def _on_event_get_table(self, ignored_address_str, _opcode=OpCode.Tabulate):
@@ -137,17 +150,14 @@ class EventsConnectionContainer(BaseConnectionContainer):
             # Keep running until explicitly requested not to
             while self.keep_running:
 
-                # We work on a line-by-line basis
-                line = socket_file.readline()
+                # Each message starts with its action ..
+                action = socket_file.read(Action.LenAction)
 
                 # No input = client is no longer connected
-                if not line:
+                if not action:
                     logger.info('Stream client disconnected (%s)', address_str)
                     break
 
-                # Extract the action sent ..
-                action = line[:2]
-
                 # .. find the handler function ..
                 func = self._action_map.get(action)
 
@@ -156,8 +166,16 @@ class EventsConnectionContainer(BaseConnectionContainer):
                     logger.warning('No handler for `%r` found. Disconnecting stream client (%s)', action, address_str)
                     break
 
-                # .. otherwise, handle the action ..
-                data = line[2:]
+                # .. batches of events are binary data preceded by their size ..
+                if action == Action.PushBatch:
+                    size, = BatchFormat.Header.unpack(socket_file.read(BatchFormat.Header.size))
+                    data = socket_file.read(size)
+
+                # .. while everything else is sent line by line ..
+                else:
+                    data = socket_file.readline()
+
+                # .. and now we can handle the action.
 
                 try:
                     response = func(data, address_str) # type: str
@@ -14,6 +14,7 @@ from traceback import format_exc
 
 # gevent
 from gevent import sleep
+from gevent.pool import Pool
 
 # requests
 from requests import get, post
@@ -24,11 +25,14 @@ from zato.common.json_internal import dumps, loads
 from zato.common.util.api import get_free_port
 from zato.common.util.config import get_server_api_protocol_from_config_item
 from zato.common.util.proc import start_python_process
+from zato.server.connection.connector.subprocess_.framed import encode_reply, FramedClient, FramedServer, \
+     ModuleCtx as FramedCtx
 
 # ################################################################################################################################
 
 if 0:
     from requests import Response
+    from zato.common.typing_ import list_
     from zato.server.base.parallel import ParallelServer
     ParallelServer = ParallelServer
     Response = Response
@@ -61,6 +65,15 @@ class SubprocessIPC:
 
     connector_module = '<connector-module-empty>'
 
+    # Connectors that support it are invoked over persistent connections rather than through HTTP ..
+    has_framed_ipc = True
+
+    # .. and, if this is given, they send messages to that service over a persistent connection too ..
+    callback_service = None
+
+    # .. with up to that many messages handled at a time.
+    callback_pool_size = 100
+
     action_definition_create = None
     action_outgoing_create = None
     action_channel_create = None
@@ -73,6 +86,12 @@ class SubprocessIPC:
         self.api_protocol = get_server_api_protocol_from_config_item(self.server.use_tls)
         self.ipc_tcp_port:'int | None' = None
 
+        # These are set only if the connector supports framed IPC
+        self.framed_port:'int | None' = None
+        self.framed_client:'FramedClient | None' = None
+        self.callback_server:'FramedServer | None' = None
+        self.callback_pool:'Pool | None' = None
+
 # ################################################################################################################################
 
     def _check_enabled(self):
@@ -110,6 +129,21 @@ class SubprocessIPC:
         # Credentials for both servers and connectors
         username, password = self.get_credentials()
 
+        # A port for the connector's framed server, if it has one ..
+        if self.has_framed_ipc:
+            self.framed_port = get_free_port(self.ipc_tcp_port + 1)
+
+            # Connections to a previous connector, if any, are of no use anymore
+            if self.framed_client:
+                self.framed_client.close()
+                self.framed_client = None
+
+            # .. and our own server that the connector will be sending its messages to.
+            if self.callback_service and not self.callback_server:
+                self.callback_pool = Pool(self.callback_pool_size)
+                self.callback_server = FramedServer('127.0.0.1', 0, username, password, self._on_callback_items)
+                self.callback_server.start()
+
         # Employ IPC to exchange subprocess startup configuration
         self.server.connector_config_ipc.set_config(self.ipc_config_name, dumps({
             'port': self.ipc_tcp_port,
@@ -121,7 +155,9 @@ class SubprocessIPC:
             'base_dir': self.server.base_dir,
             'needs_pidfile': not self.server.has_fg,
             'pidfile_suffix': self.pidfile_suffix,
-            'logging_conf_path': self.server.logging_conf_path
+            'logging_conf_path': self.server.logging_conf_path,
+            'framed_port': self.framed_port,
+            'server_framed_port': self.callback_server.port if self.callback_server else None,
         }))
 
         # Start connector in a sub-process
@@ -187,6 +223,39 @@ class SubprocessIPC:
         else:
             return response.ok
 
+# ################################################################################################################################
+
+    def _on_callback(self, item:'bytes') -> 'None':
+        try:
+            _ = self.server.invoke(self.callback_service, item.decode('utf8'))
+        except Exception:
+            logger.warning('Exception in {} callback service `%s` -> `%s`'.format(self.connector_name),
+                self.callback_service, format_exc())
+
+# ################################################################################################################################
+
+    def _on_callback_items(self, items:'list_[bytes]') -> 'list_[bytes]':
+        """ Invoked for each batch of messages that the connector sends over our framed server. Each message is handed
+        to a greenlet of its own and acknowledged as soon as it is, which means that messages do not wait for the ones before them
+        and a batch is not sent again because of a reconnection once its messages are being handled. If all the greenlets
+        are busy, the batch is not acknowledged until there is room for it, which makes the connector stop sending more.
+        """
+        out = []
+
+        for item in items:
+            _ = self.callback_pool.spawn(self._on_callback, item)
+            out.append(encode_reply(FramedCtx.Status_OK, b''))
+
+        return out
+
+# ################################################################################################################################
+
+    def _get_framed_client(self) -> 'FramedClient':
+        if not self.framed_client:
+            username, password = self.get_credentials()
+            self.framed_client = FramedClient('127.0.0.1', self.framed_port, username, password)
+        return self.framed_client
+
 # ################################################################################################################################
 
     def ping(self, id):
@@ -221,8 +290,17 @@ class SubprocessIPC:
         if self.check_enabled:
             self._check_enabled()
 
-        address = address_pattern.format(self.api_protocol, self.ipc_tcp_port, 'api')
-        response = post(address, data=dumps(msg), auth=self.get_credentials()) # type: Response
+        # Use a persistent connection if the connector has a framed server ..
+        if self.framed_port:
+            try:
+                response = self._get_framed_client().invoke(dumps(msg).encode('utf8'))
+            except OSError as e:
+                raise ConnectorClosedException(e, '{} connector not reachable'.format(self.connector_name))
+
+        # .. or send a new HTTP request otherwise.
+        else:
+            address = address_pattern.format(self.api_protocol, self.ipc_tcp_port, 'api')
+            response = post(address, data=dumps(msg), auth=self.get_credentials()) # type: Response
 
         if not response.ok:
             if raise_on_error:
@@ -278,9 +278,9 @@ class RequestDispatcher:
         # .. but do not do it for paths that are explicitly configured to be ignored ..
         if _has_log_info:
             if not path_info in self.server.rest_log_ignore:
-                msg  = f'REST cha → cid={cid}; {http_method} {wsgi_raw_uri} name={channel_name}; len={len(payload)}; '
-                msg += f'agent={user_agent}; remote-addr={remote_addr}:{wsgi_remote_port}'
-                logger.info(msg)
+                self.server.rest_log_buffer.log(_logging_info,
+                    'REST cha → cid=%s; %s %s name=%s; len=%s; agent=%s; remote-addr=%s:%s',
+                    (cid, http_method, wsgi_raw_uri, channel_name, len(payload), user_agent, remote_addr, wsgi_remote_port))
 
         # .. we have a match and ee can possibly handle the incoming request ..
         if url_match not in ModuleCtx.No_URL_Match:
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from http.client import BAD_GATEWAY, GATEWAY_TIMEOUT, SERVICE_UNAVAILABLE
+from logging import getLogger
+from time import monotonic
+
+# gevent
+from gevent.lock import RLock
+
+# Zato
+from zato.common.api import HTTP_SOAP
+from zato.common.exception import CircuitOpen
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import callable_
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato_rest')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # How many consecutive failures open the circuit, zero means that the circuit is never opened,
+    # which is the default because what a failure is depends on the remote end ..
+    Default_Max_Failures = HTTP_SOAP.CIRCUIT_BREAKER.MAX_FAILURES
+
+    # .. and for how many seconds it stays open before a single trial call is let through.
+    Default_Open_Time = HTTP_SOAP.CIRCUIT_BREAKER.OPEN_TIME
+
+    # Responses that mean that the remote end is not available, as opposed to other server errors,
+    # e.g. SOAP faults, which are returned with HTTP 500 by remote ends that work fine otherwise.
+    Failure_Status_Codes = {BAD_GATEWAY, SERVICE_UNAVAILABLE, GATEWAY_TIMEOUT}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class State:
+    Closed   = 'closed'
+    Open     = 'open'
+    HalfOpen = 'half-open'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CircuitBreaker:
+    """ Keeps track of failures of a single outgoing connection. Once there were too many of them in a row,
+    the circuit is opened and callers fail immediately instead of waiting for a remote end that is most likely down.
+    After a while, a single call is let through and, depending on its outcome, the circuit is closed or opened again.
+    """
+    def __init__(
+        self,
+        name:'str',
+        max_failures:'int'=ModuleCtx.Default_Max_Failures,
+        open_time:'float'=ModuleCtx.Default_Open_Time,
+        _monotonic:'callable_'=monotonic,
+    ) -> 'None':
+        self.name = name
+        self.max_failures = max_failures
+        self.open_time = open_time
+        self._monotonic = _monotonic
+
+        self.state = State.Closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = RLock()
+
+# ################################################################################################################################
+
+    def before_call(self, cid:'str') -> 'None':
+        """ Raises an exception if the connection must not be invoked now.
+        """
+        # Nothing to do if the breaker is disabled or if the circuit is closed, which is what we expect most of the time ..
+        if self.max_failures <= 0 or self.state == State.Closed:
+            return
+
+        with self.lock:
+
+            # .. the circuit may have been closed in the meantime ..
+            if self.state == State.Closed:
+                return
+
+            # .. if it has been open long enough, we let through a single call that will decide what to do next.
+            # If a previous trial call has not finished in as much time, it is assumed that it never will
+            # and another one is let through ..
+            if self._monotonic() - self.opened_at >= self.open_time:
+                if self.state == State.HalfOpen:
+                    logger.info('Trial call for `%s` not finished after %ss; cid:`%s`', self.name, self.open_time, cid)
+                else:
+                    self.state = State.HalfOpen
+                    logger.info('Circuit half-open for `%s`; cid:`%s`', self.name, cid)
+
+                self.opened_at = self._monotonic()
+                return
+
+            # .. otherwise, the circuit is open or there already is a trial call in progress.
+            raise CircuitOpen(cid, 'Circuit open for `{}` after {} failure(s)'.format(self.name, self.failures))
+
+# ################################################################################################################################
+
+    def on_success(self) -> 'None':
+
+        if self.state == State.Closed and not self.failures:
+            return
+
+        with self.lock:
+            if self.state != State.Closed:
+                logger.info('Circuit closed for `%s`', self.name)
+            self.state = State.Closed
+            self.failures = 0
+
+# ################################################################################################################################
+
+    def on_failure(self) -> 'None':
+
+        if self.max_failures <= 0:
+            return
+
+        with self.lock:
+            self.failures += 1
+
+            # A failed trial call opens the circuit again, as does reaching the maximum number of failures
+            if self.state == State.HalfOpen or (self.state == State.Closed and self.failures >= self.max_failures):
+                self.state = State.Open
+                self.opened_at = self._monotonic()
+                logger.warning('Circuit opened for `%s` after %s failure(s), retrying in %ss',
+                    self.name, self.failures, self.open_time)
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -8,6 +8,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # stdlib
 import os
+from collections.abc import Iterator
 from copy import deepcopy
 from datetime import datetime
 from http.client import OK
@@ -22,7 +23,7 @@ from gevent.lock import RLock
 # requests
 from requests import Response as _RequestsResponse
 from requests.adapters import HTTPAdapter
-from requests.exceptions import Timeout as RequestsTimeout
+from requests.exceptions import RequestException, Timeout as RequestsTimeout
 from requests.sessions import Session as RequestsSession
 
 # requests-ntlm
@@ -40,6 +41,8 @@ from zato.common.typing_ import cast_
 from zato.common.util.api import get_component_name
 from zato.common.util.config import extract_param_placeholders
 from zato.common.util.open_ import open_rb
+from zato.server.connection.http_soap.circuit_breaker import CircuitBreaker, ModuleCtx as CircuitBreakerCtx
+from zato.server.connection.http_soap.response_cache import ResponseCache
 from zato.server.connection.queue import ConnectionQueue
 
 # ################################################################################################################################
@@ -63,6 +66,17 @@ has_debug = logger.isEnabledFor(DEBUG)
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How many bytes at a time to read from responses that are streamed to services
+    Stream_Chunk_Size = 64 * 1024
+
+    # Requests with these methods do not modify resources so they do not invalidate any cached responses
+    Safe_Methods = {'GET', 'HEAD', 'OPTIONS'}
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 soapenv11_namespace = 'http://schemas.xmlsoap.org/soap/envelope/'
 soapenv12_namespace = 'http://www.w3.org/2003/05/soap-envelope'
 
@@ -85,6 +99,23 @@ class Response(_RequestsResponse):
 # ################################################################################################################################
 # ################################################################################################################################
 
+class SizedStream:
+    """ An iterator of bytes whose total size is known in advance, which lets requests send it with a Content-Length header
+    instead of using chunked transfer encoding.
+    """
+    def __init__(self, data:'any_', size:'int') -> 'None':
+        self.data = data
+        self.size = size
+
+    def __iter__(self) -> 'any_':
+        return iter(self.data)
+
+    def __len__(self) -> 'int':
+        return self.size
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class HTTPSAdapter(HTTPAdapter):
     """ An adapter which exposes a method for clearing out the underlying pool. Useful with HTTPS as it allows to update TLS
     material on the fly.
@@ -159,6 +190,21 @@ class BaseHTTPSOAPWrapper:
 
         self.set_address_data()
         self.set_auth()
+        self.set_circuit_breaker()
+
+# ################################################################################################################################
+
+    def set_circuit_breaker(self) -> 'None':
+
+        # Each connection may have its own limits, otherwise the defaults are used ..
+        max_failures = self.config.get('circuit_breaker_max_failures')
+        max_failures = CircuitBreakerCtx.Default_Max_Failures if max_failures in (None, '') else int(max_failures)
+
+        open_time = self.config.get('circuit_breaker_open_time')
+        open_time = CircuitBreakerCtx.Default_Open_Time if open_time in (None, '') else float(open_time)
+
+        # .. and each has a breaker of its own.
+        self.circuit_breaker = CircuitBreaker(self.config.get('name') or '', max_failures, open_time)
 
 # ################################################################################################################################
 
@@ -311,8 +357,11 @@ class BaseHTTPSOAPWrapper:
                 token_is_cache_hit = None
                 token_cache_hits = None
 
+            # .. streamed requests without a size of their own are sent in chunks so we do not know how big they are ..
+            data_len = len(data) if hasattr(data, '__len__') else '-'
+
             # .. basic details about what we are sending what we are sending ..
-            msg = f'REST out → cid={cid}; {method} {address}; name:{self.config["name"]}; params={params}; len={len(data)}' + \
+            msg = f'REST out → cid={cid}; {method} {address}; name:{self.config["name"]}; params={params}; len={data_len}' + \
                   f'; sec={sec_def_name} ({_sec_type})'
 
             # .. optionally, log details of the Bearer token ..
@@ -322,13 +371,33 @@ class BaseHTTPSOAPWrapper:
             # .. log the information about our request ..
             logger.info(msg)
 
-            # .. do send it ..
-            response = self.session.request(
-                method, address, data=data, json=json, auth=auth, headers=headers, hooks=hooks,
-                cert=cert, verify=tls_verify, timeout=self.config['timeout'], *args, **kwargs)
+            # .. fail immediately if the remote end has been failing recently ..
+            self.circuit_breaker.before_call(cid)
+
+            # .. do send it, with transport errors, e.g. connection errors or timeouts, counting as failures,
+            # unlike our own greenlet being killed, which says nothing about the remote end ..
+            try:
+                response = self.session.request(
+                    method, address, data=data, json=json, auth=auth, headers=headers, hooks=hooks,
+                    cert=cert, verify=tls_verify, timeout=self.config['timeout'], *args, **kwargs)
+            except RequestException:
+                self.circuit_breaker.on_failure()
+                raise
+
+            # .. and so do responses saying that the remote end is not available ..
+            if response.status_code in CircuitBreakerCtx.Failure_Status_Codes:
+                self.circuit_breaker.on_failure()
+            else:
+                self.circuit_breaker.on_success()
+
+            # .. streamed responses have not been read yet so we cannot know their length unless we are told what it is ..
+            if kwargs.get('stream'):
+                response_len = response.headers.get('Content-Length', '-')
+            else:
+                response_len = len(response.text)
 
             # .. log what we received ..
-            msg = f'REST out ← cid={cid}; {response.status_code} time={response.elapsed}; len={len(response.text)}'
+            msg = f'REST out ← cid={cid}; {response.status_code} time={response.elapsed}; len={response_len}'
             logger.info(msg)
 
             # .. and return it.
@@ -467,6 +536,10 @@ class HTTPSOAPWrapper(BaseHTTPSOAPWrapper):
         super(HTTPSOAPWrapper, self).__init__(config, requests_module, server)
         self.server = server
 
+        # Responses to GET requests can be optionally cached, up to that many bytes in total
+        response_cache_max_size = self.config.get('response_cache_max_size')
+        self.response_cache = ResponseCache(int(response_cache_max_size)) if response_cache_max_size else None
+
 # ################################################################################################################################
 
     def __str__(self) -> 'str':
@@ -565,9 +638,16 @@ class HTTPSOAPWrapper(BaseHTTPSOAPWrapper):
         # Pop it here for later use because we cannot pass it to the requests module
         model = kwargs.pop('model', None)
 
+        # If we are to stream the response, its body will not be read in here
+        is_stream = kwargs.get('stream', False)
+
+        # Requests can be streamed too, in which case their data is an iterator of bytes that is sent as it is consumed
+        is_data_stream = isinstance(data, Iterator)
+
         # We do not serialize ourselves data based on this content type,
         # leaving it up to the underlying HTTP library to do it ..
         needs_serialize_based_on_content_type = self.config.get('content_type') != ContentType.FormURLEncoded
+        needs_serialize_based_on_content_type = needs_serialize_based_on_content_type and not is_data_stream
 
         # .. otherwise, our input data may need to be serialized ..
         if needs_serialize_based_on_content_type:
@@ -596,6 +676,18 @@ class HTTPSOAPWrapper(BaseHTTPSOAPWrapper):
         # .. check if we have custom headers on input ..
         headers = kwargs.pop('headers', None) or {}
 
+        # .. if we know how big a streamed request is, it is sent in one piece rather than in chunks ..
+        if is_data_stream:
+            headers = dict(headers)
+            content_length = headers.pop('Content-Length', None)
+            if content_length is not None:
+                data = SizedStream(data, int(content_length))
+
+        # .. if we may use a cached response, these headers will be part of its key ..
+        needs_response_cache = self.response_cache and method == 'GET' and not is_stream
+        if needs_response_cache:
+            user_headers = dict(headers)
+
         # .. build a default set of headers now ..
         headers = self._create_headers(cid, headers)
 
@@ -617,8 +709,30 @@ class HTTPSOAPWrapper(BaseHTTPSOAPWrapper):
             if isinstance(data, str):
                 data = data.encode('utf-8')
 
-        # .. do invoke the connection ..
-        response = self.invoke_http(cid, method, address, data, headers, {}, params=qs_params, *args, **kwargs)
+        # .. do invoke the connection, possibly through the cache ..
+        if needs_response_cache:
+
+            def _invoke_http(extra_headers:'strstrdict') -> '_RequestsResponse':
+                return self.invoke_http(cid, method, address, data, dict(headers, **extra_headers), {},
+                    params=qs_params, *args, **kwargs)
+
+            response_cache = cast_('ResponseCache', self.response_cache)
+            cache_key = response_cache.get_key(
+                address, qs_params, user_headers, kwargs.get('sec_def_name'), kwargs.get('auth_scopes')) # type: ignore
+            response = response_cache.invoke(cache_key, _invoke_http, self.config['timeout'])
+
+        else:
+            response = self.invoke_http(cid, method, address, data, headers, {}, params=qs_params, *args, **kwargs)
+
+            # .. requests that may have modified a resource make responses cached for it no longer valid ..
+            if self.response_cache and method not in ModuleCtx.Safe_Methods:
+                self.response_cache.invalidate(address)
+
+        # .. streamed responses are given to our caller as an iterator of bytes, read as it is consumed, ..
+        # .. although the response itself can be still used as well, e.g. through response.raw, which is file-like ..
+        if is_stream:
+            response.data = response.iter_content(ModuleCtx.Stream_Chunk_Size) # type: ignore
+            return cast_('Response', response)
 
         # .. by default, we have no parsed response at all, ..
         # .. which means that we can assume it will be the same as the raw, text response ..
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from collections import OrderedDict
+from http.client import NOT_MODIFIED, OK
+from logging import getLogger
+from time import monotonic
+
+# gevent
+from gevent import Timeout
+from gevent.event import AsyncResult
+from gevent.lock import RLock
+
+# requests
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, callable_, floatnone, strdict
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger('zato_rest')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Responses with these status codes can be stored ..
+    Cacheable_Status = {OK}
+
+    # .. and these headers are refreshed when a stored response is revalidated.
+    Refresh_Headers = 'Cache-Control', 'Date', 'ETag', 'Expires', 'Last-Modified'
+
+    # How many bytes each header is assumed to take up when the size of a response is computed
+    Header_Overhead = 64
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def parse_cache_control(value:'str') -> 'strdict':
+    """ Turns a Cache-Control header into a dict of directives, e.g. 'max-age=60, no-cache' -> {'max-age':'60', 'no-cache':''}.
+    """
+    out = {}
+
+    for directive in value.split(','):
+        directive = directive.strip()
+        if not directive:
+            continue
+
+        name, _, directive_value = directive.partition('=')
+        out[name.strip().lower()] = directive_value.strip().strip('"')
+
+    return out
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class CacheEntry:
+    """ A response received from a remote end, possibly kept in the cache.
+    """
+    __slots__ = 'status_code', 'reason', 'url', 'encoding', 'headers', 'content', 'size', 'expires_at', 'etag', 'last_modified'
+
+    def __init__(self, response:'Response') -> 'None':
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.url = response.url
+        self.encoding = response.encoding
+        self.headers = CaseInsensitiveDict(response.headers)
+        self.content = response.content
+        self.size = len(self.content) + len(self.headers) * ModuleCtx.Header_Overhead
+        self.expires_at = 0.0
+        self.set_validators()
+
+# ################################################################################################################################
+
+    def copy(self) -> 'CacheEntry':
+        """ Returns a new entry with the same response, which can be modified without affecting this one.
+        """
+        out = CacheEntry.__new__(CacheEntry)
+
+        for name in CacheEntry.__slots__:
+            setattr(out, name, getattr(self, name))
+
+        out.headers = CaseInsensitiveDict(self.headers)
+        return out
+
+# ################################################################################################################################
+
+    def set_validators(self) -> 'None':
+        self.etag = self.headers.get('ETag')
+        self.last_modified = self.headers.get('Last-Modified')
+
+# ################################################################################################################################
+
+    def get_max_age(self) -> 'int | None':
+        """ Returns for how many seconds the response can be used without revalidation
+        or None if it should not be stored at all.
+        """
+        if self.status_code not in ModuleCtx.Cacheable_Status:
+            return None
+
+        # The response may differ in ways that we cannot know about ..
+        if self.headers.get('Vary', '').strip() == '*':
+            return None
+
+        cache_control = parse_cache_control(self.headers.get('Cache-Control', ''))
+
+        # .. or we may be told explicitly not to store it ..
+        if 'no-store' in cache_control:
+            return None
+
+        # .. we may be able to store it but we will need to revalidate it each time ..
+        if 'no-cache' in cache_control:
+            max_age = 0
+
+        # .. or we may be told for how long it is fresh ..
+        else:
+            try:
+                max_age = max(int(cache_control.get('max-age', 0)), 0)
+            except ValueError:
+                max_age = 0
+
+        # .. and if it is never fresh, it is worth storing only if it can be revalidated.
+        if not max_age and not (self.etag or self.last_modified):
+            return None
+
+        return max_age
+
+# ################################################################################################################################
+
+    def get_validation_headers(self) -> 'strdict':
+        out = {}
+
+        if self.etag:
+            out['If-None-Match'] = self.etag
+
+        if self.last_modified:
+            out['If-Modified-Since'] = self.last_modified
+
+        return out
+
+# ################################################################################################################################
+
+    def to_response(self) -> 'Response':
+        """ Each caller receives its own response object that it is free to modify.
+        """
+        response = Response()
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.url = self.url
+        response.encoding = self.encoding
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        return response
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ResponseCache:
+    """ Keeps responses to GET requests for as long as the remote end allows it, up to a maximum total size,
+    evicting the least recently used responses first. Concurrent requests for the same resource that is not in the cache
+    result in a single call to the remote end, whose response is then shared by all of them.
+    """
+    def __init__(self, max_size:'int', _monotonic:'callable_'=monotonic) -> 'None':
+        self.max_size = max_size
+        self._monotonic = _monotonic
+
+        self.size = 0
+        self.entries = OrderedDict() # type: OrderedDict[any_, CacheEntry]
+        self.in_flight = {} # type: dict[any_, AsyncResult]
+        self.lock = RLock()
+
+        # For statistics
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+# ################################################################################################################################
+
+    def get_key(self, address:'str', params:'anydict', headers:'anydict', *args:'any_') -> 'any_':
+        params = tuple(sorted((str(key), str(value)) for key, value in params.items()))
+        headers = tuple(sorted((str(key).lower(), str(value)) for key, value in headers.items()))
+        return (address, params, headers) + args
+
+# ################################################################################################################################
+
+    def _store(self, key:'any_', entry:'CacheEntry') -> 'None':
+
+        with self.lock:
+
+            # Replace any previous entry ..
+            self._delete(key)
+
+            # .. responses that could never fit in are simply not stored ..
+            if entry.size > self.max_size:
+                return
+
+            self.entries[key] = entry
+            self.size += entry.size
+
+            # .. and make room for the new one if needed.
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+
+# ################################################################################################################################
+
+    def _delete(self, key:'any_') -> 'None':
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry.size
+
+# ################################################################################################################################
+
+    def invalidate(self, address:'str') -> 'None':
+        """ Deletes all the responses from a given address, e.g. because it has just been modified.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == address]:
+                self._delete(key)
+
+# ################################################################################################################################
+
+    def clear(self) -> 'None':
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+# ################################################################################################################################
+
+    def invoke(self, key:'any_', invoke_func:'callable_', timeout:'floatnone'=None) -> 'Response':
+        """ Returns a response from the cache or, if there is none or it needs to be revalidated, from invoke_func,
+        which receives a dict of extra headers to send and returns a response from the remote end. If another caller
+        is already obtaining the same response, we wait for it for up to timeout seconds, after which we invoke
+        the remote end ourselves.
+        """
+        with self.lock:
+
+            # We may have a fresh response already ..
+            entry = self.entries.get(key)
+
+            if entry and entry.expires_at > self._monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.to_response()
+
+            # .. if not, someone else may be already obtaining it ..
+            in_flight = self.in_flight.get(key)
+
+            # .. or we will need to obtain it ourselves.
+            if not in_flight:
+                in_flight = self.in_flight[key] = AsyncResult()
+                is_leader = True
+            else:
+                is_leader = False
+
+        # If we were not the first ones to ask for the response, we wait for whoever was ..
+        if not is_leader:
+            try:
+                result = in_flight.get(timeout=timeout) # type: CacheEntry
+            except Timeout:
+                logger.info('Response to `%s` not received after %ss, invoking it directly', key[0], timeout)
+                self.misses += 1
+                response, _ = self._invoke(key, None, invoke_func)
+                return response
+            else:
+                self.hits += 1
+                return result.to_response()
+
+        # .. otherwise, we need to let them know what we received, no matter how our own call ends.
+        try:
+            self.misses += 1
+            response, result = self._invoke(key, entry, invoke_func)
+        except BaseException as e:
+
+            # Callers waiting for us were not interrupted themselves so they receive a regular exception
+            if not isinstance(e, Exception):
+                e = Exception('Response to `{}` not received, e:`{!r}`'.format(key[0], e))
+
+            in_flight.set_exception(e)
+            raise
+        else:
+            in_flight.set(result)
+        finally:
+            with self.lock:
+                _ = self.in_flight.pop(key, None)
+
+        return response
+
+# ################################################################################################################################
+
+    def _invoke(self, key:'any_', entry:'CacheEntry | None', invoke_func:'callable_') -> 'tuple[Response, CacheEntry]':
+
+        # If we already have a stale response, we can ask the remote end if it is still valid ..
+        response = invoke_func(entry.get_validation_headers() if entry else {}) # type: Response
+
+        # .. if it is, only its metadata needs to be updated. Other callers may be still using the entry that we have,
+        # which is why a new one is created, and it is stored again in case the old one was evicted in the meantime ..
+        if entry and response.status_code == NOT_MODIFIED:
+
+            self.revalidated += 1
+            entry = entry.copy()
+
+            for name in ModuleCtx.Refresh_Headers:
+                value = response.headers.get(name)
+                if value is not None:
+                    entry.headers[name] = value
+
+            entry.set_validators()
+            max_age = entry.get_max_age()
+
+            if max_age is None:
+                with self.lock:
+                    self._delete(key)
+            else:
+                entry.expires_at = self._monotonic() + max_age
+                self._store(key, entry)
+
+            return entry.to_response(), entry
+
+        # .. otherwise, this is a new response that we may be able to store.
+        result = CacheEntry(response)
+        max_age = result.get_max_age()
+
+        if max_age is None:
+            with self.lock:
+                self._delete(key)
+        else:
+            result.expires_at = self._monotonic() + max_age
+            self._store(key, result)
+
+        return response, result
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -7,6 +7,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections import deque
 from logging import getLogger
 
 # gevent
@@ -29,6 +30,9 @@ event_type_req      = EventInfo.EventType.service_request
 event_type_resp     = EventInfo.EventType.service_response
 object_type_service = EventInfo.ObjectType.service
 
+# If we cannot connect to the backend, this is how many of the most recent events will be kept until we can
+max_backlog_size = 1_000_000
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -39,7 +43,7 @@ class ServiceStatsClient:
         self.port = -1
         self.impl = None # type: EventsClient
         self.impl_class = impl_class or EventsClient
-        self.backlog = []
+        self.backlog = deque(maxlen=max_backlog_size) # type: deque
         self.lock = RLock()
 
 # ################################################################################################################################
@@ -71,15 +75,14 @@ class ServiceStatsClient:
             # .. ensure no updates to the backlog while we run ..
             with self.lock:
 
-                # .. get all enqueued events ..
-                for item in self.backlog[:]: # type: PushCtx
+                # .. get all enqueued events, oldest first, each removed from the queue in constant time ..
+                backlog = self.backlog
+                while backlog:
+                    item = backlog.popleft() # type: PushCtx
 
-                    # .. push each to the backend ..
+                    # .. and push each to the backend, which will send them in batches.
                     self.impl.push(item)
 
-                    # .. and remove it from the queue ..
-                    self.backlog.remove(item)
-
 # ################################################################################################################################
 
     def push(self, cid, timestamp, service_name, is_request, total_time_ms=0, id=None):
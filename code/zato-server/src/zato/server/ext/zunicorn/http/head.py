@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+"""
+BELOW IS THE ORIGINAL LICENSE ON WHICH THIS SOFTWARE IS BASED.
+
+2009-2018 (c) Benoît Chesneau <benoitc@e-engura.org>
+2009-2015 (c) Paul J. Davis <paul.joseph.davis@gmail.com>
+
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+# flake8: noqa
+
+"""
+Pure-Python parsing of request lines and headers, used if the compiled version from zato.cy.http_parser is not available.
+Both versions accept and reject exactly the same input.
+"""
+
+import regex as re
+
+from zato.server.ext.zunicorn._compat import bytes_to_str
+from zato.server.ext.zunicorn.http.errors import (InvalidHeader, InvalidHeaderName, InvalidRequestLine,
+    InvalidRequestMethod, InvalidHTTPVersion, InvalidSchemeHeaders, LimitRequestHeaders)
+from zato.server.ext.zunicorn.util import split_request_uri
+
+HEADER_RE = re.compile(r"[\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\"]")
+METHOD_RE = re.compile(r"[A-Z0-9$-_.]{3,20}")
+VERSION_RE = re.compile(r"HTTP/(\d+)\.(\d+)")
+
+
+def parse_request_line(line_bytes, METHOD_RE=METHOD_RE, VERSION_RE=VERSION_RE,
+        split_request_uri=split_request_uri, bytes_to_str=bytes_to_str):
+    """ Returns the method, URI, path, query, fragment and version from a request line.
+    """
+    bits = [bytes_to_str(bit) for bit in line_bytes.split(None, 2)]
+    if len(bits) != 3:
+        raise InvalidRequestLine(bytes_to_str(line_bytes))
+
+    # Method
+    if not METHOD_RE.match(bits[0]):
+        raise InvalidRequestMethod(bits[0])
+    method = bits[0].upper()
+
+    # URI
+    uri = bits[1]
+
+    try:
+        parts = split_request_uri(uri)
+    except ValueError:
+        raise InvalidRequestLine(bytes_to_str(line_bytes))
+
+    # Version
+    match = VERSION_RE.match(bits[2])
+    if match is None:
+        raise InvalidHTTPVersion(bits[2])
+    version = (int(match.group(1)), int(match.group(2)))
+
+    return method, uri, parts.path or "", parts.query or "", parts.fragment or "", version
+
+
+def parse_headers(data, limit_request_fields, limit_request_field_size, secure_scheme_headers, scheme,
+        HEADER_RE=HEADER_RE, bytes_to_str=bytes_to_str):
+    """ Returns a list of (name, value) header tuples from data, which are all the header lines without the final empty one,
+    and the request's scheme, as given on input or as set by one of secure_scheme_headers.
+    """
+    headers = []
+    scheme_header = False
+
+    # Split lines on \r\n keeping the \r\n on each line
+    lines = [bytes_to_str(line) + "\r\n" for line in data.split(b"\r\n")]
+
+    # Parse headers into key/value pairs paying attention
+    # to continuation lines.
+
+    lines_pop = lines.pop
+
+    while lines:
+        if len(headers) >= limit_request_fields:
+            raise LimitRequestHeaders("limit request headers fields")
+
+        # Parse initial header name : value pair.
+        curr = lines_pop(0)
+        header_length = len(curr)
+        if curr.find(":") < 0:
+            raise InvalidHeader(curr.strip())
+        name, value = curr.split(":", 1)
+        name = name.rstrip(" \t").upper()
+        if HEADER_RE.search(name):
+            raise InvalidHeaderName(name)
+
+        name, value = name.strip(), [value.lstrip()]
+
+        # Consume value continuation lines
+        while lines and lines[0].startswith((" ", "\t")):
+            curr = lines_pop(0)
+            header_length += len(curr)
+            if header_length > limit_request_field_size > 0:
+                raise LimitRequestHeaders("limit request headers "
+                        + "fields size")
+            value.append(curr)
+        value = ''.join(value).rstrip()
+
+        if header_length > limit_request_field_size > 0:
+            raise LimitRequestHeaders("limit request headers fields size")
+
+        if name in secure_scheme_headers:
+            secure = value == secure_scheme_headers[name]
+            new_scheme = "https" if secure else "http"
+            if scheme_header:
+                if new_scheme != scheme:
+                    raise InvalidSchemeHeaders()
+            else:
+                scheme_header = True
+                scheme = new_scheme
+
+        headers.append((name, value))
+
+    return headers, scheme
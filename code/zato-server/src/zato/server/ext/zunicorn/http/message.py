@@ -36,29 +36,26 @@ OTHER DEALINGS IN THE SOFTWARE.
 
 # flake8: noqa
 
-import regex as re
 import socket
 from errno import ENOTCONN
 
 from zato.server.ext.zunicorn._compat import bytes_to_str
 from zato.server.ext.zunicorn.http.unreader import SocketUnreader
 from zato.server.ext.zunicorn.http.body import ChunkedReader, LengthReader, EOFReader, Body
-from zato.server.ext.zunicorn.http.errors import (InvalidHeader, InvalidHeaderName, NoMoreData,
-    InvalidRequestLine, InvalidRequestMethod, InvalidHTTPVersion,
-    LimitRequestLine, LimitRequestHeaders)
+from zato.server.ext.zunicorn.http.errors import InvalidHeader, NoMoreData, LimitRequestLine, LimitRequestHeaders
 from zato.server.ext.zunicorn.http.errors import InvalidProxyLine, ForbiddenProxyRequest
-from zato.server.ext.zunicorn.http.errors import InvalidSchemeHeaders
-from zato.server.ext.zunicorn.six import BytesIO, string_types
-from zato.server.ext.zunicorn.util import split_request_uri
+from zato.server.ext.zunicorn.six import string_types
+
+# Parsing of request lines and headers is compiled if possible
+try:
+    from zato.cy.http_parser import parse_headers, parse_request_line
+except ImportError:
+    from zato.server.ext.zunicorn.http.head import parse_headers, parse_request_line
 
 MAX_REQUEST_LINE = 8190
 MAX_HEADERS = 32768
 DEFAULT_MAX_HEADERFIELD_SIZE = 8190
 
-HEADER_RE = re.compile(r"[\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\"]")
-METHOD_RE = re.compile(r"[A-Z0-9$-_.]{3,20}")
-VERSION_RE = re.compile(r"HTTP/(\d+)\.(\d+)")
-
 
 class Message:
     def __init__(self, cfg, unreader, MAX_HEADERS=MAX_HEADERS,
@@ -87,15 +84,10 @@ class Message:
     def parse(self, unreader):
         raise NotImplementedError()
 
-    def parse_headers(self, data, bytes_to_str=bytes_to_str):
+    def parse_headers(self, data, parse_headers=parse_headers):
         cfg = self.cfg
-        headers = []
-
-        # Split lines on \r\n keeping the \r\n on each line
-        lines = [bytes_to_str(line) + "\r\n" for line in data.split(b"\r\n")]
 
         # handle scheme headers
-        scheme_header = False
         secure_scheme_headers = {}
         if '*' in cfg.forwarded_allow_ips:
             secure_scheme_headers = cfg.secure_scheme_headers
@@ -108,53 +100,8 @@ class Message:
             elif isinstance(remote_addr, string_types):
                 secure_scheme_headers = cfg.secure_scheme_headers
 
-        # Parse headers into key/value pairs paying attention
-        # to continuation lines.
-
-        self_limit_request_fields = self.limit_request_fields
-        self_limit_request_field_size = self.limit_request_field_size
-        lines_pop = lines.pop
-
-        while lines:
-            if len(headers) >= self_limit_request_fields:
-                raise LimitRequestHeaders("limit request headers fields")
-
-            # Parse initial header name : value pair.
-            curr = lines_pop(0)
-            header_length = len(curr)
-            if curr.find(":") < 0:
-                raise InvalidHeader(curr.strip())
-            name, value = curr.split(":", 1)
-            name = name.rstrip(" \t").upper()
-            if HEADER_RE.search(name):
-                raise InvalidHeaderName(name)
-
-            name, value = name.strip(), [value.lstrip()]
-
-            # Consume value continuation lines
-            while lines and lines[0].startswith((" ", "\t")):
-                curr = lines_pop(0)
-                header_length += len(curr)
-                if header_length > self_limit_request_field_size > 0:
-                    raise LimitRequestHeaders("limit request headers "
-                            + "fields size")
-                value.append(curr)
-            value = ''.join(value).rstrip()
-
-            if header_length > self_limit_request_field_size > 0:
-                raise LimitRequestHeaders("limit request headers fields size")
-
-            if name in secure_scheme_headers:
-                secure = value == secure_scheme_headers[name]
-                scheme = "https" if secure else "http"
-                if scheme_header:
-                    if scheme != self.scheme:
-                        raise InvalidSchemeHeaders()
-                else:
-                    scheme_header = True
-                    self.scheme = scheme
-
-            headers.append((name, value))
+        headers, self.scheme = parse_headers(data, self.limit_request_fields, self.limit_request_field_size,
+            secure_scheme_headers, self.scheme)
 
         return headers
 
@@ -215,50 +162,39 @@ class Request(Message):
         super(Request, self).__init__(cfg, unreader)
 
     def get_data(self, unreader, buf, stop=False, NoMoreData=NoMoreData):
+        """ Returns buf followed by more data read from unreader.
+        """
         data = unreader.read()
         if not data:
             if stop:
                 raise StopIteration()
-            raise NoMoreData(buf.getvalue())
-        buf.write(data)
+            raise NoMoreData(buf)
+        return buf + data if buf else data
 
-    def parse(self, unreader, BytesIO=BytesIO):
-        buf = BytesIO()
-        self.get_data(unreader, buf, stop=True)
+    def parse(self, unreader):
+        data = self.get_data(unreader, b"", stop=True)
 
         # get request line
-        line, rbuf = self.read_line(unreader, buf, self.limit_request_line)
+        line, data = self.read_line(unreader, data, self.limit_request_line)
 
         # proxy protocol
         if self.cfg.proxy_protocol:
             if self.proxy_protocol(bytes_to_str(line)):
                 # get next request line
-                buf = BytesIO()
-                buf.write(rbuf)
-                line, rbuf = self.read_line(unreader, buf, self.limit_request_line)
+                line, data = self.read_line(unreader, data, self.limit_request_line)
 
         self.parse_request_line(line)
-        buf = BytesIO()
-        buf.write(rbuf)
 
         # Headers
-        data = buf.getvalue()
-        idx = data.find(b"\r\n\r\n")
-
-        done = data[:2] == b"\r\n"
-
-        data_find = data.find
         self_get_data = self.get_data
-        buf_getvalue = buf.getvalue
         self_max_buffer_headers = self.max_buffer_headers
 
         while True:
-            idx = data_find(b"\r\n\r\n")
+            idx = data.find(b"\r\n\r\n")
             done = data[:2] == b"\r\n"
 
             if idx < 0 and not done:
-                self_get_data(unreader, buf)
-                data = buf_getvalue()
+                data = self_get_data(unreader, data)
                 if len(data) > self_max_buffer_headers:
                     raise LimitRequestHeaders("max buffer headers")
             else:
@@ -270,19 +206,13 @@ class Request(Message):
 
         self.headers = self.parse_headers(data[:idx])
 
-        ret = data[idx + 4:]
-        buf = None
+        return data[idx + 4:]
 
-        return ret
-
-    def read_line(self, unreader, buf, limit=0):
-        data = buf.getvalue()
-        data_find = data.find
+    def read_line(self, unreader, data, limit=0):
         self_get_data = self.get_data
-        buf_getvalue = buf.getvalue
 
         while True:
-            idx = data_find(b"\r\n")
+            idx = data.find(b"\r\n")
             if idx >= 0:
                 # check if the request line is too large
                 if idx > limit > 0:
@@ -290,8 +220,7 @@ class Request(Message):
                 break
             elif len(data) - 2 > limit > 0:
                 raise LimitRequestLine(len(data), limit)
-            self_get_data(unreader, buf)
-            data = buf_getvalue()
+            data = self_get_data(unreader, data)
 
         return (data[:idx],  # request line,
                 data[idx + 2:])  # residue in the buffer, skip \r\n
@@ -375,34 +304,8 @@ class Request(Message):
             "proxy_port": d_port
         }
 
-    def parse_request_line(self, line_bytes, METHOD_RE=METHOD_RE, VERSION_RE=VERSION_RE,
-            split_request_uri=split_request_uri, bytes_to_str=bytes_to_str):
-
-        bits = [bytes_to_str(bit) for bit in line_bytes.split(None, 2)]
-        if len(bits) != 3:
-            raise InvalidRequestLine(bytes_to_str(line_bytes))
-
-        # Method
-        if not METHOD_RE.match(bits[0]):
-            raise InvalidRequestMethod(bits[0])
-        self.method = bits[0].upper()
-
-        # URI
-        self.uri = bits[1]
-
-        try:
-            parts = split_request_uri(self.uri)
-        except ValueError:
-            raise InvalidRequestLine(bytes_to_str(line_bytes))
-        self.path = parts.path or ""
-        self.query = parts.query or ""
-        self.fragment = parts.fragment or ""
-
-        # Version
-        match = VERSION_RE.match(bits[2])
-        if match is None:
-            raise InvalidHTTPVersion(bits[2])
-        self.version = (int(match.group(1)), int(match.group(2)))
+    def parse_request_line(self, line_bytes, parse_request_line=parse_request_line):
+        self.method, self.uri, self.path, self.query, self.fragment, self.version = parse_request_line(line_bytes)
 
     def set_body_reader(self, EOFReader=EOFReader, Body=Body, LengthReader=LengthReader):
         super(Request, self).set_body_reader()
@@ -34,8 +34,6 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 OTHER DEALINGS IN THE SOFTWARE.
 """
 
-import os
-
 from zato.server.ext.zunicorn import six
 
 # Classes that can undo reading data from
@@ -44,7 +42,7 @@ from zato.server.ext.zunicorn import six
 
 class Unreader:
     def __init__(self):
-        self.buf = six.BytesIO()
+        self.buf = b""
 
     def chunk(self):
         raise NotImplementedError()
@@ -59,31 +57,33 @@ class Unreader:
             if size < 0:
                 size = None
 
-        self.buf.seek(0, os.SEEK_END)
+        buf = self.buf
 
-        if size is None and self.buf.tell():
-            ret = self.buf.getvalue()
-            self.buf = six.BytesIO()
-            return ret
         if size is None:
-            d = self.chunk()
-            return d
+            if buf:
+                self.buf = b""
+                return buf
+            return self.chunk()
+
+        # Collect chunks in a list to avoid copying the buffer on each one
+        parts = [buf]
+        buf_len = len(buf)
 
-        while self.buf.tell() < size:
+        while buf_len < size:
             chunk = self.chunk()
             if not chunk:
-                ret = self.buf.getvalue()
-                self.buf = six.BytesIO()
-                return ret
-            self.buf.write(chunk)
-        data = self.buf.getvalue()
-        self.buf = six.BytesIO()
-        self.buf.write(data[size:])
+                self.buf = b""
+                return b"".join(parts)
+            parts.append(chunk)
+            buf_len += len(chunk)
+
+        data = b"".join(parts) if len(parts) > 1 else buf
+        self.buf = data[size:]
         return data[:size]
 
     def unread(self, data):
-        self.buf.seek(0, os.SEEK_END)
-        self.buf.write(data)
+        if data:
+            self.buf = self.buf + data if self.buf else bytes(data)
 
 
 class SocketUnreader(Unreader):
@@ -41,7 +41,7 @@ import regex as re
 
 from zato.server.ext.zunicorn import SERVER_SOFTWARE, util
 from zato.server.ext.zunicorn._compat import unquote_to_wsgi_str
-from zato.server.ext.zunicorn.http.message import HEADER_RE
+from zato.server.ext.zunicorn.http.head import HEADER_RE
 from zato.server.ext.zunicorn.http.errors import InvalidHeader, InvalidHeaderName
 from zato.server.ext.zunicorn.six import string_types, binary_type, reraise
 
@@ -60,6 +60,21 @@ BLKSIZE = 0x3FFFFFFF
 
 HEADER_VALUE_RE = re.compile(r'[\x00-\x1F\x7F]')
 
+# Parts of response heads that are the same in each response, already encoded ..
+CONNECTION_UPGRADE = b"Connection: upgrade\r\n"
+CONNECTION_CLOSE = b"Connection: close\r\n"
+CONNECTION_KEEP_ALIVE = b"Connection: keep-alive\r\n"
+TRANSFER_ENCODING_CHUNKED = b"Transfer-Encoding: chunked\r\n"
+LAST_CHUNK = b"0\r\n\r\n"
+
+# .. parts that depend on the HTTP version, status or server software only, encoded the first time they are needed ..
+STATUS_LINE_CACHE_MAX = 1024
+_status_lines = {}
+_server_headers = {}
+
+# .. and the Date header, along with the value it was built from.
+_date_header = [None, None]
+
 log = logging.getLogger(__name__)
 
 
@@ -130,6 +145,8 @@ class Response:
         self.response_length = None
         self.sent = 0
         self.upgrade = False
+        self.is_complete = False
+        self.use_sendmsg = not cfg.is_ssl
         self.cfg = cfg
 
     def force_close(self):
@@ -223,38 +240,83 @@ class Response:
             return False
         return True
 
-    def default_headers(self, util_http_date=util.http_date):
+    def get_status_line(self, _status_lines=_status_lines, STATUS_LINE_CACHE_MAX=STATUS_LINE_CACHE_MAX):
+        key = (self.req.version, self.status)
+        status_line = _status_lines.get(key)
+
+        if status_line is None:
+            status_line = ("HTTP/%s.%s %s\r\n" % (self.req.version[0], self.req.version[1], self.status)).encode("utf8")
+
+            # Applications can use statuses with any reason phrase, hence the limit
+            if len(_status_lines) < STATUS_LINE_CACHE_MAX:
+                _status_lines[key] = status_line
+
+        return status_line
+
+    def get_server_header(self, _server_headers=_server_headers):
+        server_header = _server_headers.get(self.version)
+
+        if server_header is None:
+            server_header = _server_headers[self.version] = ("Server: %s\r\n" % self.version).encode("utf8")
+
+        return server_header
+
+    def get_date_header(self, util_http_date=util.http_date, _date_header=_date_header):
+        value = util_http_date()
+
+        # The same object is returned for as long as the date does not change
+        if value is not _date_header[0]:
+            _date_header[1] = ("Date: %s\r\n" % value).encode("ascii")
+            _date_header[0] = value
+
+        return _date_header[1]
+
+    def default_headers(self):
         # set the connection header
         if self.upgrade:
-            connection = "upgrade"
+            connection = CONNECTION_UPGRADE
         elif self.should_close():
-            connection = "close"
+            connection = CONNECTION_CLOSE
         else:
-            connection = "keep-alive"
+            connection = CONNECTION_KEEP_ALIVE
 
         headers = [
-            "HTTP/%s.%s %s\r\n" % (self.req.version[0],
-                self.req.version[1], self.status),
-            "Server: %s\r\n" % self.version,
-            "Date: %s\r\n" % util_http_date(),
-            "Connection: %s\r\n" % connection
+            self.get_status_line(),
+            self.get_server_header(),
+            self.get_date_header(),
+            connection
         ]
         if self.chunked:
-            headers.append("Transfer-Encoding: chunked\r\n")
+            headers.append(TRANSFER_ENCODING_CHUNKED)
         return headers
 
-    def send_headers(self, util_write=util.write, util_to_bytestring=util.to_bytestring):
+    def get_head(self):
+        head = self.default_headers()
+        head.append(("".join(["%s: %s\r\n" % (k, v) for k, v in self.headers]) + "\r\n").encode("utf8"))
+        return b"".join(head)
+
+    def send(self, buffers, util_write_vector=util.write_vector):
+        """ Sends the response's head, unless it has been already sent, along with the buffers given on input.
+        """
+        if not self.headers_sent:
+            buffers.insert(0, self.get_head())
+            util_write_vector(self.sock, buffers, self.use_sendmsg)
+            self.headers_sent = True
+
+        elif len(buffers) == 1:
+            self.sock.sendall(buffers[0])
+
+        elif buffers:
+            util_write_vector(self.sock, buffers, self.use_sendmsg)
+
+    def send_headers(self):
         if self.headers_sent:
             return
-        tosend = self.default_headers()
-        tosend.extend(["%s: %s\r\n" % (k, v) for k, v in self.headers])
+        self.send([])
 
-        header_str = "%s\r\n" % "".join(tosend)
-        util_write(self.sock, util_to_bytestring(header_str, "ascii"))
-        self.headers_sent = True
-
-    def write(self, arg, binary_type=binary_type, util_write=util.write):
-        self.send_headers()
+    def add_body(self, buffers, arg, binary_type=binary_type):
+        """ Appends arg to the buffers to send, possibly shortened to the response's length, and framed if it is chunked.
+        """
         if not isinstance(arg, binary_type):
             raise TypeError('{!r} is not a byte'.format(arg))
         arglen = len(arg)
@@ -268,13 +330,34 @@ class Response:
             if tosend < arglen:
                 arg = arg[:tosend]
 
-        # Sending an empty chunk signals the end of the
-        # response and prematurely closes the response
-        if self.chunked and tosend == 0:
-            return
+        if self.chunked:
+            # Sending an empty chunk signals the end of the
+            # response and prematurely closes the response
+            if tosend == 0:
+                return
+            buffers.append(b"%X\r\n" % tosend)
+            buffers.append(arg)
+            buffers.append(b"\r\n")
+        elif tosend:
+            buffers.append(arg)
 
         self.sent += tosend
-        util_write(self.sock, arg, self.chunked)
+
+    def write(self, arg):
+        buffers = []
+        self.add_body(buffers, arg)
+        self.send(buffers)
+
+    def write_all(self, items):
+        """ Sends the head, all the items of a response's body and, for chunked responses, the last chunk, all at once.
+        """
+        buffers = []
+        for item in items:
+            self.add_body(buffers, item)
+        if self.chunked:
+            buffers.append(LAST_CHUNK)
+            self.is_complete = True
+        self.send(buffers)
 
     def can_sendfile(self):
         return self.cfg.sendfile is not False and sendfile is not None
@@ -329,10 +412,9 @@ class Response:
                 self.write(item)
 
     def close(self):
-        if not self.headers_sent:
-            self.send_headers()
-        if self.chunked:
-            util.write_chunk(self.sock, b"")
+        if self.is_complete:
+            return
+        self.send([LAST_CHUNK] if self.chunked else [])
 
 
 def create(req, sock, client, server, cfg, Response=Response, default_environ=default_environ,
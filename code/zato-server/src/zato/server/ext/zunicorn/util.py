@@ -72,6 +72,9 @@ is_forking = is_linux
 days   = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
 months = (None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
 
+# How many buffers a single sendmsg call can be given, the lowest limit of commonly used systems
+IOV_MAX = 1024
+
 # Server and Date aren't technically hop-by-hop
 # headers, but they are in the purview of the
 # origin server which the WSGI spec says we should
@@ -356,6 +359,20 @@ def write(sock, data, chunked=False):
     sock.sendall(data)
 
 
+def write_vector(sock, buffers, use_sendmsg=True, IOV_MAX=IOV_MAX):
+    """ Sends all the buffers on input, in one system call unless the socket does not support vectored writes.
+    """
+    if not use_sendmsg or len(buffers) > IOV_MAX:
+        sock.sendall(b"".join(buffers))
+        return
+
+    sent = sock.sendmsg(buffers)
+
+    # Whatever the kernel did not accept in one go is sent the regular way
+    if sent < sum(map(len, buffers)):
+        sock.sendall(b"".join(buffers)[sent:])
+
+
 def write_nonblock(sock, data, chunked=False):
     timeout = sock.gettimeout()
     if timeout != 0.0:
@@ -439,20 +456,35 @@ def getcwd():
     return cwd
 
 
-def http_date(_gmtime=gmtime, _days=days, _months=months):
+# The value of the Date header changes once a second, which is why it is not built anew for each response.
+# The first element is the second the value was built for and the second one is the value itself.
+_http_date_cache = [None, None]
+
+def http_date(_gmtime=gmtime, _time=time.time, _days=days, _months=months, _cache=_http_date_cache):
     """ Return the current date and time formatted for a message header.
     """
-    _time_tuple = _gmtime()
+    now = int(_time())
+
+    if now == _cache[0]:
+        return _cache[1]
 
-    return '%s, %02d %s %02d:%02d:%02d GMT' % (
+    _time_tuple = _gmtime(now)
+
+    value = '%s, %02d %s %04d %02d:%02d:%02d GMT' % (
         _days[_time_tuple.tm_wday],
         _time_tuple.tm_mday,
         _months[_time_tuple.tm_mon],
+        _time_tuple.tm_year,
         _time_tuple.tm_hour,
         _time_tuple.tm_min,
         _time_tuple.tm_sec
     )
 
+    _cache[1] = value
+    _cache[0] = now
+
+    return value
+
 
 def is_hoppish(header):
     return header.lower().strip() in hop_headers
@@ -133,6 +133,9 @@ class AsyncWorker(base.Worker):
             try:
                 if isinstance(respiter, environ['wsgi.file_wrapper']):
                     resp.write_file(respiter)
+                elif isinstance(respiter, (list, tuple)):
+                    # The whole body is already known so it can be sent along with the head
+                    resp.write_all(respiter)
                 else:
                     for item in respiter:
                         resp.write(item)
@@ -19,7 +19,7 @@ from sys import maxsize
 from traceback import format_exc
 
 # gevent
-from gevent import sleep
+from gevent import joinall, sleep, spawn
 from gevent.lock import RLock
 
 # globre
@@ -35,14 +35,15 @@ from zato.server.file_transfer.observer.base import BackgroundPathInspector, Pat
 from zato.server.file_transfer.observer.local_ import LocalObserver
 from zato.server.file_transfer.observer.ftp import FTPObserver
 from zato.server.file_transfer.observer.sftp import SFTPObserver
-from zato.server.file_transfer.snapshot import FTPSnapshotMaker, LocalSnapshotMaker, SFTPSnapshotMaker
+from zato.server.file_transfer.snapshot import FileStream, FTPSnapshotMaker, LocalSnapshotMaker, SFTPSnapshotMaker
 
 # ################################################################################################################################
 
 if 0:
     from bunch import Bunch
+    from gevent import Greenlet
     from requests import Response
-    from zato.common.typing_ import any_, anydict, anylist, list_
+    from zato.common.typing_ import any_, anydict, anylist, callable_, list_
     from zato.server.base.parallel import ParallelServer
     from zato.server.base.worker import WorkerStore
     from zato.server.file_transfer.event import FileTransferEvent
@@ -365,34 +366,49 @@ class FileTransferAPI:
         }
 
         # Services
-        self.invoke_service_callbacks(service_list, request)
+        greenlets = self.invoke_service_callbacks(service_list, request)
 
         # Topics
-        self.invoke_topic_callbacks(topic_list, request)
+        greenlets.extend(self.invoke_topic_callbacks(topic_list, request))
 
         # REST outgoing connections
-        self.invoke_rest_outconn_callbacks(outconn_rest_list, request)
+        greenlets.extend(self.invoke_rest_outconn_callbacks(outconn_rest_list, request))
+
+        # A streamed file stays open until all the callbacks have read it
+        if isinstance(event.raw_data, FileStream):
+            _ = joinall(greenlets)
+            event.raw_data.close()
+
+# ################################################################################################################################
+
+    def _run_callback(self, func:'callable_', *args:'any_') -> 'None':
+        try:
+            _ = func(*args)
+        except Exception:
+            logger.warning(format_exc())
 
 # ################################################################################################################################
 
-    def invoke_service_callbacks(self, service_list:'anylist', request:'anydict') -> 'None':
+    def invoke_service_callbacks(self, service_list:'anylist', request:'anydict') -> 'list_[Greenlet]':
+
+        out = []
 
         for item in service_list: # type: str
-            try:
-                _ = spawn_greenlet(self.server.invoke, item, request)
-            except Exception:
-                logger.warning(format_exc())
+            out.append(spawn(self._run_callback, self.server.invoke, item, request))
+
+        return out
 
 # ################################################################################################################################
 
-    def invoke_topic_callbacks(self, topic_list:'anylist', request:'anydict') -> 'None':
+    def invoke_topic_callbacks(self, topic_list:'anylist', request:'anydict') -> 'list_[Greenlet]':
+
+        out = []
 
         for item in topic_list:
             item = cast_('str', item)
-            try:
-                _ = spawn_greenlet(self.server.invoke, item, request)
-            except Exception:
-                logger.warning(format_exc())
+            out.append(spawn(self._run_callback, self.server.invoke, item, request))
+
+        return out
 
 # ################################################################################################################################
 
@@ -423,6 +439,11 @@ class FileTransferAPI:
                 'X-Zato-Mime-Type': mime_type,
             }
 
+            # Streamed files are sent chunk by chunk, without reading all of them into memory
+            if isinstance(payload, FileStream):
+                headers['Content-Length'] = str(payload.size)
+                payload = payload.iter_bytes()
+
             response = item.conn.post(cid, payload, params, headers=headers) # type: Response
 
             if response.status_code != OK:
@@ -432,10 +453,14 @@ class FileTransferAPI:
 
 # ################################################################################################################################
 
-    def invoke_rest_outconn_callbacks(self, outconn_rest_list:'anylist', request:'anydict') -> 'None':
+    def invoke_rest_outconn_callbacks(self, outconn_rest_list:'anylist', request:'anydict') -> 'list_[Greenlet]':
+
+        out = []
 
         for item_id in outconn_rest_list: # type: int
-            _ = spawn_greenlet(self._invoke_rest_outconn_callback, item_id, request)
+            out.append(spawn(self._run_callback, self._invoke_rest_outconn_callback, item_id, request))
+
+        return out
 
 # ################################################################################################################################
 
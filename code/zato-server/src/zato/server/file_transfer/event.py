@@ -18,6 +18,7 @@ from watchdog.events import DirCreatedEvent
 
 # Zato
 from zato.common.util.api import hot_deploy, spawn_greenlet
+from zato.server.file_transfer.snapshot import FileStream, ModuleCtx as SnapshotCtx
 
 if 0:
     from bunch import Bunch
@@ -69,7 +70,7 @@ class FileTransferEvent:
 
     channel_name = 'not-set'  # type: str
     ts_utc = 'not-set'        # type: str
-    raw_data = 'not-set'      # type: str
+    raw_data = 'not-set'      # type: str | FileStream
     data = singleton          # type: str
     has_raw_data = 'not-set'  # type: bool
     has_data = 'not-set'      # type: bool
@@ -161,7 +162,36 @@ class FileTransferEventHandler:
                         self.config.should_delete_after_pickup, should_deploy_in_place=self.config.should_deploy_in_place)
                 return
 
-            if self.config.should_read_on_pickup:
+            # Large files can be streamed to services instead of being read into memory in their entirety ..
+            if self.config.should_read_on_pickup and self.config.get('should_stream_on_pickup'):
+
+                stream_args = (
+                    int(self.config.get('stream_chunk_size') or SnapshotCtx.Stream_Chunk_Size),
+                    self.config.data_encoding,
+                    bool(self.config.get('is_line_by_line')),
+                )
+
+                if snapshot_maker:
+                    event.raw_data = snapshot_maker.get_file_stream(event.full_path, *stream_args)
+                else:
+                    event.raw_data = FileStream.from_path(event.full_path, *stream_args)
+
+                event.has_raw_data = True
+
+                # .. parsers receive the stream too, e.g. csv.reader will read it line by line as services iterate over rows ..
+                if self.config.should_parse_on_pickup:
+                    try:
+                        data_to_parse = event.raw_data.iter_lines() if self.config.parser_needs_string_io else event.raw_data
+                        parser = self.manager.get_parser(self.config.parse_with)
+                        event.data = parser(data_to_parse)
+                        event.has_data = True
+                    except Exception:
+                        exception = format_exc()
+                        event.parse_error = exception
+                        logger.warning('File transfer parsing error (%s) e:`%s`', self.config.name, exception)
+
+            # .. while all the other ones are read in full.
+            elif self.config.should_read_on_pickup:
 
                 if snapshot_maker:
                     raw_data = snapshot_maker.get_file_data(event.full_path)
@@ -9,8 +9,12 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import os
 from datetime import datetime
+from stat import S_ISDIR, S_ISREG
+from io import BufferedReader, RawIOBase, TextIOWrapper
+from itertools import count
 from logging import getLogger
-from pathlib import Path
+from tempfile import TemporaryFile
+from time import monotonic, time
 from traceback import format_exc
 
 # ciso8601
@@ -19,6 +23,9 @@ try:
 except ImportError:
     from dateutil.parser import parse as parse_datetime
 
+# gevent
+from gevent import sleep
+
 # Zato
 from zato.common.json_ import dumps
 from zato.common.odb.query.generic import FTPFileTransferWrapper, SFTPFileTransferWrapper
@@ -55,6 +62,25 @@ logger = getLogger('zato')
 # This must be more than 1 because 1 second is the minimum time between two invocations of a scheduled job.
 default_interval = 1.1
 
+# Each snapshot has its own ID so that it is possible to tell which one another one was made after
+_snapshot_id_counter = count(1)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Directories modified more recently than that many seconds ago are always listed again because some file systems
+    # store modification times with a low resolution and we would not notice further changes in the same time period ..
+    Min_Trusted_Dir_Age = 2
+
+    # .. and all the directories are listed once in that many seconds in case a file system did not update
+    # .. the modification time of a directory whose contents changed.
+    Full_Scan_Interval = 60
+
+    # How many bytes at a time to read from files that are streamed to services
+    Stream_Chunk_Size = 64 * 1024
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -88,6 +114,12 @@ class DirSnapshot:
         self.path = path
         self.file_data = {}
 
+        # Snapshot makers that know what changed since their previous snapshot will populate these
+        self.snapshot_id = next(_snapshot_id_counter)
+        self.changes_since_id = None # type: int | None
+        self.files_created = set() # type: set[str]
+        self.files_modified = set() # type: set[str]
+
 # ################################################################################################################################
 
     def add_item(self, data:'anylist') -> 'None':
@@ -168,6 +200,12 @@ class DirSnapshotDiff:
         if not (previous_snapshot and current_snapshot):
             return
 
+        # If the current snapshot knows what changed since the previous one, we do not need to compare them in full.
+        if current_snapshot.changes_since_id == previous_snapshot.snapshot_id:
+            self.files_created = set(current_snapshot.files_created)
+            self.files_modified = set(current_snapshot.files_modified)
+            return
+
         # New files ..
         self.files_created = set(current_snapshot.file_data) - set(previous_snapshot.file_data)
 
@@ -193,6 +231,91 @@ class DirSnapshotDiff:
 # ################################################################################################################################
 # ################################################################################################################################
 
+class _FileStreamReader(RawIOBase):
+    """ Reads a file descriptor from its own offset, independently of any other reader of the same descriptor.
+    """
+    def __init__(self, fd:'int') -> 'None':
+        self.fd = fd
+        self.offset = 0
+
+    def readable(self) -> 'bool':
+        return True
+
+    def readinto(self, buffer:'any_') -> 'int':
+
+        data = os.pread(self.fd, len(buffer), self.offset)
+        size = len(data)
+
+        buffer[:size] = data
+        self.offset += size
+
+        # Let other greenlets run in between reading consecutive chunks
+        sleep(0)
+
+        return size
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FileStream:
+    """ Gives services access to the contents of a file without reading all of it into memory. The file is opened
+    immediately so it can be read even if it is moved or deleted afterwards. Data is read only when it is iterated over,
+    chunk by chunk or line by line, so it is the consumer that decides how fast the file is read. Each iteration
+    starts from the beginning of the file, independently of any other one.
+    """
+    def __init__(self, fd:'int', chunk_size:'int', encoding:'str', is_line_by_line:'bool') -> 'None':
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.is_line_by_line = is_line_by_line
+        self.size = os.fstat(fd).st_size
+
+    @staticmethod
+    def from_path(path:'str', *args:'any_', **kwargs:'any_') -> 'FileStream':
+        return FileStream(os.open(path, os.O_RDONLY), *args, **kwargs)
+
+# ################################################################################################################################
+
+    def iter_bytes(self) -> 'any_':
+        """ Returns the file's contents in chunks of up to chunk_size bytes.
+        """
+        reader = _FileStreamReader(self.fd)
+        buffer = bytearray(self.chunk_size)
+
+        while True:
+            size = reader.readinto(buffer)
+            if not size:
+                break
+            yield bytes(buffer[:size])
+
+# ################################################################################################################################
+
+    def iter_lines(self) -> 'any_':
+        """ Returns the file's contents line by line, decoded using the channel's encoding.
+        """
+        reader = BufferedReader(_FileStreamReader(self.fd), self.chunk_size)
+        text = TextIOWrapper(reader, encoding=self.encoding, newline='')
+
+        for line in text:
+            yield line
+
+# ################################################################################################################################
+
+    def __iter__(self) -> 'any_':
+        return self.iter_lines() if self.is_line_by_line else self.iter_bytes()
+
+# ################################################################################################################################
+
+    def close(self) -> 'None':
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    __del__ = close
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class AbstractSnapshotMaker:
 
     file_client: 'BaseFileClient'
@@ -217,6 +340,11 @@ class AbstractSnapshotMaker:
     def get_file_data(self, *args:'any_', **kwargs:'any_') -> 'None':
         raise NotImplementedError('Must be implemented in subclasses')
 
+# ################################################################################################################################
+
+    def get_file_stream(self, *args:'any_', **kwargs:'any_') -> 'FileStream':
+        raise NotImplementedError('Must be implemented in subclasses')
+
 # ################################################################################################################################
 
     def store_snapshot(self, snapshot:'DirSnapshot') -> 'None':
@@ -225,37 +353,298 @@ class AbstractSnapshotMaker:
 # ################################################################################################################################
 # ################################################################################################################################
 
+class _LocalDirState:
+    """ What a directory contained the last time it was listed.
+    """
+    __slots__ = 'mtime_ns', 'is_trusted', 'entries', 'sub_dirs'
+
+    def __init__(self, mtime_ns:'int', is_trusted:'bool', entries:'set[str]', sub_dirs:'set[str]') -> 'None':
+        self.mtime_ns = mtime_ns
+        self.is_trusted = is_trusted
+        self.entries = entries
+        self.sub_dirs = sub_dirs
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Marks paths deleted by a scan that has not been committed yet
+_deleted = object()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LocalDirIndex:
+    """ Keeps the state of a local directory tree between snapshots. Each directory is listed again only if its modification
+    time changed, so the cost of a snapshot depends on the number of directories and changes rather than on the number of files.
+
+    Changes found during a scan are kept aside and they become part of the index only once the whole scan succeeds,
+    which means that a scan that fails half-way leaves the index as it was after the previous one.
+    """
+    def __init__(self, path:'str') -> 'None':
+        self.path = path
+        self.file_data = {} # type: dict[str, ItemInfo]
+        self.stat_data = {} # type: dict[str, tuple[int, int]]
+        self.dir_state = {} # type: dict[str, _LocalDirState]
+        self.last_snapshot_id = None # type: int | None
+        self.last_full_scan = 0.0
+
+        # Changes to each of the dicts above that the current scan found so far
+        self._pending = {} # type: dict[str, dict]
+
+# ################################################################################################################################
+
+    def _get(self, name:'str', key:'str') -> 'any_':
+        """ Returns a value from one of the dicts, taking into account changes that have not been committed yet.
+        """
+        pending = self._pending[name]
+
+        if key in pending:
+            value = pending[key]
+            return None if value is _deleted else value
+        else:
+            return getattr(self, name).get(key)
+
+# ################################################################################################################################
+
+    def _set(self, name:'str', key:'str', value:'any_') -> 'None':
+        self._pending[name][key] = value
+
+# ################################################################################################################################
+
+    def _begin(self) -> 'None':
+        self._pending = {'file_data': {}, 'stat_data': {}, 'dir_state': {}}
+
+# ################################################################################################################################
+
+    def _commit(self) -> 'None':
+
+        for name, pending in self._pending.items():
+            data = getattr(self, name)
+            for key, value in pending.items():
+                if value is _deleted:
+                    _ = data.pop(key, None)
+                else:
+                    data[key] = value
+
+        self._begin()
+
+# ################################################################################################################################
+
+    def _get_item_info(self, full_path:'str', name:'str', stat:'os.stat_result', is_dir:'bool', is_file:'bool') -> 'ItemInfo':
+        item_info = ItemInfo()
+        item_info.full_path = full_path
+        item_info.name = name
+        item_info.size = stat.st_size
+        item_info.is_dir = is_dir
+        item_info.is_file = is_file
+        item_info.last_modified = datetime.fromtimestamp(stat.st_mtime)
+        return item_info
+
+# ################################################################################################################################
+
+    def _is_unchanged(self, full_path:'str', stat:'os.stat_result') -> 'bool':
+        """ Returns True if a path's size and modification time are the same as previously, which lets us skip building
+        a new ItemInfo object for it.
+        """
+        stat_data = (stat.st_size, stat.st_mtime_ns)
+
+        if self._get('stat_data', full_path) == stat_data:
+            return True
+        else:
+            self._set('stat_data', full_path, stat_data)
+            return False
+
+# ################################################################################################################################
+
+    def _set_item(self, item_info:'ItemInfo', snapshot:'DirSnapshot') -> 'None':
+
+        # Note that a path that changes more than once in between two snapshots is reported only once
+        previous = self._get('file_data', item_info.full_path)
+
+        if not previous:
+            snapshot.files_created.add(item_info.full_path)
+
+        elif previous.size != item_info.size or previous.last_modified != item_info.last_modified:
+            snapshot.files_modified.add(item_info.full_path)
+
+        self._set('file_data', item_info.full_path, item_info)
+
+# ################################################################################################################################
+
+    def _delete_path(self, full_path:'str') -> 'None':
+
+        dir_state = self._get('dir_state', full_path) # type: _LocalDirState
+
+        for name in self._pending:
+            self._set(name, full_path, _deleted)
+
+        # Deleting a directory means deleting everything that it contained
+        if dir_state:
+            for entry in dir_state.entries:
+                self._delete_path(entry)
+
+# ################################################################################################################################
+
+    def _scan_entry(self, entry:'os.DirEntry', entries:'set[str]', sub_dirs:'set[str]', snapshot:'DirSnapshot') -> 'None':
+
+        # We do not follow symlinks to directories to make sure that there are no loops
+        if entry.is_dir(follow_symlinks=False):
+            sub_dirs.add(entry.path)
+            return
+
+        # What used to be a directory may be a file now
+        if self._get('dir_state', entry.path):
+            self._delete_path(entry.path)
+
+        try:
+            entry_stat = entry.stat()
+        except FileNotFoundError:
+            # The entry was deleted after the directory was listed
+            entries.discard(entry.path)
+            return
+
+        self._check_file(entry.path, entry.name, entry_stat, entry.is_dir(), entry.is_file(), snapshot)
+
+# ################################################################################################################################
+
+    def _check_file(
+        self,
+        full_path:'str',
+        name:'str',
+        stat:'os.stat_result',
+        is_dir:'bool',
+        is_file:'bool',
+        snapshot:'DirSnapshot'
+    ) -> 'None':
+        if not self._is_unchanged(full_path, stat):
+            self._set_item(self._get_item_info(full_path, name, stat, is_dir, is_file), snapshot)
+
+# ################################################################################################################################
+
+    def _check_known_files(self, dir_state:'_LocalDirState', snapshot:'DirSnapshot') -> 'None':
+        """ Checks files of a directory that was not listed again because modifying a file in place
+        does not change the modification time of its directory.
+        """
+        for full_path in dir_state.entries:
+
+            if full_path in dir_state.sub_dirs:
+                continue
+
+            try:
+                stat = os.stat(full_path)
+            except FileNotFoundError:
+                # The file was deleted in the meantime, which we will find out once its directory is listed
+                continue
+            except OSError:
+                logger.warning('Could not check `%s`, e:`%s`', full_path, format_exc())
+                continue
+
+            is_dir = S_ISDIR(stat.st_mode)
+            is_file = S_ISREG(stat.st_mode)
+
+            self._check_file(full_path, os.path.basename(full_path), stat, is_dir, is_file, snapshot)
+
+# ################################################################################################################################
+
+    def _scan_dir(self, dir_path:'str', snapshot:'DirSnapshot', is_full_scan:'bool', now:'float') -> 'None':
+
+        stat = os.stat(dir_path)
+        dir_state = self._get('dir_state', dir_path) # type: _LocalDirState
+
+        # Each directory, apart from the top-level one, is a snapshot item itself
+        if dir_path != self.path and not self._is_unchanged(dir_path, stat):
+            self._set_item(self._get_item_info(dir_path, os.path.basename(dir_path), stat, True, False), snapshot)
+
+        # If the list of files in a directory did not change, we only need to check the files that we already know about
+        # and its sub-directories ..
+        if dir_state and dir_state.is_trusted and dir_state.mtime_ns == stat.st_mtime_ns and not is_full_scan:
+            sub_dirs = dir_state.sub_dirs
+            self._check_known_files(dir_state, snapshot)
+
+        # .. otherwise, we list it again.
+        else:
+            entries = set() # type: set[str]
+            sub_dirs = set() # type: set[str]
+
+            with os.scandir(dir_path) as listing:
+                for entry in listing:
+
+                    entries.add(entry.path)
+
+                    # An entry that we cannot access now is left as it was, including not being reported as deleted
+                    try:
+                        self._scan_entry(entry, entries, sub_dirs, snapshot)
+                    except OSError:
+                        logger.warning('Could not check `%s`, e:`%s`', entry.path, format_exc())
+
+            # Everything that we had previously but did not find now was deleted
+            if dir_state:
+                for full_path in dir_state.entries - entries:
+                    self._delete_path(full_path)
+
+            # A modification time too close to now may not reflect all the changes made in the same period
+            is_trusted = now - stat.st_mtime > ModuleCtx.Min_Trusted_Dir_Age
+            self._set('dir_state', dir_path, _LocalDirState(stat.st_mtime_ns, is_trusted, entries, sub_dirs))
+
+        for sub_dir in sub_dirs:
+            try:
+                self._scan_dir(sub_dir, snapshot, is_full_scan, now)
+            except FileNotFoundError:
+                # The directory was deleted after its parent was listed, which we will find out next time the parent is.
+                self._delete_path(sub_dir)
+            except OSError:
+                # The directory cannot be listed now, e.g. because of its permissions, so we will try again next time
+                logger.warning('Could not scan `%s`, e:`%s`', sub_dir, format_exc())
+
+# ################################################################################################################################
+
+    def get_snapshot(self) -> 'DirSnapshot':
+
+        snapshot = DirSnapshot(self.path)
+
+        # We periodically list all the directories, no matter what their modification times are.
+        is_full_scan = monotonic() - self.last_full_scan > ModuleCtx.Full_Scan_Interval
+
+        # Nothing found during the scan is kept unless all of it succeeds ..
+        self._begin()
+        self._scan_dir(self.path, snapshot, is_full_scan, time())
+        self._commit()
+
+        if is_full_scan:
+            self.last_full_scan = monotonic()
+
+        # .. the changes found are relative to the snapshot that we returned previously ..
+        snapshot.changes_since_id = self.last_snapshot_id
+        self.last_snapshot_id = snapshot.snapshot_id
+
+        # .. while the snapshot itself contains all the files.
+        snapshot.file_data = dict(self.file_data)
+
+        return snapshot
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class LocalSnapshotMaker(AbstractSnapshotMaker):
+
+    def __init__(self, *args:'any_', **kwargs:'any_') -> 'None':
+        super().__init__(*args, **kwargs)
+
+        # Each path observed has its own index of what it contains
+        self.dir_index = {} # type: dict[str, LocalDirIndex]
+
     def connect(self):
         # Not used with local snapshots
         pass
 
     def get_snapshot(self, path:'str', *args:'any_', **kwargs:'any_') -> 'DirSnapshot':
 
-        # Output to return
-        snapshot = DirSnapshot(path)
+        dir_index = self.dir_index.get(path)
 
-        # All files found in path
-        file_list = [] # type: anylist
+        if not dir_index:
+            dir_index = self.dir_index[path] = LocalDirIndex(path)
 
-        # Recursively, get all files
-        listing = Path(path).rglob('*')
-
-        for item in listing:
-            full_path = str(item)
-            stat = item.stat()
-            file_list.append({
-                'full_path': full_path,
-                'name': item.name,
-                'is_dir': item.is_dir(),
-                'is_file': item.is_file(),
-                'size': stat.st_size,
-                'last_modified': datetime.fromtimestamp(stat.st_mtime)
-            })
-
-        snapshot.add_item(file_list)
-
-        return snapshot
+        return dir_index.get_snapshot()
 
 # ################################################################################################################################
 
@@ -263,6 +652,11 @@ class LocalSnapshotMaker(AbstractSnapshotMaker):
         with open(path, 'rb') as f:
             return f.read()
 
+# ################################################################################################################################
+
+    def get_file_stream(self, path:'str', *args:'any_', **kwargs:'any_') -> 'FileStream':
+        return FileStream.from_path(path, *args, **kwargs)
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -384,6 +778,28 @@ class BaseRemoteSnapshotMaker(AbstractSnapshotMaker):
     def get_file_data(self, path:'str') -> 'bytes':
         return self.file_client.get(path)
 
+# ################################################################################################################################
+
+    def get_file_stream(self, path:'str', *args:'any_', **kwargs:'any_') -> 'FileStream':
+
+        # Remote files are downloaded to a temporary file first ..
+        temp_file = TemporaryFile()
+
+        try:
+            # .. directly, if the underlying client can do it ..
+            self.file_client.get_as_file_object(path, temp_file)
+        except NotImplementedError:
+            # .. or through memory otherwise.
+            _ = temp_file.write(self.file_client.get(path))
+
+        temp_file.flush()
+
+        # The stream has its own descriptor so the temporary file can be closed, which deletes it once the stream is closed too
+        stream = FileStream(os.dup(temp_file.fileno()), *args, **kwargs)
+        temp_file.close()
+
+        return stream
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -10,9 +10,16 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import uuid
+from collections import OrderedDict
 from contextlib import closing
 from datetime import datetime
+from hashlib import sha256
 from logging import getLogger
+from time import monotonic
+from traceback import format_exc
+
+# gevent
+from gevent import sleep, spawn
 
 # Bunch
 from bunch import bunchify, Bunch
@@ -33,6 +40,163 @@ logger = getLogger(__name__)
 
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How often, in seconds, renewals of tokens are written to the ODB
+    Renew_Interval = 5
+
+    # For how long, in seconds, a token is trusted without confirming in the ODB that it still exists. This is also how long
+    # it takes at most for a token deleted by one worker process to be rejected by all the other ones.
+    Revalidate_Interval = 30
+
+    # How many tokens at most are kept in the validation cache of each worker process
+    Max_Cache_Size = 100_000
+
+# ################################################################################################################################
+
+class _ValidationEntry:
+    __slots__ = 'token', 'token_data', 'expires_at', 'checked_at'
+
+    def __init__(self, token, token_data, expires_at, checked_at):
+        # type: (object, Bunch, float, float)
+        self.token = token
+        self.token_data = token_data
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+# ################################################################################################################################
+
+class ValidationCache:
+    """ A process-wide cache of tokens that have been already decrypted and decoded, keyed by a digest of each token.
+    Renewals of tokens found in this cache are merged and written to the ODB in batches, every renew_interval seconds.
+    """
+    def __init__(self, renew_interval, revalidate_interval, max_size=ModuleCtx.Max_Cache_Size):
+        # type: (float, float, int)
+        self.renew_interval = renew_interval
+        self.revalidate_interval = revalidate_interval
+        self.max_size = max_size
+
+        # Digest -> _ValidationEntry, oldest first, which is also the order in which entries need to be revalidated
+        self.entries = OrderedDict()
+
+        # Digest -> (token, ttl) of tokens whose expiry time is to be extended in the ODB
+        self.to_renew = {}
+
+        # Writes renewals to the ODB, set the first time that any token is renewed
+        self.jwt_cache = None # type: JWTCache
+        self.renew_greenlet = None
+
+# ################################################################################################################################
+
+    def get_digest(self, token):
+        # type: (object) -> str
+        if not isinstance(token, bytes):
+            token = token.encode('utf8')
+        return sha256(token).hexdigest()
+
+# ################################################################################################################################
+
+    def _is_valid(self, entry, now):
+        # type: (_ValidationEntry, float) -> bool
+        return now < entry.expires_at and (now - entry.checked_at) < self.revalidate_interval
+
+# ################################################################################################################################
+
+    def _evict(self, now):
+        # type: (float) -> None
+        """ Deletes entries that can no longer be used, as well as the oldest ones if the cache is full.
+        """
+        entries = self.entries
+
+        # Entries are checked oldest first so we can stop at the first one that can still be used ..
+        while entries:
+            digest, entry = next(iter(entries.items()))
+            if self._is_valid(entry, now):
+                break
+            del entries[digest]
+
+        # .. and if this was not enough, the oldest ones make room for new ones.
+        while len(entries) >= self.max_size:
+            _ = entries.popitem(last=False)
+
+# ################################################################################################################################
+
+    def get(self, digest, now):
+        # type: (str, float) -> _ValidationEntry
+        """ Returns a cached entry for the token, unless there is none, it has expired or it needs to be revalidated.
+        """
+        entry = self.entries.get(digest)
+
+        if entry:
+            if self._is_valid(entry, now):
+                return entry
+            else:
+                del self.entries[digest]
+
+# ################################################################################################################################
+
+    def set(self, digest, token, token_data, now):
+        # type: (str, object, Bunch, float) -> _ValidationEntry
+        _ = self.entries.pop(digest, None)
+        self._evict(now)
+
+        entry = _ValidationEntry(token, token_data, now + token_data.ttl, now)
+        self.entries[digest] = entry
+        return entry
+
+# ################################################################################################################################
+
+    def renew(self, digest, entry, jwt_cache, now):
+        # type: (str, _ValidationEntry, JWTCache, float) -> None
+        """ Extends the expiry time of a token locally and schedules the same to take place in the ODB.
+        """
+        entry.expires_at = now + entry.token_data.ttl
+
+        # Renewing the same token many times before the next flush results in a single ODB update
+        self.to_renew[digest] = (entry.token, entry.token_data.ttl)
+        self.jwt_cache = jwt_cache
+
+        if not self.renew_greenlet:
+            self.renew_greenlet = spawn(self._renew_loop)
+
+# ################################################################################################################################
+
+    def delete(self, digest):
+        # type: (str) -> None
+        _ = self.entries.pop(digest, None)
+        _ = self.to_renew.pop(digest, None)
+
+# ################################################################################################################################
+
+    def flush(self):
+        # type: () -> int
+        """ Writes all pending renewals to the ODB. Returns the number of tokens renewed.
+        """
+        if not self.to_renew:
+            return 0
+
+        to_renew, self.to_renew = self.to_renew, {}
+        self.jwt_cache.renew_many(list(to_renew.values()))
+
+        return len(to_renew)
+
+# ################################################################################################################################
+
+    def _renew_loop(self):
+        while True:
+            sleep(self.renew_interval)
+            try:
+                _ = self.flush()
+            except Exception:
+                logger.warning('Could not renew JWT tokens, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
+# A singleton shared by all the JWT objects in the current process
+validation_cache = ValidationCache(ModuleCtx.Renew_Interval, ModuleCtx.Revalidate_Interval)
+
+# ################################################################################################################################
+
 class AuthInfo:
     __slots__ = 'sec_def_id', 'sec_def_username', 'token'
 
@@ -111,38 +275,46 @@ class JWT:
 
 # ################################################################################################################################
 
-    def validate(self, expected_username, token):
+    def validate(self, expected_username, token, _validation_cache=validation_cache):
         """ Check if the given token is (still) valid.
 
-        1. Look for the token in Cache without decrypting/decoding it.
-        2.a If not found, return "Invalid"
-        2.b If found:
-            3. decrypt
-            4. decode
-            5. renew the cache expiration asynchronously (do not wait for the update confirmation).
-            5. return "valid" + the token contents
+        1. Look for the token in the process-wide validation cache.
+        2.a If found, use its already decoded contents.
+        2.b If not found, look for the token in ODB without decrypting/decoding it.
+            3.a If not found, return "Invalid"
+            3.b If found, decrypt and decode it and add it to the validation cache.
+        4. Renew the token's expiration, which will be written to ODB in the next batch of renewals.
+        5. Return "valid" + the token contents
         """
-        if self.cache.get(token):
-            decrypted = self.fernet.decrypt(token)
-            token_data = bunchify(jwt.decode(decrypted, self.secret))
+        now = monotonic()
+        digest = _validation_cache.get_digest(token)
+        entry = _validation_cache.get(digest, now)
 
-            if token_data.username == expected_username:
+        if not entry:
 
-                # Renew the token expiration
-                self.cache.put(token, token, token_data.ttl, is_async=True)
-                return Bunch(valid=True, token=token_data, raw_token=token)
+            if not self.cache.get(token):
+                return Bunch(valid=False, message='Invalid token')
 
-            else:
-                return Bunch(valid=False, message='Unexpected user for token found')
+            decrypted = self.fernet.decrypt(token)
+            token_data = bunchify(jwt.decode(decrypted, self.secret, algorithms=[self.ALGORITHM]))
+            entry = _validation_cache.set(digest, token, token_data, now)
+
+        if entry.token_data.username == expected_username:
+
+            # Renew the token expiration
+            _validation_cache.renew(digest, entry, self.cache, now)
+            return Bunch(valid=True, token=Bunch(entry.token_data), raw_token=token)
 
         else:
-            return Bunch(valid=False, message='Invalid token')
+            return Bunch(valid=False, message='Unexpected user for token found')
 
 # ################################################################################################################################
 
-    def delete(self, token):
-        """ Deletes a token in ODB.
+    def delete(self, token, _validation_cache=validation_cache):
+        """ Deletes a token in ODB. Other worker processes will stop accepting it no later than
+        after ModuleCtx.Revalidate_Interval seconds.
         """
+        _validation_cache.delete(_validation_cache.get_digest(token))
         self.cache.delete(token)
 
 # ################################################################################################################################
@@ -102,6 +102,39 @@ class JWTCache:
     def get(self, key):
         return self._odb_get(key)
 
+# ################################################################################################################################
+
+    def renew_many(self, items, _chunk_size=500):
+        """ Extends expiry times of many keys in ODB at once, in a single transaction. Each item is a (key, ttl) tuple.
+        Keys that do not exist in ODB are ignored, e.g. because they were deleted in the meantime,
+        which means that they will not be recreated.
+        """
+        now = datetime.datetime.utcnow()
+        key_to_ttl = {}
+
+        for key, ttl in items:
+            key = self._get_odb_key(key)
+            if isinstance(key, unicode):
+                key = key.encode('utf8')
+            key_to_ttl[key] = ttl
+
+        keys = list(key_to_ttl)
+
+        with closing(self.odb.session()) as session:
+            try:
+                for idx in range(0, len(keys), _chunk_size):
+                    query = session.query(KVData).filter(KVData.key.in_(keys[idx:idx+_chunk_size]))
+                    for item in query:
+                        item.expiry_time = now + datetime.timedelta(seconds=key_to_ttl[item.key])
+
+                session.commit()
+
+            except Exception:
+                logger.exception('Unable to renew `%d` key(s) in ODB', len(keys))
+                session.rollback()
+
+                raise
+
 # ################################################################################################################################
 
     def delete(self, key):
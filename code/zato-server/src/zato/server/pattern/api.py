@@ -8,10 +8,11 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 # Import all patterns into one place
 
-from zato.server.pattern.base import FanOut, ParallelExec
+from zato.server.pattern.base import FanOut, ParallelExec, ScatterGather
 from zato.server.pattern.invoke_retry import InvokeRetry
 
 # For flake8
 FanOut = FanOut
 InvokeRetry = InvokeRetry
 ParallelExec = ParallelExec
+ScatterGather = ScatterGather
@@ -7,13 +7,22 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections import deque
 from datetime import datetime
 from logging import getLogger
+from time import monotonic
+from traceback import format_exc
+
+# gevent
+from gevent import spawn, Timeout
+from gevent.event import Event
+from gevent.pool import Pool
 
 # Zato
 from zato.common import CHANNEL
 from zato.common.util import spawn_greenlet
-from zato.server.pattern.model import CacheEntry, InvocationResponse, ParallelCtx, Target
+from zato.common.util.heap import LazyHeap
+from zato.server.pattern.model import CacheEntry, ParallelCtx, Target
 
 # ################################################################################################################################
 
@@ -30,6 +39,118 @@ logger = getLogger(__name__)
 # ################################################################################################################################
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How long, in seconds, an invocation without an explicit timeout may wait for its targets
+    # before its cache entry is considered stale and is evicted.
+    Stale_Entry_Max_Age = 3600
+
+    # How many targets a scatter-gather invocation runs at a time if it is not given its own limit
+    Scatter_Gather_Max_Concurrency = 100
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _get_response_dict(source, target, cid, req_ts_utc, resp_ts_utc, response, exception):
+    # type: (str, str, str, datetime, datetime, object, object) -> dict
+
+    # For pre-Zato 3.2 compatibility, callbacks expect dicts on input.
+    return {
+        'source': source,
+        'target': target,
+        'response': response,
+        'req_ts_utc': req_ts_utc.isoformat(),
+        'resp_ts_utc': resp_ts_utc.isoformat(),
+        'ok': False if exception else True,
+        'exception': exception,
+        'cid': cid,
+    }
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Deadline:
+    """ A callback that runs once its deadline is reached, unless it is cancelled first.
+    """
+    __slots__ = 'callback', 'args'
+
+    def __init__(self, callback, args):
+        # type: (object, tuple) -> None
+        self.callback = callback
+        self.args = args
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Deadlines:
+    """ Keeps the deadlines of all the parallel invocations in a process in a single heap, served by a single greenlet
+    which sleeps until the earliest of them or until an earlier one is added.
+    """
+    def __init__(self):
+        # type: () -> None
+
+        # Deadlines of all the callbacks that have not run yet
+        self.heap = LazyHeap()
+        self.wakeup = Event()
+        self.greenlet = None
+
+# ################################################################################################################################
+
+    def add(self, timeout, callback, *args):
+        # type: (float, object, object) -> _Deadline
+        """ Runs callback with args after timeout seconds and returns a deadline that can be cancelled.
+        """
+        deadline = _Deadline(callback, args)
+        is_earliest = self.heap.add(deadline, monotonic() + timeout)
+
+        # The greenlet is started the first time it is needed ..
+        if self.greenlet is None:
+            self.greenlet = spawn(self._run)
+
+        # .. and it needs to wake up earlier than it planned to only if this is the earliest deadline now.
+        elif is_earliest:
+            self.wakeup.set()
+
+        return deadline
+
+# ################################################################################################################################
+
+    def cancel(self, deadline):
+        # type: (_Deadline) -> None
+
+        # Nothing happens if it has already run or been cancelled
+        _ = self.heap.remove(deadline)
+
+# ################################################################################################################################
+
+    def _run(self):
+        # type: () -> None
+
+        heap = self.heap
+
+        while True:
+
+            # Run everything that is due ..
+            for deadline, _ignored_time in heap.pop_due(monotonic()):
+                try:
+                    deadline.callback(*deadline.args)
+                except Exception:
+                    logger.warning('Could not run a parallel deadline callback, e:`%s`', format_exc())
+
+            # .. and sleep until the next deadline, if any, unless something earlier is added in the meantime.
+            next_deadline = heap.get_next_deadline()
+
+            self.wakeup.clear()
+            _ = self.wakeup.wait(None if next_deadline is None else max(0, next_deadline - monotonic()))
+
+# ################################################################################################################################
+
+# Shared by all the parallel invocations in the process
+_deadlines = _Deadlines()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class ParallelBase:
     """ A base class for most parallel integration patterns. An instance of this class is created for each service instance.
     """
@@ -63,22 +184,41 @@ class ParallelBase:
             entry.final_responses = {}
             entry.on_target_list = ctx.on_target_list
             entry.on_final_list = ctx.on_final_list
+            entry.target_names = [item.name for item in ctx.target_list]
+
+            # .. if there is a concurrency limit, only the first batch of targets is invoked now
+            # and each of the remaining ones will be invoked when a previous one completes ..
+            if ctx.max_concurrency and ctx.max_concurrency < entry.len_targets:
+                to_invoke = ctx.target_list[:ctx.max_concurrency]
+                entry.pending_targets = deque(ctx.target_list[ctx.max_concurrency:])
+            else:
+                to_invoke = ctx.target_list
+                entry.pending_targets = deque()
+
+            # .. each entry has a deadline, explicit or not, after which it is evicted from the cache,
+            # which means that targets that never complete will not keep it around indefinitely ..
+            is_stale_check = not ctx.timeout
+            timeout = ctx.timeout or ModuleCtx.Stale_Entry_Max_Age
+            entry.deadline = _deadlines.add(timeout, self._on_deadline, ctx.cid, is_stale_check)
 
             # .. and add it to the cache.
             self.cache[ctx.cid] = entry
 
         # Now that metadata is stored, we can actually invoke each of the serviced from our list of targets.
 
-        for item in ctx.target_list: # type: Target
+        for item in to_invoke: # type: Target
             self.source.invoke_async(item.name, item.payload, channel=self.call_channel, cid=ctx.cid)
 
 # ################################################################################################################################
 
-    def invoke(self, targets, on_final, on_target=None, cid=None, _utcnow=datetime.utcnow):
+    def invoke(self, targets, on_final, on_target=None, cid=None, timeout=None, max_concurrency=None,
+        _utcnow=datetime.utcnow):
         """ Invokes targets collecting their responses, can be both as a whole or individual ones,
-        and executes callback(s).
+        and executes callback(s). If timeout is given, on-final callbacks will receive partial responses
+        if not all of the targets completed in time. If max_concurrency is given, no more than this many
+        targets will be running at a time.
         """
-        # type: (dict, list, list, str, object) -> None
+        # type: (dict, list, list, str, float, int, object) -> None
 
         # Establish what our CID is ..
         cid = cid or self.cid
@@ -97,6 +237,8 @@ class ParallelBase:
         ctx.req_ts_utc = _utcnow()
         ctx.source_name = self.source.name
         ctx.target_list = target_list
+        ctx.timeout = timeout
+        ctx.max_concurrency = max_concurrency
 
         # .. on-final is always available ..
         ctx.on_final_list = [on_final] if isinstance(on_final, str) else on_final
@@ -117,6 +259,56 @@ class ParallelBase:
         # .. and return the CID to the caller.
         return cid
 
+# ################################################################################################################################
+
+    def _invoke_on_final(self, invoker, entry, missing_targets):
+        # type: (Service, CacheEntry, list) -> None
+
+        # This message is what all the on-final callbacks
+        # receive in their self.request.payload attribute.
+        on_final_message = {
+            'phase': 'on-final',
+            'source': self.source.name,
+            'req_ts_utc': entry.req_ts_utc,
+            'on_target': entry.on_target_list,
+            'on_final': entry.on_final_list,
+            'data': entry.target_responses,
+            'timed_out': bool(missing_targets),
+            'missing_targets': missing_targets,
+        }
+
+        for on_final_item in entry.on_final_list: # type: str
+            invoker.invoke_async(on_final_item, on_final_message, channel=self.on_final_channel, cid=entry.cid)
+
+# ################################################################################################################################
+
+    def _on_deadline(self, cid, is_stale_check):
+        # type: (str, bool) -> None
+
+        with self.lock:
+
+            # .. if there is no entry, it means that all the targets completed before the deadline ..
+            entry = self.cache.pop(cid, None) # type: CacheEntry
+            if not entry:
+                return
+
+            # .. otherwise, find out which targets did not respond in time ..
+            responded = {item['target'] for item in entry.target_responses}
+            missing_targets = [name for name in entry.target_names if name not in responded]
+
+            # .. targets that have not been invoked yet will never be ..
+            entry.pending_targets.clear()
+
+            if is_stale_check:
+                logger.warning('Evicting stale parallel cache key `%s`, missing targets: %s', cid, missing_targets)
+            else:
+                logger.info('Deadline reached for parallel cache key `%s`, missing targets: %s', cid, missing_targets)
+
+            # .. and run the final callbacks with what we have so far.
+            if self.needs_on_final:
+                if entry.on_final_list:
+                    self._invoke_on_final(self.source, entry, missing_targets)
+
 # ################################################################################################################################
 
     def on_call_finished(self, invoked_service, response, exception, _utcnow=datetime.utcnow):
@@ -128,9 +320,12 @@ class ParallelBase:
             # .. find our cache entry ..
             entry = self.cache.get(invoked_service.cid) # type: CacheEntry
 
-            # .. exit early if we cannot find the entry for any reason ..
+            # .. exit early if we cannot find the entry for any reason, e.g. its deadline has been already reached,
+            # in which case the response is dropped and on-final callbacks have already received this target
+            # among the missing ones ..
             if not entry:
-                logger.warning('No such parallel cache key `%s`', invoked_service.cid)
+                logger.warning('No such parallel cache key `%s`, dropping response from `%s`',
+                    invoked_service.cid, invoked_service.name)
                 return
 
             # .. alright, we can proceed ..
@@ -140,31 +335,18 @@ class ParallelBase:
                 entry.remaining_targets -= 1
 
                 # .. build information about the response that we have ..
-                invocation_response = InvocationResponse()
-                invocation_response.cid = invoked_service.cid
-                invocation_response.req_ts_utc = entry.req_ts_utc
-                invocation_response.resp_ts_utc = _utcnow()
-                invocation_response.response = response
-                invocation_response.exception = exception
-                invocation_response.ok = False if exception else True
-                invocation_response.source = self.source.name
-                invocation_response.target = invoked_service.name
-
-                # For pre-Zato 3.2 compatibility, callbacks expect dicts on input.
-                dict_payload = {
-                    'source': invocation_response.source,
-                    'target': invocation_response.target,
-                    'response': invocation_response.response,
-                    'req_ts_utc': invocation_response.req_ts_utc.isoformat(),
-                    'resp_ts_utc': invocation_response.resp_ts_utc.isoformat(),
-                    'ok': invocation_response.ok,
-                    'exception': invocation_response.exception,
-                    'cid': invocation_response.cid,
-                }
+                dict_payload = _get_response_dict(self.source.name, invoked_service.name, invoked_service.cid,
+                    entry.req_ts_utc, _utcnow(), response, exception)
 
                 # .. add the received response to the list of what we have so far ..
                 entry.target_responses.append(dict_payload)
 
+                # .. if there are targets waiting because of a concurrency limit, the next one can run now ..
+                if entry.pending_targets:
+                    next_target = entry.pending_targets.popleft() # type: Target
+                    invoked_service.invoke_async(
+                        next_target.name, next_target.payload, channel=self.call_channel, cid=invoked_service.cid)
+
                 # .. invoke any potential on-target callbacks ..
                 if entry.on_target_list:
 
@@ -178,25 +360,14 @@ class ParallelBase:
                 # .. check if this was the last service that we were waiting for ..
                 if entry.remaining_targets == 0:
 
-                    # .. if so, run the final callback services if it is required in our case ..
+                    # .. if so, the deadline is no longer needed ..
+                    if entry.deadline:
+                        _deadlines.cancel(entry.deadline)
+
+                    # .. run the final callback services if it is required in our case ..
                     if self.needs_on_final:
                         if entry.on_final_list:
-
-                            # This message is what all the on-final callbacks
-                            # receive in their self.request.payload attribute.
-                            on_final_message = {
-                                'phase': 'on-final',
-                                'source': invocation_response.source,
-                                'req_ts_utc': entry.req_ts_utc,
-                                'on_target': entry.on_target_list,
-                                'on_final': entry.on_final_list,
-                                'data': entry.target_responses,
-                            }
-
-                            for on_final_item in entry.on_final_list: # type: str
-                                invoked_service.invoke_async(
-                                    on_final_item, on_final_message,
-                                    channel=self.on_final_channel, cid=invoked_service.cid)
+                            self._invoke_on_final(invoked_service, entry, [])
 
                     # .. now, clean up by deleting the current entry from cache.
                     # Note that we ise None in an unlikely it is already deleted,
@@ -210,8 +381,8 @@ class ParallelExec(ParallelBase):
     call_channel = CHANNEL.PARALLEL_EXEC_CALL
     on_target_channel = CHANNEL.PARALLEL_EXEC_ON_TARGET
 
-    def invoke(self, targets, on_target, cid=None):
-        return super().invoke(targets, None, on_target, cid)
+    def invoke(self, targets, on_target, cid=None, timeout=None, max_concurrency=None):
+        return super().invoke(targets, None, on_target, cid, timeout, max_concurrency)
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -224,3 +395,69 @@ class FanOut(ParallelBase):
 
 # ################################################################################################################################
 # ################################################################################################################################
+
+class ScatterGather:
+    """ Invokes targets in parallel and synchronously returns all of their responses,
+    waiting no longer than the timeout given, if any.
+    """
+    def __init__(self, source):
+        # type: (Service) -> None
+        self.source = source
+
+# ################################################################################################################################
+
+    def _invoke_target(self, name, payload, req_ts_utc, _utcnow=datetime.utcnow):
+        # type: (str, object, datetime, object) -> dict
+
+        try:
+            response = self.source.invoke(name, payload)
+        except Exception as e:
+            response = None
+            exception = e
+        else:
+            exception = None
+
+        return _get_response_dict(self.source.name, name, self.source.cid, req_ts_utc, _utcnow(), response, exception)
+
+# ################################################################################################################################
+
+    def invoke(self, targets, timeout=None, max_concurrency=None, _utcnow=datetime.utcnow):
+        """ Invokes all the targets and returns a list of responses, one for each target, in the order of targets.
+        Targets that did not complete within the timeout will have their 'timed_out' key set to True.
+        """
+        # type: (dict, float, int, object) -> list
+
+        req_ts_utc = _utcnow()
+        greenlets = {}
+
+        # A pool will block new targets until previous ones complete, which means that even without an explicit limit
+        # a single invocation with many targets will not spawn a greenlet for each of them at once ..
+        group = Pool(max_concurrency or ModuleCtx.Scatter_Gather_Max_Concurrency)
+
+        # .. spawning targets counts towards the deadline too because the pool may be waiting for a free slot ..
+        with Timeout(timeout, False):
+            for name, payload in targets.items():
+                greenlets[name] = group.spawn(self._invoke_target, name, payload, req_ts_utc)
+            group.join()
+
+        # .. anything that is still running at this point is not needed anymore ..
+        group.kill(block=False)
+
+        # .. and now we can build the response for our caller.
+        out = []
+
+        for name in targets:
+            g = greenlets.get(name)
+            if g is not None and g.successful():
+                item = g.value
+                item['timed_out'] = False
+            else:
+                item = _get_response_dict(self.source.name, name, self.source.cid, req_ts_utc, _utcnow(), None, None)
+                item['ok'] = False
+                item['timed_out'] = True
+            out.append(item)
+
+        return out
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -32,6 +32,8 @@ class ParallelCtx:
     target_list: list_[Target]
     on_target_list: optional[list] = None
     on_final_list: optional[list] = None
+    timeout: optional[float] = None
+    max_concurrency: optional[int] = None
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -46,6 +48,9 @@ class CacheEntry:
     final_responses: dict
     on_target_list: optional[list] = None
     on_final_list: optional[list] = None
+    target_names: optional[list] = None
+    pending_targets: optional[list] = None
+    deadline: optional[object] = None
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -19,9 +19,10 @@ from gevent.lock import RLock
 # Zato
 from zato.common.api import PUBSUB
 from zato.common.exception import BadRequest
-from zato.common.typing_ import any_, anydict, anylist, anyset, anytuple, callable_, dict_, dictlist, intsetdict, strlist, \
-     strdictdict, strset, strsetdict
+from zato.common.typing_ import any_, anydict, anylist, anyset, anytuple, callable_, dict_, dictlist, strlist, strdictdict, \
+     strset, strsetdict
 from zato.common.util.api import spawn_greenlet
+from zato.common.util.heap import LazyHeap
 from zato.common.util.pubsub import make_short_msg_copy_from_dict
 from zato.common.util.time_ import utcnow_as_ms
 
@@ -39,6 +40,19 @@ logger_overflow = logging.getLogger('zato_pubsub_overflow')
 
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How often, in seconds, the cleanup task looks for expired messages
+    Cleanup_Interval = 2
+
+    # How many expired messages to delete at most before the lock is released to let publishers and subscribers in
+    Cleanup_Batch_Size = 5000
+
+    # Entries of messages deleted before they expired are dropped from the expiry index once there are that many of them
+    Expiry_Min_Compact_Size = 10_000
+
+# ################################################################################################################################
+
 hook_type_to_method = {
     PUBSUB.HOOK_TYPE.BEFORE_PUBLISH: 'before_publish',
     PUBSUB.HOOK_TYPE.BEFORE_DELIVERY: 'before_delivery',
@@ -102,40 +116,139 @@ def get_expiration(
 
 # ################################################################################################################################
 
-class InRAMSync:
-    """ A backlog of messages kept in RAM for whom there are subscriptions - that is, they are known to have subscribers
-    and will be ultimately delivered to them. Stores a list of sub_keys and all messages that a sub_key points to.
-    It acts as a multi-key dict and keeps only a single copy of message for each sub_key.
+class ExpiryIndex(LazyHeap):
+    """ Keeps IDs of messages ordered by their expiration time so that finding the expired ones does not require
+    a scan of all the messages.
     """
+    def __init__(self) -> 'None':
+        super().__init__(ModuleCtx.Expiry_Min_Compact_Size)
 
+    def discard(self, msg_id:'str') -> 'None':
+        """ Removes a message from the index, if it is there.
+        """
+        _ = self.remove(msg_id)
+
+    def pop_expired(self, now:'int', max_count:'int') -> 'strlist':
+        """ Removes from the index and returns IDs of up to max_count messages that expired as of now.
+        """
+        return [msg_id for msg_id, _ignored_expiration_time in self.pop_due(now, max_count)]
+
+# ################################################################################################################################
+
+class TopicBacklog:
+    """ Non-GD messages of a single topic. Each topic has its own lock so publishers and subscribers
+    of different topics never need to wait for one another.
+    """
     lock: 'RLock'
-    pubsub: 'PubSub'
+    topic_id: 'int'
 
     msg_id_to_msg:     'strdictdict'
-    topic_id_msg_id:   'intsetdict'
     sub_key_to_msg_id: 'strsetdict'
     msg_id_to_sub_key: 'strsetdict'
 
-    def __init__(self, pubsub:'PubSub') -> 'None':
+    expiry_index: 'ExpiryIndex'
+
+    def __init__(self, topic_id:'int') -> 'None':
 
         self.lock = RLock()
-        self.pubsub = pubsub
+        self.topic_id = topic_id
 
         # Msg ID   -> Message data - What is the actual contents of each message
         self.msg_id_to_msg = {}
 
-        # Topic ID -> Msg ID set --- What messages are available for each topic (no matter sub_key)
-        self.topic_id_msg_id = {}
-
         # Sub key  -> Msg ID set --- What messages are available for a given subcriber
         self.sub_key_to_msg_id = {}
 
         # Msg ID   -> Sub key set  - What subscribers are interested in a given message
         self.msg_id_to_sub_key = {}
 
+        # Msg ID ordered by expiration time - What messages should be deleted next
+        self.expiry_index = ExpiryIndex()
+
+# ################################################################################################################################
+
+    @property
+    def depth(self) -> 'int':
+        return len(self.msg_id_to_msg)
+
+# ################################################################################################################################
+
+    def delete_msg(self, msg_id:'str') -> 'anytuple':
+        """ Deletes a message along with all the references to it. Must be called with self.lock held.
+        Returns the message's data, the sub_keys it was for and whether it was found for at least one of them.
+        """
+        msg = self.msg_id_to_msg.pop(msg_id, None)
+        sub_keys = self.msg_id_to_sub_key.pop(msg_id, None)
+        has_sk_msg = False
+
+        self.expiry_index.discard(msg_id)
+
+        # The message may have been for only some of its sub_keys, e.g. if it was a response to a previous request
+        # that used reply_to_sk, in which case only the sub_key pointed to by reply_to_sk will get it.
+        for sub_key in sub_keys or ():
+            sk_msg_set = self.sub_key_to_msg_id.get(sub_key)
+            if sk_msg_set and msg_id in sk_msg_set:
+                sk_msg_set.remove(msg_id)
+                has_sk_msg = True
+
+        return msg, sub_keys, has_sk_msg
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InRAMSync:
+    """ A backlog of messages kept in RAM for whom there are subscriptions - that is, they are known to have subscribers
+    and will be ultimately delivered to them. Stores a list of sub_keys and all messages that a sub_key points to.
+    It acts as a multi-key dict and keeps only a single copy of message for each sub_key. Messages of each topic
+    are kept separately, in a TopicBacklog of their own, guarded by its own lock.
+    """
+
+    lock: 'RLock'
+    pubsub: 'PubSub'
+
+    topics: 'dict_[int, TopicBacklog]'
+    msg_id_to_topic_id: 'dict_[str, int]'
+    sub_key_to_topic_id: 'dict_[str, int]'
+
+    def __init__(self, pubsub:'PubSub') -> 'None':
+
+        # This lock is needed only to create topics, everything else uses the locks of topics
+        self.lock = RLock()
+        self.pubsub = pubsub
+
+        # Topic ID -> Topic backlog - What messages are available for each topic
+        self.topics = {}
+
+        # Msg ID   -> Topic ID ----- What topic a given message belongs to
+        self.msg_id_to_topic_id = {}
+
+        # Sub key  -> Topic ID ----- What topic a given subscriber is subscribed to
+        self.sub_key_to_topic_id = {}
+
         # Start in background a cleanup task that deletes all expired and removed messages
         _ = spawn_greenlet(self.run_cleanup_task)
 
+# ################################################################################################################################
+
+    def _get_topic(self, topic_id:'int') -> 'TopicBacklog':
+        """ Returns the backlog of a topic by its ID, creating it if it does not exist yet.
+        """
+        topic = self.topics.get(topic_id)
+
+        if not topic:
+            with self.lock:
+                topic = self.topics.get(topic_id)
+                if not topic:
+                    topic = self.topics[topic_id] = TopicBacklog(topic_id)
+
+        return topic
+
+# ################################################################################################################################
+
+    def _get_topic_by_msg_id(self, msg_id:'str') -> 'TopicBacklog | None':
+        topic_id = self.msg_id_to_topic_id.get(msg_id)
+        return self.topics.get(topic_id) if topic_id is not None else None
+
 # ################################################################################################################################
 
     def add_messages(
@@ -150,31 +263,40 @@ class InRAMSync:
     ) -> 'None':
         """ Adds all input messages to sub_keys for the topic.
         """
-        with self.lock:
+        topic = self._get_topic(topic_id)
+
+        with topic.lock:
 
             # Local aliases
             msg_ids = [msg['pub_msg_id'] for msg in messages]
             len_messages = len(messages)
-            topic_messages = self.topic_id_msg_id.setdefault(topic_id, set())
+            depth = topic.depth
 
             # Try to append the messages for each of their subscribers ..
             for sub_key in sub_keys:
 
                 # .. but first, make sure that storing these messages would not overflow the topic's depth,
                 # if it could exceed the max depth, store the messages in log files only ..
-                if len(topic_messages) + len_messages > max_depth:
+                if depth + len_messages > max_depth:
                     self.log_messages_to_store(cid, topic_name, max_depth, sub_key, messages)
 
                     # .. skip this sub_key in such a case ..
                     continue
 
                 # .. otherwise, we make it known that the sub_key is interested in this message ..
-                sub_key_msg = self.sub_key_to_msg_id.setdefault(sub_key, set())
+                sub_key_msg = topic.sub_key_to_msg_id.setdefault(sub_key, set())
                 sub_key_msg.update(msg_ids)
 
+                # .. and where to find it.
+                self.sub_key_to_topic_id[sub_key] = topic_id
+
             # For each message given on input, store its actual contents ..
             for msg in messages:
-                self.msg_id_to_msg[msg['pub_msg_id']] = msg
+                topic.msg_id_to_msg[msg['pub_msg_id']] = msg
+
+                # .. make sure that the message can be found when it expires or when it is deleted ..
+                self.msg_id_to_topic_id[msg['pub_msg_id']] = topic_id
+                topic.expiry_index.add(msg['pub_msg_id'], msg['expiration_time'])
 
                 # We received timestamps as strings whereas our recipients require floats
                 # so we need to do the conversion here.
@@ -190,13 +312,10 @@ class InRAMSync:
                 if 'priority' not in msg:
                     msg['priority'] = _default_pri
 
-                # .. add a reverse mapping, from message ID to sub_key ..
-                msg_sub_key = self.msg_id_to_sub_key.setdefault(msg['pub_msg_id'], set())
+                # .. and add a reverse mapping, from message ID to sub_key.
+                msg_sub_key = topic.msg_id_to_sub_key.setdefault(msg['pub_msg_id'], set())
                 msg_sub_key.update(sub_keys)
 
-            # .. and add a reference to it to the topic.
-            topic_messages.update(msg_ids)
-
 # ################################################################################################################################
 
     def update_msg(
@@ -206,8 +325,15 @@ class InRAMSync:
         _warn='No such message in sync backlog `%s`' # type: str
         ) -> 'bool':
 
-        with self.lock:
-            _msg = self.msg_id_to_msg.get(msg['msg_id'])
+        topic = self._get_topic_by_msg_id(msg['msg_id'])
+
+        if not topic:
+            logger.warning(_warn, msg['msg_id'])
+            logger_zato.warning(_warn, msg['msg_id'])
+            return False # No such message
+
+        with topic.lock:
+            _msg = topic.msg_id_to_msg.get(msg['msg_id'])
             if not _msg:
                 logger.warning(_warn, msg['msg_id'])
                 logger_zato.warning(_warn, msg['msg_id'])
@@ -216,6 +342,9 @@ class InRAMSync:
                 for attr in _update_attrs:
                     _msg[attr] = msg[attr]
 
+                # The message's expiration time may have changed
+                topic.expiry_index.add(msg['msg_id'], _msg['expiration_time'])
+
                 # Ok, found and updated
                 return True
 
@@ -228,34 +357,15 @@ class InRAMSync:
 
 # ################################################################################################################################
 
-    def _delete_messages(self, msg_list:'strlist') -> 'None':
-        """ Low-level implementation of self.delete_messages - must be called with self.lock held.
+    def _delete_messages(self, topic:'TopicBacklog', msg_list:'strlist') -> 'None':
+        """ Low-level implementation of self.delete_messages - must be called with topic.lock held.
         """
         logger.info('Deleting non-GD messages `%s`', msg_list)
 
         for msg_id in list(msg_list):
 
-            found_to_sub_key = self.msg_id_to_sub_key.pop(msg_id, None)
-            found_to_msg = self.msg_id_to_msg.pop(msg_id, None)
-
-            _has_topic_msg = False # Was the ID found for at least one topic
-            _has_sk_msg = False     # Ditto but for sub_keys
-
-            for _topic_msg_set in self.topic_id_msg_id.values():
-                try:
-                    _ = _topic_msg_set.remove(msg_id)
-                except KeyError:
-                    pass # This is fine, msg_id did not belong to this topic
-                else:
-                    _has_topic_msg = True
-
-            for _sk_msg_set in self.sub_key_to_msg_id.values():
-                try:
-                    _ = _sk_msg_set.remove(msg_id)
-                except KeyError:
-                    pass # This is fine, msg_id did not belong to this topic
-                else:
-                    _has_sk_msg = True
+            found_to_msg, found_to_sub_key, _has_sk_msg = topic.delete_msg(msg_id)
+            _ = self.msg_id_to_topic_id.pop(msg_id, None)
 
             if not found_to_sub_key:
                 logger.warning('Message not found (msg_id_to_sub_key) %s', msg_id)
@@ -265,10 +375,6 @@ class InRAMSync:
                 logger.warning('Message not found (msg_id_to_msg) %s', msg_id)
                 logger_zato.warning('Message not found (msg_id_to_msg) %s', msg_id)
 
-            if not _has_topic_msg:
-                logger.warning('Message not found (_has_topic_msg) %s', msg_id)
-                logger_zato.warning('Message not found (_has_topic_msg) %s', msg_id)
-
             if not _has_sk_msg:
                 logger.warning('Message not found (_has_sk_msg) %s', msg_id)
                 logger_zato.warning('Message not found (_has_sk_msg) %s', msg_id)
@@ -278,14 +384,35 @@ class InRAMSync:
     def delete_messages(self, msg_list:'strlist') -> 'None':
         """ Deletes all messages from input msg_list.
         """
-        with self.lock:
-            self._delete_messages(msg_list)
+        # Messages may belong to different topics, each with its own lock
+        by_topic = {} # type: dict_[int, strlist]
+
+        for msg_id in msg_list:
+            topic_id = self.msg_id_to_topic_id.get(msg_id)
+
+            if topic_id is None:
+                logger.warning('Message not found (msg_id_to_topic_id) %s', msg_id)
+                logger_zato.warning('Message not found (msg_id_to_topic_id) %s', msg_id)
+            else:
+                by_topic.setdefault(topic_id, []).append(msg_id)
+
+        for topic_id, topic_msg_list in by_topic.items():
+            topic = self.topics[topic_id]
+            with topic.lock:
+                self._delete_messages(topic, topic_msg_list)
 
 # ################################################################################################################################
 
     def has_messages_by_sub_key(self, sub_key:'str') -> 'bool':
-        with self.lock:
-            msg_id_set = self.sub_key_to_msg_id.get(sub_key) or set()
+
+        topic_id = self.sub_key_to_topic_id.get(sub_key)
+        topic = self.topics.get(topic_id) if topic_id is not None else None
+
+        if not topic:
+            return False
+
+        with topic.lock:
+            msg_id_set = topic.sub_key_to_msg_id.get(sub_key) or set()
             return len(msg_id_set) > 0
 
 # ################################################################################################################################
@@ -293,18 +420,17 @@ class InRAMSync:
     def clear_topic(self, topic_id:'int') -> 'None':
         logger.info('Clearing topic `%s` (id:%s)', self.pubsub.get_topic_by_id(topic_id).name, topic_id)
 
-        with self.lock:
+        # Not all servers will have messages for the topic, hence .get
+        topic = self.topics.get(topic_id)
 
-            # Not all servers will have messages for the topic, hence .get
-            messages = self.topic_id_msg_id.get(topic_id, set())
-
-            if messages:
-                messages = list(messages) # We need a copy so as not to change the input set during iteration later on
-                self._delete_messages(messages)
-            else:
-                logger.info(
-                    'Did not find any non-GD messages to delete for topic `%s`',
-                    self.pubsub.get_topic_by_id(topic_id))
+        if topic and topic.depth:
+            with topic.lock:
+                messages = list(topic.msg_id_to_msg) # We need a copy so as not to change the input dict during iteration
+                self._delete_messages(topic, messages)
+        else:
+            logger.info(
+                'Did not find any non-GD messages to delete for topic `%s`',
+                self.pubsub.get_topic_by_id(topic_id))
 
 # ################################################################################################################################
 
@@ -315,12 +441,17 @@ class InRAMSync:
         delete_msg=True, # type: bool
         delete_sub=False # type: bool
     ) -> 'dictlist':
-        """ Low-level implementation of retrieve_messages_by_sub_keys which must be called with self.lock held.
+        """ Low-level implementation of retrieve_messages_by_sub_keys.
         """
 
         # Forward declaration
         msg_id: 'str'
 
+        topic = self.topics.get(topic_id)
+
+        if not topic:
+            return []
+
         # We cannot return expired messages
         now = utcnow_as_ms()
 
@@ -333,66 +464,45 @@ class InRAMSync:
         # A list of messages that will be optionally deleted before they are returned
         to_delete_msg = set() # type: anyset
 
-        # First, collect data for all sub_keys ..
-        for sub_key in sub_keys:
+        with topic.lock:
 
-            for msg_id in self.sub_key_to_msg_id.get(sub_key, []):
+            # First, collect data for all sub_keys ..
+            for sub_key in sub_keys:
 
-                # We already had this message marked for output
-                if msg_id in msg_seen:
-                    continue
-                else:
-                    # Mark as already seen
-                    msg_seen.add(msg_id)
+                for msg_id in topic.sub_key_to_msg_id.get(sub_key, []):
 
-                    # Filter out expired messages
-                    msg = self.msg_id_to_msg.get(msg_id)
-                    if not msg:
-                        logger.warning('Msg `%s` not found in self.msg_id_to_msg', msg_id)
-                        continue
-                    if now >= msg['expiration_time']:
+                    # We already had this message marked for output
+                    if msg_id in msg_seen:
                         continue
                     else:
-                        out.append(self.msg_id_to_msg[msg_id])
-
-                if delete_msg:
-                    to_delete_msg.add(msg_id)
-
-        # Delete all messages marked to be deleted ..
-        for msg_id in to_delete_msg:
-
-            # .. first, direct mappings ..
-            _ = self.msg_id_to_msg.pop(msg_id, None)
+                        # Mark as already seen
+                        msg_seen.add(msg_id)
+
+                        # Filter out expired messages
+                        msg = topic.msg_id_to_msg.get(msg_id)
+                        if not msg:
+                            logger.warning('Msg `%s` not found in topic.msg_id_to_msg', msg_id)
+                            continue
+                        if now >= msg['expiration_time']:
+                            continue
+                        else:
+                            out.append(msg)
 
-            logger.info('Deleting msg from mapping dict `%s`, before:`%s`', msg_id, self.msg_id_to_msg)
+                    if delete_msg:
+                        to_delete_msg.add(msg_id)
 
-            # .. now, remove the message from topic ..
-            self.topic_id_msg_id[topic_id].remove(msg_id)
+            # Delete all messages marked to be deleted, along with all the references to them ..
+            for msg_id in to_delete_msg:
+                _ = topic.delete_msg(msg_id)
+                _ = self.msg_id_to_topic_id.pop(msg_id, None)
 
-            logger.info('Deleting msg from mapping topic `%s`, after:`%s`', msg_id, self.topic_id_msg_id)
+            if to_delete_msg:
+                logger.info('Deleted msg from topic `%s` `%s`, left:`%s`', topic_id, sorted(to_delete_msg), topic.depth)
 
-            # .. now, find the message for each sub_key ..
-            for sub_key in sub_keys:
-                sub_key_to_msg_id = self.sub_key_to_msg_id.get(sub_key)
-
-                # We need this if statement because it is possible that a client is subscribed to a topic
-                # but it will not receive a particular message. This is possible if the message is a response
-                # to a previous request and the latter used reply_to_sk, in which case only that one sub_key pointed to
-                # by reply_to_sk will get the response, which ultimately means that self.sub_key_to_msg_id
-                # will not have this response for current sub_key.
-                if sub_key_to_msg_id:
-
-                    # .. delete the message itself - but we need to catch ValueError because
-                    # to_delete_msg is a list of all messages to be deleted and we do not know
-                    # if this particular message belonged to this particular sub_key or not.
-                    try:
-                        sub_key_to_msg_id.remove(msg_id)
-                    except KeyError:
-                        pass # OK, message was not found for this sub_key
-
-                    # .. now delete the sub_key either because we are explicitly told to (e.g. during unsubscribe)
-                    if delete_sub:# or (not sub_key_to_msg_id):
-                        del self.sub_key_to_msg_id[sub_key]
+            # .. now delete the sub_keys if we are explicitly told to (e.g. during unsubscribe).
+            if delete_sub and to_delete_msg:
+                for sub_key in sub_keys:
+                    _ = topic.sub_key_to_msg_id.pop(sub_key, None)
 
         return out
 
@@ -401,8 +511,7 @@ class InRAMSync:
     def retrieve_messages_by_sub_keys(self, topic_id:'int', sub_keys:'strlist') -> 'dictlist':
         """ Retrieves and returns all messages matching input - messages are deleted from RAM.
         """
-        with self.lock:
-            return self.get_delete_messages_by_sub_keys(topic_id, sub_keys)
+        return self.get_delete_messages_by_sub_keys(topic_id, sub_keys)
 
 # ################################################################################################################################
 
@@ -414,21 +523,18 @@ class InRAMSync:
     ) -> 'anylist':
         """ Returns messages for topic by its ID, optionally with pagination and filtering by input query.
         """
+        topic = self.topics.get(topic_id)
 
-        # Forward declaration
-        msg_id: 'str'
+        if not topic:
+            return []
 
-        with self.lock:
-            msg_id_list = self.topic_id_msg_id.get(topic_id, [])
-            if not msg_id_list:
-                return []
+        with topic.lock:
 
             # A list of messages to be returned - we actually need to build a whole list instead of using
-            # generators because the underlying container is an unsorted set and we need a sorted result on output.
+            # generators because the underlying container may change once the lock is released.
             msg_list = [] # type: dictlist
 
-            for msg_id in msg_id_list:
-                msg = self.msg_id_to_msg[msg_id]
+            for msg in topic.msg_id_to_msg.values():
                 if query:
                     if query not in msg['data'][:self.pubsub.data_prefix_len]:
                         continue
@@ -445,8 +551,9 @@ class InRAMSync:
 # ################################################################################################################################
 
     def get_message_by_id(self, msg_id:'str') -> 'anydict':
-        with self.lock:
-            return self.msg_id_to_msg[msg_id]
+        topic = self.topics[self.msg_id_to_topic_id[msg_id]]
+        with topic.lock:
+            return topic.msg_id_to_msg[msg_id]
 
 # ################################################################################################################################
 
@@ -464,30 +571,36 @@ class InRAMSync:
         msg_id:  'str'
         sub_key: 'str'
 
-        # Always acquire a lock for this kind of operation
-        with self.lock:
+        topic = self.topics.get(topic_id)
 
-            # For each sub_key ..
-            for sub_key in sub_keys:
+        if topic:
 
-                # .. get all messages waiting for this subscriber, assuming there are any at all ..
-                msg_ids = self.sub_key_to_msg_id.pop(sub_key, [])
+            # Always acquire a lock for this kind of operation
+            with topic.lock:
 
-                # .. for each message found we need to check if it is needed by any other subscriber,
-                # and if it's not, then we delete all the reference to this message. Otherwise, we leave it
-                # as is, because there is at least one other subscriber waiting for it.
-                for msg_id in msg_ids:
+                # For each sub_key ..
+                for sub_key in sub_keys:
 
-                    # Get all subscribers interested in this message ..
-                    current_subs = self.msg_id_to_sub_key[msg_id]
-                    current_subs.remove(sub_key)
+                    # .. this sub_key will not receive any messages anymore ..
+                    _ = self.sub_key_to_topic_id.pop(sub_key, None)
 
-                    # .. if the list is empty, it means that there no some subscribers left for that message,
-                    # in which case we may deleted references to this message from other look-up structures.
-                    if not current_subs:
-                        del self.msg_id_to_msg[msg_id]
-                        topic_msg = self.topic_id_msg_id[topic_id]
-                        topic_msg.remove(msg_id)
+                    # .. get all messages waiting for this subscriber, assuming there are any at all ..
+                    msg_ids = topic.sub_key_to_msg_id.pop(sub_key, [])
+
+                    # .. for each message found we need to check if it is needed by any other subscriber,
+                    # and if it's not, then we delete all the reference to this message. Otherwise, we leave it
+                    # as is, because there is at least one other subscriber waiting for it.
+                    for msg_id in msg_ids:
+
+                        # Get all subscribers interested in this message ..
+                        current_subs = topic.msg_id_to_sub_key[msg_id]
+                        current_subs.remove(sub_key)
+
+                        # .. if the list is empty, it means that there no some subscribers left for that message,
+                        # in which case we may deleted references to this message from other look-up structures.
+                        if not current_subs:
+                            _ = topic.delete_msg(msg_id)
+                            _ = self.msg_id_to_topic_id.pop(msg_id, None)
 
         logger.info(pattern, sub_keys, topic_name)
         logger_zato.info(pattern, sub_keys, topic_name)
@@ -495,78 +608,82 @@ class InRAMSync:
 # ################################################################################################################################
 
     def run_cleanup_task(self, _utcnow:'callable_'=utcnow_as_ms, _sleep:'callable_'=sleep) -> 'None':
-        """ A background task waking up periodically to remove all expired and retrieved messages from backlog.
+        """ A background task waking up periodically to remove all expired messages from backlog.
         """
-
-        # Forward declarations
-        msg_id:   'str'
-        sub_key:  'str'
-        topic_id: 'int'
-
         while True:
             try:
-                with self.lock:
+                len_expired = self.delete_expired(_utcnow(), _sleep)
 
-                    # Local alias
-                    publishers = {} # type: dict_[int, Endpoint]
+                suffix = 's' if (len_expired==0 or len_expired > 1) else ''
+                len_messages = len(self.msg_id_to_topic_id)
+                if len_expired or len_messages:
+                    logger.info('In-RAM. Deleted %s pub/sub message%s. Left:%s', len_expired, suffix, len_messages)
 
-                    # We keep them separate so as not to modify any objects during iteration.
-                    expired_msg = [] # type: anylist
+                # Sleep for a moment before checking again but don't do it with any lock held.
+                _sleep(ModuleCtx.Cleanup_Interval)
 
-                    # Calling it once will suffice.
-                    now = _utcnow()
+            except Exception:
+                e = format_exc()
+                log_msg = 'Could not remove messages from in-RAM backlog, e:`%s`'
+                logger.warning(log_msg, e)
+                logger_zato.warning(log_msg, e)
+                _sleep(0.1)
 
-                    for _, msg in self.msg_id_to_msg.items():
+# ################################################################################################################################
 
-                        if now >= msg['expiration_time']:
+    def delete_expired(self, now:'int', _sleep:'callable_'=sleep) -> 'int':
+        """ Deletes all the messages that expired as of now and returns how many there were. Only the expired messages
+        are visited and they are deleted in batches, with the lock of their topic released in between each,
+        so that publishers and subscribers do not need to wait until all of them are deleted.
+        """
+
+        # Forward declarations
+        msg_id:  'str'
 
-                            # It's possible that there will be many expired messages all sent by the same publisher
-                            # so there is no need to query self.pubsub for each message.
-                            if msg['published_by_id'] not in publishers:
-                                publishers[msg['published_by_id']] = self.pubsub.get_endpoint_by_id(msg['published_by_id'])
+        # It's possible that there will be many expired messages all sent by the same publisher
+        # so there is no need to query self.pubsub for each message.
+        publishers = {} # type: dict_[int, Endpoint]
 
-                            # We can be sure that it is always found
-                            publisher = publishers[msg['published_by_id']] # type: Endpoint
+        len_expired = 0
 
-                            # Log the message to make sure the expiration event is always logged ..
-                            logger_zato.info('Found an expired msg:`%s`, topic:`%s`, publisher:`%s`, pub_time:`%s`, exp:`%s`',
-                                msg['pub_msg_id'], msg['topic_name'], publisher.name, msg['pub_time'], msg['expiration'])
+        # New topics may be added while we are running
+        for topic in list(self.topics.values()):
 
-                            # .. and append it to the list of messages to be deleted.
-                            expired_msg.append((msg['pub_msg_id'], msg['topic_id']))
+            while True:
 
-                    # For logging what was done
-                    len_expired = len(expired_msg)
+                with topic.lock:
+
+                    expired_msg = topic.expiry_index.pop_expired(now, ModuleCtx.Cleanup_Batch_Size)
 
                     # Iterate over all the expired messages found and delete them from in-RAM structures
-                    for msg_id, topic_id in expired_msg:
+                    for msg_id in expired_msg:
 
-                        # Get all sub_keys waiting for these messages and delete the message from each one,
-                        # but note that there may be possibly no subscribers at all if the message was published
-                        # to a topic without any subscribers.
-                        for sub_key in self.msg_id_to_sub_key.pop(msg_id):
-                            self.sub_key_to_msg_id[sub_key].remove(msg_id)
+                        msg, _ignored_sub_keys, _ignored_has_sk_msg = topic.delete_msg(msg_id)
+                        _ = self.msg_id_to_topic_id.pop(msg_id, None)
 
-                        # Remove all references to the message from topic
-                        self.topic_id_msg_id[topic_id].remove(msg_id)
+                        if not msg:
+                            continue
 
-                        # And finally, remove the message's contents
-                        del self.msg_id_to_msg[msg_id]
+                        if msg['published_by_id'] not in publishers:
+                            publishers[msg['published_by_id']] = self.pubsub.get_endpoint_by_id(msg['published_by_id'])
 
-                suffix = 's' if (len_expired==0 or len_expired > 1) else ''
-                len_messages = len(self.msg_id_to_msg)
-                if len_expired or len_messages:
-                    logger.info('In-RAM. Deleted %s pub/sub message%s. Left:%s' % (len_expired, suffix, self.msg_id_to_msg))
+                        # We can be sure that it is always found
+                        publisher = publishers[msg['published_by_id']] # type: Endpoint
 
-                # Sleep for a moment before checking again but don't do it with self.lock held.
-                _sleep(2)
+                        # Log the message to make sure the expiration event is always logged
+                        logger_zato.info('Found an expired msg:`%s`, topic:`%s`, publisher:`%s`, pub_time:`%s`, exp:`%s`',
+                            msg['pub_msg_id'], msg['topic_name'], publisher.name, msg['pub_time'], msg['expiration'])
 
-            except Exception:
-                e = format_exc()
-                log_msg = 'Could not remove messages from in-RAM backlog, e:`%s`'
-                logger.warning(log_msg, e)
-                logger_zato.warning(log_msg, e)
-                _sleep(0.1)
+                len_expired += len(expired_msg)
+
+                # A batch that was not full means that there is nothing more to delete in this topic ..
+                if len(expired_msg) < ModuleCtx.Cleanup_Batch_Size:
+                    break
+
+                # .. otherwise, let other greenlets run before the next batch.
+                _sleep(0)
+
+        return len_expired
 
 # ################################################################################################################################
 
@@ -594,8 +711,8 @@ class InRAMSync:
     def get_topic_depth(self, topic_id:'int') -> 'int':
         """ Returns depth of a given in-RAM queue for the topic.
         """
-        with self.lock:
-            return len(self.topic_id_msg_id.get(topic_id, set()))
+        topic = self.topics.get(topic_id)
+        return topic.depth if topic else 0
 
 # ################################################################################################################################
 # ################################################################################################################################
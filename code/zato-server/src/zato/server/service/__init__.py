@@ -51,6 +51,7 @@ from zato.server.connection.zmq_.outgoing import ZMQFacade
 from zato.server.pattern.api import FanOut
 from zato.server.pattern.api import InvokeRetry
 from zato.server.pattern.api import ParallelExec
+from zato.server.pattern.api import ScatterGather
 from zato.server.pubsub import PubSub
 from zato.server.service.reqresp import AMQPRequestData, Cloud, Definition, HL7API, HL7RequestData, IBMMQRequestData, \
      InstantMessaging, Outgoing, Request
@@ -361,12 +362,13 @@ class AMQPFacade:
 class PatternsFacade:
     """ The API through which services make use of integration patterns.
     """
-    __slots__ = ('invoke_retry', 'fanout', 'parallel')
+    __slots__ = ('invoke_retry', 'fanout', 'parallel', 'scatter_gather')
 
     def __init__(self, invoking_service:'Service', cache:'anydict', lock:'RLock') -> 'None':
         self.invoke_retry = InvokeRetry(invoking_service)
         self.fanout = FanOut(invoking_service, cache, lock)
         self.parallel = ParallelExec(invoking_service, cache, lock)
+        self.scatter_gather = ScatterGather(invoking_service)
 
 # ################################################################################################################################
 
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from hashlib import sha256
+from logging import getLogger
+from tempfile import NamedTemporaryFile
+from traceback import format_exc
+
+# gevent
+from gevent.threadpool import ThreadPool
+
+# Zato
+from zato.common.api import SourceCodeInfo
+from zato.common.json_internal import dumps, loads
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import anydict, dictnone, strlist, strnone
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+
+    # Increased each time the layout of what we store in the manifest changes
+    Format_Version = 1
+
+    # Under the server's work_dir
+    File_Name = 'deploy-manifest.json'
+
+    # What we hash each source file with
+    Hash_Method = 'SHA-256'
+
+    # How many threads at most to read and hash source files with
+    Max_Threads = min(32, (os.cpu_count() or 1) + 4)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+def _read_source(path:'str', hash:'strnone') -> 'SourceCodeInfo':
+    """ Reads a source file and computes its hash unless it is already known. This runs in a thread pool
+    so it must not touch anything but the file system.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    info = SourceCodeInfo()
+    info.source = source
+    info.len_source = len(source)
+    info.path = path
+    info.hash = hash or sha256(source).hexdigest()
+    info.hash_method = ModuleCtx.Hash_Method
+
+    return info
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LazySourceCodeInfo(SourceCodeInfo):
+    """ Describes a file whose hash is already known from the manifest. The file itself is read only if its source
+    is actually needed, e.g. when a service is stored in the ODB for the first time or when a hot-deployed module
+    is looked up in other modules' imports.
+    """
+    __slots__ = ('_source',)
+
+    @property
+    def source(self) -> 'bytes':
+        if self._source is None:
+            with open(self.path, 'rb') as f:
+                self._source = f.read()
+        return self._source
+
+    @source.setter
+    def source(self, value:'bytes | None') -> 'None':
+        self._source = value
+
+# ################################################################################################################################
+
+def _get_lazy_source(path:'str', entry:'anydict') -> 'LazySourceCodeInfo':
+
+    info = LazySourceCodeInfo()
+    info.source = None
+    info.len_source = entry['size']
+    info.path = path
+    info.hash = entry['hash']
+    info.hash_method = ModuleCtx.Hash_Method
+
+    return info
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DeployManifest:
+    """ Keeps track of the source files that services and models are deployed from. Each file is read and hashed at most once
+    for as long as its mtime and size do not change. Hashes are stored in the server's work_dir, which means that
+    a file that one process has already hashed is not read at all by other workers or after a restart,
+    unless its source is actually needed.
+    """
+    def __init__(self, path:'strnone'=None) -> 'None':
+
+        # Where the manifest is stored, if anywhere
+        self.path = path
+
+        # Path -> {'mtime_ns', 'size', 'hash'} for all the files seen so far
+        self.entries:'anydict' = {}
+
+        # Path -> SourceCodeInfo for all the files read by the current process
+        self.sources:'anydict' = {}
+
+        # Set to True each time the entries change and to False after they are stored
+        self.has_changes = False
+
+# ################################################################################################################################
+
+    def set_path(self, work_dir:'str') -> 'None':
+        """ Sets the manifest's location and loads any entries that have been already stored there.
+        """
+        self.path = os.path.join(work_dir, ModuleCtx.File_Name)
+        self.load()
+
+# ################################################################################################################################
+
+    def load(self) -> 'None':
+        """ Loads entries from the file system, unless there are none or they cannot be used.
+        """
+        if not (self.path and os.path.exists(self.path)):
+            return
+
+        try:
+            with open(self.path, 'rb') as f:
+                manifest = loads(f.read())
+        except Exception:
+            logger.warning('Deploy manifest `%s` could not be loaded, e:`%s`', self.path, format_exc())
+            return
+
+        if manifest.get('format_version') != ModuleCtx.Format_Version:
+            logger.info('Ignoring deploy manifest in format `%s` (expected `%s`)',
+                manifest.get('format_version'), ModuleCtx.Format_Version)
+            return
+
+        # Entries that other processes stored may be newer than ours, but not the other way around
+        for path, entry in manifest['entries'].items():
+            current = self.entries.get(path)
+            if not (current and current['mtime_ns'] >= entry['mtime_ns']):
+                self.entries[path] = entry
+
+# ################################################################################################################################
+
+    def store(self) -> 'None':
+        """ Atomically saves all the entries to the file system, if there is anything new to save.
+        """
+        if not (self.path and self.has_changes):
+            return
+
+        # Hot-deployed files are often deleted after they are picked up so there is no point in keeping track of them
+        for path in list(self.entries):
+            if not os.path.exists(path):
+                del self.entries[path]
+                _ = self.sources.pop(path, None)
+
+        manifest = {
+            'format_version': ModuleCtx.Format_Version,
+            'entries': self.entries,
+        }
+
+        try:
+
+            # Write to a temporary file first so that no one can ever read a partially written manifest ..
+            dir_name = os.path.dirname(self.path)
+            with NamedTemporaryFile(mode='w', dir=dir_name, prefix='.deploy-manifest-', delete=False) as f:
+                _ = f.write(dumps(manifest))
+                temp_path = f.name
+
+            # .. now, it is safe to move it to its target location.
+            os.replace(temp_path, self.path)
+
+        except Exception:
+            logger.warning('Deploy manifest `%s` could not be stored, e:`%s`', self.path, format_exc())
+
+        else:
+            self.has_changes = False
+
+# ################################################################################################################################
+
+    def _get_known_entry(self, path:'str', stat:'os.stat_result') -> 'dictnone':
+        """ Returns a manifest entry for the path if the file has not changed since it was last seen.
+        """
+        entry = self.entries.get(path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return entry
+
+# ################################################################################################################################
+
+    def _on_source_read(self, path:'str', stat:'os.stat_result', info:'SourceCodeInfo') -> 'None':
+
+        self.sources[path] = info
+
+        # Record the hash unless we already had the very same one
+        entry = self._get_known_entry(path, stat)
+        if not (entry and entry['hash'] == info.hash):
+            self.entries[path] = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'hash': info.hash,
+            }
+            self.has_changes = True
+
+# ################################################################################################################################
+
+    def _get_current(self, path:'str', stat:'os.stat_result') -> 'SourceCodeInfo | None':
+        """ Returns what we know about a file if it has not changed since we last saw it, reading nothing from it.
+        """
+        entry = self._get_known_entry(path, stat)
+        if not entry:
+            return None
+
+        # We may have the file's source already ..
+        info = self.sources.get(path)
+        if info and info.hash == entry['hash']:
+            return info
+
+        # .. but if not, its hash is enough for now.
+        info = _get_lazy_source(path, entry)
+        self.sources[path] = info
+
+        return info
+
+# ################################################################################################################################
+
+    def get_source_code_info(self, path:'str') -> 'SourceCodeInfo':
+        """ Returns the source code of a file, reading and hashing it only if it is the first time that any process sees it
+        or if it has changed in the meantime.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        info = self._get_current(path, stat)
+        if not info:
+            info = _read_source(path, None)
+            self._on_source_read(path, stat, info)
+
+        return info
+
+# ################################################################################################################################
+
+    def prefetch(self, path_list:'strlist') -> 'int':
+        """ Reads and hashes in a thread pool all the files that no process has hashed yet or that have changed.
+        Returns the number of files that needed to be read.
+        """
+        to_read = []
+
+        # Workers deploy services one after another so the ones that come later will find here what the first one stored
+        self.load()
+
+        for path in path_list:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # The file may have been deleted in the meantime, in which case it will be reported by the caller later on
+                continue
+            else:
+                if not self._get_current(path, stat):
+                    to_read.append((path, stat, None))
+
+        if not to_read:
+            return 0
+
+        pool = ThreadPool(min(len(to_read), ModuleCtx.Max_Threads))
+
+        try:
+            results = pool.map(self._prefetch_one, to_read)
+        finally:
+            pool.kill()
+
+        for (path, stat, _ignored_hash), info in zip(to_read, results):
+            if info:
+                self._on_source_read(path, stat, info)
+
+        return len(to_read)
+
+# ################################################################################################################################
+
+    def _prefetch_one(self, item:'tuple') -> 'SourceCodeInfo | None':
+        path, _ignored_stat, hash = item
+        try:
+            return _read_source(path, hash)
+        except OSError:
+            # As above, the caller will report any issues when it reads the file again
+            return None
+
+# ################################################################################################################################
+# ################################################################################################################################
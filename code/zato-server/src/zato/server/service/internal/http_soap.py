@@ -100,7 +100,7 @@ class _BaseGet(AdminService):
                 'data_encoding', 'is_audit_log_sent_active', 'is_audit_log_received_active', \
                 Integer('max_len_messages_sent'), Integer('max_len_messages_received'), \
                 Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received'), \
-                'username', 'is_wrapper', 'wrapper_type'
+                'username', 'is_wrapper', 'wrapper_type', 'circuit_breaker_max_failures', 'circuit_breaker_open_time'
 
 # ################################################################################################################################
 
@@ -297,7 +297,8 @@ class Create(_CreateEdit):
             Integer('max_len_messages_sent'), Integer('max_len_messages_received'), \
             Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received'), \
             'is_active', 'transport', 'is_internal', 'cluster_id', 'tls_verify', \
-            'is_wrapper', 'wrapper_type', 'username', 'password'
+            'is_wrapper', 'wrapper_type', 'username', 'password', \
+            'circuit_breaker_max_failures', 'circuit_breaker_open_time'
         output_required = 'id', 'name'
         output_optional = 'url_path'
 
@@ -493,7 +494,8 @@ class Edit(_CreateEdit):
             Integer('max_len_messages_sent'), Integer('max_len_messages_received'), \
             Integer('max_bytes_per_message_sent'), Integer('max_bytes_per_message_received'), \
             'cluster_id', 'is_active', 'transport', 'tls_verify', \
-            'is_wrapper', 'wrapper_type', 'username', 'password'
+            'is_wrapper', 'wrapper_type', 'username', 'password', \
+            'circuit_breaker_max_failures', 'circuit_breaker_open_time'
         output_optional = 'id', 'name'
 
     def handle(self):
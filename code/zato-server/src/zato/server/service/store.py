@@ -15,12 +15,12 @@ import sys
 from dataclasses import dataclass
 from datetime import datetime
 from functools import total_ordering
-from hashlib import sha256
 from importlib import import_module
 from inspect import getargspec, getmodule, getmro, getsourcefile, isclass
 from pickle import HIGHEST_PROTOCOL as highest_pickle_protocol
 from random import randint
 from shutil import copy as shutil_copy
+from time import monotonic
 from traceback import format_exc
 from typing import Any, List
 
@@ -57,6 +57,7 @@ from zato.common.util.api import deployment_info, import_module_from_path, is_fu
 from zato.common.util.platform_ import is_non_windows
 from zato.common.util.python_ import get_module_name_by_path
 from zato.server.config import ConfigDict
+from zato.server.service.deploy_manifest import DeployManifest
 from zato.server.service import after_handle_hooks, after_job_hooks, before_handle_hooks, before_job_hooks, \
     PubSubHook, SchedulerFacade, Service, WSXAdapter, WSXFacade
 from zato.server.service.internal import AdminService
@@ -74,7 +75,7 @@ if 0:
     from zato.common.hot_deploy_ import HotDeployProject
     from zato.common.odb.api import ODBManager
     from zato.common.typing_ import any_, anydict, anylist, callable_, dictnone, intstrdict, module_, stranydict, \
-        strdictdict, strint, strintdict, strlist, stroriter, tuple_
+        strdictdict, strint, strintdict, strlist, strnone, stroriter, tuple_
     from zato.server.base.parallel import ParallelServer
     from zato.server.base.worker import WorkerStore
     from zato.server.config import ConfigStore
@@ -204,7 +205,6 @@ class ModelInfo:
     name: 'str'
     path: 'str'
     mod_name: 'str'
-    source: 'str'
 
 modelinfolist = list_[ModelInfo]
 
@@ -212,12 +212,30 @@ modelinfolist = list_[ModelInfo]
 # ################################################################################################################################
 
 class DeploymentInfo:
-    __slots__ = 'to_process', 'total_services', 'total_size', 'total_size_human'
+    __slots__ = 'to_process', 'total_services', 'total_size', 'total_size_human', 'phase_times'
 
     def __init__(self):
         self.to_process = []       # type: List
         self.total_size = 0        # type: int
         self.total_size_human = '' # type: str
+        self.phase_times = {}      # type: dict
+
+# ################################################################################################################################
+
+class PhaseTimer:
+    """ Measures how long each phase of a deployment takes.
+    """
+    def __init__(self, phase_times:'anydict') -> 'None':
+        self.phase_times = phase_times
+        self.start = monotonic()
+
+    def on_phase_done(self, phase:'str') -> 'None':
+        now = monotonic()
+        self.phase_times[phase] = self.phase_times.get(phase, 0) + (now - self.start)
+        self.start = now
+
+    def get_summary(self) -> 'str':
+        return ', '.join('{}:{:.3f}s'.format(phase, elapsed) for phase, elapsed in self.phase_times.items())
 
 # ################################################################################################################################
 
@@ -298,6 +316,7 @@ class ServiceStore:
         self.is_testing = is_testing
         self.max_batch_size = 0
         self.models = {}            # type: stranydict
+        self.deploy_manifest = DeployManifest()
         self.id_to_impl_name = {}   # type: intstrdict
         self.impl_name_to_id = {}   # type: strintdict
         self.name_to_impl_name = {} # type: stranydict
@@ -983,7 +1002,6 @@ class ServiceStore:
                 self.services[item.impl_name]['deployment_info'] = item_deployment_info
                 self.services[item.impl_name]['service_class'] = item_service_class
                 self.services[item.impl_name]['path'] = item.source_code_info.path
-                self.services[item.impl_name]['source_code'] = item.source_code_info.source.decode('utf8')
 
                 item_is_active = item.is_active
                 item_slow_threshold = item.slow_threshold
@@ -1065,8 +1083,8 @@ class ServiceStore:
         # Already deployed ..
         if service.name in already_deployed:
 
-            # .. thus, return True if current source code is different to what we have already
-            if service.source_code_info.source != already_deployed[service.name]:
+            # .. thus, return True if the hash of current source code is different to what we have already
+            if service.source_code_info.hash != already_deployed[service.name]:
                 return True
 
         # If we are here, it means that we should not delete this service
@@ -1211,20 +1229,19 @@ class ServiceStore:
         """
 
         items = items if isinstance(items, (list, tuple)) else [items]
+        items = [item for item in items if not self._should_skip_item(item)]
         to_process = []
-        should_skip = False
 
-        for item in items:
+        info = DeploymentInfo()
+        timer = PhaseTimer(info.phase_times)
 
-            for ignored_name in internal_to_ignore:
-                if ignored_name in item:
-                    should_skip = True
-                    break
-            else:
-                should_skip = False
+        # Read and hash upfront, in parallel, all the source files that we are about to import,
+        # so that importing them below will not need to read any of them again ..
+        to_prefetch = self._get_paths_to_prefetch(items)
+        len_prefetched = self.deploy_manifest.prefetch(to_prefetch)
+        timer.on_phase_done('read')
 
-            if should_skip:
-                continue
+        for item in items:
 
             if has_debug:
                 logger.debug('About to import services from:`%s`', item)
@@ -1278,6 +1295,8 @@ class ServiceStore:
                 imported = self.import_services_from_module_object(item, is_internal)
                 to_process.extend(imported)
 
+        timer.on_phase_done('import')
+
         total_size = 0
 
         to_process = set(to_process)
@@ -1287,7 +1306,6 @@ class ServiceStore:
             item = cast_('InRAMService', item)
             total_size += item.source_code_info.len_source
 
-        info = DeploymentInfo()
         info.to_process[:] = to_process
         info.total_size = total_size
         info.total_size_human = naturalsize(info.total_size)
@@ -1302,21 +1320,80 @@ class ServiceStore:
             # otherwise, in RAM only.
             if not self.is_testing:
                 self._store_in_odb(session, info.to_process)
+                timer.on_phase_done('odb')
+
             self._store_in_ram(session, info.to_process)
+            timer.on_phase_done('ram')
 
             # Postprocessing, like rate limiting which needs access to information that becomes
             # available only after a service is saved to ODB.
             if not self.is_testing:
                 self.after_import(session, info)
+                timer.on_phase_done('after_import')
 
         # Done with everything, we can commit it now, assuming we are not in a unittest
         finally:
             if session:
                 session.commit() # type: ignore
 
+        # Hashes of all the files read above can be reused the next time we start
+        self.deploy_manifest.store()
+
+        logger.info('Imported %d service(s) (%s) from %d file(s) (%d read) -> %s', len(info.to_process), info.total_size_human,
+            len(to_prefetch), len_prefetched, timer.get_summary())
+
         # Done deploying, we can return
         return info
 
+# ################################################################################################################################
+
+    def _should_skip_item(self, item:'any_') -> 'bool':
+        """ Returns True if a given item to import services from should be ignored.
+        """
+        if isinstance(item, str):
+            for ignored_name in internal_to_ignore:
+                if ignored_name in item:
+                    return True
+
+        return False
+
+# ################################################################################################################################
+
+    def _get_paths_to_prefetch(self, items:'anylist') -> 'strlist':
+        """ Returns paths to all the source files that importing services from the input items will need to read.
+        """
+        out = []
+
+        for item in items:
+
+            if isinstance(item, str):
+
+                # A regular directory ..
+                if os.path.isdir(item):
+                    out.extend(visit_py_source(item))
+
+                # .. a .py/.pyw file ..
+                elif is_python_file(item):
+                    out.append(item)
+
+            # .. a list of project roots.
+            elif isinstance(item, list):
+                for elem in item:
+                    elem = cast_('HotDeployProject', elem)
+                    for dir_name in elem.pickup_from_path:
+                        out.extend(visit_py_source(str(dir_name)))
+
+        # Named modules and module objects are not included because we know their paths only after they are imported,
+        # which is why their source files will be read on first use.
+        return out
+
+# ################################################################################################################################
+
+    def set_up_deploy_manifest(self, work_dir:'str') -> 'None':
+        """ Makes the deploy manifest persistent by storing it in the given directory.
+        """
+        self.deploy_manifest.set_path(work_dir)
+
 # ################################################################################################################################
 
     def after_import(self, session:'SASession | None', info:'DeploymentInfo') -> 'None':
@@ -1513,7 +1590,7 @@ class ServiceStore:
                 continue
             else:
                 # .. get the actual source code ..
-                source_code = service_data['source_code']
+                source_code = self._get_source(service_data['path'])
 
                 # .. this module can be ignored if it does not import the input one ..
                 if not self._has_module_import(source_code, mod_name):
@@ -1551,7 +1628,7 @@ class ServiceStore:
                 continue
             else:
                 # .. this module can be ignored if it does not import the input one ..
-                if not self._has_module_import(model.source, mod_name):
+                if not self._has_module_import(self._get_source(model.path), mod_name):
                     continue
 
                 # .. otherwise, store that module's path for later use ..
@@ -1646,27 +1723,36 @@ class ServiceStore:
         """ Returns the source code of and the FS path to the given module.
         """
 
-        source_info = SourceCodeInfo()
         try:
             file_name = mod.__file__ or ''
             if file_name[-1] in('c', 'o'):
                 file_name = file_name[:-1]
 
             # We would have used inspect.getsource(mod) had it not been apparently using
-            # cached copies of the source code
-            source_info.source = open(file_name, 'rb').read()
-            source_info.len_source = len(source_info.source)
-
-            source_info.path = inspect.getsourcefile(mod) or 'no-source-file'
-            source_info.hash = sha256(source_info.source).hexdigest()
-            source_info.hash_method = 'SHA-256'
+            # cached copies of the source code. Note that the manifest reads each file only once,
+            # no matter how many services or models there are in it.
+            source_info = self.deploy_manifest.get_source_code_info(file_name)
 
         except IOError:
+            source_info = SourceCodeInfo()
             if has_trace1:
                 logger.log(TRACE1, 'Ignoring IOError, mod:`%s`, e:`%s`', mod, format_exc())
 
         return source_info
 
+# ################################################################################################################################
+
+    def _get_source(self, path:'strnone') -> 'str':
+        """ Returns the source code of a deployed module, which is read only the first time that it is needed.
+        """
+        if not path:
+            return ''
+
+        try:
+            return self.deploy_manifest.get_source_code_info(path).source.decode('utf8')
+        except OSError:
+            return ''
+
 # ################################################################################################################################
 
     def _visit_class_for_model(
@@ -1680,15 +1766,10 @@ class ServiceStore:
         # Reusable
         mod_name = get_module_name_by_path(fs_location)
 
-        # Read the source and convert it from bytes to string
-        source = open(fs_location, 'rb').read()
-        source = source.decode('utf8')
-
         out = ModelInfo()
         out.name = '{}.{}'.format(mod_name, class_.__name__)
         out.path = fs_location
         out.mod_name = mod_name
-        out.source = source
 
         return out
 
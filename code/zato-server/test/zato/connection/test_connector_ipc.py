@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Must come first
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+from logging import getLogger
+from socket import create_connection, SHUT_RDWR, socketpair
+from threading import Event, Lock
+from time import sleep
+from unittest import main, TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent.pool import Pool
+
+# Zato
+from zato.common.broker_message import DEFINITION
+from zato.common.exception import ConnectorClosedException
+from zato.common.json_internal import dumps
+from zato.server.connection.connector.subprocess_.base import BaseConnectionContainer, Response
+from zato.server.connection.connector.subprocess_.framed import FramedClient, FramedSender, FramedServer, get_replies, \
+     ModuleCtx
+from zato.server.connection.connector.subprocess_.ipc import SubprocessIPC
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+_username = 'zato.test.username'
+_password = 'zato.test.password'
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _ConnectionContainer(BaseConnectionContainer):
+    """ A connector that handles pings only, without reading its configuration from a parent process.
+    """
+    def __init__(self):
+        self.logger = getLogger(__name__)
+        self.request_lock = Lock()
+        self.framed_port = 0
+
+    def _on_DEFINITION_WMQ_PING(self, msg):
+        if msg.id == 'closed':
+            return Response('503 Service Unavailable', 'Connection closed')
+        elif msg.id == 'error':
+            raise ValueError('Invalid ID')
+        else:
+            return Response(data='Pong {}'.format(msg.id))
+
+# ################################################################################################################################
+
+class _SubprocessIPC(SubprocessIPC):
+    connector_name = 'Test'
+    callback_service = 'zato.test.callback'
+    action_ping = DEFINITION.WMQ_PING
+
+    def get_credentials(self):
+        return _username, _password
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ConnectorIPCTestCase(TestCase):
+
+    def setUp(self):
+
+        # Each element is a list of messages received in a single frame
+        self.batches = []
+
+        # If set, this makes the server wait before it replies
+        self.can_reply = None
+
+        self.server = FramedServer('127.0.0.1', 0, _username, _password, self._on_items)
+        self.server.start()
+
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+# ################################################################################################################################
+
+    def _on_item(self, item):
+        if item == b'error':
+            raise ValueError(item)
+        return ModuleCtx.Status_OK, item.upper()
+
+# ################################################################################################################################
+
+    def _on_items(self, items):
+        self.batches.append(items)
+        if self.can_reply:
+            _ = self.can_reply.wait(1)
+        return get_replies(self._on_item, items)
+
+# ################################################################################################################################
+
+    def test_client(self):
+
+        client = FramedClient('127.0.0.1', self.server.port, _username, _password, pool_size=1)
+        self.addCleanup(client.close)
+
+        # Each message gets its own reply ..
+        response = client.invoke(b'abc')
+        self.assertTrue(response.ok)
+        self.assertEqual(response.text, 'ABC')
+
+        # .. including the ones that could not be handled ..
+        response = client.invoke(b'error')
+        self.assertFalse(response.ok)
+        self.assertEqual(response.status_code, ModuleCtx.Status_Error)
+        self.assertIn('ValueError', response.text)
+
+        # .. and all of them are sent over the same connection.
+        responses = client.invoke_many([b'def', b'', b'ghi'])
+        self.assertListEqual([response.text for response in responses], ['DEF', '', 'GHI'])
+        self.assertEqual(client._idle.qsize(), 1)
+
+# ################################################################################################################################
+
+    def test_client_reconnect(self):
+
+        client = FramedClient('127.0.0.1', self.server.port, _username, _password)
+        self.addCleanup(client.close)
+
+        # An idle connection is closed by its server ..
+        stale, peer = socketpair()
+        peer.close()
+        client._idle.put(stale)
+
+        # .. which is noticed before the connection would be used again.
+        self.assertEqual(client.invoke(b'abc').text, 'ABC')
+        self.assertEqual(stale.fileno(), -1)
+
+# ################################################################################################################################
+
+    def test_client_invalid_credentials(self):
+
+        client = FramedClient('127.0.0.1', self.server.port, _username, 'invalid')
+        self.assertRaises(PermissionError, client.invoke, b'abc')
+        self.assertListEqual(self.batches, [])
+
+# ################################################################################################################################
+
+    def test_credentials_frame_too_big(self):
+
+        # The server does not read more than the credentials can take up ..
+        sock = create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(sock.close)
+        sock.sendall(ModuleCtx.Header.pack(ModuleCtx.Max_Credentials_Frame_Size + 1))
+
+        # .. and closes the connection instead.
+        sock.settimeout(1)
+        self.assertEqual(sock.recv(1), b'')
+
+# ################################################################################################################################
+
+    def test_sender(self):
+
+        self.can_reply = Event()
+        sender = FramedSender('127.0.0.1', self.server.port, _username, _password, batch_size=3, queue_size=10)
+
+        # The first message is sent alone and, while it is waiting for a reply, the next ones are queued up ..
+        for idx in range(7):
+            sender.send(b'%d' % idx)
+            sleep(0.01)
+
+        # .. which means that they will be sent in batches.
+        self.can_reply.set()
+        sleep(0.2)
+
+        self.assertListEqual(self.batches, [[b'0'], [b'1', b'2', b'3'], [b'4', b'5', b'6']])
+
+# ################################################################################################################################
+
+    def test_sender_fallback(self):
+
+        # Connections accepted by the server, so they can be closed along with it
+        connections = []
+        verify_request = self.server.verify_request
+
+        def _verify_request(request, client_address):
+            connections.append(request)
+            return verify_request(request, client_address)
+
+        self.server.verify_request = _verify_request
+
+        fallback = []
+        sender = FramedSender('127.0.0.1', self.server.port, _username, _password, queue_size=2, reconnect_delay=0.01,
+            fallback=fallback.append, max_send_failures=3)
+
+        # Messages are sent to the server as long as it is running ..
+        sender.send(b'1')
+        sleep(0.1)
+        self.assertListEqual(self.batches, [[b'1']])
+
+        # .. but once it is stopped, e.g. because its process was recycled, ..
+        self.server.shutdown()
+        self.server.server_close()
+
+        for sock in connections:
+            sock.shutdown(SHUT_RDWR)
+            sock.close()
+
+        # .. producers are not blocked, even if there are more messages than the queue can take up ..
+        for idx in range(2, 10):
+            sender.send(b'%d' % idx)
+
+        sleep(0.1)
+
+        # .. because the messages are handed over to the fallback, in the order they were sent in.
+        self.assertListEqual(fallback, [b'%d' % idx for idx in range(2, 10)])
+        self.assertListEqual(self.batches, [[b'1']])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ConnectorRequestTestCase(TestCase):
+
+    def setUp(self):
+        self.container = _ConnectionContainer()
+
+        self.server = FramedServer('127.0.0.1', 0, _username, _password, self.container._on_framed_items)
+        self.server.start()
+
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.ipc = _SubprocessIPC(Bunch(use_tls=False))
+        self.ipc.framed_port = self.server.port
+        self.addCleanup(lambda: self.ipc.framed_client and self.ipc.framed_client.close())
+
+# ################################################################################################################################
+
+    def _get_request(self, id):
+        return dumps({'action': DEFINITION.WMQ_PING.value, 'id': id}).encode('utf8')
+
+# ################################################################################################################################
+
+    def test_handle_request(self):
+
+        # Each message is dispatched to the handler of its action ..
+        status_code, data = self.container._on_framed_request(self._get_request(123))
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, 'Pong 123')
+
+        # .. whose status codes are returned as they are ..
+        status_code, data = self.container._on_framed_request(self._get_request('closed'))
+        self.assertEqual(status_code, 503)
+
+        # .. unless the handler raised an exception, which does not stop other messages from the same batch from being handled.
+        replies = [ModuleCtx.Status.unpack_from(item)[0] for item in self.container._on_framed_items([
+            self._get_request('error'), self._get_request(456)])]
+        self.assertListEqual(replies, [ModuleCtx.Status_Error, 200])
+
+# ################################################################################################################################
+
+    def test_invoke_connector(self):
+
+        # A connector is invoked over a persistent connection ..
+        self.assertEqual(self.ipc.ping(123).text, 'Pong 123')
+
+        # .. with its errors raised as previously, when it was invoked over HTTP ..
+        self.assertRaises(ConnectorClosedException, self.ipc.ping, 'closed')
+        self.assertRaises(Exception, self.ipc.ping, 'error')
+        self.assertIsNone(self.ipc.invoke_connector({'action': DEFINITION.WMQ_PING.value, 'id': 'error'}, False))
+
+        # .. including the case of a connector that is not running.
+        self.server.shutdown()
+        self.server.server_close()
+        self.ipc.framed_client.close()
+
+        self.assertRaises(ConnectorClosedException, self.ipc.ping, 123)
+
+# ################################################################################################################################
+
+    def test_callback(self):
+
+        invoked = []
+        can_return = Event()
+
+        def invoke(service_name, request):
+            if request == 'error':
+                raise ValueError(request)
+            can_return.wait(1)
+            invoked.append((service_name, request))
+
+        self.ipc.server.invoke = invoke
+        self.ipc.callback_pool = Pool(_SubprocessIPC.callback_pool_size)
+
+        # Messages are acknowledged without waiting for their services to complete ..
+        replies = self.ipc._on_callback_items([b'error', b'1', b'2'])
+        self.assertListEqual([ModuleCtx.Status.unpack_from(item)[0] for item in replies], [200, 200, 200])
+        self.assertListEqual(invoked, [])
+
+        # .. and all of them are handled at the same time.
+        can_return.set()
+        sleep(0.1)
+        self.assertListEqual(invoked, [('zato.test.callback', '1'), ('zato.test.callback', '2')])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
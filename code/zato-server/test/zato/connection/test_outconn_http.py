@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Must come first so that the tests behave the same no matter if any other module patched everything before
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, sleep
+from unittest import main, TestCase
+
+# gevent
+from gevent import Timeout
+
+# Zato
+from zato.common.api import DATA_FORMAT, URL_TYPE
+from zato.common.exception import CircuitOpen, TimeoutException
+from zato.server.connection.http_soap.circuit_breaker import State
+from zato.server.connection.http_soap.outgoing import HTTPSOAPWrapper, ModuleCtx as OutgoingCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+    Big_Size = 20 * 1024 * 1024
+    Max_Failures = 3
+    Open_Time = 0.2
+    Timeout = 0.2
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *ignored_args):
+        pass
+
+    def do_GET(self):
+
+        self.server.hits += 1
+        name = self.path.strip('/')
+
+        # Large responses are produced in chunks so as not to keep them in our own memory either ..
+        if name == 'big':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(ModuleCtx.Big_Size))
+            self.end_headers()
+
+            chunk = b'a' * 1024 * 1024
+            for _ in range(ModuleCtx.Big_Size // len(chunk)):
+                _ = self.wfile.write(chunk)
+            return
+
+        # .. while everything else is a simple JSON document ..
+        if name == 'fail':
+            status = 500
+            body = b'{"error": "my.error"}'
+        elif name == 'unavailable':
+            status = 503
+            body = b'{"error": "my.unavailable"}'
+        else:
+            status = 200
+            body = b'{"name": "%s"}' % name.encode('utf8')
+
+        # .. possibly produced only after a delay.
+        if name == 'slow':
+            sleep(ModuleCtx.Timeout * 3)
+
+        self._send_json(status, body)
+
+    def do_POST(self):
+
+        # Requests whose size is not known in advance arrive in chunks ..
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size)
+                _ = self.rfile.readline()
+                if not size:
+                    break
+
+        # .. and all the other ones in one piece.
+        else:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+
+        self.server.requests.append((self.headers, body))
+        self._send_json(200, b'{}')
+
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        _ = self.wfile.write(body)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class OutgoingHTTPTestCase(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RequestHandler)
+        self.server.daemon_threads = True
+        self.server.hits = 0
+        self.server.requests = []
+
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.wrapper = self._get_wrapper(**{
+            'circuit_breaker_max_failures': ModuleCtx.Max_Failures,
+            'circuit_breaker_open_time': ModuleCtx.Open_Time,
+        })
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ################################################################################################################################
+
+    def _get_wrapper(self, **config):
+        return HTTPSOAPWrapper(None, dict({
+            'name': 'my.conn',
+            'is_active': True,
+            'address_host': 'http://127.0.0.1:{}'.format(self.server.server_address[1]),
+            'address_url_path': '/{name}',
+            'transport': URL_TYPE.PLAIN_HTTP,
+            'data_format': DATA_FORMAT.JSON,
+            'content_type': None,
+            'sec_type': None,
+            'security_name': None,
+            'username': None,
+            'password': None,
+            'timeout': ModuleCtx.Timeout,
+        }, **config))
+
+# ################################################################################################################################
+
+    def _get(self, name, **kwargs):
+        return self.wrapper.get('my.cid', {'name': name}, **kwargs)
+
+# ################################################################################################################################
+
+    def test_stream(self):
+
+        response = self._get('big', stream=True)
+
+        # The body has not been read yet ..
+        self.assertFalse(response._content_consumed)
+
+        total = 0
+        max_chunk = 0
+
+        # .. it is read piece by piece while we iterate over it.
+        for chunk in response.data:
+            total += len(chunk)
+            max_chunk = max(max_chunk, len(chunk))
+
+        self.assertEqual(total, ModuleCtx.Big_Size)
+        self.assertLessEqual(max_chunk, OutgoingCtx.Stream_Chunk_Size)
+
+        # Responses that are not streamed are parsed as previously
+        self.assertEqual(self._get('my.name').data, {'name': 'my.name'})
+
+# ################################################################################################################################
+
+    def test_stream_request(self):
+
+        def get_data():
+            for idx in range(3):
+                yield b'%d' % idx * 1000
+
+        # Iterators are sent as they are, without being serialized to JSON first, ..
+        response = self.wrapper.post('my.cid', get_data(), {'name': 'upload'}, headers={'Content-Length': '3000'})
+        self.assertEqual(response.status_code, 200)
+
+        # .. and, if their size is known, in one piece ..
+        headers, body = self.server.requests[-1]
+        self.assertEqual(headers['Content-Length'], '3000')
+        self.assertIsNone(headers['Transfer-Encoding'])
+        self.assertEqual(body, b'0' * 1000 + b'1' * 1000 + b'2' * 1000)
+
+        # .. or in chunks otherwise.
+        _ = self.wrapper.post('my.cid', get_data(), {'name': 'upload'})
+
+        headers, body = self.server.requests[-1]
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(len(body), 3000)
+
+# ################################################################################################################################
+
+    def test_circuit_breaker_off_by_default(self):
+
+        wrapper = self._get_wrapper()
+
+        # Unless configured otherwise, a remote end that is not available is always invoked
+        for _ in range(ModuleCtx.Max_Failures * 2):
+            self.assertEqual(wrapper.get('my.cid', {'name': 'unavailable'}).status_code, 503)
+
+        self.assertEqual(wrapper.circuit_breaker.state, State.Closed)
+        self.assertEqual(self.server.hits, ModuleCtx.Max_Failures * 2)
+
+# ################################################################################################################################
+
+    def test_circuit_breaker_server_errors(self):
+
+        breaker = self.wrapper.circuit_breaker
+
+        # Errors that an application returns, e.g. SOAP faults, do not open the circuit ..
+        for _ in range(ModuleCtx.Max_Failures * 2):
+            self.assertEqual(self._get('fail').status_code, 500)
+
+        self.assertEqual(breaker.state, State.Closed)
+        self.assertEqual(breaker.failures, 0)
+
+        # .. unlike the remote end not being available, which is returned to the caller until it happens too many times ..
+        for _ in range(ModuleCtx.Max_Failures):
+            self.assertEqual(self._get('unavailable').status_code, 503)
+
+        self.assertEqual(breaker.state, State.Open)
+
+        # .. after which the remote end is not invoked at all ..
+        with self.assertRaises(CircuitOpen):
+            self._get('ok')
+
+        self.assertEqual(self.server.hits, ModuleCtx.Max_Failures * 3)
+
+        # .. until a single trial call is let through, which fails and opens the circuit again ..
+        sleep(ModuleCtx.Open_Time)
+        self.assertEqual(self._get('unavailable').status_code, 503)
+        self.assertEqual(breaker.state, State.Open)
+
+        with self.assertRaises(CircuitOpen):
+            self._get('ok')
+
+        # .. while the next successful one closes it.
+        sleep(ModuleCtx.Open_Time)
+        self.assertEqual(self._get('ok').data, {'name': 'ok'})
+        self.assertEqual(breaker.state, State.Closed)
+        self.assertEqual(breaker.failures, 0)
+
+# ################################################################################################################################
+
+    def test_circuit_breaker_timeouts(self):
+
+        # Each call to a remote end that does not respond takes as long as the timeout ..
+        for _ in range(ModuleCtx.Max_Failures):
+            with self.assertRaises(TimeoutException):
+                self._get('slow')
+
+        # .. but once the circuit is open, callers learn about it immediately.
+        start = perf_counter()
+
+        with self.assertRaises(CircuitOpen):
+            self._get('slow')
+
+        self.assertLess(perf_counter() - start, ModuleCtx.Timeout / 10)
+
+    def test_circuit_breaker_trial_killed(self):
+
+        breaker = self.wrapper.circuit_breaker
+
+        for _ in range(ModuleCtx.Max_Failures):
+            self.assertEqual(self._get('unavailable').status_code, 503)
+
+        # A trial call that is interrupted by its caller says nothing about the remote end so it is not a failure ..
+        sleep(ModuleCtx.Open_Time)
+
+        with self.assertRaises(Timeout):
+            with Timeout(ModuleCtx.Timeout / 4):
+                self._get('slow')
+
+        self.assertEqual(breaker.state, State.HalfOpen)
+        self.assertEqual(breaker.failures, ModuleCtx.Max_Failures)
+
+        # .. but, because it never reported back, another one is let through only after a while.
+        with self.assertRaises(CircuitOpen):
+            self._get('ok')
+
+        sleep(ModuleCtx.Open_Time)
+        self.assertEqual(self._get('ok').data, {'name': 'ok'})
+        self.assertEqual(breaker.state, State.Closed)
+
+# ################################################################################################################################
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
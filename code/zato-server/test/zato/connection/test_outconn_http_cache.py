@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# Must come first
+from gevent.monkey import patch_all
+_ = patch_all()
+
+# stdlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import main, TestCase
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# requests
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+# Zato
+from zato.common.api import DATA_FORMAT, URL_TYPE
+from zato.server.connection.http_soap.outgoing import HTTPSOAPWrapper
+from zato.server.connection.http_soap.response_cache import ResponseCache
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+    Concurrency = 50
+    Response_Delay = 0.1
+    Max_Size = 1000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *ignored_args):
+        pass
+
+    def _send(self, status, headers, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        _ = self.wfile.write(body)
+
+    def do_GET(self):
+
+        self.server.hits += 1
+        name = self.path.strip('/')
+        body = b'{"name": "%s", "hits": %d}' % (name.encode('utf8'), self.server.hits)
+
+        # Fresh for a minute ..
+        if name.startswith('fresh'):
+            sleep(ModuleCtx.Response_Delay)
+            self._send(200, {'Cache-Control': 'max-age=60', 'ETag': '"v1"'}, body)
+
+        # .. needs to be revalidated each time ..
+        elif name == 'revalidate':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.server.not_modified += 1
+                self._send(304, {'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+            else:
+                self._send(200, {'Cache-Control': 'no-cache', 'ETag': '"v1"'}, body)
+
+        # .. or cannot be stored at all.
+        else:
+            self._send(200, {'Cache-Control': 'no-store'}, body)
+
+    def do_POST(self):
+        self.server.hits += 1
+        self._send(200, {}, b'{}')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class OutgoingHTTPCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RequestHandler)
+        self.server.daemon_threads = True
+        self.server.hits = 0
+        self.server.not_modified = 0
+
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.wrapper = HTTPSOAPWrapper(None, {
+            'name': 'my.conn',
+            'is_active': True,
+            'address_host': 'http://127.0.0.1:{}'.format(self.server.server_address[1]),
+            'address_url_path': '/{name}',
+            'transport': URL_TYPE.PLAIN_HTTP,
+            'data_format': DATA_FORMAT.JSON,
+            'content_type': None,
+            'sec_type': None,
+            'security_name': None,
+            'username': None,
+            'password': None,
+            'timeout': 5,
+            'response_cache_max_size': ModuleCtx.Max_Size,
+        })
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ################################################################################################################################
+
+    def _get(self, name, **kwargs):
+        return self.wrapper.get('my.cid', {'name': name}, **kwargs).data
+
+# ################################################################################################################################
+
+    def test_max_age_single_flight(self):
+
+        # Concurrent requests for the same resource result in a single call to the remote end ..
+        greenlets = [spawn(self._get, 'fresh') for _ in range(ModuleCtx.Concurrency)]
+        _ = joinall(greenlets, raise_error=True)
+
+        self.assertEqual(self.server.hits, 1)
+
+        for greenlet in greenlets:
+            self.assertEqual(greenlet.value, {'name': 'fresh', 'hits': 1})
+
+        # .. and, while the response is fresh, later ones do not invoke it at all.
+        for _ in range(ModuleCtx.Concurrency):
+            self.assertEqual(self._get('fresh'), {'name': 'fresh', 'hits': 1})
+
+        self.assertEqual(self.server.hits, 1)
+        self.assertEqual(self.wrapper.response_cache.misses, 1)
+
+        # Headers are part of the key
+        self.assertEqual(self._get('fresh', headers={'Accept': 'application/json'}), {'name': 'fresh', 'hits': 2})
+
+        # Requests that may modify a resource invalidate what was cached for it
+        _ = self.wrapper.post('my.cid', '{}', {'name': 'fresh'})
+        self.assertEqual(self._get('fresh'), {'name': 'fresh', 'hits': 4})
+
+# ################################################################################################################################
+
+    def test_revalidate(self):
+
+        for _ in range(5):
+            self.assertEqual(self._get('revalidate'), {'name': 'revalidate', 'hits': 1})
+
+        # Each request reached the remote end but only the first one received the full response
+        self.assertEqual(self.server.hits, 5)
+        self.assertEqual(self.server.not_modified, 4)
+        self.assertEqual(self.wrapper.response_cache.revalidated, 4)
+
+# ################################################################################################################################
+
+    def test_no_store(self):
+
+        for idx in range(3):
+            self.assertEqual(self._get('no-store'), {'name': 'no-store', 'hits': idx + 1})
+
+        self.assertEqual(len(self.wrapper.response_cache.entries), 0)
+
+# ################################################################################################################################
+
+    def test_max_size(self):
+
+        for idx in range(10):
+            _ = self._get('fresh-{}'.format(idx))
+
+        response_cache = self.wrapper.response_cache
+
+        # Only the most recently used responses are kept ..
+        self.assertLessEqual(response_cache.size, ModuleCtx.Max_Size)
+        self.assertLess(len(response_cache.entries), 10)
+
+        # .. so older ones need to be obtained again.
+        hits = self.server.hits
+        _ = self._get('fresh-9')
+        self.assertEqual(self.server.hits, hits)
+
+        _ = self._get('fresh-0')
+        self.assertEqual(self.server.hits, hits + 1)
+
+    def _get_response(self, status_code, body=b'', delay=0):
+
+        def invoke_func(_ignored_headers):
+            sleep(delay)
+
+            response = Response()
+            response.status_code = status_code
+            response.headers = CaseInsensitiveDict({'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+            response._content = body
+
+            return response
+
+        return invoke_func
+
+# ################################################################################################################################
+
+    def test_leader_interrupted(self):
+
+        response_cache = ResponseCache(ModuleCtx.Max_Size)
+        key = response_cache.get_key('/my/address', {}, {})
+
+        leader = spawn(response_cache.invoke, key, self._get_response(200, b'abc', delay=1))
+        follower = spawn(response_cache.invoke, key, self._get_response(200, b'def'))
+        sleep(0.01)
+
+        # The caller that invokes the remote end is killed ..
+        leader.kill()
+
+        # .. and the other ones learn about it instead of waiting forever.
+        _ = joinall([follower])
+
+        self.assertIsInstance(follower.exception, Exception)
+        self.assertIn('GreenletExit', str(follower.exception))
+        self.assertDictEqual(response_cache.in_flight, {})
+
+# ################################################################################################################################
+
+    def test_follower_timeout(self):
+
+        response_cache = ResponseCache(ModuleCtx.Max_Size)
+        key = response_cache.get_key('/my/address', {}, {})
+
+        leader = spawn(response_cache.invoke, key, self._get_response(200, b'abc', delay=1))
+        sleep(0.01)
+
+        # Callers do not wait for others longer than they are told to ..
+        response = response_cache.invoke(key, self._get_response(200, b'def'), timeout=0.05)
+        self.assertEqual(response.content, b'def')
+
+        # .. and the one that was the first to ask still receives its own response.
+        self.assertEqual(leader.get().content, b'abc')
+
+# ################################################################################################################################
+
+    def test_revalidate_evicted(self):
+
+        response_cache = ResponseCache(ModuleCtx.Max_Size)
+        key = response_cache.get_key('/my/address', {}, {})
+
+        _ = response_cache.invoke(key, self._get_response(200, b'abc'))
+        entry = response_cache.entries[key]
+
+        # The response is evicted while it is being revalidated ..
+        def invoke_func(headers):
+            response_cache.clear()
+            return self._get_response(304)(headers)
+
+        response = response_cache.invoke(key, invoke_func)
+        self.assertEqual(response.content, b'abc')
+
+        # .. which is why it is stored again, as a new entry, leaving the previous one as it was.
+        self.assertIn(key, response_cache.entries)
+        self.assertIsNot(response_cache.entries[key], entry)
+        self.assertEqual(response_cache.size, entry.size)
+
+# ################################################################################################################################
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
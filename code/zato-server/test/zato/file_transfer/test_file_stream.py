@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from csv import reader as csv_reader
+from tempfile import TemporaryDirectory
+from tracemalloc import get_traced_memory, start as tracemalloc_start, stop as tracemalloc_stop
+from unittest import main, TestCase
+
+# Zato
+from zato.server.file_transfer.snapshot import FileStream
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ModuleCtx:
+    Chunk_Size = 1000
+    Large_File_Size = 50_000_000
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FileStreamTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'my.csv')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, data):
+        with open(self.path, 'wb') as f:
+            _ = f.write(data)
+
+    def _get_stream(self, is_line_by_line=False):
+        return FileStream.from_path(self.path, ModuleCtx.Chunk_Size, 'utf8', is_line_by_line)
+
+# ################################################################################################################################
+
+    def test_iter_bytes(self):
+
+        data = os.urandom(ModuleCtx.Chunk_Size * 3 + 123)
+        self._write(data)
+
+        stream = self._get_stream()
+        chunks = list(stream)
+
+        self.assertEqual(stream.size, len(data))
+        self.assertEqual([len(chunk) for chunk in chunks], [ModuleCtx.Chunk_Size] * 3 + [123])
+        self.assertEqual(b''.join(chunks), data)
+
+        # Each iteration starts from the beginning ..
+        self.assertEqual(b''.join(stream.iter_bytes()), data)
+
+        # .. and the file can be still read after it has been deleted.
+        os.remove(self.path)
+        self.assertEqual(b''.join(stream.iter_bytes()), data)
+
+        stream.close()
+
+# ################################################################################################################################
+
+    def test_iter_lines(self):
+
+        # Lines of different lengths, some of which span chunk boundaries, with multi-byte characters and Windows line endings
+        lines = ['{},zażółć,{}\r\n'.format(idx, 'a' * (idx % 777)) for idx in range(100)]
+        self._write(''.join(lines).encode('utf8'))
+
+        stream = self._get_stream(True)
+        self.assertEqual(list(stream), lines)
+
+        # Such a stream can be parsed as CSV
+        rows = list(csv_reader(stream.iter_lines()))
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[10], ['10', 'zażółć', 'a' * 10])
+
+        stream.close()
+
+# ################################################################################################################################
+
+    def test_memory_constant(self):
+
+        with open(self.path, 'wb') as f:
+            chunk = b'a' * 999 + b'\n'
+            for _ in range(ModuleCtx.Large_File_Size // len(chunk)):
+                _ = f.write(chunk)
+
+        stream = self._get_stream()
+        tracemalloc_start()
+
+        try:
+            total = 0
+            for chunk in stream:
+                total += len(chunk)
+
+            lines = 0
+            for _ in stream.iter_lines():
+                lines += 1
+
+            _, peak = get_traced_memory()
+
+        finally:
+            tracemalloc_stop()
+            stream.close()
+
+        self.assertEqual(total, ModuleCtx.Large_File_Size)
+        self.assertEqual(lines, ModuleCtx.Large_File_Size // 1000)
+
+        # Only a few chunks at a time were ever kept in memory
+        self.assertLess(peak, 100_000)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import TemporaryDirectory
+from time import time
+from unittest import main, TestCase
+from unittest.mock import patch
+
+# Zato
+from zato.server.file_transfer.snapshot import DirSnapshotDiff, LocalSnapshotMaker
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Server:
+    odb = None
+
+class _FileTransferAPI:
+    server = _Server()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class LocalSnapshotMakerTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+        for dir_name in ('a', 'b', os.path.join('b', 'c')):
+            os.mkdir(self._get_path(dir_name))
+
+        for file_name in ('1.txt', os.path.join('a', '2.txt'), os.path.join('b', 'c', '3.txt')):
+            self._write(file_name, 'abc')
+
+        self._set_old_mtimes()
+
+        self.snapshot_maker = LocalSnapshotMaker(_FileTransferAPI(), None)
+        self.snapshot = self.snapshot_maker.get_snapshot(self.path)
+        self.dir_index = self.snapshot_maker.dir_index[self.path]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+# ################################################################################################################################
+
+    def _get_path(self, name):
+        return os.path.join(self.path, name)
+
+    def _write(self, name, data):
+        with open(self._get_path(name), 'w') as f:
+            _ = f.write(data)
+
+    def _set_old_mtimes(self):
+
+        # Directories modified long enough ago are not listed again unless they change
+        old_time = time() - 3600
+
+        for dir_path, dir_names, file_names in os.walk(self.path):
+            for name in dir_names + file_names:
+                os.utime(os.path.join(dir_path, name), (old_time, old_time))
+            os.utime(dir_path, (old_time, old_time))
+
+    def _get_diff(self):
+        snapshot = self.snapshot_maker.get_snapshot(self.path)
+        diff = DirSnapshotDiff(self.snapshot, snapshot)
+        self.snapshot = snapshot
+        return diff
+
+# ################################################################################################################################
+
+    def test_no_changes(self):
+
+        dir_state = dict(self.dir_index.dir_state)
+        diff = self._get_diff()
+
+        self.assertEqual(diff.files_created, set())
+        self.assertEqual(diff.files_modified, set())
+
+        # No directory had to be listed again
+        for dir_path, state in self.dir_index.dir_state.items():
+            self.assertIs(state, dir_state[dir_path])
+
+        self.assertEqual(sorted(self.snapshot.file_data), sorted(self._get_path(name) for name in (
+            '1.txt', 'a', os.path.join('a', '2.txt'), 'b', os.path.join('b', 'c'), os.path.join('b', 'c', '3.txt'))))
+
+# ################################################################################################################################
+
+    def test_created(self):
+
+        dir_state = dict(self.dir_index.dir_state)
+        self._write(os.path.join('b', 'c', '4.txt'), 'abc')
+
+        diff = self._get_diff()
+
+        # The new file is found and its directory is reported as modified ..
+        self.assertEqual(diff.files_created, {self._get_path(os.path.join('b', 'c', '4.txt'))})
+        self.assertEqual(diff.files_modified, {self._get_path(os.path.join('b', 'c'))})
+
+        # .. while only that directory had to be listed again.
+        for dir_path, state in self.dir_index.dir_state.items():
+            if dir_path == self._get_path(os.path.join('b', 'c')):
+                self.assertIsNot(state, dir_state[dir_path])
+            else:
+                self.assertIs(state, dir_state[dir_path])
+
+# ################################################################################################################################
+
+    def test_modified_in_place(self):
+
+        dir_state = dict(self.dir_index.dir_state)
+        self._write(os.path.join('a', '2.txt'), 'abcdef')
+
+        # Files modified in place are noticed by the very next snapshot ..
+        diff = self._get_diff()
+        self.assertEqual(diff.files_created, set())
+        self.assertEqual(diff.files_modified, {self._get_path(os.path.join('a', '2.txt'))})
+
+        # .. even though their directories were not listed again.
+        for dir_path, state in self.dir_index.dir_state.items():
+            self.assertIs(state, dir_state[dir_path])
+
+# ################################################################################################################################
+
+    def test_deleted(self):
+
+        rmtree(self._get_path('b'))
+
+        diff = self._get_diff()
+
+        self.assertEqual(diff.files_created, set())
+        self.assertEqual(diff.files_modified, set())
+        self.assertEqual(sorted(self.snapshot.file_data), sorted(self._get_path(name) for name in (
+            '1.txt', 'a', os.path.join('a', '2.txt'))))
+
+        # If it is created again, it is reported as new
+        os.mkdir(self._get_path('b'))
+        self._write(os.path.join('b', '5.txt'), 'abc')
+
+        diff = self._get_diff()
+        self.assertEqual(diff.files_created, {self._get_path('b'), self._get_path(os.path.join('b', '5.txt'))})
+
+# ################################################################################################################################
+
+    def test_full_diff(self):
+
+        previous = self.snapshot
+        self._write(os.path.join('a', '6.txt'), 'abc')
+
+        # This snapshot is not used to compute the diff below ..
+        _ = self.snapshot_maker.get_snapshot(self.path)
+        self._write(os.path.join('a', '7.txt'), 'abc')
+
+        # .. which is why the snapshots are compared in full.
+        diff = DirSnapshotDiff(previous, self.snapshot_maker.get_snapshot(self.path))
+        self.assertEqual(diff.files_created, {self._get_path(os.path.join('a', name)) for name in ('6.txt', '7.txt')})
+
+    def _patch_scandir(self, name, exception_class):
+
+        scandir = os.scandir
+        failing_path = self._get_path(name)
+
+        def _scandir(path):
+            if path == failing_path:
+                raise exception_class(path)
+            return scandir(path)
+
+        return patch('zato.server.file_transfer.snapshot.os.scandir', _scandir)
+
+# ################################################################################################################################
+
+    def test_dir_not_accessible(self):
+
+        self._write(os.path.join('a', '6.txt'), 'abc')
+        self._write(os.path.join('b', 'c', '4.txt'), 'abc')
+
+        # A directory that cannot be listed does not stop others from being scanned ..
+        with self._patch_scandir(os.path.join('b', 'c'), PermissionError):
+            diff = self._get_diff()
+
+        self.assertEqual(diff.files_created, {self._get_path(os.path.join('a', '6.txt'))})
+
+        # .. and what it contained is not reported as deleted ..
+        self.assertIn(self._get_path(os.path.join('b', 'c', '3.txt')), self.snapshot.file_data)
+
+        # .. while its contents are checked again once it can be listed.
+        diff = self._get_diff()
+        self.assertEqual(diff.files_created, {self._get_path(os.path.join('b', 'c', '4.txt'))})
+
+# ################################################################################################################################
+
+    def test_failed_scan_not_committed(self):
+
+        file_data = dict(self.dir_index.file_data)
+        dir_state = dict(self.dir_index.dir_state)
+
+        self._write(os.path.join('a', '6.txt'), 'abc')
+        self._write(os.path.join('b', 'c', '4.txt'), 'abc')
+
+        # A scan that fails for reasons other than file system errors ..
+        with self._patch_scandir(os.path.join('b', 'c'), ValueError):
+            with self.assertRaises(ValueError):
+                _ = self.snapshot_maker.get_snapshot(self.path)
+
+        # .. does not change the index at all ..
+        self.assertDictEqual(self.dir_index.file_data, file_data)
+        self.assertDictEqual(self.dir_index.dir_state, dir_state)
+
+        # .. which is why the next one finds all the changes.
+        diff = self._get_diff()
+        self.assertEqual(diff.files_created, {
+            self._get_path(os.path.join('a', '6.txt')),
+            self._get_path(os.path.join('b', 'c', '4.txt')),
+        })
+
+# ################################################################################################################################
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
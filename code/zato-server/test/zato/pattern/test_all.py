@@ -13,15 +13,15 @@ from unittest import main, TestCase
 from faker import Faker
 
 # gevent
-from gevent import sleep
+from gevent import sleep, spawn_later
 from gevent.lock import RLock
 
 # Zato
 from zato.common import CHANNEL
 from zato.common.ext.dataclasses import dataclass
 from zato.common.util import spawn_greenlet
-from zato.server.pattern.api import ParallelExec
-from zato.server.pattern.base import ParallelBase
+from zato.server.pattern.api import FanOut, ParallelExec, ScatterGather
+from zato.server.pattern.base import _deadlines, ParallelBase
 from zato.server.pattern.model import ParallelCtx
 from zato.server.service import PatternsFacade
 
@@ -75,6 +75,50 @@ class FakeService:
 # ################################################################################################################################
 # ################################################################################################################################
 
+class RecordingService(FakeService):
+    """ Records all the invocations made and lets only the selected targets complete, each after a delay.
+    """
+    def __init__(self, cache, lock, response_payload, invoked, in_flight, completing=None, delay=0.01):
+        # type: (dict, RLock, str, list, list, list, float) -> None
+        super().__init__(cache, lock, response_payload)
+        self.invoked = invoked
+        self.in_flight = in_flight
+        self.completing = completing
+        self.delay = delay
+
+    def _complete(self, func, invoked_service):
+        self.in_flight.remove(invoked_service.name)
+        func(invoked_service, self.response_payload, None)
+
+    def invoke(self, target_name, payload):
+        sleep(payload['delay'])
+        return payload
+
+    def invoke_async(self, target_name, payload, channel, cid):
+
+        self.invoked.append((target_name, channel, payload))
+
+        if channel in _pattern_call_channels:
+
+            self.in_flight.append(target_name)
+
+            if self.completing is None or target_name in self.completing:
+
+                invoked_service = RecordingService(
+                    self.cache, self.lock, self.response_payload, self.invoked, self.in_flight, self.completing, self.delay)
+                invoked_service.name = target_name
+                invoked_service.cid = cid
+
+                if channel == _fanout_call:
+                    func = self.patterns.fanout.on_call_finished
+                else:
+                    func = self.patterns.parallel.on_call_finished
+
+                _ = spawn_later(self.delay, self._complete, func, invoked_service)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 @dataclass(init=False)
 class ParamsCtx:
     cid: object
@@ -323,6 +367,171 @@ class ParallelExecTestCase(BaseTestCase):
 # ################################################################################################################################
 # ################################################################################################################################
 
+class DeadlineTestCase(BaseTestCase):
+
+    def test_fanout_timeout_partial_results(self):
+
+        cache = {}
+        lock = RLock()
+        invoked = []
+        in_flight = []
+        params_ctx = self.get_default_params(cache, lock)
+
+        # Only the first target will ever complete
+        source = RecordingService(cache, lock, 'my.payload', invoked, in_flight, completing=[params_ctx.service_name1])
+        source.cid = params_ctx.cid
+        source.name = params_ctx.source_name
+
+        api = FanOut(source, cache, lock)
+        api.invoke(params_ctx.targets, params_ctx.on_final1, timeout=0.05)
+
+        # Give the test enough time to run
+        sleep(0.1)
+
+        on_final = [item for item in invoked if item[1] == CHANNEL.FANOUT_ON_FINAL]
+        self.assertEqual(len(on_final), 1)
+
+        name, _, message = on_final[0]
+        self.assertEqual(name, params_ctx.on_final1)
+        self.assertTrue(message['timed_out'])
+        self.assertListEqual(message['missing_targets'], [params_ctx.service_name2])
+        self.assertEqual(len(message['data']), 1)
+        self.assertEqual(message['data'][0]['target'], params_ctx.service_name1)
+
+        # The entry must have been evicted
+        self.assertDictEqual(cache, {})
+
+# ################################################################################################################################
+
+    def test_fanout_no_timeout_when_all_complete(self):
+
+        cache = {}
+        lock = RLock()
+        invoked = []
+        in_flight = []
+        params_ctx = self.get_default_params(cache, lock)
+
+        source = RecordingService(cache, lock, 'my.payload', invoked, in_flight)
+        source.cid = params_ctx.cid
+        source.name = params_ctx.source_name
+
+        api = FanOut(source, cache, lock)
+        api.invoke(params_ctx.targets, params_ctx.on_final1, timeout=0.05)
+
+        # Give the test enough time to run, including the time after the deadline
+        sleep(0.1)
+
+        on_final = [item for item in invoked if item[1] == CHANNEL.FANOUT_ON_FINAL]
+        self.assertEqual(len(on_final), 1)
+
+        message = on_final[0][2]
+        self.assertFalse(message['timed_out'])
+        self.assertListEqual(message['missing_targets'], [])
+        self.assertEqual(len(message['data']), 2)
+        self.assertDictEqual(cache, {})
+
+# ################################################################################################################################
+
+    def test_parallel_exec_max_concurrency(self):
+
+        cache = {}
+        lock = RLock()
+        invoked = []
+        in_flight = []
+        max_in_flight = []
+        params_ctx = self.get_default_params(cache, lock)
+
+        targets = {'my.service.{}'.format(idx): {'idx': idx} for idx in range(10)}
+
+        source = RecordingService(cache, lock, 'my.payload', invoked, in_flight)
+        source.cid = params_ctx.cid
+        source.name = params_ctx.source_name
+
+        api = ParallelExec(source, cache, lock)
+        api.invoke(targets, params_ctx.on_target1, max_concurrency=3)
+
+        for _ in range(20):
+            max_in_flight.append(len(in_flight))
+            sleep(0.005)
+
+        calls = [item for item in invoked if item[1] == CHANNEL.PARALLEL_EXEC_CALL]
+
+        self.assertEqual(max(max_in_flight), 3)
+        self.assertListEqual(sorted(item[0] for item in calls), sorted(targets))
+        self.assertDictEqual(cache, {})
+
+# ################################################################################################################################
+
+    def test_deadlines_shared(self):
+
+        cache = {}
+        lock = RLock()
+        invoked = []
+        in_flight = []
+        params_ctx = self.get_default_params(cache, lock)
+
+        source = RecordingService(cache, lock, 'my.payload', invoked, in_flight, delay=0)
+        source.name = params_ctx.source_name
+
+        api = FanOut(source, cache, lock)
+
+        # Each invocation has its own deadline ..
+        for idx in range(5):
+            source.cid = 'cid.{}'.format(idx)
+            api.cid = source.cid
+            api.invoke(params_ctx.targets, params_ctx.on_final1, timeout=10)
+
+        sleep(0.05)
+
+        # .. all of them are served by the same greenlet ..
+        greenlet = _deadlines.greenlet
+        self.assertIsNotNone(greenlet)
+        self.assertFalse(greenlet.dead)
+
+        # .. and once the targets complete, their deadlines are cancelled.
+        on_final = [item for item in invoked if item[1] == CHANNEL.FANOUT_ON_FINAL]
+        self.assertEqual(len(on_final), 5)
+        self.assertFalse([deadline for deadline in _deadlines.heap.entries if deadline.args[0].startswith('cid.')])
+        self.assertDictEqual(cache, {})
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ScatterGatherTestCase(BaseTestCase):
+
+    def test_scatter_gather(self):
+
+        cache = {}
+        lock = RLock()
+        params_ctx = self.get_default_params(cache, lock)
+
+        source = RecordingService(cache, lock, 'my.payload', [], [])
+        source.cid = params_ctx.cid
+        source.name = params_ctx.source_name
+
+        targets = {
+            'my.service.1': {'delay': 0.01},
+            'my.service.2': {'delay': 1},
+        }
+
+        api = ScatterGather(source)
+        response = api.invoke(targets, timeout=0.1)
+
+        self.assertEqual(len(response), 2)
+
+        self.assertEqual(response[0]['target'], 'my.service.1')
+        self.assertDictEqual(response[0]['response'], {'delay': 0.01})
+        self.assertTrue(response[0]['ok'])
+        self.assertFalse(response[0]['timed_out'])
+
+        self.assertEqual(response[1]['target'], 'my.service.2')
+        self.assertIsNone(response[1]['response'])
+        self.assertFalse(response[1]['ok'])
+        self.assertTrue(response[1]['timed_out'])
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 if __name__ == '__main__':
     _ = main()
 
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from time import perf_counter
+from unittest import main, TestCase
+
+# gevent
+from gevent import sleep, spawn
+
+# Zato
+from zato.server.pubsub.sync import InRAMSync, ModuleCtx
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if 0:
+    from zato.common.typing_ import any_, anydict, dictlist
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+# Expiration times in tests are relative to that, so that no message expires on its own, in the real time
+base_time = 10 ** 13
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Endpoint:
+    name = 'my.endpoint'
+
+class _Server:
+    name = 'my.server'
+    pid = 123
+
+class _PubSub:
+    server = _Server()
+    data_prefix_len = 100
+    data_prefix_short_len = 10
+
+    def get_endpoint_by_id(self, endpoint_id:'int') -> '_Endpoint':
+        return _Endpoint()
+
+    def get_topic_by_id(self, topic_id:'int') -> '_Endpoint':
+        return _Endpoint()
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class InRAMSyncTestCase(TestCase):
+
+    def setUp(self):
+        self.sync = InRAMSync(_PubSub()) # type: ignore
+
+    def _get_msg(self, msg_id:'str', expiration_time:'int', topic_id:'int'=1) -> 'anydict':
+        return {
+            'pub_msg_id': msg_id,
+            'pub_time': '1.0',
+            'expiration': 1000,
+            'expiration_time': base_time + expiration_time,
+            'published_by_id': 1,
+            'topic_id': topic_id,
+            'topic_name': '/my/topic/{}'.format(topic_id),
+            'data': 'my.data',
+        }
+
+    def _add(self, messages:'dictlist', sub_keys:'any_'=('sk.1', 'sk.2'), topic_id:'int'=1) -> 'None':
+        self.sync.add_messages('my.cid', topic_id, '/my/topic/{}'.format(topic_id), 10_000_000, list(sub_keys), messages)
+
+    def _delete_expired(self, now:'int') -> 'int':
+        return self.sync.delete_expired(base_time + now)
+
+    def _assert_not_found(self, msg_id:'str') -> 'None':
+        self.assertNotIn(msg_id, self.sync.msg_id_to_topic_id)
+
+        for topic in self.sync.topics.values():
+            self.assertNotIn(msg_id, topic.msg_id_to_msg)
+            self.assertNotIn(msg_id, topic.msg_id_to_sub_key)
+            self.assertNotIn(msg_id, topic.expiry_index)
+
+            for msg_id_set in topic.sub_key_to_msg_id.values():
+                self.assertNotIn(msg_id, msg_id_set)
+
+# ################################################################################################################################
+
+    def test_delete_expired(self):
+
+        # Messages expiring at different times, in two topics ..
+        self._add([self._get_msg('a.{}'.format(idx), 100 + idx) for idx in range(10)])
+        self._add([self._get_msg('b.{}'.format(idx), 200 + idx, 2) for idx in range(10)], ['sk.3'], 2)
+
+        # .. only the ones that already expired are deleted ..
+        self.assertEqual(self._delete_expired(104), 5)
+        self.assertEqual(self._delete_expired(104), 0)
+
+        for idx in range(5):
+            self._assert_not_found('a.{}'.format(idx))
+
+        # .. and the rest is intact.
+        self.assertEqual(self.sync.get_topic_depth(1), 5)
+        self.assertEqual(self.sync.get_topic_depth(2), 10)
+        self.assertEqual(len(self.sync.topics[1].sub_key_to_msg_id['sk.1']), 5)
+        self.assertEqual(len(self.sync.topics[2].sub_key_to_msg_id['sk.3']), 10)
+
+        self.assertEqual(self._delete_expired(1000), 15)
+        self.assertEqual(len(self.sync.msg_id_to_topic_id), 0)
+
+        for topic in self.sync.topics.values():
+            self.assertEqual(topic.depth, 0)
+            self.assertEqual(len(topic.expiry_index), 0)
+
+# ################################################################################################################################
+
+    def test_delete_retrieve_update(self):
+
+        self._add([self._get_msg('a.{}'.format(idx), 100) for idx in range(5)])
+
+        # Messages deleted explicitly ..
+        self.sync.delete_msg_by_id('a.0')
+        self._assert_not_found('a.0')
+
+        # .. or retrieved by subscribers are deleted from all the look-up structures ..
+        self._add([self._get_msg('b.1', 100)], ['sk.3'])
+        out = self.sync.retrieve_messages_by_sub_keys(1, ['sk.3'])
+        self.assertListEqual([msg['pub_msg_id'] for msg in out], ['b.1'])
+        self._assert_not_found('b.1')
+
+        # .. messages can have their expiration time changed ..
+        msg = dict(self.sync.get_message_by_id('a.1'))
+        msg.update(msg_id='a.1', expiration_time=base_time + 500, size=7, pub_correl_id=None, in_reply_to=None, mime_type=None)
+        self.assertTrue(self.sync.update_msg(msg))
+
+        # .. and none of it is taken into account when they expire.
+        self.assertEqual(self._delete_expired(100), 3)
+        self.assertEqual(self._delete_expired(500), 1)
+        self._assert_not_found('a.1')
+
+# ################################################################################################################################
+
+    def test_expiry_index_compact(self):
+
+        count = ModuleCtx.Expiry_Min_Compact_Size * 2
+        self._add([self._get_msg('a.{}'.format(idx), 100) for idx in range(count)], ['sk.1'])
+
+        # Retrieving all the messages does not leave them in the heap forever
+        _ = self.sync.retrieve_messages_by_sub_keys(1, ['sk.1'])
+
+        self.assertEqual(len(self.sync.topics[1].expiry_index), 0)
+        self.assertLessEqual(len(self.sync.topics[1].expiry_index.heap), ModuleCtx.Expiry_Min_Compact_Size)
+
+# ################################################################################################################################
+
+    def test_publish_latency_while_expiring(self):
+
+        count = 100_000
+        latency = []
+
+        # Messages that are about to expire ..
+        self._add([self._get_msg('a.{}'.format(idx), 100) for idx in range(count)])
+
+        # .. a publisher keeps publishing while they are being deleted ..
+        def publish():
+            idx = 0
+            while not is_done:
+                idx += 1
+                start = perf_counter()
+                self._add([self._get_msg('b.{}'.format(idx), 10_000)])
+                latency.append(perf_counter() - start)
+                sleep(0)
+
+        is_done = False
+        publisher = spawn(publish)
+        sleep(0)
+
+        start = perf_counter()
+        len_expired = self._delete_expired(100)
+        total_time = perf_counter() - start
+
+        is_done = True
+        publisher.join()
+
+        # .. all of the messages expired ..
+        self.assertEqual(len_expired, count)
+
+        # .. and the publisher did not have to wait until all of them were deleted, only for one batch at most.
+        self.assertGreater(len(latency), count // ModuleCtx.Cleanup_Batch_Size)
+        self.assertLess(max(latency), total_time / 4)
+
+# ################################################################################################################################
+
+    def test_topics_independent(self):
+
+        self._add([self._get_msg('a.{}'.format(idx), 100) for idx in range(3)], ['sk.1'], 1)
+        self._add([self._get_msg('b.{}'.format(idx), 100, 2) for idx in range(5)], ['sk.2'], 2)
+
+        # Each topic knows its own depth ..
+        self.assertEqual(self.sync.get_topic_depth(1), 3)
+        self.assertEqual(self.sync.get_topic_depth(2), 5)
+        self.assertEqual(self.sync.get_topic_depth(3), 0)
+
+        self.assertTrue(self.sync.has_messages_by_sub_key('sk.1'))
+        self.assertFalse(self.sync.has_messages_by_sub_key('sk.3'))
+
+        # .. one of them is busy ..
+        def hold_lock():
+            with self.sync.topics[1].lock:
+                sleep(0.2)
+
+        holder = spawn(hold_lock)
+        sleep(0)
+
+        # .. yet the other one can be published to and consumed from in the meantime.
+        start = perf_counter()
+
+        self._add([self._get_msg('b.5', 100, 2)], ['sk.2'], 2)
+        out = self.sync.retrieve_messages_by_sub_keys(2, ['sk.2'])
+
+        self.assertLess(perf_counter() - start, 0.1)
+        self.assertEqual(len(out), 6)
+        self.assertEqual(self.sync.get_topic_depth(2), 0)
+
+        holder.join()
+
+        # Clearing a topic leaves all the other ones intact
+        self._add([self._get_msg('b.6', 100, 2)], ['sk.2'], 2)
+        self.sync.clear_topic(1)
+
+        self.assertEqual(self.sync.get_topic_depth(1), 0)
+        self.assertEqual(self.sync.get_topic_depth(2), 1)
+        self.assertFalse(self.sync.has_messages_by_sub_key('sk.1'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
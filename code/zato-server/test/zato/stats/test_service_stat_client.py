@@ -7,12 +7,13 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from time import perf_counter
 from unittest import main, TestCase
 
 # Zato
 from zato.common.test import rand_int, rand_string
 from zato.common.events.client import Client as EventsClient
-from zato.common.events.common import EventInfo
+from zato.common.events.common import Action, BatchFormat, decode_push_batch, EventInfo
 from zato.server.connection.stats import ServiceStatsClient
 
 # ################################################################################################################################
@@ -66,6 +67,25 @@ class TestImplClass(EventsClient):
 # ################################################################################################################################
 # ################################################################################################################################
 
+class BatchImplClass(EventsClient):
+    def __init__(self, host, port):
+        # type: (str, int) -> None
+        super().__init__(host, port)
+
+        self.is_connected = True
+        self.sent = []
+
+        # Batches will be flushed explicitly
+        self.flush_greenlet = True
+
+# ################################################################################################################################
+
+    def send(self, action, data=b'', suffix=b'\n'):
+        self.sent.append((action, data, suffix))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 class ServiceStatsClientTestCase(TestCase):
 
 # ################################################################################################################################
@@ -305,6 +325,82 @@ class ServiceStatsClientTestCase(TestCase):
         self.assertEqual(len(stats_client.backlog), 0)
         self.assertEqual(stats_client.impl.push_counter, 2)
 
+# ################################################################################################################################
+
+    def test_push_backlog_linear(self):
+
+        def _get_flush_time(count):
+
+            # Events are enqueued before there is a backend to push them to ..
+            stats_client = ServiceStatsClient(impl_class=TestImplClass)
+
+            for idx in range(count):
+                stats_client.push(rand_string(), None, 'my.service', True, idx)
+
+            self.assertEqual(len(stats_client.backlog), count)
+
+            # .. and pushed once it is available.
+            stats_client.init(rand_string(), rand_int())
+
+            start = perf_counter()
+            stats_client._push_backlog()
+            flush_time = perf_counter() - start
+
+            self.assertEqual(len(stats_client.backlog), 0)
+            self.assertEqual(stats_client.impl.push_counter, count)
+
+            return flush_time
+
+        small = _get_flush_time(10_000)
+        large = _get_flush_time(100_000)
+
+        # Ten times as many events take roughly ten times as long to push
+        self.assertLess(large, small * 30)
+
+# ################################################################################################################################
+
+    def test_push_batch(self):
+
+        stats_client = ServiceStatsClient(impl_class=BatchImplClass)
+        stats_client.init(rand_string(), rand_int())
+        stats_client.impl.max_batch_events = 10
+
+        for idx in range(25):
+            stats_client.push('cid.{}'.format(idx), 'timestamp.{}'.format(idx), 'my.service', idx % 2 == 0, idx)
+
+        # Full batches are sent immediately ..
+        self.assertEqual(len(stats_client.impl.sent), 2)
+
+        # .. and the remaining ones when they are flushed.
+        self.assertEqual(stats_client.impl.flush(), 5)
+        self.assertEqual(stats_client.impl.flush(), 0)
+        self.assertEqual(len(stats_client.impl.sent), 3)
+
+        events = []
+
+        for action, data, suffix in stats_client.impl.sent:
+
+            self.assertEqual(action, Action.PushBatch)
+            self.assertEqual(suffix, b'')
+
+            size, = BatchFormat.Header.unpack_from(data)
+            data = data[BatchFormat.Header.size:]
+
+            self.assertEqual(size, len(data))
+            events.extend(decode_push_batch(data))
+
+        self.assertEqual(len(events), 25)
+
+        for idx, event in enumerate(events):
+            self.assertEqual(event['cid'], 'cid.{}'.format(idx))
+            self.assertEqual(event['timestamp'], 'timestamp.{}'.format(idx))
+            self.assertEqual(event['object_id'], 'my.service')
+            self.assertEqual(event['total_time_ms'], idx)
+            self.assertEqual(event['object_type'], EventInfo.ObjectType.service)
+            self.assertIsNone(event['source_type'])
+            self.assertEqual(event['event_type'],
+                EventInfo.EventType.service_request if idx % 2 == 0 else EventInfo.EventType.service_response)
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from tempfile import TemporaryDirectory
+from unittest import main, TestCase
+
+# Bunch
+from bunch import Bunch
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.broker.client import BrokerClient
+from zato.common.broker_message import CHANNEL, SERVICE
+from zato.common.odb.api import ODBManager
+from zato.common.odb.model import AWSSecurity, Base, Cluster, NTLM
+from zato.server.base.parallel.config_snapshot import ConfigSnapshot
+from zato.server.config import ConfigDict
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class FakeODB:
+    """ Returns query results the same way that ODBManager does and counts how many times it was invoked.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def get_sec_list(self, cluster_id, needs_columns):
+        self.calls += 1
+        rows = [
+            Bunch({'id': 1, 'name': 'sec.1', 'username': 'user.1', 'cluster_id': cluster_id}),
+            Bunch({'id': 2, 'name': 'sec.2', 'username': 'user.2', 'cluster_id': cluster_id}),
+        ]
+        columns = dict.fromkeys(['id', 'name', 'username', 'cluster_id'])
+        return rows, columns
+
+    def get_empty_list(self, cluster_id, needs_columns):
+        self.calls += 1
+        return None
+
+    def get_channel_list(self, cluster_id):
+        self.calls += 1
+        return [Bunch({'id': 3, 'name': 'channel.1', 'url_path': '/test'})]
+
+class FakeServerRPC:
+    """ Collects all the messages that would be sent to servers.
+    """
+    def __init__(self):
+        self.messages = []
+
+    def invoke_all(self, service, msg, *args, **kwargs):
+        self.messages.append(msg)
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class ConfigSnapshotTestCase(TestCase):
+
+    def _build_snapshot(self, work_dir, odb, deployment_key='deployment.1', change_id='change.1'):
+        snapshot = ConfigSnapshot(work_dir, deployment_key, change_id)
+        snapshot.get_query('sec', odb.get_sec_list, 123, True)
+        snapshot.get_query('empty', odb.get_empty_list, 123, True)
+        snapshot.get_list('channel', odb.get_channel_list, 123)
+        return snapshot
+
+# ################################################################################################################################
+
+    def test_store_and_load(self):
+
+        odb = FakeODB()
+
+        with TemporaryDirectory() as work_dir:
+
+            # The first worker runs all the queries and stores their results ..
+            snapshot = self._build_snapshot(work_dir, odb)
+            snapshot.store()
+            self.assertEqual(odb.calls, 3)
+            self.assertFalse(snapshot.is_loaded)
+
+            # .. and another worker loads them ..
+            snapshot = ConfigSnapshot(work_dir, 'deployment.1', 'change.1')
+            self.assertTrue(snapshot.load())
+            self.assertTrue(snapshot.is_loaded)
+
+            sec = snapshot.get_query('sec', odb.get_sec_list, 123, True)
+            empty = snapshot.get_query('empty', odb.get_empty_list, 123, True)
+            channel = snapshot.get_list('channel', odb.get_channel_list, 123)
+
+            # .. without running any queries.
+            self.assertEqual(odb.calls, 3)
+
+            config_dict = ConfigDict.from_query('sec', sec)
+            self.assertListEqual(sorted(config_dict.keys()), ['sec.1', 'sec.2'])
+            self.assertEqual(config_dict['sec.1']['config']['username'], 'user.1')
+            self.assertEqual(config_dict['sec.2']['config']['cluster_id'], 123)
+
+            self.assertIsNone(empty)
+
+            self.assertEqual(len(channel), 1)
+            self.assertEqual(channel[0].name, 'channel.1')
+            self.assertEqual(channel[0].url_path, '/test')
+
+# ################################################################################################################################
+
+    def test_load_invalid(self):
+
+        odb = FakeODB()
+
+        with TemporaryDirectory() as work_dir:
+
+            # There is no snapshot yet
+            self.assertFalse(ConfigSnapshot(work_dir, 'deployment.1', 'change.1').load())
+
+            snapshot = self._build_snapshot(work_dir, odb)
+            snapshot.store()
+
+            # A different deployment
+            self.assertFalse(ConfigSnapshot(work_dir, 'deployment.2', 'change.1').load())
+
+            # Configuration has changed since the snapshot was built
+            self.assertFalse(ConfigSnapshot(work_dir, 'deployment.1', 'change.2').load())
+
+            # Still valid
+            self.assertTrue(ConfigSnapshot(work_dir, 'deployment.1', 'change.1').load())
+
+            # Deleted explicitly
+            snapshot.invalidate()
+            self.assertFalse(ConfigSnapshot(work_dir, 'deployment.1', 'change.1').load())
+
+            # Invalid contents
+            with open(snapshot.path, 'wb') as f:
+                _ = f.write(b'invalid')
+
+            self.assertFalse(ConfigSnapshot(work_dir, 'deployment.1', 'change.1').load())
+
+# ################################################################################################################################
+
+    def test_real_odb(self):
+
+        with TemporaryDirectory() as work_dir:
+
+            engine = create_engine('sqlite:///{}'.format(os.path.join(work_dir, 'odb.db')))
+            self.addCleanup(engine.dispose)
+
+            Base.metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+
+            cluster = Cluster(None, 'cluster.1', None, 'sqlite', 'localhost', 1, 'user', 'db', None, 'localhost', 1,
+                'localhost', 2, 3)
+            session.add(cluster)
+            session.add(NTLM(None, 'ntlm.1', True, 'user.1', 'password.1', cluster))
+            session.add(NTLM(None, 'ntlm.2', True, 'user.2', 'password.2', cluster))
+            session.add(AWSSecurity(None, 'aws.1', True, 'user.3', 'password.3', cluster))
+            session.commit()
+
+            cluster_id = cluster.id
+            session.close()
+
+            odb = ODBManager()
+            odb.session = sessionmaker(bind=engine)
+
+            # Queries return SQLAlchemy's named tuples, which is what the first worker stores ..
+            snapshot = ConfigSnapshot(work_dir, 'deployment.1', 'change.1')
+            ntlm = snapshot.get_query('ntlm', odb.get_ntlm_list, cluster_id, True)
+            aws = snapshot.get_query('aws', odb.get_aws_security_list, cluster_id, True)
+            snapshot.store()
+
+            expected_ntlm = ConfigDict.from_query('ntlm', ntlm)
+            expected_aws = ConfigDict.from_query('aws', aws)
+
+            # .. and other workers get the same configuration from the snapshot.
+            snapshot = ConfigSnapshot(work_dir, 'deployment.1', 'change.1')
+            self.assertTrue(snapshot.load())
+
+            ntlm = snapshot.get_query('ntlm', odb.get_ntlm_list, cluster_id, True)
+            aws = snapshot.get_query('aws', odb.get_aws_security_list, cluster_id, True)
+
+            for expected, config_dict in ((expected_ntlm, ConfigDict.from_query('ntlm', ntlm)),
+                                          (expected_aws, ConfigDict.from_query('aws', aws))):
+
+                self.assertListEqual(sorted(config_dict.keys()), sorted(expected.keys()))
+
+                for name in expected.keys():
+                    self.assertDictEqual(dict(config_dict[name]['config']), dict(expected[name]['config']))
+
+            self.assertEqual(ConfigDict.from_query('ntlm', ntlm)['ntlm.2']['config']['username'], 'user.2')
+
+# ################################################################################################################################
+
+    def test_on_publish(self):
+
+        published = []
+        server_rpc = FakeServerRPC()
+
+        # Only the process publishing a message learns about it through the callback ..
+        broker_client = BrokerClient(server_rpc=server_rpc, on_publish=published.append)
+        msg = {'action': CHANNEL.HTTP_SOAP_DELETE.value}
+        _ = broker_client._rpc_invoke(msg)
+
+        self.assertListEqual(published, [msg])
+
+        # .. while all the servers, including this one, receive the message itself.
+        self.assertListEqual(server_rpc.messages, [msg])
+
+# ################################################################################################################################
+
+    def test_is_change_action(self):
+
+        self.assertTrue(ConfigSnapshot.is_change_action(CHANNEL.HTTP_SOAP_CREATE_EDIT.value))
+        self.assertTrue(ConfigSnapshot.is_change_action(CHANNEL.HTTP_SOAP_DELETE.value))
+        self.assertFalse(ConfigSnapshot.is_change_action(SERVICE.PUBLISH.value))
+        self.assertFalse(ConfigSnapshot.is_change_action('invalid-action'))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+import os
+from hashlib import sha256
+from tempfile import TemporaryDirectory
+from unittest import main, TestCase
+
+# Zato
+from zato.server.service import deploy_manifest
+from zato.server.service.deploy_manifest import DeployManifest
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class DeployManifestTestCase(TestCase):
+
+    def setUp(self):
+
+        # Count how many times each file was actually read ..
+        self.read_paths = []
+        self._orig_read_source = deploy_manifest._read_source
+
+        def _read_source(path, hash):
+            self.read_paths.append(path)
+            return self._orig_read_source(path, hash)
+
+        # .. which is done by patching the function that reads them.
+        deploy_manifest._read_source = _read_source
+
+    def tearDown(self):
+        deploy_manifest._read_source = self._orig_read_source
+
+# ################################################################################################################################
+
+    def _create_files(self, dir_name, count):
+        out = []
+        for idx in range(count):
+            path = os.path.join(dir_name, 'mod{}.py'.format(idx))
+            with open(path, 'wb') as f:
+                _ = f.write('# Module {}\n'.format(idx).encode('utf8'))
+            out.append(path)
+        return out
+
+# ################################################################################################################################
+
+    def test_prefetch_reads_once(self):
+
+        with TemporaryDirectory() as dir_name:
+
+            path_list = self._create_files(dir_name, 5)
+            manifest = DeployManifest()
+
+            # All the files are read and hashed the first time around ..
+            self.assertEqual(manifest.prefetch(path_list), 5)
+
+            # .. but not again ..
+            self.assertEqual(manifest.prefetch(path_list), 0)
+
+            # .. including when they are accessed individually.
+            for path in path_list:
+                info = manifest.get_source_code_info(path)
+                self.assertEqual(info.hash, sha256(info.source).hexdigest())
+                self.assertEqual(info.len_source, len(info.source))
+                self.assertEqual(info.hash_method, 'SHA-256')
+
+            self.assertEqual(len(self.read_paths), 5)
+
+            # A file that changes needs to be read again
+            with open(path_list[0], 'wb') as f:
+                _ = f.write(b'# Changed\n')
+
+            info = manifest.get_source_code_info(path_list[0])
+            self.assertEqual(info.source, b'# Changed\n')
+            self.assertEqual(info.hash, sha256(b'# Changed\n').hexdigest())
+            self.assertEqual(len(self.read_paths), 6)
+
+# ################################################################################################################################
+
+    def test_other_workers_do_not_read(self):
+
+        with TemporaryDirectory() as dir_name:
+
+            path_list = self._create_files(dir_name, 3)
+
+            # The first worker reads and hashes all the files ..
+            first = DeployManifest()
+            first.set_path(dir_name)
+
+            self.assertEqual(first.prefetch(path_list), 3)
+            first.store()
+
+            # .. while the next one only finds their hashes in the manifest that the first one stored ..
+            other = DeployManifest()
+            other.set_path(dir_name)
+
+            self.assertEqual(other.prefetch(path_list), 0)
+            self.assertEqual(len(self.read_paths), 3)
+
+            for path in path_list:
+                info = other.get_source_code_info(path)
+                self.assertEqual(info.hash, first.get_source_code_info(path).hash)
+                self.assertEqual(info.len_source, os.path.getsize(path))
+
+            # .. and it reads a file only if it actually needs its source.
+            info = other.get_source_code_info(path_list[0])
+            self.assertEqual(info.source, b'# Module 0\n')
+            self.assertEqual(len(self.read_paths), 3)
+
+# ################################################################################################################################
+
+    def test_store_and_load(self):
+
+        with TemporaryDirectory() as dir_name:
+
+            path_list = self._create_files(dir_name, 3)
+
+            manifest = DeployManifest()
+            manifest.set_path(dir_name)
+            _ = manifest.prefetch(path_list)
+            manifest.store()
+
+            # A new process will load the hashes ..
+            manifest = DeployManifest()
+            manifest.set_path(dir_name)
+            self.assertEqual(sorted(manifest.entries), sorted(path_list))
+
+            # .. and use them if the files did not change.
+            orig_sha256 = deploy_manifest.sha256
+            deploy_manifest.sha256 = None
+
+            try:
+                info = manifest.get_source_code_info(path_list[1])
+            finally:
+                deploy_manifest.sha256 = orig_sha256
+
+            self.assertEqual(info.hash, sha256(b'# Module 1\n').hexdigest())
+
+            # Files that no longer exist are not stored
+            os.remove(path_list[2])
+            manifest.has_changes = True
+            manifest.store()
+
+            manifest = DeployManifest()
+            manifest.set_path(dir_name)
+            self.assertEqual(sorted(manifest.entries), sorted(path_list[:2]))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
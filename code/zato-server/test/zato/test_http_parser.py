@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, skipUnless, TestCase
+
+# Zato
+from zato.server.ext.zunicorn.http import head
+from zato.server.ext.zunicorn.http.errors import InvalidHeader, InvalidHeaderName, InvalidHTTPVersion, \
+     InvalidRequestLine, InvalidRequestMethod, InvalidSchemeHeaders, LimitRequestHeaders
+from zato.server.ext.zunicorn.http.message import Request
+from zato.server.ext.zunicorn.http.unreader import IterUnreader
+
+try:
+    from zato.cy import http_parser
+except ImportError:
+    http_parser = None
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Config:
+    is_ssl = False
+    proxy_protocol = False
+    limit_request_line = 4094
+    limit_request_fields = 100
+    limit_request_field_size = 8190
+    forwarded_allow_ips = ['127.0.0.1']
+    secure_scheme_headers = {'X-FORWARDED-PROTO': 'https'}
+
+# ################################################################################################################################
+
+_request = b'POST /api/v1/orders?id=123#top HTTP/1.1\r\n' \
+           b'Host: localhost:17010\r\n' \
+           b'Content-Type: application/json\r\n' \
+           b'X-Long: abc\r\n' \
+           b'  def\r\n' \
+           b'Content-Length: 13\r\n' \
+           b'\r\n' \
+           b'{"id": "123"}'
+
+# Input to both of the parsers, each with what the pure-Python one returns or raises
+_request_lines = [
+    b'GET / HTTP/1.0',
+    b'GET /a/b?c=d HTTP/1.1',
+    b'get / HTTP/1.1',
+    b'GET http://example.com/a HTTP/1.1',
+    b'GE / HTTP/1.1',
+    b'GET / HTTP/1',
+    b'GET / HTTPS/1.1',
+    b'GET /',
+]
+
+_headers = [
+    b'A: b',
+    b'A:b\r\nC :  d  ',
+    b'A: b\r\n\tc\r\n d',
+    b'A b',
+    b'A(: b',
+    b'X-Forwarded-Proto: https',
+    b'X-Forwarded-Proto: https\r\nX-Forwarded-Proto: http',
+    b'\r\n'.join(b'A%d: b' % idx for idx in range(10)),
+    b'A: ' + b'b' * 100,
+]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class HTTPParserTestCase(TestCase):
+
+    def _parse(self, parser, func_name, *args):
+        """ Returns what a parser's function returned, or the class of what it raised.
+        """
+        try:
+            return getattr(parser, func_name)(*args)
+        except Exception as e:
+            return e.__class__
+
+# ################################################################################################################################
+
+    def _parse_all(self, parser):
+        """ Parses all the input test data using the given parser.
+        """
+        out = []
+
+        for line in _request_lines:
+            out.append(self._parse(parser, 'parse_request_line', line))
+
+        for data in _headers:
+            out.append(self._parse(parser, 'parse_headers', data, 5, 50, _Config.secure_scheme_headers, 'http'))
+
+        return out
+
+# ################################################################################################################################
+
+    def test_parse(self):
+
+        request_lines = _request_lines
+        result = self._parse_all(head)
+
+        # Request lines ..
+        self.assertTupleEqual(result[0], ('GET', '/', '/', '', '', (1, 0)))
+        self.assertTupleEqual(result[1], ('GET', '/a/b?c=d', '/a/b', 'c=d', '', (1, 1)))
+        self.assertIs(result[2], InvalidRequestMethod)
+        self.assertEqual(result[3][2], '/a')
+        self.assertIs(result[4], InvalidRequestMethod)
+        self.assertIs(result[5], InvalidHTTPVersion)
+        self.assertIs(result[6], InvalidHTTPVersion)
+        self.assertIs(result[7], InvalidRequestLine)
+
+        # .. and headers.
+        result = result[len(request_lines):]
+
+        self.assertTupleEqual(result[0], ([('A', 'b')], 'http'))
+        self.assertTupleEqual(result[1], ([('A', 'b'), ('C', 'd')], 'http'))
+        self.assertTupleEqual(result[2], ([('A', 'b\r\n\tc\r\n d')], 'http'))
+        self.assertIs(result[3], InvalidHeader)
+        self.assertIs(result[4], InvalidHeaderName)
+        self.assertTupleEqual(result[5], ([('X-FORWARDED-PROTO', 'https')], 'https'))
+        self.assertIs(result[6], InvalidSchemeHeaders)
+        self.assertIs(result[7], LimitRequestHeaders)
+        self.assertIs(result[8], LimitRequestHeaders)
+
+# ################################################################################################################################
+
+    @skipUnless(http_parser, 'zato.cy.http_parser not available')
+    def test_compiled_parser(self):
+
+        # The compiled parser needs to behave exactly like the pure-Python one
+        self.assertListEqual(self._parse_all(http_parser), self._parse_all(head))
+
+# ################################################################################################################################
+
+    def test_request(self):
+
+        # The request's head arrives in chunks, split at any point
+        for chunk_size in (1, 2, 7, len(_request)):
+
+            chunks = [_request[idx:idx+chunk_size] for idx in range(0, len(_request), chunk_size)]
+            request = Request(_Config(), IterUnreader(chunks), 1)
+
+            self.assertEqual(request.method, 'POST')
+            self.assertEqual(request.path, '/api/v1/orders')
+            self.assertEqual(request.query, 'id=123')
+            self.assertEqual(request.fragment, 'top')
+            self.assertTupleEqual(request.version, (1, 1))
+            self.assertListEqual(request.headers, [
+                ('HOST', 'localhost:17010'),
+                ('CONTENT-TYPE', 'application/json'),
+                ('X-LONG', 'abc\r\n  def'),
+                ('CONTENT-LENGTH', '13'),
+            ])
+            self.assertEqual(request.body.read(), b'{"id": "123"}')
+
+# ################################################################################################################################
+
+    def test_pipelined_requests(self):
+
+        # Two requests on the same connection, with the second one's head read along with the first one's body
+        unreader = IterUnreader([_request + _request.replace(b'POST', b'PUT')])
+
+        request1 = Request(_Config(), unreader, 1)
+        self.assertEqual(request1.body.read(), b'{"id": "123"}')
+
+        request2 = Request(_Config(), unreader, 2)
+        self.assertEqual(request2.method, 'PUT')
+        self.assertEqual(request2.body.read(), b'{"id": "123"}')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
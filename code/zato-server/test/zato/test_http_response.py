@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from unittest import main, TestCase
+
+# Zato
+from zato.server.ext.zunicorn import util
+from zato.server.ext.zunicorn.http.wsgi import Response
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class _Config:
+    is_ssl = False
+    sendfile = False
+    server_software = 'Zato'
+
+# ################################################################################################################################
+
+class _Request:
+    method = 'GET'
+    version = (1, 1)
+
+    def should_close(self):
+        return False
+
+# ################################################################################################################################
+
+class _Socket:
+    """ Keeps each of the system calls that data was sent with.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def sendall(self, data):
+        self.calls.append(data)
+
+    def sendmsg(self, buffers):
+        self.calls.append(b''.join(buffers))
+        return sum(map(len, buffers))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class HTTPResponseTestCase(TestCase):
+
+    def _get_response(self, headers):
+        sock = _Socket()
+        response = Response(_Request(), sock, _Config())
+        _ = response.start_response('200 OK', headers)
+
+        return response, sock
+
+# ################################################################################################################################
+
+    def _get_head(self, *headers):
+        return b'HTTP/1.1 200 OK\r\nServer: Zato\r\nDate: ' + util.http_date().encode('ascii') + \
+            b'\r\nConnection: keep-alive\r\n' + b''.join(headers) + b'\r\n'
+
+# ################################################################################################################################
+
+    def test_write_all_chunked(self):
+
+        response, sock = self._get_response([('X-Zato-CID', '123')])
+
+        # The whole response, including the last chunk, is sent in one call ..
+        response.write_all([b'abc', b'', b'defgh'])
+        response.close()
+
+        self.assertListEqual(sock.calls, [
+            self._get_head(b'Transfer-Encoding: chunked\r\n', b'X-Zato-CID: 123\r\n') +
+            b'3\r\nabc\r\n5\r\ndefgh\r\n0\r\n\r\n'
+        ])
+
+        # .. and the response knows what it sent.
+        self.assertTrue(response.headers_sent)
+        self.assertEqual(response.sent, 8)
+
+# ################################################################################################################################
+
+    def test_write_content_length(self):
+
+        response, sock = self._get_response([('Content-Length', '4')])
+
+        # The head goes along with the first write and nothing above the content length is sent
+        response.write(b'abc')
+        response.write(b'def')
+        response.close()
+
+        self.assertListEqual(sock.calls, [
+            self._get_head(b'Content-Length: 4\r\n') + b'abc',
+            b'd',
+        ])
+
+# ################################################################################################################################
+
+    def test_empty_body(self):
+
+        response, sock = self._get_response([])
+        response.close()
+
+        self.assertListEqual(sock.calls, [self._get_head(b'Transfer-Encoding: chunked\r\n') + b'0\r\n\r\n'])
+
+# ################################################################################################################################
+
+    def test_http_date(self):
+
+        # The same value is returned for as long as the second does not change
+        self.assertIs(util.http_date(_time=lambda: 1700000000.1), util.http_date(_time=lambda: 1700000000.9))
+        self.assertEqual(util.http_date(_time=lambda: 1700000001.0), 'Tue, 14 Nov 2023 22:13:21 GMT')
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from contextlib import closing
+from unittest import main
+
+# Bunch
+from bunch import Bunch
+
+# cryptography
+from cryptography.fernet import Fernet
+
+# SQLAlchemy
+from sqlalchemy import event
+
+# Zato
+from zato.common.odb.model import KVData
+from zato.common.test import ODBTestCase
+from zato.server.jwt_ import JWT, ValidationCache
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class JWTValidationCacheTestCase(ODBTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.statements = []
+        self.engine = self.session_wrapper.pool.engine
+
+        event.listen(self.engine, 'before_cursor_execute', self._on_statement)
+
+        # Each test has its own cache, with a background renewal loop that it never runs
+        self.validation_cache = ValidationCache(renew_interval=3600, revalidate_interval=3600)
+        self.validation_cache.renew_greenlet = True
+
+        self.jwt = JWT(self.session_wrapper, None, Fernet.generate_key())
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self._on_statement)
+
+    def _on_statement(self, conn, cursor, statement, *ignored_args):
+        self.statements.append(statement)
+
+# ################################################################################################################################
+
+    def _get_token(self, username='my.user', ttl=60):
+        token = self.jwt._create_token(username=username, ttl=ttl)
+        self.jwt.cache.put(token, token, ttl, is_async=False)
+        return token.encode('utf8')
+
+    def _get_expiry_time(self, token):
+        with closing(self.session_wrapper.session()) as session:
+            return session.query(KVData.expiry_time).filter(KVData.key==token).one()[0]
+
+    def _validate(self, token, username='my.user'):
+        return self.jwt.validate(username, token, _validation_cache=self.validation_cache)
+
+# ################################################################################################################################
+
+    def test_validate_cached(self):
+
+        token = self._get_token()
+        expiry_time = self._get_expiry_time(token)
+
+        self.statements[:] = []
+
+        for _ in range(10_000):
+            result = self._validate(token)
+            self.assertTrue(result.valid)
+
+        self.assertEqual(result.token.username, 'my.user')
+        self.assertEqual(result.raw_token, token)
+
+        # Only the first validation needed to look up the token in ODB
+        self.assertEqual(len(self.statements), 1)
+
+        # Renewals of the same token are merged into a single update ..
+        self.assertEqual(self.validation_cache.flush(), 1)
+        self.assertEqual(self.validation_cache.flush(), 0)
+
+        # .. which extended the token's expiration in ODB.
+        self.assertGreater(self._get_expiry_time(token), expiry_time)
+
+        # Users are checked even if tokens are cached
+        result = self._validate(token, 'my.user.2')
+        self.assertFalse(result.valid)
+        self.assertEqual(result.message, 'Unexpected user for token found')
+
+# ################################################################################################################################
+
+    def test_delete(self):
+
+        token = self._get_token()
+        self.assertTrue(self._validate(token).valid)
+
+        # The process that deleted a token stops accepting it immediately ..
+        self.jwt.delete(token, _validation_cache=self.validation_cache)
+        self.assertFalse(self._validate(token).valid)
+
+        # .. and pending renewals do not resurrect it in ODB.
+        self.assertEqual(self.validation_cache.flush(), 0)
+        self.validation_cache.jwt_cache.renew_many([(token, 60)])
+        self.assertFalse(self._validate(token).valid)
+
+# ################################################################################################################################
+
+    def test_revalidate(self):
+
+        token = self._get_token()
+        self.assertTrue(self._validate(token).valid)
+
+        # Another process deletes the token in ODB ..
+        self.jwt.cache.delete(token)
+
+        # .. which is not noticed until the token needs to be revalidated ..
+        self.assertTrue(self._validate(token).valid)
+
+        # .. at which point it is rejected.
+        self.validation_cache.revalidate_interval = 0
+        self.assertFalse(self._validate(token).valid)
+
+    def test_evict(self):
+
+        validation_cache = ValidationCache(renew_interval=3600, revalidate_interval=10, max_size=3)
+        token_data = Bunch(ttl=5)
+
+        for idx in range(3):
+            _ = validation_cache.set('digest.{}'.format(idx), b'token', token_data, now=idx)
+
+        # Expired entries are deleted when new ones are added ..
+        _ = validation_cache.set('digest.3', b'token', token_data, now=5.5)
+        self.assertListEqual(list(validation_cache.entries), ['digest.1', 'digest.2', 'digest.3'])
+
+        # .. and if none has expired, the oldest ones are, once the cache is full.
+        _ = validation_cache.set('digest.4', b'token', token_data, now=5.9)
+        self.assertListEqual(list(validation_cache.entries), ['digest.2', 'digest.3', 'digest.4'])
+
+# ################################################################################################################################
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -7,16 +7,29 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
 # stdlib
+from collections import OrderedDict
 from contextlib import closing
+from copy import deepcopy
 from datetime import datetime, timedelta
 from hashlib import sha256
 from logging import getLogger
+from time import monotonic
 from traceback import format_exc
 from uuid import uuid4
 
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep, spawn
+
+# SQLAlchemy
+from sqlalchemy import bindparam
+
 # Zato
 from zato.common.api import GENERIC, SEC_DEF_TYPE
 from zato.common.audit import audit_pii
+from zato.common.broker_message import SSO as BROKER_MSG_SSO
 from zato.common.json_internal import dumps
 from zato.common.odb.model import SSOSession as SessionModel
 from zato.common.model.sso import ExpiryHookInput
@@ -34,14 +47,12 @@ from zato.sso.util import new_user_session_token, set_password, UserChecker, val
 
 if 0:
     from typing import Callable
-    from bunch import Bunch
     from zato.common.odb.model import SSOUser
-    from zato.common.typing_ import anylist, anytuple, boolnone, callable_, dtnone, list_, stranydict, strnone
+    from zato.common.typing_ import any_, anylist, anytuple, boolnone, callable_, dtnone, list_, stranydict, strnone
     from zato.server.base.parallel import ParallelServer
     from zato.sso.totp_ import TOTPAPI
     from zato.sso.user import User
 
-    Bunch = Bunch
     Callable = Callable
     SSOUser = SSOUser
     User = User
@@ -66,6 +77,191 @@ _ext_sec_type_supported = SEC_DEF_TYPE.BASIC_AUTH, SEC_DEF_TYPE.JWT
 
 # ################################################################################################################################
 
+class ModuleCtx:
+
+    # How often, in seconds, new expiration times of renewed sessions are written to the database
+    Flush_Interval = 5
+
+    # For how long, in seconds, a cached session is trusted before it is read from the database again. This is how long
+    # it takes at most for changes to users or sessions not announced to all servers to be noticed by each of them.
+    Revalidate_Interval = 10
+
+    # How many sessions at most are kept in the cache of each server process
+    Max_Cache_Size = 100_000
+
+# ################################################################################################################################
+
+class _CachedSession:
+    __slots__ = 'sso_info', 'checked_at'
+
+    def __init__(self, sso_info:'Bunch', checked_at:'float') -> 'None':
+        self.sso_info = sso_info
+        self.checked_at = checked_at
+
+# ################################################################################################################################
+
+class SessionCache:
+    """ Sessions recently verified by the current server process, keyed by a digest of their USTs.
+    Renewals of cached sessions are merged and written to the database in bulk, every flush_interval seconds.
+    Callers always receive copies of cached sessions, which they are free to modify.
+    """
+    def __init__(
+        self,
+        flush_interval:'float',
+        revalidate_interval:'float',
+        max_size:'int'=ModuleCtx.Max_Cache_Size,
+    ) -> 'None':
+        self.flush_interval = flush_interval
+        self.revalidate_interval = revalidate_interval
+        self.max_size = max_size
+        self.odb_session_func = None # type: callable_
+
+        # Session key -> _CachedSession, least recently used first
+        self.entries = OrderedDict() # type: OrderedDict
+
+        # Session key -> (UST, expiration time, opaque attributes) of sessions that need to be written to the database
+        self.to_renew = {} # type: dict
+
+        self.flush_greenlet = None
+
+# ################################################################################################################################
+
+    def get_key(self, ust:'str') -> 'str':
+        """ Returns a key that a session is cached under. It is safe to share it with other servers.
+        """
+        return sha256(ust.encode('utf8')).hexdigest()
+
+# ################################################################################################################################
+
+    def _copy(self, sso_info:'Bunch', _opaque=GENERIC.ATTR_NAME) -> 'Bunch':
+
+        # Opaque attributes are the only ones that are not immutable
+        out = Bunch(sso_info)
+        out[_opaque] = deepcopy(sso_info[_opaque])
+
+        return out
+
+# ################################################################################################################################
+
+    def _is_valid(self, entry:'_CachedSession', now:'datetime') -> 'bool':
+        return entry.sso_info.expiration_time > now and (monotonic() - entry.checked_at) < self.revalidate_interval
+
+# ################################################################################################################################
+
+    def _evict(self, now:'datetime') -> 'None':
+        """ Deletes least recently used sessions that can no longer be used, and then more of them if the cache is full.
+        """
+        entries = self.entries
+
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if self._is_valid(entry, now):
+                break
+            del entries[key]
+
+        while len(entries) >= self.max_size:
+            _ = entries.popitem(last=False)
+
+# ################################################################################################################################
+
+    def get(self, key:'str', now:'datetime') -> 'Bunch | None':
+        """ Returns a session unless it is not in the cache, it has expired or it needs to be read from the database again.
+        """
+        entry = self.entries.get(key) # type: _CachedSession
+
+        if entry:
+            if self._is_valid(entry, now):
+                self.entries.move_to_end(key)
+                return self._copy(entry.sso_info)
+            else:
+                del self.entries[key]
+
+# ################################################################################################################################
+
+    def set(self, key:'str', sso_info:'any_', now:'datetime', _opaque=GENERIC.ATTR_NAME) -> 'Bunch':
+        """ Caches a session read from the database, returning a copy of it.
+        """
+        sso_info = Bunch(sso_info if isinstance(sso_info, dict) else sso_info._asdict())
+        sso_info[_opaque] = sso_info.get(_opaque) or {}
+
+        _ = self.entries.pop(key, None)
+        self._evict(now)
+        self.entries[key] = _CachedSession(sso_info, monotonic())
+
+        return self._copy(sso_info)
+
+# ################################################################################################################################
+
+    def renew(self, key:'str', ust:'str', sso_info:'Bunch', _opaque=GENERIC.ATTR_NAME) -> 'None':
+        """ Stores a session's new expiration time and opaque attributes and schedules them to be written to the database.
+        """
+        # The session may have been evicted in the meantime, in which case it will be read from the database again ..
+        entry = self.entries.get(key) # type: _CachedSession
+        if entry:
+            entry.sso_info = self._copy(sso_info)
+
+        # .. but its renewal will still be written. Renewing the same session many times before the next flush
+        # results in a single update.
+        self.to_renew[key] = (ust, sso_info.expiration_time, dumps(sso_info[_opaque]))
+
+        if not self.flush_greenlet:
+            self.flush_greenlet = spawn(self._flush_loop)
+
+# ################################################################################################################################
+
+    def delete(self, key:'str') -> 'None':
+        _ = self.entries.pop(key, None)
+        _ = self.to_renew.pop(key, None)
+
+# ################################################################################################################################
+
+    def delete_by_user_id(self, user_id:'str') -> 'None':
+        for key, entry in list(self.entries.items()):
+            if entry.sso_info.user_id == user_id:
+                self.delete(key)
+
+# ################################################################################################################################
+
+    def flush(self, _opaque=GENERIC.ATTR_NAME) -> 'int':
+        """ Writes to the database all the sessions renewed since the last flush. Returns the number of sessions written.
+        """
+        to_renew, self.to_renew = self.to_renew, {}
+        params = []
+
+        for ust, expiration_time, opaque in to_renew.values():
+            params.append({
+                'b_ust': ust,
+                'b_expiration_time': expiration_time,
+                'b_opaque': opaque,
+            })
+
+        if not params:
+            return 0
+
+        # Sessions deleted in the database in the meantime will not match, which means that they will not be recreated
+        query = SessionModelUpdate().values({
+            'expiration_time': bindparam('b_expiration_time'),
+            _opaque: bindparam('b_opaque'),
+        }).where(SessionModelTable.c.ust==bindparam('b_ust'))
+
+        with closing(self.odb_session_func()) as session:
+            session.execute(query, params)
+            session.commit()
+
+        return len(params)
+
+# ################################################################################################################################
+
+    def _flush_loop(self) -> 'None':
+        while True:
+            sleep(self.flush_interval)
+            try:
+                _ = self.flush()
+            except Exception:
+                logger.warning('Could not flush SSO session renewals, e:`%s`', format_exc())
+
+# ################################################################################################################################
+
 class SessionInfo:
     """ Details about an individual session.
     """
@@ -124,12 +320,39 @@ class SessionAPI:
         self.is_sqlite = None
         self.interaction_max_len = 100
         self.user_checker = UserChecker(self.decrypt_func, self.verify_hash_func, self.sso_conf)
+        self.session_cache = SessionCache(ModuleCtx.Flush_Interval, ModuleCtx.Revalidate_Interval)
 
 # ################################################################################################################################
 
     def post_configure(self, func:'callable_', is_sqlite:'bool') -> 'None':
         self.odb_session_func = func
         self.is_sqlite = is_sqlite
+        self.session_cache.odb_session_func = func
+
+# ################################################################################################################################
+
+    def invalidate(self, ust:'strnone'=None, user_id:'strnone'=None) -> 'None':
+        """ Removes from the caches of all servers a session given on input or all the sessions of a user.
+        """
+        session_key = self.session_cache.get_key(ust) if ust else None
+
+        # This server stops using the cached data immediately ..
+        self.on_broker_msg_SSO_SESSION_INVALIDATE(session_key, user_id)
+
+        # .. and all the other servers will do the same once they receive this message.
+        self.server.broker_client.publish({
+            'action': BROKER_MSG_SSO.SESSION_INVALIDATE.value,
+            'session_key': session_key,
+            'user_id': user_id,
+        })
+
+# ################################################################################################################################
+
+    def on_broker_msg_SSO_SESSION_INVALIDATE(self, session_key:'strnone', user_id:'strnone') -> 'None':
+        if session_key:
+            self.session_cache.delete(session_key)
+        if user_id:
+            self.session_cache.delete_by_user_id(user_id)
 
 # ################################################################################################################################
 
@@ -495,19 +718,30 @@ class SessionAPI:
         """ Verifies if input user session token is valid and if the user is allowed to access current_app.
         On success, if renew is True, renews the session. Returns all session attributes or True,
         depending on needs_attrs's value.
+
+        Sessions are looked up in the database only if they are not in the session cache yet
+        and renewals are written to the database by the cache, in bulk.
         """
         # type: (object, str, str, bool, bool, bool, bool, datetime, str) -> object
 
         now = _now()
         ctx = VerifyCtx(self.decrypt_func(ust) if needs_decrypt else ust, remote_addr, current_app)
 
-        # Look up user and raise exception if not found by input UST
-        sso_info = self._get_session_by_ust(session, ctx.ust, now)
+        # Look up the session in our cache first ..
+        session_key = self.session_cache.get_key(ctx.ust)
+        sso_info = self.session_cache.get(session_key, now)
 
-        # Invalid UST or the session has already expired but in either case
-        # we can not access it.
+        # .. if it is not there, look up user and raise exception if not found by input UST ..
         if not sso_info:
-            raise ValidationError(status_code.session.no_such_session, False)
+            sso_info = self._get_session_by_ust(session, ctx.ust, now)
+
+            # Invalid UST or the session has already expired but in either case
+            # we can not access it.
+            if not sso_info:
+                raise ValidationError(status_code.session.no_such_session, False)
+
+            # .. otherwise, we can cache it for later use.
+            sso_info = self.session_cache.set(session_key, sso_info, now)
 
         if skip_sec:
             return sso_info if needs_attrs else True
@@ -520,22 +754,19 @@ class SessionAPI:
             if renew:
 
                 # Update current interaction details for this session
-                opaque = getattr(sso_info, _opaque) or {}
+                opaque = sso_info[_opaque]
                 session_state_change_list = self._extract_session_state_change_list(sso_info)
                 _ = self.update_session_state_change_list(session_state_change_list, remote_addr, user_agent, ctx_source, now)
                 opaque['session_state_change_list'] = session_state_change_list
 
-                # Set a new expiration time
+                # Set a new expiration time ..
                 session_expiry = self._get_session_expiry_delta(ctx.current_app, sso_info.username)
                 expiration_time = now + timedelta(minutes=session_expiry)
+                sso_info.expiration_time = expiration_time
+
+                # .. which will be written to the database along with other renewals.
+                self.session_cache.renew(session_key, ctx.ust, sso_info)
 
-                session.execute(
-                    SessionModelUpdate().values({
-                        'expiration_time': expiration_time,
-                        GENERIC.ATTR_NAME: dumps(opaque),
-                }).where(
-                    SessionModelTable.c.ust==ctx.ust
-                ))
                 return expiration_time
             else:
                 # Indicate success
@@ -711,11 +942,14 @@ class SessionAPI:
             # Check that the session and user exist ..
             if self._get(session, ust, current_app, remote_addr, 'logout', needs_decrypt=False, renew=False, skip_sec=skip_sec):
 
-                # .. and if so, delete the session now.
+                # .. and if so, delete the session now ..
                 session.execute(
                     SessionModelDelete().\
                     where(SessionModelTable.c.ust==ust)
                 )
                 session.commit()
 
+                # .. and make sure that no server uses it anymore.
+                self.invalidate(ust=ust)
+
 # ################################################################################################################################
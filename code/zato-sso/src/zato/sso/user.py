@@ -803,6 +803,9 @@ class UserAPI:
                 msg = 'Expected for rows_matched to be 1 instead of %d, user_id:`%s`, username:`%s`'
                 logger.warning(msg, rows_matched, user_id, username)
 
+            # The user's sessions no longer exist so no server can keep them in its cache
+            self.session.invalidate(user_id=user_id)
+
             # After deleting the user from ODB, we can remove a reference to this account
             # from the map of linked accounts.
             for auth_id_link_map in self.auth_id_link_map.values(): # type: dict
@@ -890,6 +893,10 @@ class UserAPI:
             )
             session.commit()
 
+        # Cached sessions of a user who is now locked cannot be used anymore
+        if is_locked:
+            self.session.invalidate(user_id=user_id)
+
 # ################################################################################################################################
 
     def login(self, cid, username, password, current_app, remote_addr, user_agent=None,
@@ -1470,6 +1477,9 @@ class UserAPI:
 
             session.commit()
 
+        # .. and remove them from the caches of all servers too.
+        self.session.invalidate(user_id=user_id)
+
         return auth_id
 
 # ################################################################################################################################
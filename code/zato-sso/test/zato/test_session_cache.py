@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2023, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+# stdlib
+from datetime import datetime, timedelta
+from unittest import main, TestCase
+
+# Zato
+from zato.common.api import GENERIC
+from zato.sso.session import SessionCache
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+class SessionCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.now = datetime(2023, 1, 1, 12, 0, 0)
+
+        # Renewals are never flushed in background in these tests
+        self.cache = SessionCache(flush_interval=3600, revalidate_interval=3600, max_size=3)
+        self.cache.flush_greenlet = True
+
+# ################################################################################################################################
+
+    def _set(self, ust, user_id='user.1', minutes=10):
+        key = self.cache.get_key(ust)
+        sso_info = {
+            'ust': ust,
+            'user_id': user_id,
+            'expiration_time': self.now + timedelta(minutes=minutes),
+            GENERIC.ATTR_NAME: {'session_state_change_list': []},
+        }
+        _ = self.cache.set(key, sso_info, self.now)
+        return key
+
+# ################################################################################################################################
+
+    def test_hit(self):
+
+        key = self._set('ust.1')
+
+        sso_info = self.cache.get(key, self.now)
+        self.assertEqual(sso_info.ust, 'ust.1')
+
+        # Each caller receives its own copy of the session ..
+        sso_info.user_id = 'user.2'
+        sso_info[GENERIC.ATTR_NAME]['session_state_change_list'].append({'idx': 1})
+
+        sso_info = self.cache.get(key, self.now)
+        self.assertEqual(sso_info.user_id, 'user.1')
+        self.assertListEqual(sso_info[GENERIC.ATTR_NAME]['session_state_change_list'], [])
+
+        # .. and changes become visible to others only when the session is renewed.
+        sso_info.expiration_time = self.now + timedelta(minutes=20)
+        sso_info[GENERIC.ATTR_NAME]['session_state_change_list'].append({'idx': 1})
+        self.cache.renew(key, 'ust.1', sso_info)
+
+        sso_info = self.cache.get(key, self.now)
+        self.assertEqual(sso_info.expiration_time, self.now + timedelta(minutes=20))
+        self.assertListEqual(sso_info[GENERIC.ATTR_NAME]['session_state_change_list'], [{'idx': 1}])
+
+        ust, expiration_time, opaque = self.cache.to_renew[key]
+        self.assertEqual(ust, 'ust.1')
+        self.assertEqual(expiration_time, self.now + timedelta(minutes=20))
+        self.assertIn('"idx"', opaque)
+
+# ################################################################################################################################
+
+    def test_expiry(self):
+
+        key = self._set('ust.1', minutes=1)
+
+        # A session that has expired is not returned ..
+        self.assertIsNone(self.cache.get(key, self.now + timedelta(minutes=2)))
+        self.assertNotIn(key, self.cache.entries)
+
+        # .. neither is one that needs to be read from the database again.
+        key = self._set('ust.2')
+        self.cache.revalidate_interval = 0
+
+        self.assertIsNone(self.cache.get(key, self.now))
+        self.assertNotIn(key, self.cache.entries)
+
+# ################################################################################################################################
+
+    def test_max_size(self):
+
+        key1 = self._set('ust.1', minutes=1)
+        key2 = self._set('ust.2')
+        key3 = self._set('ust.3')
+
+        # Expired sessions are deleted when new ones are added ..
+        self.now += timedelta(minutes=2)
+        key4 = self._set('ust.4')
+        self.assertListEqual(list(self.cache.entries), [key2, key3, key4])
+
+        # .. and, once the cache is full, so are the least recently used ones ..
+        _ = self.cache.get(key2, self.now)
+        key5 = self._set('ust.5')
+        self.assertListEqual(list(self.cache.entries), [key4, key2, key5])
+
+        # .. though their renewals are not lost.
+        sso_info = self.cache.get(key4, self.now)
+        _ = self._set('ust.6')
+        _ = self._set('ust.7')
+        _ = self._set('ust.8')
+        self.assertNotIn(key4, self.cache.entries)
+
+        self.cache.renew(key4, 'ust.4', sso_info)
+        self.assertIn(key4, self.cache.to_renew)
+        self.assertNotIn(key1, self.cache.to_renew)
+
+# ################################################################################################################################
+
+    def test_invalidate(self):
+
+        key1 = self._set('ust.1')
+        key2 = self._set('ust.2', user_id='user.2')
+        key3 = self._set('ust.3', user_id='user.2')
+
+        self.cache.renew(key1, 'ust.1', self.cache.get(key1, self.now))
+
+        # Deleting a session drops its pending renewal as well ..
+        self.cache.delete(key1)
+        self.assertIsNone(self.cache.get(key1, self.now))
+        self.assertDictEqual(self.cache.to_renew, {})
+
+        # .. and all the sessions of a user can be deleted at once.
+        self.cache.delete_by_user_id('user.2')
+        self.assertIsNone(self.cache.get(key2, self.now))
+        self.assertIsNone(self.cache.get(key3, self.now))
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    _ = main()
+
+# ################################################################################################################################
+# ################################################################################################################################
@@ -250,6 +250,12 @@ $.fn.zato.http_soap.data_table.new_row = function(item, data, include_tr) {
     row += String.format("<td class='ignore'>{0}</td>", data.json_path || json_path);
     row += String.format("<td class='ignore'>{0}</td>", data.data_encoding || data_encoding);
 
+    /* 39a, 39b */
+    if(is_outgoing) {
+        row += String.format("<td class='ignore'>{0}</td>", data.circuit_breaker_max_failures);
+        row += String.format("<td class='ignore'>{0}</td>", data.circuit_breaker_open_time);
+    }
+
     if(include_tr) {
         row += '</tr>';
     }
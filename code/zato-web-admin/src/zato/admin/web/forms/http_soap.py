@@ -50,6 +50,10 @@ class CreateForm(DataFormatForm, WithAuditLog):
     ping_method = forms.CharField(widget=forms.TextInput(attrs={'style':'width:20%'}))
     pool_size = forms.CharField(widget=forms.TextInput(attrs={'style':'width:10%'}))
     timeout = forms.CharField(widget=forms.TextInput(attrs={'style':'width:10%'}), initial=MISC.DEFAULT_HTTP_TIMEOUT)
+    circuit_breaker_max_failures = forms.CharField(widget=forms.TextInput(attrs={'style':'width:10%'}),
+        initial=HTTP_SOAP.CIRCUIT_BREAKER.MAX_FAILURES)
+    circuit_breaker_open_time = forms.CharField(widget=forms.TextInput(attrs={'style':'width:10%'}),
+        initial=HTTP_SOAP.CIRCUIT_BREAKER.OPEN_TIME)
     security = forms.ChoiceField(widget=forms.Select(attrs={'style':'width:100%'}))
     has_rbac = forms.BooleanField(required=False, widget=forms.CheckboxInput())
     content_type = forms.CharField(widget=forms.TextInput(attrs={'style':'width:100%'}))
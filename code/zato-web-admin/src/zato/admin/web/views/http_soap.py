@@ -22,7 +22,7 @@ from zato.admin.web.forms.http_soap import SearchForm, CreateForm, EditForm
 from zato.admin.web.views import get_http_channel_security_id, get_security_id_from_select, get_tls_ca_cert_list, \
      id_only_service, method_allowed, parse_response_data, SecurityList
 from zato.common.api import AuditLog, CACHE, DEFAULT_HTTP_PING_METHOD, DEFAULT_HTTP_POOL_SIZE, DELEGATED_TO_RBAC, \
-     generic_attrs, HTTP_SOAP_SERIALIZATION_TYPE, MISC, PARAMS_PRIORITY, SEC_DEF_TYPE, SEC_DEF_TYPE_NAME, \
+     generic_attrs, HTTP_SOAP, HTTP_SOAP_SERIALIZATION_TYPE, MISC, PARAMS_PRIORITY, SEC_DEF_TYPE, SEC_DEF_TYPE_NAME, \
      SOAP_CHANNEL_VERSIONS, SOAP_VERSIONS, URL_PARAMS_PRIORITY, URL_TYPE
 from zato.common.exception import ZatoException
 from zato.common.json_internal import dumps
@@ -61,6 +61,9 @@ _rest_security_type_supported = {
 _max_len_messages = AuditLog.Default.max_len_messages
 _max_data_stored_per_message = AuditLog.Default.max_data_stored_per_message
 
+# Opaque attributes that only outgoing connections use
+outconn_attrs = 'circuit_breaker_max_failures', 'circuit_breaker_open_time'
+
 def _get_edit_create_message(params, prefix=''):
     """ A bunch of attributes that can be used by both 'edit' and 'create' actions
     for channels and outgoing connections.
@@ -91,6 +94,8 @@ def _get_edit_create_message(params, prefix=''):
         'ping_method': params.get(prefix + 'ping_method'),
         'pool_size': params.get(prefix + 'pool_size'),
         'timeout': params.get(prefix + 'timeout'),
+        'circuit_breaker_max_failures': params.get(prefix + 'circuit_breaker_max_failures'),
+        'circuit_breaker_open_time': params.get(prefix + 'circuit_breaker_open_time'),
         'sec_tls_ca_cert_id': params.get(prefix + 'sec_tls_ca_cert_id'),
         'security_id': security_id,
         'has_rbac': bool(params.get(prefix + 'has_rbac')),
@@ -255,7 +260,7 @@ def index(req):
                     cache_id=item.cache_id, cache_name=cache_name, cache_type=item.cache_type, cache_expiry=item.cache_expiry,
                     content_encoding=item.content_encoding, match_slash=match_slash, http_accept=http_accept)
 
-            for name in generic_attrs:
+            for name in generic_attrs + outconn_attrs:
                 setattr(http_soap, name, item.get(name))
 
             items.append(http_soap)
@@ -275,6 +280,8 @@ def index(req):
         'default_http_ping_method':DEFAULT_HTTP_PING_METHOD,
         'default_http_pool_size':DEFAULT_HTTP_POOL_SIZE,
         'default_http_timeout':MISC.DEFAULT_HTTP_TIMEOUT,
+        'circuit_breaker_max_failures':HTTP_SOAP.CIRCUIT_BREAKER.MAX_FAILURES,
+        'circuit_breaker_open_time':HTTP_SOAP.CIRCUIT_BREAKER.OPEN_TIME,
         'audit_max_len_messages': _max_len_messages,
         'audit_max_data_stored_per_message': _max_data_stored_per_message,
         'paginate':True,